@@ -1,6 +1,8 @@
 import unittest
 import yaml
 import os
+import shutil
+import tempfile
 
 from marmot.features.alignment_feature_extractor import AlignmentFeatureExtractor
 from marmot.features.pos_feature_extractor import POSFeatureExtractor
@@ -16,11 +18,15 @@ class FeatureExtractorErrorTest(unittest.TestCase):
     def setUp(self):
         module_path = os.path.dirname(__file__)
         self.module_path = module_path
+        self.tmp_dir = tempfile.mkdtemp()
 #        test_config = os.path.join(module_path, 'test_data/test_config.yaml')
 #        
 #        with open(test_config, "r") as cfg_file:
 #            self.config = yaml.load(cfg_file.read())
 
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
     def test_alignment_no_source(self):
         alignmentFE = AlignmentFeatureExtractor()
         obj = {'token':u'hits', 'index':2, 'target':[u'a',u'boy',u'hits',u'a',u'dog']}
@@ -72,13 +78,13 @@ class FeatureExtractorErrorTest(unittest.TestCase):
             gtFE.get_features(obj)
 
     def test_source_lm_no_source(self):
-        slmFE = SourceLMFeatureExtractor(os.path.join(self.module_path, '../../experiment/tiny_test/europarl.1000.en'))
+        slmFE = SourceLMFeatureExtractor(os.path.join(self.module_path, '../../experiment/tiny_test/europarl.1000.en'), cache_dir=self.tmp_dir)
         obj = {'token':u'hits', 'index':2, 'target':[u'a',u'boy',u'hits',u'a',u'dog']}
         with self.assertRaises(NoDataError):
             slmFE.get_features(obj)
 
     def test_source_lm_no_alignments(self):
-        slmFE = SourceLMFeatureExtractor(os.path.join(self.module_path, '../../experiment/tiny_test/europarl.1000.en'))
+        slmFE = SourceLMFeatureExtractor(os.path.join(self.module_path, '../../experiment/tiny_test/europarl.1000.en'), cache_dir=self.tmp_dir)
         obj = {'token':u'hits', 'index':2, 'target':[u'a',u'boy',u'hits',u'a',u'dog'], 'source':[u'un', u'garcon',u'frappe', u'un', u'chien']}
         with self.assertRaises(NoDataError):
             slmFE.get_features(obj)
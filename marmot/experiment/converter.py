@@ -5,29 +5,86 @@ from __future__ import print_function
 #
 ############################################################
 import os
-import sys
 import time
+import shutil
+import logging
+import multiprocessing as multi
 from argparse import ArgumentParser
+
+import numpy as np
 from sklearn.metrics import f1_score
 from subprocess import call
 from marmot.util.generate_crf_template import generate_crf_template
 from marmot.experiment.import_utils import mk_tmp_dir
+from marmot.util.feature_index import FeatureIndex, HashedFeatureIndex, svm_light_line, SVM_BUFFER_SIZE
+from marmot.util.feature_loader import sentence_ranges
 
+logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+logger = logging.getLogger('experiment_logger')
 
-# <in_file> -- input file
-# <tmp_dir> -- directory to store the output
-# <sequence> -- True - sentences as sequences, False - each word is a separate sequence
-# full name of the output: "crfpp.<dataset_name>.<stamp>"
-def crfsuite_to_crfpp(in_file, tmp_dir, dataset_name, sequence=True, stamp=None):
-    #TODO: template
-    if stamp is None:
-        stamp = str(time.time())
-    feature_num = 0
-    out_file_name = os.path.join(tmp_dir, "crfpp." + dataset_name + '.' + stamp)
-    out_file = open(out_file_name, 'w')
+SVM_TAGS = {'OK': '+1', 'BAD': '-1'}
+
+
+# the input is split into shards: byte ranges which end at sentence boundaries (see feature_loader.sentence_ranges)
+# the shards are converted by <workers> processes to temporary files which are then concatenated in order,
+# so the output doesn't depend on the number of workers
+
+# lines of the byte range start..end-1 of a file (without the newlines)
+def range_lines(file_name, start, end):
+    a_file = open(file_name, 'rb')
+    a_file.seek(start)
+    data = a_file.read(end - start)
+    a_file.close()
+    lines = data.split('\n')
+    return lines[:-1] if data.endswith('\n') else lines
+
+
+# file names of the converted shards: the output itself for one process, temporary files otherwise
+def shard_outputs(out_file_name, n_shards, parallel):
+    if not parallel:
+        return [(out_file_name, 'w' if idx == 0 else 'a') for idx in range(n_shards)]
+    return [('{}.shard{}'.format(out_file_name, idx), 'w') for idx in range(n_shards)]
+
+
+def merge_shards(out_file_name, shard_files):
+    out_file = open(out_file_name, 'wb')
+    for shard_file in shard_files:
+        a_file = open(shard_file, 'rb')
+        shutil.copyfileobj(a_file, out_file, SVM_BUFFER_SIZE)
+        a_file.close()
+        os.remove(shard_file)
+    out_file.close()
+
+
+# convert the shards with <convert> (which gets the elements of <args>), returns the results in the order of the shards
+# <initializer>, <initargs> -- state shared by the worker processes (set once per process)
+def convert_shards(convert, args, out_file_name, workers=1, initializer=None, initargs=()):
+    parallel = workers > 1 and len(args) > 1
+    outputs = shard_outputs(out_file_name, len(args), parallel)
+    args = [a + out for a, out in zip(args, outputs)]
+    if parallel:
+        pool = multi.Pool(workers, initializer, initargs)
+        results = pool.map(convert, args)
+        pool.close()
+        pool.join()
+        merge_shards(out_file_name, [shard_file for shard_file, mode in outputs])
+    else:
+        if initializer is not None:
+            initializer(*initargs)
+        results = [convert(a) for a in args]
+    if len(args) == 0:
+        open(out_file_name, 'w').close()
+    return results
+
+
+# one shard of the CRF++ conversion, returns the tags and the number of features (None for a shard with no objects)
+def crfpp_shard(args):
+    in_file, start, end, sequence, out_file_name, mode = args
+    out_file = open(out_file_name, mode, SVM_BUFFER_SIZE)
     tag_set = []
-    for line in open(in_file):
-        line = line.strip('\n').decode('utf-8')
+    feature_num = None
+    for line in range_lines(in_file, start, end):
+        line = line.decode('utf-8')
         if line == '':
             if sequence:
                 out_file.write('\n')
@@ -47,57 +104,131 @@ def crfsuite_to_crfpp(in_file, tmp_dir, dataset_name, sequence=True, stamp=None)
         out_file.write('%s\t%s\n' % (to_pr.encode('utf-8'), cur_tag.encode('utf-8')))
         if not sequence:
             out_file.write('\n')
-    generate_crf_template(feature_num, template_name='template', tmp_dir=tmp_dir)
     out_file.close()
-    return out_file_name, tag_set
+    logger.info('{}: converted bytes {}..{}'.format(in_file, start, end))
+    return tag_set, feature_num
 
 
-# <sequence> -- True - sequential representation for HMM, False - plain for classification
-def crfsuite_to_svmlight(in_file, tmp_dir, dataset_name, binarized_features=None, sequence=False, stamp=None):
+# <in_file> -- input file
+# <tmp_dir> -- directory to store the output
+# <sequence> -- True - sentences as sequences, False - each word is a separate sequence
+# <workers> -- number of processes which convert the shards
+# full name of the output: "crfpp.<dataset_name>.<stamp>"
+def crfsuite_to_crfpp(in_file, tmp_dir, dataset_name, sequence=True, stamp=None, workers=1):
     if stamp is None:
         stamp = str(time.time())
-    no_bin = False
-    if binarized_features is None:
-        print("No binary features list provided, it will be generated from the data")
-        no_bin = True
-        binarized_features = []
+    out_file_name = os.path.join(tmp_dir, "crfpp." + dataset_name + '.' + stamp)
+    args = [(in_file, start, end, sequence) for start, end in sentence_ranges(in_file, n_parts=workers)]
+    results = convert_shards(crfpp_shard, args, out_file_name, workers=workers)
+    tag_set = [tag for tags, feature_num in results for tag in tags]
+    # the number of features of the last object
+    feature_nums = [feature_num for tags, feature_num in results if feature_num is not None]
+    generate_crf_template(feature_nums[-1] if len(feature_nums) > 0 else 0, template_name='template', tmp_dir=tmp_dir)
+    return out_file_name, tag_set
 
-    out_file_name = os.path.join(tmp_dir, "svmlight." + dataset_name + '.' + stamp)
-    out_file = open(out_file_name, 'w')
-    seg_idx = 1
+
+# binary features of a line of the CRFSuite file: <name>=<value> (':' is removed)
+def line_features(elements):
+    if not any([':' in el for el in elements]):
+        return elements
+    features = []
+    for el in elements:
+        stop = el.find(':')
+        if stop == -1:
+            features.append(el)
+        else:
+            features.append(el[:stop] + el[stop + 1:])
+    return features
+
+
+# first pass over a shard: the number of empty lines (for the numbering of the sequences)
+# and, if <collect>, the binary features in the order of their first occurrence
+def scan_shard(args):
+    in_file, start, end, collect = args
+    n_empty = 0
+    seen, features = set(), []
+    for line in range_lines(in_file, start, end):
+        if line == '':
+            n_empty += 1
+        elif collect:
+            line_set = line_features(line.split('\t')[1:])
+            # most lines have no new features
+            if seen.issuperset(line_set):
+                continue
+            for feature in line_set:
+                if feature not in seen:
+                    seen.add(feature)
+                    features.append(feature)
+    return n_empty, features
+
+
+# the feature index used by the processes which convert the shards
+shard_index = None
+
+
+def set_shard_index(index):
+    global shard_index
+    shard_index = index
+
+
+# one shard of the svm_light conversion, <first_qid> -- number of the first sequence of the shard
+def svmlight_shard(args):
+    in_file, start, end, sequence, first_qid, out_file_name, mode = args
+    out_file = open(out_file_name, mode, SVM_BUFFER_SIZE)
+    seg_idx = first_qid
     tag_set = []
-    tag_map = {'OK': '+1', 'BAD': '-1', u'OK': '+1', u'BAD': '-1'}
-    for idx, line in enumerate(open(in_file)):
-        if idx % 1000 == 0:
-            sys.stderr.write('.')
-        if line.strip('\n') == '':
+    for line in range_lines(in_file, start, end):
+        if line == '':
             seg_idx += 1
             continue
-        elements = line.strip('\n').decode('utf-8').split('\t')
-        cur_tag = elements[0]
+        elements = line.split('\t')
+        cur_tag = elements[0].decode('utf-8')
         tag_set.append(cur_tag)
-        cur_tag_svm = tag_map[cur_tag]
-        cur_features = []
-        for el in elements[1:]:
-            stop = el.find(':')
-            cur_el = ''
-            if stop == -1:
-                cur_el = el
-            else:
-                cur_el = el[:stop] + el[stop + 1:]
-            try:
-                cur_features.append(binarized_features.index(cur_el) + 1)
-            except:
-                if no_bin:
-                    binarized_features.append(cur_el)
-                    cur_features.append(len(binarized_features))
-        cur_features.sort()
+        cur_features = shard_index.ids(line_features(elements[1:]))
         if sequence:
-            out_file.write('%s qid:%d %s\n' % (cur_tag_svm, seg_idx, ' '.join([str(f) + ':1.0' for f in cur_features])))
+            out_file.write(svm_light_line(SVM_TAGS[cur_tag], cur_features, qid=seg_idx))
         else:
-            out_file.write('%s\t%s\n' % (cur_tag_svm, ' '.join([str(f) + ':1.0' for f in cur_features])))
+            out_file.write(svm_light_line(SVM_TAGS[cur_tag], cur_features, separator='\t'))
     out_file.close()
-    sys.stderr.write('\n')
+    logger.info('{}: converted bytes {}..{}'.format(in_file, start, end))
+    return tag_set
+
+
+# <sequence> -- True - sequential representation for HMM, False - plain for classification
+# <binarized_features> -- index of the binary features: the FeatureIndex returned for the training data,
+#                         a HashedFeatureIndex (shared by all datasets, nothing is built),
+#                         None -- a FeatureIndex is built from this file (numbered as in a sequential pass)
+# <workers> -- number of processes which convert the shards
+def crfsuite_to_svmlight(in_file, tmp_dir, dataset_name, binarized_features=None, sequence=False, stamp=None, workers=1):
+    if stamp is None:
+        stamp = str(time.time())
+    ranges = sentence_ranges(in_file, n_parts=workers)
+    build_index = binarized_features is None
+    if build_index:
+        logger.info("No binary features list provided, it will be generated from the data")
+        binarized_features = FeatureIndex()
+
+    # the first pass is needed to build the index and to number the sequences
+    first_qids = [1] * len(ranges)
+    if build_index or sequence:
+        scan_args = [(in_file, start, end, build_index) for start, end in ranges]
+        if workers > 1 and len(ranges) > 1:
+            pool = multi.Pool(workers)
+            scans = pool.map(scan_shard, scan_args)
+            pool.close()
+            pool.join()
+        else:
+            scans = [scan_shard(a) for a in scan_args]
+        first_qids = [1 + n for n in np.cumsum([0] + [n_empty for n_empty, features in scans[:-1]])]
+        for n_empty, features in scans:
+            for feature in features:
+                binarized_features.add(feature)
+
+    out_file_name = os.path.join(tmp_dir, "svmlight." + dataset_name + '.' + stamp)
+    args = [(in_file, start, end, sequence, int(first_qid)) for (start, end), first_qid in zip(ranges, first_qids)]
+    results = convert_shards(svmlight_shard, args, out_file_name, workers=workers, initializer=set_shard_index, initargs=(binarized_features,))
+    set_shard_index(None)
+    tag_set = [tag for tags in results for tag in tags]
     return out_file_name, tag_set, binarized_features
 
 
@@ -149,6 +280,8 @@ if __name__ == "__main__":
     parser.add_argument("--params", default='', help="training params, string")
     parser.add_argument("--test_params", default='', help="test params, string")
     parser.add_argument("--tmp", default=None, action="store", help="temporary directory")
+    parser.add_argument("--workers", default=1, type=int, help="number of processes which convert the shards of the input")
+    parser.add_argument("--hash_bits", default=None, type=int, help="svm_light: number the binary features by their hashes (2^hash_bits columns)")
     args = parser.parse_args()
 
     tmp_dir = args.tmp if args.tmp is not None else os.path.join(os.path.dirname(os.path.realpath(__file__)), 'tmp_dir')
@@ -174,8 +307,8 @@ if __name__ == "__main__":
         test_out.close()
         compute_ref(test_tags, args.test_file+'.tagged', data_type=args.method)
     elif args.method == 'crfpp':
-        my_train_file, train_tags = crfsuite_to_crfpp(args.train_file, tmp_dir, 'train', sequence=sequence, stamp=stamp)
-        my_test_file, test_tags = crfsuite_to_crfpp(args.test_file, tmp_dir, 'test', sequence=sequence, stamp=stamp)
+        my_train_file, train_tags = crfsuite_to_crfpp(args.train_file, tmp_dir, 'train', sequence=sequence, stamp=stamp, workers=args.workers)
+        my_test_file, test_tags = crfsuite_to_crfpp(args.test_file, tmp_dir, 'test', sequence=sequence, stamp=stamp, workers=args.workers)
         model = os.path.join(tmp_dir, 'crfpp_model_file' + stamp)
         print("Running training: {}".format(' '.join(['crf_learn'] + args.params.split() + [os.path.join(tmp_dir, 'template'), my_train_file, model])))
         call(['crf_learn'] + args.params.split() + [os.path.join(tmp_dir, 'template'), my_train_file, model])
@@ -183,8 +316,9 @@ if __name__ == "__main__":
         call(['crf_test'] + args.test_params.split() + ['-m', model, '-o', my_test_file+'.tagged', my_test_file])
         compute_ref(test_tags, my_test_file+'.tagged', data_type=args.method)
     elif args.method == 'svm_light':
-        my_train_file, train_tags, binarized_features = crfsuite_to_svmlight(args.train_file, tmp_dir, 'train', binarized_features=None, sequence=sequence, stamp=stamp)
-        my_test_file, test_tags, binarized_features = crfsuite_to_svmlight(args.test_file, tmp_dir, 'test', binarized_features=binarized_features, sequence=sequence, stamp=stamp)
+        binarized_features = HashedFeatureIndex(args.hash_bits) if args.hash_bits is not None else None
+        my_train_file, train_tags, binarized_features = crfsuite_to_svmlight(args.train_file, tmp_dir, 'train', binarized_features=binarized_features, sequence=sequence, stamp=stamp, workers=args.workers)
+        my_test_file, test_tags, binarized_features = crfsuite_to_svmlight(args.test_file, tmp_dir, 'test', binarized_features=binarized_features, sequence=sequence, stamp=stamp, workers=args.workers)
         model = os.path.join(tmp_dir, 'svm_model_file.' + stamp)
         print("Running training: {}".format(' '.join(['/export/tools/varvara/svm_multiclass/svm_light/svm_learn'] + args.params.split() + [my_train_file, model])))
         call(['/export/tools/varvara/svm_multiclass/svm_light/svm_learn'] + args.params.split() + [my_train_file, model])
@@ -10,11 +10,13 @@ import time
 from subprocess import call
 
 from marmot.experiment.import_utils import call_for_each_element, build_object, build_objects, mk_tmp_dir
-from marmot.experiment.preprocessing_utils import create_contexts, flatten, contexts_to_features, tags_from_contexts, fit_binarizers, binarize
+from marmot.experiment.preprocessing_utils import create_contexts, corpus_vocabularies, flatten, contexts_to_features, tags_from_contexts, build_encoder, binarize, finish_feature_extraction
 from marmot.experiment.learning_utils import map_classifiers, predict_all
 from marmot.evaluation.evaluation_metrics import weighted_fmeasure, sequence_correlation, sequence_correlation_weighted
 from marmot.evaluation.evaluation_utils import compare_vocabulary
-from marmot.util.persist_features import persist_features
+from marmot.util.feature_cache import FeatureCache
+from marmot.util.representation_cache import RepresentationCache, generate_representation
+from marmot.util.persist_features import persist_features, row_length
 from marmot.util.generate_crf_template import generate_crf_template
 from marmot.evaluation.evaluation_utils import write_res_to_file
 
@@ -79,9 +81,11 @@ def main(config):
         representation_generators = build_objects(config['representations'])
     else:
         representation_generators = []
+    # outputs of the generators stored in the previous runs are reused
+    representation_cache = RepresentationCache(config['representation_cache_dir']) if 'representation_cache_dir' in config else None
     for r in representation_generators:
-        train_data = r.generate(train_data)
-        test_data = r.generate(test_data)
+        train_data = generate_representation(r, train_data, cache=representation_cache)
+        test_data = generate_representation(r, test_data, cache=representation_cache)
 
 #    borders = config['borders'] if 'borders' in config else False
 
@@ -114,9 +118,13 @@ def main(config):
     # the data_type is the format corresponding to the model of the data that the user wishes to learn
     data_type = config['contexts'] if 'contexts' in config else 'plain'
 
-    test_contexts = create_contexts(test_data, data_type=data_type)
+    # the extractors are created before the contexts: the fields they read as ids are interned in the stores
+    logger.info('creating feature extractors...')
+    feature_extractors = build_objects(config['feature_extractors'])
+    vocabularies = corpus_vocabularies(feature_extractors)
+    test_contexts = create_contexts(test_data, data_type=data_type, vocabularies=vocabularies)
     test_contexts_seq = create_contexts(test_data, data_type='sequential')
-    train_contexts = create_contexts(train_data, data_type=data_type)
+    train_contexts = create_contexts(train_data, data_type=data_type, vocabularies=vocabularies)
 
     logger.info('Vocabulary comparison -- coverage for each dataset: ')
     logger.info(compare_vocabulary([train_data['target'], test_data['target']]))
@@ -128,12 +136,15 @@ def main(config):
     test_tags = call_for_each_element(test_contexts, tags_from_contexts, data_type=data_type)
     test_tags_seq = call_for_each_element(test_contexts_seq, tags_from_contexts, data_type='sequential')
 
-    logger.info('creating feature extractors...')
-    feature_extractors = build_objects(config['feature_extractors'])
+    profile_file = config['features']['profile_file'] if 'profile_file' in config['features'] else None
+    # features extracted in the previous runs are reused
+    feature_cache = FeatureCache(config['features']['cache_dir']) if 'cache_dir' in config['features'] else None
     logger.info('mapping the feature extractors over the contexts for test...')
-    test_features = call_for_each_element(test_contexts, contexts_to_features, [feature_extractors, workers], data_type=data_type)
+    test_features = call_for_each_element(test_contexts, contexts_to_features, [feature_extractors, workers, feature_cache], data_type=data_type)
     logger.info('mapping the feature extractors over the contexts for train...')
-    train_features = call_for_each_element(train_contexts, contexts_to_features, [feature_extractors, workers], data_type=data_type)
+    train_features = call_for_each_element(train_contexts, contexts_to_features, [feature_extractors, workers, feature_cache], data_type=data_type)
+    # the worker processes are shared by all datasets
+    finish_feature_extraction(feature_cache=feature_cache, profile_file=profile_file)
 
     logger.info('number of training instances: {}'.format(len(train_features)))
     logger.info('number of testing instances: {}'.format(len(test_features)))
@@ -159,11 +170,10 @@ def main(config):
         true_features_num = len(all_values[0])
 
         logger.info('fitting binarizers...')
-        binarizers = fit_binarizers(all_values)
+        binarizers = build_encoder(config['features'], feature_names, all_values)
         logger.info('binarizing test data...')
         test_features = call_for_each_element(test_features, binarize, [binarizers], data_type=data_type)
         logger.info('binarizing training data...')
-        # TODO: this line hangs with alignment+w2v
         train_features = call_for_each_element(train_features, binarize, [binarizers], data_type=data_type)
 
         logger.info('All of your features are now scalars in numpy arrays')
@@ -207,7 +217,7 @@ def main(config):
     for dataset_obj in experiment_datasets:
         persist_features(dataset_obj['name']+time_stamp, dataset_obj['features'], persist_dir, feature_names=feature_names, tags=dataset_obj['tags'], file_format=config['persist_format'])
 
-    feature_num = len(train_features[0][0])
+    feature_num = row_length(train_features[0])
     train_file = os.path.join(tmp_dir, 'train'+time_stamp+'.crf')
     test_file = os.path.join(tmp_dir, 'test'+time_stamp+'.crf')
 
@@ -8,6 +8,7 @@ from sklearn.preprocessing import LabelBinarizer, MultiLabelBinarizer
 
 from import_utils import import_class
 from preprocessing_utils import map_feature_extractor
+from marmot.util.corpus_store import TokenIndex
 
 logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
 logger = logging.getLogger('testlogger')
@@ -41,28 +42,36 @@ def init_class(klass, args):
 
 
 def filter_contexts(token_contexts, min_total=1):
+    if isinstance(token_contexts, TokenIndex):
+        return token_contexts.subset([token for token in token_contexts if token_contexts.count(token) >= min_total])
     return {token: contexts for token, contexts in token_contexts.items() if len(contexts) >= min_total}
 
 
 # filter contexts to satisfy the whole size constraint and the class size constraint
+# for a TokenIndex the tags are read from the posting lists, no context objects are created
 def filter_contexts_class(token_contexts, min_total=1, min_class_count=1, proportion=2):
-    new_token_contexts = {}
-    classes = set([cc['tag'] for context in token_contexts.values() for cc in context])
-    for token, contexts in token_contexts.items():
+    if isinstance(token_contexts, TokenIndex):
+        all_tags = {token: token_contexts.tags(token) for token in token_contexts}
+        classes = set([tag for tags in all_tags.values() for tag in tags])
+        token_tags = {token: tags for token, tags in all_tags.items() if len(tags) >= min_total}
+    else:
+        classes = set([cc['tag'] for context in token_contexts.values() for cc in context])
         # no need to check other conditions if there are too few contexts
-        if len(contexts) < min_total:
-            continue
-
+        token_tags = {token: [cc['tag'] for cc in contexts] for token, contexts in token_contexts.items() if len(contexts) >= min_total}
+    good_tokens = []
+    for token, tags in token_tags.items():
         class_counts = {cl: 0 for cl in classes}
-        for cc in contexts:
-            class_counts[cc['tag']] += 1
+        for tag in tags:
+            class_counts[tag] += 1
         min_class = min(class_counts.values())
         cur_proportion = max(class_counts.values())/max(min_class,1)
 
         if min_class >= min_class_count and cur_proportion <= proportion:
-            new_token_contexts[token] = contexts
+            good_tokens.append(token)
 
-    return new_token_contexts
+    if isinstance(token_contexts, TokenIndex):
+        return token_contexts.subset(good_tokens)
+    return {token: token_contexts[token] for token in good_tokens}
 
 
 # convert the tag representation of a list of contexts into another format (remap the tag strings)
@@ -173,6 +182,8 @@ def tags_from_contexts(token_contexts):
     :param token_contexts:
     :return: a dict of {<token>: [tag_i, tag_i+1, ...]}
     """
+    if isinstance(token_contexts, TokenIndex):
+        return {token: np.array(token_contexts.tags(token)) for token in token_contexts}
     return {token: np.array([context['tag'] for context in contexts]) for token, contexts in token_contexts.items()}
 
 
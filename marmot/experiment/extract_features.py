@@ -7,9 +7,14 @@ import sys
 import os
 
 from marmot.experiment.import_utils import call_for_each_element, build_object, build_objects, mk_tmp_dir
-from marmot.experiment.preprocessing_utils import create_contexts, tags_from_contexts, contexts_to_features, fit_binarizers, binarize, flatten
+from marmot.experiment.preprocessing_utils import create_contexts, corpus_vocabularies, tags_from_contexts, contexts_to_features, contexts_to_feature_blocks, build_encoder, binarize, stream_features, finish_feature_extraction
 from marmot.evaluation.evaluation_utils import compare_vocabulary
-from marmot.util.persist_features import persist_features
+from marmot.util.feature_cache import FeatureCache
+from marmot.util.representation_cache import RepresentationCache, generate_representation
+from marmot.util.feature_blocks import FeatureBlocks
+from marmot.util.encoder_store import save_encoder
+from marmot.util.persist_features import persist_datasets, persist_features_stream
+from marmot.util.feature_writer import check_compression
 from marmot.util.generate_crf_template import generate_crf_template
 
 logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
@@ -24,6 +29,8 @@ def main(config):
     workers = config['workers']
     tmp_dir = config['tmp_dir']
     tmp_dir = mk_tmp_dir(tmp_dir)
+    # an unknown compression or a missing zstandard package fails before the data is processed
+    check_compression(config['features']['compression'] if 'compression' in config['features'] else None)
 
     # REPRESENTATION GENERATION
     # main representations (source, target, tags)
@@ -59,12 +66,14 @@ def main(config):
         representation_generators = build_objects(config['representations'])
     else:
         representation_generators = []
+    # outputs of the generators stored in the previous runs are reused
+    representation_cache = RepresentationCache(config['representation_cache_dir']) if 'representation_cache_dir' in config else None
     for r in representation_generators:
-        train_data = r.generate(train_data)
+        train_data = generate_representation(r, train_data, cache=representation_cache)
         if test:
-            test_data = r.generate(test_data)
+            test_data = generate_representation(r, test_data, cache=representation_cache)
         if dev:
-            dev_data = r.generate(dev_data)
+            dev_data = generate_representation(r, dev_data, cache=representation_cache)
 
     print("TEST DATA", test_data['alignments'][0])
     logger.info("Simple representations: {}".format(len(train_data['target'])))
@@ -87,13 +96,68 @@ def main(config):
 #    print('Target dependencies: {}'.format(train_data['target_dependencies'][0]))
 #    print('Source root: {}'.format(train_data['source_root'][0]))
 #    print('Target root: {}'.format(train_data['target_root'][0]))
-    train_contexts = create_contexts(train_data, data_type=data_type)
+
+    # streaming mode: contexts and features are created and persisted for <chunk_size> sentences at a time
+    streaming = config['features']['streaming'] if 'streaming' in config['features'] else False
+    persist_format = config['persist_format'] if 'persist_format' in config else config['features']['persist_format']
+    # compression of the text feature files: 'gzip' or 'zstd'
+    compression = config['features']['compression'] if 'compression' in config['features'] else None
+    # the hashing encoder needs no training features, hashed features are written in the svm_light format chunk by chunk
+    hashing = 'encoder' in config['features'] and config['features']['encoder'] == 'hashing'
+    if streaming and config['features']['binarize'] is True and not (hashing and persist_format == 'svm_light'):
+        logger.warning('Binarization needs all training features (unless the hashing encoder and the svm_light format are used), streaming mode is switched off')
+        streaming = False
+    # the scaling factors are fitted on all training features
+    if streaming and config['features']['binarize'] is True and 'scale' in config['features'] and config['features']['scale']:
+        logger.warning('Scaling needs all training features, streaming mode is switched off')
+        streaming = False
+    if streaming and persist_format == 'binary':
+        logger.warning('The binary feature file is written for the whole dataset at once, streaming mode is switched off')
+        streaming = False
+    if streaming:
+        chunk_size = config['features']['chunk_size'] if 'chunk_size' in config['features'] else 1000
+        logger.info('Streaming mode, chunk size: {} sentences'.format(chunk_size))
+        logger.info('creating feature extractors...')
+        feature_extractors = build_objects(config['feature_extractors'])
+        profile_file = config['features']['profile_file'] if 'profile_file' in config['features'] else None
+        # features extracted in the previous runs are reused
+        feature_cache = FeatureCache(config['features']['cache_dir']) if 'cache_dir' in config['features'] else None
+        feature_names = [f for extractor in feature_extractors for f in extractor.get_feature_names()]
+        vocabularies = corpus_vocabularies(feature_extractors)
+        persist_dir = config['persist_dir'] if 'persist_dir' in config else config['features']['persist_dir']
+        persist_dir = mk_tmp_dir(persist_dir)
+        encoder = build_encoder(config['features'], feature_names) if config['features']['binarize'] is True else None
+        experiment_datasets = [('train', train_data)]
+        if test:
+            experiment_datasets.append(('test', test_data))
+        if dev:
+            experiment_datasets.append(('dev', dev_data))
+        for dataset_name, dataset in experiment_datasets:
+            logger.info('extracting and persisting the features for {}...'.format(dataset_name))
+            feature_chunks = stream_features(dataset, feature_extractors, chunk_size=chunk_size, workers=workers, feature_cache=feature_cache,
+                                             vocabularies=vocabularies)
+            persist_features_stream(dataset_name, feature_chunks, persist_dir, feature_names=feature_names, file_format=persist_format, encoder=encoder,
+                                    workers=workers, compression=compression)
+        finish_feature_extraction(feature_cache=feature_cache, profile_file=profile_file)
+        if encoder is not None and 'encoder_file' in config['features']:
+            save_encoder(encoder, config['features']['encoder_file'], vocabularies=vocabularies)
+            logger.info('Encoder saved to: {}'.format(config['features']['encoder_file']))
+        if persist_format == 'crf++':
+            generate_crf_template(len(feature_names), 'template', persist_dir)
+        logger.info('Features persisted to: {}'.format(', '.join([os.path.join(persist_dir, nn) for nn, _ in experiment_datasets])))
+        return
+
+    # the extractors are created before the contexts: the fields they read as ids are interned in the stores
+    logger.info('creating feature extractors...')
+    feature_extractors = build_objects(config['feature_extractors'])
+    vocabularies = corpus_vocabularies(feature_extractors)
+    train_contexts = create_contexts(train_data, data_type=data_type, vocabularies=vocabularies)
     if test:
-        test_contexts = create_contexts(test_data, data_type=data_type)
+        test_contexts = create_contexts(test_data, data_type=data_type, vocabularies=vocabularies)
         logger.info('Vocabulary comparison -- coverage for test dataset: ')
         logger.info(compare_vocabulary([train_data['target'], test_data['target']]))
     if dev:
-        dev_contexts = create_contexts(dev_data, data_type=data_type)
+        dev_contexts = create_contexts(dev_data, data_type=data_type, vocabularies=vocabularies)
 #    print("TEST CONTEXT", test_contexts[0])
     print("Train contexts: ", len(train_contexts))
     if dev:
@@ -117,17 +181,22 @@ def main(config):
     if test:
         print("Test tags: ", len(test_tags))
 
-    logger.info('creating feature extractors...')
-    feature_extractors = build_objects(config['feature_extractors'])
+    profile_file = config['features']['profile_file'] if 'profile_file' in config['features'] else None
+    # features extracted in the previous runs are reused
+    feature_cache = FeatureCache(config['features']['cache_dir']) if 'cache_dir' in config['features'] else None
+    # features which will be binarized are extracted as blocks: the numeric features are kept in float32 matrices
+    extract = contexts_to_feature_blocks if config['features']['binarize'] is True else contexts_to_features
     if test:
         logger.info('mapping the feature extractors over the contexts for test...')
-        test_features = call_for_each_element(test_contexts, contexts_to_features, [feature_extractors, workers], data_type=data_type)
+        test_features = call_for_each_element(test_contexts, extract, [feature_extractors, workers, feature_cache], data_type=data_type)
         print("Test features sample: ", test_features[0])
     if dev:
         logger.info('mapping the feature extractors over the contexts for dev...')
-        dev_features = call_for_each_element(dev_contexts, contexts_to_features, [feature_extractors, workers], data_type=data_type)
+        dev_features = call_for_each_element(dev_contexts, extract, [feature_extractors, workers, feature_cache], data_type=data_type)
     logger.info('mapping the feature extractors over the contexts for train...')
-    train_features = call_for_each_element(train_contexts, contexts_to_features, [feature_extractors, 1], data_type=data_type)
+    train_features = call_for_each_element(train_contexts, extract, [feature_extractors, workers, feature_cache], data_type=data_type)
+    # the worker processes are shared by all datasets
+    finish_feature_extraction(feature_cache=feature_cache, profile_file=profile_file)
     print("Train features sample: ", train_features[0])
 
     logger.info('number of training instances: {}'.format(len(train_features)))
@@ -141,30 +210,41 @@ def main(config):
 
     # binarizing features
     logger.info('binarization flag: {}'.format(config['features']['binarize']))
-    # flatten so that we can properly binarize the features
+    # stack the features of all sequences so that we can properly binarize them
     if config['features']['binarize'] is True:
         logger.info('Binarizing your features...')
         all_values = []
         if data_type == 'sequential':
-            all_values = flatten(train_features)
+            all_values = FeatureBlocks.vstack(train_features)
         elif data_type == 'plain':
             all_values = train_features
         elif data_type == 'token':
-            all_values = flatten(train_features.values())
+            all_values = FeatureBlocks.vstack(train_features.values())
 
         feature_names = [f for extractor in feature_extractors for f in extractor.get_feature_names()]
         features_num = len(feature_names)
         true_features_num = len(all_values[0])
 
         logger.info('fitting binarizers...')
-        binarizers = fit_binarizers(all_values)
-        logger.info('binarizing test data...')
-        test_features = call_for_each_element(test_features, binarize, [binarizers], data_type=data_type)
+        binarizers = build_encoder(config['features'], feature_names, all_values)
+        # the fitted encoder is reused to binarize new data (see extract_features_predict.py)
+        if 'encoder_file' in config['features']:
+            save_encoder(binarizers, config['features']['encoder_file'], vocabularies=vocabularies)
+            logger.info('Encoder saved to: {}'.format(config['features']['encoder_file']))
+        # the features stay in sparse matrices: svm_light and binary files are written from them directly,
+        # the crf formats densify one sentence at a time, only the csv of the plain data is dense
+        if hashing and data_type == 'plain' and persist_format not in ('svm_light', 'binary'):
+            logger.warning('Hashed features are written to a dense csv with {} columns, use the svm_light format for the plain data'.format(binarizers.n_features()))
+        if test:
+            logger.info('binarizing test data...')
+            test_features = call_for_each_element(test_features, binarize, [binarizers], data_type=data_type)
+        if dev:
+            logger.info('binarizing dev data...')
+            dev_features = call_for_each_element(dev_features, binarize, [binarizers], data_type=data_type)
         logger.info('binarizing training data...')
-        # TODO: this line hangs with alignment+w2v
         train_features = call_for_each_element(train_features, binarize, [binarizers], data_type=data_type)
 
-        logger.info('All of your features are now scalars in numpy arrays')
+        logger.info('All of your features are now scalars in sparse matrices')
         logger.info('training and test sets successfully generated')
 
     # persisting features
@@ -179,12 +259,9 @@ def main(config):
 
     persist_dir = config['persist_dir'] if 'persist_dir' in config else config['features']['persist_dir']
     persist_dir = mk_tmp_dir(persist_dir)
-    persist_format = config['persist_format'] if 'persist_format' in config else config['features']['persist_format']
     logger.info('persisting your features to: {}'.format(persist_dir))
-    # for each dataset, write a file and persist the features
-    for dataset_obj in experiment_datasets:
-#        persist_features(dataset_obj['name'], dataset_obj['features'], persist_dir, feature_names=feature_names, tags=dataset_obj['tags'], file_format=persist_format)
-        persist_features(dataset_obj['name'], dataset_obj['features'], persist_dir, feature_names=feature_names, tags=dataset_obj['tags'], file_format=persist_format)
+    # the files of all datasets are written at a time
+    persist_datasets(experiment_datasets, persist_dir, feature_names=feature_names, file_format=persist_format, workers=workers, compression=compression)
     # generate a template for CRF++ feature extractor
     feature_num = len(feature_names)
     if persist_format == 'crf++':
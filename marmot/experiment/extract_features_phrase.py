@@ -6,7 +6,7 @@ import logging
 import os
 
 from marmot.experiment.import_utils import build_objects, build_object, mk_tmp_dir, call_for_each_element
-from marmot.experiment.preprocessing_utils import tags_from_contexts, contexts_to_features
+from marmot.experiment.preprocessing_utils import tags_from_contexts, contexts_to_features, finish_feature_extraction
 from marmot.evaluation.evaluation_utils import compare_vocabulary
 from marmot.util.persist_features import persist_features
 from marmot.util.generate_crf_template import generate_crf_template
@@ -88,6 +88,7 @@ def main(config):
 
     logger.info('creating feature extractors...')
     feature_extractors = build_objects(config['feature_extractors'])
+    profile_file = config['features']['profile_file'] if 'features' in config and 'profile_file' in config['features'] else None
     if test:
         logger.info('mapping the feature extractors over the contexts for test...')
         test_features = call_for_each_element(test_contexts, contexts_to_features, [feature_extractors, workers], data_type=data_type)
@@ -96,6 +97,8 @@ def main(config):
         dev_features = call_for_each_element(dev_contexts, contexts_to_features, [feature_extractors, workers], data_type=data_type)
     logger.info('mapping the feature extractors over the contexts for train...')
     train_features = call_for_each_element(train_contexts, contexts_to_features, [feature_extractors, workers], data_type=data_type)
+    # the worker processes are shared by all datasets
+    finish_feature_extraction(profile_file=profile_file)
 
     logger.info('number of training instances: {}'.format(len(train_features)))
     logger.info('number of testing instances: {}'.format(len(test_features)))
@@ -0,0 +1,97 @@
+from __future__ import print_function, division
+
+from argparse import ArgumentParser
+import yaml
+import logging
+import os
+
+from marmot.experiment.import_utils import call_for_each_element, build_object, build_objects, mk_tmp_dir
+from marmot.experiment.preprocessing_utils import create_contexts, corpus_vocabularies, tags_from_contexts, contexts_to_feature_blocks, binarize, finish_feature_extraction
+from marmot.util.feature_cache import FeatureCache
+from marmot.util.representation_cache import RepresentationCache, generate_representation
+from marmot.util.encoder_store import load_encoder
+from marmot.util.persist_features import persist_features
+from marmot.util.generate_crf_template import generate_crf_template
+
+logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+logger = logging.getLogger('experiment_logger')
+'''
+Feature extraction for prediction only
+Extract the features of new data and binarize them with the encoder saved by extract_features.py
+(config['features']['encoder_file']), nothing is fitted on the new data.
+The config is the one used for training, the data to score is config['datasets']['test']
+'''
+
+
+def main(config):
+    workers = config['workers']
+    tmp_dir = config['tmp_dir']
+    tmp_dir = mk_tmp_dir(tmp_dir)
+
+    logger.info('creating feature extractors...')
+    feature_extractors = build_objects(config['feature_extractors'])
+    # the encoder is loaded before the contexts are created: it restores the vocabularies of the training run,
+    # so the fields which the extractors read as ids are interned with the same ids
+    vocabularies = corpus_vocabularies(feature_extractors)
+    encoder_file = config['features']['encoder_file']
+    logger.info('loading the encoder from {}...'.format(encoder_file))
+    encoder = load_encoder(encoder_file, vocabularies=vocabularies)
+
+    # REPRESENTATION GENERATION
+    test_data_generator = build_object(config['datasets']['test'][0])
+    test_data = test_data_generator.generate()
+    if 'representations' in config:
+        representation_generators = build_objects(config['representations'])
+    else:
+        representation_generators = []
+    # outputs of the generators stored in the previous runs are reused
+    representation_cache = RepresentationCache(config['representation_cache_dir']) if 'representation_cache_dir' in config else None
+    for r in representation_generators:
+        test_data = generate_representation(r, test_data, cache=representation_cache)
+    # unlabeled data: placeholder tags, the contexts need them
+    if 'tags' not in test_data:
+        test_data['tags'] = [[1 for w in sentence] for sentence in test_data['target']]
+
+    data_type = config['data_type']
+    test_contexts = create_contexts(test_data, data_type=data_type, vocabularies=vocabularies)
+    test_tags = call_for_each_element(test_contexts, tags_from_contexts, data_type=data_type)
+    logger.info('Test contexts: {}'.format(len(test_contexts)))
+    # END REPRESENTATION GENERATION
+
+    # FEATURE EXTRACTION
+    profile_file = config['features']['profile_file'] if 'profile_file' in config['features'] else None
+    feature_cache = FeatureCache(config['features']['cache_dir']) if 'cache_dir' in config['features'] else None
+    feature_names = [f for extractor in feature_extractors for f in extractor.get_feature_names()]
+    if len(encoder.feature_names) > 0 and list(encoder.feature_names) != feature_names:
+        raise ValueError('The feature extractors of the config differ from the ones the encoder was fitted with')
+    logger.info('mapping the feature extractors over the contexts for test...')
+    test_features = call_for_each_element(test_contexts, contexts_to_feature_blocks, [feature_extractors, workers, feature_cache], data_type=data_type)
+    finish_feature_extraction(feature_cache=feature_cache, profile_file=profile_file)
+
+    persist_format = config['persist_format'] if 'persist_format' in config else config['features']['persist_format']
+    sparse_output = data_type == 'plain' and persist_format == 'svm_light'
+    logger.info('binarizing test data...')
+    test_features = call_for_each_element(test_features, binarize, [encoder, sparse_output], data_type=data_type)
+    # END FEATURE EXTRACTION
+
+    persist_dir = config['persist_dir'] if 'persist_dir' in config else config['features']['persist_dir']
+    persist_dir = mk_tmp_dir(persist_dir)
+    persist_features('test', test_features, persist_dir, feature_names=feature_names, tags=test_tags, file_format=persist_format)
+    if persist_format == 'crf++':
+        generate_crf_template(len(feature_names), 'template', persist_dir)
+    logger.info('Features persisted to: {}'.format(os.path.join(persist_dir, 'test')))
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser()
+    parser.add_argument("configuration_file", action="store", help="path to the config file (in YAML format).")
+    args = parser.parse_args()
+    experiment_config = {}
+
+    # Experiment hyperparams
+    cfg_path = args.configuration_file
+    # read configuration file
+    with open(cfg_path, "r") as cfg_file:
+        experiment_config = yaml.load(cfg_file.read())
+    main(experiment_config)
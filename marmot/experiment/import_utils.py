@@ -3,7 +3,12 @@ from __future__ import print_function
 import numpy
 import os
 import sys
+import copy
 import errno
+try:
+    from collections.abc import Mapping
+except ImportError:  # Python 2
+    from collections import Mapping
 
 
 def import_class(module_name):
@@ -49,8 +54,10 @@ def call_for_each_element(data, function, args=[], data_type='sequential'):
         assert(list_of_lists(data))
         return [function(d, *args) for d in data]
     elif data_type == 'token':
-        assert(type(data) == dict)
-    return {token: function(contexts, *args) for token, contexts in data.items()}
+        # a dict or a TokenIndex
+        assert(isinstance(data, Mapping))
+    # the contexts of a TokenIndex are resolved one token at a time
+    return {token: function(data[token], *args) for token in data}
 
 
 # call through the function tree, at each node look for: (func:<>, args:<>)
@@ -74,6 +81,8 @@ def build_object(obj_info, root_element='module'):
     #sys.stderr.write("Class imported\n")
     input_args = obj_info['args'] if 'args' in obj_info else []
     #sys.stderr.write("Arguments extracted\n")
+    # the arguments as specified in the config (used as a part of the key of cached features)
+    spec = (obj_info[root_element], copy.deepcopy(input_args))
 
     # map args to function outputs where requested
     for idx, arg in enumerate(input_args):
@@ -84,6 +93,10 @@ def build_object(obj_info, root_element='module'):
     # init the object
     obj = klass(*input_args)
     #sys.stderr.write('Object instance created\n')
+    try:
+        obj.build_spec = spec
+    except AttributeError:
+        pass
     return obj
 
 
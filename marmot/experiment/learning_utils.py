@@ -3,11 +3,17 @@ import logging
 import numpy as np
 import copy
 from multiprocessing import Pool
+from scipy import sparse
+try:
+    from collections.abc import Mapping
+except ImportError:  # Python 2
+    from collections import Mapping
 
 from sklearn.metrics import f1_score
 from marmot.learning.pystruct_sequence_learner import PystructSequenceLearner
 from marmot.experiment.import_utils import call_for_each_element
 from marmot.experiment.preprocessing_utils import flatten, fit_binarizers, binarize
+from marmot.util.corpus_store import TokenIndex
 
 logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
 logger = logging.getLogger('testlogger')
@@ -24,25 +30,29 @@ def train_classifier(X, y, classifier):
     classifier.fit(X, y)
 
 
+# <tags> for data_type='token' -- a dict {token: [tags]} or the TokenIndex of the training contexts
 def map_classifiers(all_contexts, tags, classifier_type, data_type='plain', classifier_args=None):
     if data_type == 'plain':
-        assert(type(all_contexts) == np.ndarray or type(all_contexts) == list)
+        assert(type(all_contexts) == np.ndarray or type(all_contexts) == list or sparse.issparse(all_contexts))
         logger.info('training classifier')
         classifier = init_classifier(classifier_type, classifier_args)
         classifier.fit(all_contexts, tags)
         return classifier
     elif data_type == 'token':
-        assert(type(all_contexts) == dict)
+        assert(isinstance(all_contexts, Mapping))
         classifier_map = {}
         for token, contexts in all_contexts.items():
             logger.info('training classifier for token: {}'.format(token.encode('utf-8')))
             token_classifier = init_classifier(classifier_type, classifier_args)
-            token_classifier.fit(contexts, tags[token])
+            token_tags = tags.tags(token) if isinstance(tags, TokenIndex) else tags[token]
+            token_classifier.fit(contexts, token_tags)
             classifier_map[token] = token_classifier
         return classifier_map
 
 
-def predict_all(test_features, classifier_map, data_type='plain'):
+# <token_index> -- the TokenIndex of the test contexts (data_type='token' only)
+#     if provided, the predictions are returned as a flat list in the corpus order instead of a {token: predictions} dict
+def predict_all(test_features, classifier_map, data_type='plain', token_index=None):
     if data_type == 'plain':
         predictions = classifier_map.predict(test_features)
         return predictions
@@ -56,6 +66,8 @@ def predict_all(test_features, classifier_map, data_type='plain'):
             except KeyError as e:
                 print(key + " - is NOT in the classifier map")
                 raise
+        if token_index is not None:
+            return token_index.scatter(test_predictions)
         return test_predictions
 
 
@@ -64,8 +76,9 @@ def run_prediction((train_data, train_tags, test_data, test_tags, idx)):
     all_values = flatten(train_data)
     # binarize
     binarizers = fit_binarizers(all_values)
-    test_data = call_for_each_element(test_data, binarize, [binarizers], data_type='sequential')
-    train_data = call_for_each_element(train_data, binarize, [binarizers], data_type='sequential')
+    # dense arrays: pystruct doesn't accept sparse input
+    test_data = call_for_each_element(test_data, binarize, [binarizers, False], data_type='sequential')
+    train_data = call_for_each_element(train_data, binarize, [binarizers, False], data_type='sequential')
 
     x_train = np.array([np.array(xi) for xi in train_data])
     y_train = np.array([np.array(xi) for xi in train_tags])
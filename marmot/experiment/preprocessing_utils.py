@@ -1,15 +1,18 @@
 from __future__ import print_function
 
 import os
-import copy
 import multiprocessing as multi
 import logging
 import numpy as np
-from collections import defaultdict
-from sklearn.preprocessing.label import LabelBinarizer, MultiLabelBinarizer
 import ipdb
 
 from marmot.util.simple_corpus import SimpleCorpus
+from marmot.util.corpus_store import CorpusStore, ContextView, TokenIndex, is_sequence_column
+from marmot.util.feature_blocks import FeatureBlocks
+from marmot.util.feature_encoder import CategoricalEncoder, HashingEncoder
+from marmot.util.feature_cache import FieldRecorder, RecordingContext
+from marmot.util.vocabulary import Vocabularies
+from marmot.util.extractor_profiler import profiler
 from marmot.experiment.import_utils import list_of_lists
 
 logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
@@ -26,17 +29,14 @@ def convert_alignments(align_list, n_words):
     return new_align
 
 
-# TODO: this function adds keys to the context object, but maybe the user wants different keys
-# TODO: the function should be agnostic about which keys it adds -- why does it care?
-# there is a difference between 'sequence fields' and 'token fields'
-# this method creates a context for each token
+# create the context objects for a single sentence
+# the contexts are views over a one-sentence CorpusStore: every field of <repr_dict> except 'tags'
+# is available in each context, together with the token-level fields 'token', 'index', 'tag' and 'sequence_tags'
 def create_context(repr_dict, sentence_id=None):
     '''
     :param repr_dict: a dict representing a 'line' or 'sentence' or a 'segment'
     :return: a list of context objects representing the data for each token in the sequence
     '''
-
-    context_list = []
     # is checked before in create_contexts, but who knows
     if 'target' not in repr_dict:
         print("No 'target' label in data representations")
@@ -45,50 +45,42 @@ def create_context(repr_dict, sentence_id=None):
         print("No 'tag' label in data representations or wrong format of tag")
         print(repr_dict)
         return []
-#    if 'alignments' in repr_dict:
-#        repr_dict['alignments'] = convert_alignments(repr_dict['alignments'], len(repr_dict['target']))
-
-    active_keys = repr_dict.keys()
-    active_keys.remove('tags')
-    #if 'alignments_file':
-#        print("OGOGO!!! ALIGNMENTS REMOVED")
-    #    active_keys.remove('alignments_file')
-    for idx, word in enumerate(repr_dict['target']):
-        c = {}
-        c['token'] = word
-        c['index'] = idx
-        if sentence_id is not None:
-            c['sentence_id'] = sentence_id
-        if type(repr_dict['tags']) == list or type(repr_dict['tags']) == np.ndarray:
-            c['tag'] = repr_dict['tags'][idx]
-            c['sequence_tags'] = repr_dict['tags']
-        elif type(repr_dict['tags']) == int:
-            c['tag'] = repr_dict['tags'][idx]
-        else:
-            print("Unknown type of tags representation:", type(repr_dict['tags']))
-            return []
-        for k in active_keys:
-            #print("Current key: ", k)
-            c[k] = repr_dict[k]
-        context_list.append(c)
-    return context_list
+    if type(repr_dict['tags']) != list and type(repr_dict['tags']) != np.ndarray:
+        print("Unknown type of tags representation:", type(repr_dict['tags']))
+        return []
+
+    store = CorpusStore({k: [v] for k, v in repr_dict.items()}, first_sentence=sentence_id or 0)
+    return store.sentence_contexts(0)
+
+
+# vocabularies of the fields which the feature extractors read as ids (the extractors with ids=True),
+# None if there are no such extractors -- then the corpus isn't interned
+# the same object is passed to create_contexts for all datasets of an experiment, so their ids agree
+def corpus_vocabularies(feature_extractors):
+    fields = set([field for extractor in feature_extractors if hasattr(extractor, 'get_id_fields') for field in extractor.get_id_fields()])
+    if len(fields) == 0:
+        return None
+    return Vocabularies(sorted(fields))
 
 
 # create context objects from a data_obj -
 #     - a dictionary with representation labels as keys ('target', 'source', etc.) and
 #       representations (lists of lists) as values
+# the data_obj is stored once in a columnar CorpusStore, context objects are lightweight views
+# which hold only (sentence_id, index) and behave like the old per-token dicts
+# <vocabularies> -- the fields to intern, see corpus_vocabularies
 # output: if data_type = 'plain', one list of context objects is returned
 #         if data_type = 'sequential', a list of lists of context objects is returned (list of sequences)
-#         if data_type = 'token', a dict {token: <list_of_contexts>} is returned
+#         if data_type = 'token', a TokenIndex is returned -- it behaves like a dict {token: <list_of_contexts>},
+#                                 but keeps only the posting list of token positions for every token
 # TODO: this function requires the 'target' and 'tag' keys, but the user may wish to specify other keys
 # TODO: 'target' and 'tag' don't make sense for every task
-def create_contexts(data_obj, data_type='plain'):
+def create_contexts(data_obj, data_type='plain', vocabularies=None):
     '''
     :param data_obj: an object representing a dataset consisting of files
     :param data_type:
     :return:
     '''
-    contexts = []
     if 'target' not in data_obj:
         print("No 'target' label in data representations")
         return []
@@ -97,20 +89,36 @@ def create_contexts(data_obj, data_type='plain'):
         print("No 'tag' label in data representations or wrong format of tag")
         return []
 
-    for s_idx, sents in enumerate(zip(*data_obj.values())):
-        if data_type == 'sequential':
-            contexts.append(create_context({data_obj.keys()[i]: sents[i] for i in range(len(sents))}, sentence_id=s_idx))
-        else:
-            contexts.extend(create_context({data_obj.keys()[i]: sents[i] for i in range(len(sents))}, sentence_id=s_idx))
-
-            # TODO: there is an error here
-            if data_type == 'token':
-                new_contexts = defaultdict(list)
-                for cont in contexts:
-                    new_contexts[cont['token']].append(cont)
-                    contexts = copy.deepcopy(new_contexts)
-
-    return contexts
+    store = CorpusStore(data_obj, vocabularies=vocabularies)
+    if data_type == 'sequential':
+        return [store.sentence_contexts(s_idx) for s_idx in range(len(store))]
+    elif data_type == 'token':
+        return TokenIndex(store)
+    return list(store.iter_contexts())
+
+
+# split a data_obj into CorpusStores of at most <chunk_size> sentences
+# the stores keep the numbering of sentences in the whole corpus
+def iter_corpus_chunks(data_obj, chunk_size=1000, vocabularies=None):
+    n_sentences = len(CorpusStore(data_obj))
+    for start in range(0, n_sentences, chunk_size):
+        end = min(start + chunk_size, n_sentences)
+        chunk = {k: v[start:end] if is_sequence_column(v) else v for k, v in data_obj.items()}
+        yield CorpusStore(chunk, first_sentence=start, vocabularies=vocabularies)
+
+
+# streaming feature extraction: the features are extracted for <chunk_size> sentences at a time
+# yields pairs (feature sequences, tag sequences) -- one sequence per sentence of the chunk
+# only one chunk of contexts and features is kept in memory
+def stream_features(data_obj, feature_extractors, chunk_size=1000, workers=1, feature_cache=None, vocabularies=None):
+    for store in iter_corpus_chunks(data_obj, chunk_size=chunk_size, vocabularies=vocabularies):
+        contexts = list(store.iter_contexts())
+        features = contexts_to_features(contexts, feature_extractors, workers=workers, feature_cache=feature_cache) if len(contexts) > 0 else []
+        feature_seqs, tag_seqs = [], []
+        for s_idx in range(len(store)):
+            feature_seqs.append(features[store.offsets[s_idx]:store.offsets[s_idx + 1]])
+            tag_seqs.append(list(store.field('tags', s_idx)))
+        yield feature_seqs, tag_seqs
 
 
 # convert list of lists into a flat list
@@ -126,34 +134,223 @@ def map_feature_extractor((context, extractor)):
     return extractor.get_features(context)
 
 
+# features for a list of contexts from the same sentence
+# extractors which don't implement get_features_batch are called for every context
+# every call is measured by the profiler of the process
+def map_feature_extractor_batch((contexts, extractor)):
+    with profiler.measure(extractor, len(contexts)):
+        if hasattr(extractor, 'get_features_batch'):
+            return extractor.get_features_batch(contexts)
+        return [extractor.get_features(context) for context in contexts]
+
+
+# features of one batch and the fields of the contexts which the extractor has read (see feature_cache.FieldRecorder)
+def record_feature_extractor_batch((contexts, extractor)):
+    recorder = FieldRecorder()
+    features = map_feature_extractor_batch(([RecordingContext(context, recorder) for context in contexts], extractor))
+    return features, recorder.fields
+
+
+def same_sentence(context, other):
+    if isinstance(context, ContextView) and isinstance(other, ContextView):
+        return context.store is other.store and context.sentence_id == other.sentence_id
+    return context.get('sentence_id') == other.get('sentence_id') and context.get('target') == other.get('target')
+
+
+# split a list of contexts into runs of consecutive contexts from the same sentence
+# (a whole sentence for 'plain' and 'sequential' contexts, the occurrences of a token in a sentence for 'token' contexts)
+def sentence_batches(contexts):
+    batches = []
+    for context in contexts:
+        if len(batches) > 0 and same_sentence(batches[-1][-1], context):
+            batches[-1].append(context)
+        else:
+            batches.append([context])
+    return batches
+
+
+# features of all extractors for a list of sentence batches
+# returns one flat list of feature values per context (in the order of the contexts)
+# <by_extractor> -- keep the outputs of the extractors separate: one list with the outputs for all contexts per extractor
+# <record> -- record the fields which are read by the extractor (only one extractor), returns the features and the fields of every batch
+def extract_batches(batches, feature_extractors, by_extractor=False, record=False):
+    if record:
+        outputs = [record_feature_extractor_batch((batch, feature_extractors[0])) for batch in batches]
+        return [x for features, fields in outputs for x in features], [fields for features, fields in outputs]
+    if by_extractor:
+        res = [[] for extractor in feature_extractors]
+        for batch in batches:
+            for e_idx, extractor in enumerate(feature_extractors):
+                res[e_idx].extend(map_feature_extractor_batch((batch, extractor)))
+        return res
+    res_list = []
+    for batch in batches:
+        extractors_output = [map_feature_extractor_batch((batch, extractor)) for extractor in feature_extractors]
+        for i in range(len(batch)):
+            res_list.append([x for extractor_features in extractors_output for x in extractor_features[i]])
+    return res_list
+
+
+# the extractors of a worker process -- set once when the worker is started, never sent with the data
+_worker_extractors = None
+
+
+def init_feature_worker(feature_extractors):
+    global _worker_extractors
+    _worker_extractors = feature_extractors
+
+
+# <extractor_ids> -- numbers of the extractors to use (all extractors if None)
+# returns the features and the profiling statistics of the chunk
+def extract_batches_worker((batches, extractor_ids, by_extractor, record)):
+    profiler.reset()
+    if extractor_ids is None:
+        features = extract_batches(batches, _worker_extractors, by_extractor=by_extractor, record=record)
+    else:
+        features = extract_batches(batches, [_worker_extractors[i] for i in extractor_ids], by_extractor=by_extractor, record=record)
+    return features, profiler.stats
+
+
+class FeatureEngine(object):
+    '''
+    A pool of worker processes which keep their own copies of the feature extractors.
+    The extractors are passed to the workers once, when the pool is started (with fork they are not even pickled),
+    and the workers receive chunks of sentences and return blocks of features for the whole chunk.
+    The same engine is reused by all calls of contexts_to_features with the same list of extractors.
+    '''
+
+    def __init__(self, feature_extractors, workers):
+        self.feature_extractors = feature_extractors
+        self.workers = workers
+        self.pool = multi.Pool(workers, initializer=init_feature_worker, initargs=(feature_extractors,))
+
+    # <extractor_ids> -- numbers of the extractors to use (all extractors if None)
+    # <chunk_size> -- number of sentences sent to a worker at once
+    # <by_extractor> -- the outputs of the extractors are returned separately (see extract_batches)
+    # <record> -- the fields read by the extractor are returned as well (see extract_batches)
+    def extract(self, batches, extractor_ids=None, chunk_size=None, by_extractor=False, record=False):
+        if chunk_size is None:
+            # a few chunks per worker to balance the load
+            chunk_size = max(1, len(batches) // (self.workers * 4))
+        chunks = [(batches[i:i + chunk_size], extractor_ids, by_extractor, record) for i in range(0, len(batches), chunk_size)]
+        n_extractors = len(self.feature_extractors) if extractor_ids is None else len(extractor_ids)
+        res_list = [[] for i in range(n_extractors)] if by_extractor else []
+        fields = []
+        for block, stats in self.pool.imap(extract_batches_worker, chunks):
+            if record:
+                res_list.extend(block[0])
+                fields.extend(block[1])
+            elif by_extractor:
+                for e_idx, outputs in enumerate(block):
+                    res_list[e_idx].extend(outputs)
+            else:
+                res_list.extend(block)
+            profiler.merge(stats)
+        if record:
+            return res_list, fields
+        return res_list
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
+_feature_engine = None
+
+
+# the engine for <feature_extractors> -- a new pool is started only if the extractors or the number of workers change
+def get_feature_engine(feature_extractors, workers):
+    global _feature_engine
+    if _feature_engine is not None and _feature_engine.feature_extractors is feature_extractors and _feature_engine.workers == workers:
+        return _feature_engine
+    close_feature_engine()
+    logger.info('Starting {} feature extraction workers'.format(workers))
+    _feature_engine = FeatureEngine(feature_extractors, workers)
+    return _feature_engine
+
+
+# stop the worker processes (call after the features for all datasets are extracted)
+def close_feature_engine():
+    global _feature_engine
+    if _feature_engine is not None:
+        _feature_engine.close()
+        _feature_engine = None
+
+
+# call after the features for all datasets are extracted:
+# stop the workers, save the new features in the cache, log the extractor profile and save it to <profile_file> (.json or .tsv)
+def finish_feature_extraction(feature_cache=None, profile_file=None):
+    close_feature_engine()
+    if feature_cache is not None:
+        feature_cache.flush()
+    profiler.log_summary()
+    if profile_file is not None:
+        profiler.write(profile_file)
+
+
 # feature extraction for categorical features with conversion to one-hot representation
 # this implementation is for a list representation
 # this returns a list of lists, where each list contains the feature extractor results for a context
 # the point of returning a list of lists is to allow binarization of the feature values
-# TODO: we can binarize over the columns of the matrix instead of binarizing the results of each feature extractor
-# TODO: is the output of the single worker and the multithreaded different? if so, change
-def contexts_to_features(contexts, feature_extractors, workers=1):
+# the extractors are called once per sentence (get_features_batch), not once per token
+# with several workers the extraction is done by a FeatureEngine which is shared by the calls for train/dev/test data
+# <feature_cache> -- a FeatureCache, only the features which are not in the cache are extracted
+# <by_extractor> -- return the outputs of every extractor separately (see extract_batches)
+def contexts_to_features(contexts, feature_extractors, workers=1, feature_cache=None, by_extractor=False):
+    batches = sentence_batches(contexts)
+    if feature_cache is not None:
+        return cached_contexts_to_features(batches, feature_extractors, workers, feature_cache, by_extractor=by_extractor)
+    return run_extractors(batches, feature_extractors, workers, by_extractor=by_extractor)
+
+
+# the same features as FeatureBlocks: the numeric outputs (w2v vectors, LM scores, counts) are kept as
+# float32 matrices and are not split into one value per column, the categorical columns are kept as lists
+# the blocks can be passed to fit_binarizers and binarize instead of the lists of feature values
+def contexts_to_feature_blocks(contexts, feature_extractors, workers=1, feature_cache=None):
+    outputs = contexts_to_features(contexts, feature_extractors, workers=workers, feature_cache=feature_cache, by_extractor=True)
+    return FeatureBlocks.from_extractor_outputs(outputs, len(contexts))
+
+
+def run_extractors(batches, feature_extractors, workers, extractor_ids=None, by_extractor=False, record=False):
     # single thread
     if workers == 1:
-        return [[x for a_list in [map_feature_extractor((context, extractor)) for extractor in feature_extractors] for x in a_list] for context in contexts]
-
-    # multiple threads
-    else:
-        # resulting object
-        res_list = []
-        pool = multi.Pool(workers)
-        logger.info('Multithreaded - Extracting the features for: ' + str(len(contexts)) + ' contexts...')
-        # each context is paired with all feature extractors
-        for extractor in feature_extractors:
-            context_list = [(cont, extractor) for cont in contexts]
-            features = pool.map(map_feature_extractor, context_list)
-            res_list.append(features)
-        # np.hstack and np.vstack can't be used because lists have objects of different types
-        intermediate = [[x[i] for x in res_list] for i in range(len(res_list[0]))]
-        res_list = [flatten(x) for x in intermediate]
-        pool.close()
-        pool.join()
-
+        if extractor_ids is not None:
+            feature_extractors = [feature_extractors[i] for i in extractor_ids]
+        return extract_batches(batches, feature_extractors, by_extractor=by_extractor, record=record)
+
+    # multiple processes
+    logger.info('Multithreaded - Extracting the features for: ' + str(sum([len(b) for b in batches])) + ' contexts...')
+    return get_feature_engine(feature_extractors, workers).extract(batches, extractor_ids=extractor_ids, by_extractor=by_extractor, record=record)
+
+
+# feature extraction with a cache: every extractor is run only for the sentences which are missing in the cache
+# the fields which the extractor reads are recorded when it's run, they are the key of the new features
+def cached_contexts_to_features(batches, feature_extractors, workers, feature_cache, by_extractor=False):
+    # hashes of the fields of every batch, shared by the extractors
+    memos = [{} for batch in batches]
+    # features of every extractor: one list of per-context features for every batch
+    all_features = []
+    for e_idx, extractor in enumerate(feature_extractors):
+        key = feature_cache.extractor_key(extractor)
+        cur_features = [feature_cache.lookup(key, batch, memo) for batch, memo in zip(batches, memos)]
+        missing = [b_idx for b_idx, features in enumerate(cur_features) if features is None]
+        if len(missing) > 0:
+            logger.info('Extracting features of {} for {} of {} sentences'.format(type(extractor).__name__, len(missing), len(batches)))
+            new_features, fields = run_extractors([batches[b_idx] for b_idx in missing], feature_extractors, workers, extractor_ids=[e_idx], record=True)
+            position = 0
+            for b_idx, batch_fields in zip(missing, fields):
+                batch = batches[b_idx]
+                cur_features[b_idx] = new_features[position:position + len(batch)]
+                position += len(batch)
+                feature_cache.add(key, batch, cur_features[b_idx], batch_fields)
+        all_features.append(cur_features)
+
+    if by_extractor:
+        return [[x for batch_features in extractor_features for x in batch_features] for extractor_features in all_features]
+    res_list = []
+    for b_idx, batch in enumerate(batches):
+        for i in range(len(batch)):
+            res_list.append([x for extractor_features in all_features for x in extractor_features[b_idx][i]])
     return res_list
 
 
@@ -164,66 +361,43 @@ def tags_from_contexts(contexts):
 
 # train converters(binarizers) from categorical values to one-hot representation
 #      for all features
-# all_values is a list of lists, because we need to look at the feature values for every instance to binarize properly
+# all_values is a list of lists (or FeatureBlocks), because we need to look at the feature values for every instance to binarize properly
+# only the categorical columns are looked at -- the numeric columns (w2v vectors, LM scores, counts) are left as they are
+# returns a CategoricalEncoder: every categorical column gets a vocabulary of its values with a slot for unknown values
 def fit_binarizers(all_values):
-    binarizers = {}
-    for f in range(len(all_values[0])):
-        cur_features = [context[f] for context in all_values]
-        # only categorical values need to be binarized, ints/floats are left as they are
-        if type(cur_features[0]) == str or type(cur_features[0]) == unicode:
-            lb = LabelBinarizer()
-            lb.fit(cur_features)
-            binarizers[f] = lb
-        elif type(cur_features[0]) == list:
-            mlb = MultiLabelBinarizer()
-            # default feature for unknown values
-            cur_features.append(tuple(("__unk__",)))
-            mlb.fit([tuple(x) for x in cur_features])
-            binarizers[f] = mlb
-    return binarizers
+    return CategoricalEncoder().fit(all_values)
+
+
+# the encoder of the categorical features selected in the 'features' section of the config:
+#   encoder: one_hot (default) -- a CategoricalEncoder fitted on the training features <all_values>
+#   encoder: hashing -- a HashingEncoder, nothing is fitted. Options: hash_bits (default 18), signed_hash (default True)
+# <feature_names> -- names of the features (the hashing encoder hashes the pairs (feature name, value))
+def build_encoder(features_config, feature_names, all_values=None):
+    encoder = features_config['encoder'] if 'encoder' in features_config else 'one_hot'
+    scale = features_config['scale'] if 'scale' in features_config else False
+    if encoder == 'hashing':
+        n_bits = features_config['hash_bits'] if 'hash_bits' in features_config else 18
+        signed = features_config['signed_hash'] if 'signed_hash' in features_config else True
+        hashing_encoder = HashingEncoder(feature_names=feature_names, n_bits=n_bits, signed=signed, scale=scale)
+        # the scaling factors are the only fitted part of the hashing encoder
+        if scale and all_values is not None:
+            hashing_encoder.fit(all_values)
+        return hashing_encoder
+    elif encoder == 'one_hot':
+        return CategoricalEncoder(feature_names=feature_names, scale=scale).fit(all_values)
+    raise ValueError("Unknown encoder: '{}', the options are 'one_hot' and 'hashing'".format(encoder))
 
 
 # convert categorical features to one-hot representations with pre-fitted binarizers
-# TODO: this function implicitly converts the data into a numpy array
-def binarize(features, binarizers):
-    assert(list_of_lists(features))
-    num_features = len(features[0])
-    if binarizers != {} and max(binarizers.keys()) >= num_features:     
-        print("Binarizers keys max: ", max(binarizers.keys()))
-        print("Total feature number: ", num_features)
-        print("Features:", features[0])
-    assert(binarizers == {} or max(binarizers.keys()) < num_features)
-
-    binarized_cols = []
-    for i in range(num_features):
-        # get this column
-        cur_values = [f[i] for f in features]
-        # if there's a binarizer for this column
-        if i in binarizers:
-            binarizer = binarizers[i]
-            if type(binarizer) == LabelBinarizer:
-                binarized_cols.append(binarizer.transform(cur_values))
-            elif type(binarizer) == MultiLabelBinarizer:
-                assert(list_of_lists(cur_values))
-                # MultiLabelBinarizer doesn't support unknown values -- they need to be replaced with a default value
-                # we're going to use the empty list as the default value
-                cur_values_default = []
-                default_value = binarizer.classes_[-1]
-                for a_list in cur_values:
-                    new_list = list(a_list)
-                    for j, val in enumerate(new_list):
-                        if val not in binarizer.classes_:
-                            new_list[j] = default_value
-                    cur_values_default.append(tuple(new_list))
-
-                transformed = binarizer.transform(cur_values_default)
-                binarized_cols.append(transformed)
-            else:
-                raise NotImplementedError('this function is not implemented for type: {}'.format(type(binarizer)))
-        else:
-            binarized_cols.append(np.array(cur_values).reshape(len(cur_values), 1))
-
-    assert (len(binarized_cols) == num_features), 'the number of columns after binarization must match the number of features'
-    new_features = np.hstack(binarized_cols)
+# the encoder emits a scipy.sparse CSR matrix with the one-hot columns and the numeric features (see marmot.util.feature_encoder)
+# <binarizers> -- a CategoricalEncoder or a HashingEncoder (see build_encoder)
+# <sparse> -- return the CSR matrix (accepted by the sklearn learners and the feature writers),
+#             False converts it to a numpy array for the consumers which need dense input (e.g. pystruct)
+def binarize(features, binarizers, sparse=True):
+    if not isinstance(features, FeatureBlocks):
+        assert(list_of_lists(features))
+    new_features = binarizers.transform(features)
+    if not sparse:
+        new_features = new_features.toarray()
 
     return new_features
@@ -9,7 +9,7 @@ import time
 from subprocess import call
 
 from marmot.experiment.import_utils import build_objects, build_object, call_for_each_element, import_class
-from marmot.experiment.preprocessing_utils import tags_from_contexts, contexts_to_features, flatten, fit_binarizers, binarize
+from marmot.experiment.preprocessing_utils import tags_from_contexts, contexts_to_features, flatten, fit_binarizers, binarize, finish_feature_extraction
 from marmot.experiment.context_utils import create_contexts_ngram, get_contexts_words_number
 from marmot.experiment.learning_utils import map_classifiers, predict_all
 from marmot.evaluation.evaluation_utils import compare_vocabulary
@@ -164,10 +164,13 @@ def main(config, stamp):
 
     logger.info('creating feature extractors...')
     feature_extractors = build_objects(config['feature_extractors'])
+    profile_file = config['features']['profile_file'] if 'features' in config and 'profile_file' in config['features'] else None
     logger.info('mapping the feature extractors over the contexts for test...')
     test_features = call_for_each_element(test_contexts, contexts_to_features, [feature_extractors, workers], data_type=data_type)
     logger.info('mapping the feature extractors over the contexts for train...')
     train_features = call_for_each_element(train_contexts, contexts_to_features, [feature_extractors, workers], data_type=data_type)
+    # the worker processes are shared by all datasets
+    finish_feature_extraction(profile_file=profile_file)
 
     logger.info('number of training instances: {}'.format(len(train_features)))
     logger.info('number of testing instances: {}'.format(len(test_features)))
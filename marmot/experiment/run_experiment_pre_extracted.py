@@ -6,39 +6,64 @@ import sys
 import yaml
 import time
 import logging
+import numpy as np
+from scipy import sparse
 from subprocess import call
 from sklearn.metrics import f1_score
 from marmot.experiment.import_utils import call_for_each_element, build_object, build_objects, mk_tmp_dir
-from marmot.experiment.preprocessing_utils import create_contexts, tags_from_contexts, contexts_to_features
-from marmot.util.persist_features import persist_features
+from marmot.experiment.preprocessing_utils import create_contexts, corpus_vocabularies, tags_from_contexts, contexts_to_features
+from marmot.util.persist_features import persist_features, is_sparse_sequences
 from marmot.util.add_bigram_features import add_bigram_features
+from marmot.util.feature_blocks import FeatureBlocks
+from marmot.util.feature_loader import load_text_features
+from marmot.util.feature_file import FeatureFile, is_feature_file
 
 logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
 logger = logging.getLogger('experiment_logger')
 
 
-def load_features(features_file, feature_names_file=None):
+# features of a file in the CRF++ format (tab-separated values, one word per line, an empty line after every sentence)
+# or of a binary feature file
+# numbers are converted to float, the other values are unicode strings (see marmot.util.feature_loader)
+# the features stay in FeatureBlocks (numeric matrices + categorical columns), they are never converted to lists of rows here:
+# <data_type> -- 'sequential': FeatureBlocks for every sentence (views of the rows of the sentence), 'plain': FeatureBlocks with all rows
+# a binary file with binarized features gives a CSR matrix ('plain') or a CSR matrix for every sentence ('sequential'),
+# their columns are the one-hot values, so they are named by their numbers (f0, f1, ...) unless <feature_names_file> names all of them
+# <workers> -- number of processes which parse the parts of the file
+def load_features(features_file, feature_names_file=None, data_type='sequential', workers=1):
     feature_names = []
     if feature_names_file is not None:
         for n_line in open(feature_names_file):
             feature_names.append(n_line.decode('utf-8').strip('\n'))
-    features = []
-    cur_features = []
-    for f_line in open(features_file):
-        if f_line == '\n':
-            features.append(cur_features)
-            cur_features = []
-            continue
-        f_line = f_line.decode('utf-8').strip('\n')
-        f_chunks = f_line.split("\t")
-        for f in f_chunks:
-            try:
-                cur_features.append(float(f))
-            except ValueError:
-                cur_features.append(f)
-    if len(cur_features) != 0:
-        features.append(cur_features)
-    return features, feature_name
+    # a binary feature file (see marmot.util.feature_file) is memory-mapped
+    if is_feature_file(features_file):
+        binary_features = FeatureFile(features_file)
+        offsets = binary_features.sentence_offsets.tolist()
+        if binary_features.is_sparse():
+            features = binary_features.matrix()
+            if len(feature_names) != features.shape[1]:
+                feature_names = [u'f{}'.format(col) for col in range(features.shape[1])]
+        else:
+            features = binary_features.blocks()
+            if len(feature_names) == 0:
+                feature_names = binary_features.feature_names
+    else:
+        features, lengths, _, _ = load_text_features(features_file, workers=workers, dtype=np.float64)
+        offsets = np.cumsum([0] + lengths).tolist()
+    if data_type == 'plain':
+        return features, feature_names
+    return [features[start:end] for start, end in zip(offsets[:-1], offsets[1:])], feature_names
+
+
+# add the bigram features (a feature + the tag, see add_bigram_features) to the features of a dataset
+# FeatureBlocks are converted to lists of rows, the binarized (sparse) features can't get the bigram features
+def add_bigrams(features, tags, data_type):
+    if sparse.issparse(features) or is_sparse_sequences(features):
+        raise ValueError("The bigram features can't be added to binarized features, use the features before binarization")
+    if data_type == 'plain':
+        return add_bigram_features(features.rows() if isinstance(features, FeatureBlocks) else features, tags)
+    # every sentence gets its own tags
+    return [add_bigram_features(seq.rows() if isinstance(seq, FeatureBlocks) else seq, tag_seq) for seq, tag_seq in zip(features, tags)]
 
 
 # load labels (one line per sentence, OK/BAD)
@@ -72,12 +97,15 @@ def main(config):
     tmp_dir = mk_tmp_dir(tmp_dir)
     time_stamp = str(time.time())
 
+    # the data_type is the format corresponding to the model of the data that the user wishes to learn
+    data_type = config['data_type'] if 'data_type' in config else 'plain'
+
     #----------------------Feature extraction from file------------------
     if 'pre-extracted' in config:
-        train_features, feature_names = load_features(config['pre-extracted']['train-features'], config['pre-extracted']['feature-names'])
-        test_features, _ = load_features(config['pre-extracted']['test-features'])
-        train_tags = load_tags(config['pre-extracted']['train-tags']
-        test_tags = load_tags(config['pre-extracted']['test-tags']
+        train_features, feature_names = load_features(config['pre-extracted']['train-features'], config['pre-extracted']['feature-names'], data_type=data_type, workers=workers)
+        test_features, _ = load_features(config['pre-extracted']['test-features'], data_type=data_type, workers=workers)
+        train_tags = load_tags(config['pre-extracted']['train-tags'], data_type)
+        test_tags = load_tags(config['pre-extracted']['test-tags'], data_type)
 
     #--------------REPRESENTATION GENERATION---------------------
     else:
@@ -101,19 +129,18 @@ def main(config):
         logger.info("Train data sequences: {}".format(len(train_data['target'])))
         logger.info("Sample sequence: {}".format([w.encode('utf-8') for w in train_data['target'][0]]))
 
-        # the data_type is the format corresponding to the model of the data that the user wishes to learn
-        data_type = config['data_type'] if 'data_type' in config else 'plain'
-
-        test_contexts = create_contexts(test_data, data_type=data_type)
-        train_contexts = create_contexts(train_data, data_type=data_type)
+        # the extractors are created before the contexts: the fields they read as ids are interned in the stores
+        logger.info('creating feature extractors...')
+        feature_extractors = build_objects(config['feature_extractors'])
+        vocabularies = corpus_vocabularies(feature_extractors)
+        test_contexts = create_contexts(test_data, data_type=data_type, vocabularies=vocabularies)
+        train_contexts = create_contexts(train_data, data_type=data_type, vocabularies=vocabularies)
 
         #------------------------FEATURE EXTRACTION--------------------------
         train_tags = call_for_each_element(train_contexts, tags_from_contexts, data_type=data_type)
         test_tags = call_for_each_element(test_contexts, tags_from_contexts, data_type=data_type)
 
         # create features
-        logger.info('creating feature extractors...')
-        feature_extractors = build_objects(config['feature_extractors'])
         logger.info('mapping the feature extractors over the contexts for test...')
         test_features = call_for_each_element(test_contexts, contexts_to_features, [feature_extractors, workers], data_type=data_type)
         logger.info('mapping the feature extractors over the contexts for train...')
@@ -122,8 +149,10 @@ def main(config):
         feature_names = [f for extractor in feature_extractors for f in extractor.get_feature_names()]
 
     if 'bigram_features' in config and config['bigram_features']:
-        train_features = call_for_each_element(train_features, add_bigram_features, [train_tags], data_type=data_type)
-        train_features = call_for_each_element(train_features, add_bigram_features, [train_tags], data_type=data_type)
+        train_features = add_bigrams(train_features, train_tags, data_type)
+        test_features = add_bigrams(test_features, test_tags, data_type)
+        # every feature gets a bigram version
+        feature_names = feature_names + [name + u'_bigram' for name in feature_names]
 
     # create binary features for training
     logger.info('number of training instances: {}'.format(len(train_features)))
@@ -11,7 +11,10 @@ from marmot.experiment.preprocessing_utils import *
 from marmot.experiment.learning_utils import map_classifiers, predict_all
 from marmot.evaluation.evaluation_metrics import weighted_fmeasure, sequence_correlation, sequence_correlation_weighted
 from marmot.evaluation.evaluation_utils import compare_vocabulary
-from marmot.util.persist_features import persist_features
+from marmot.util.feature_cache import FeatureCache
+from marmot.util.representation_cache import RepresentationCache, generate_representation
+from marmot.util.feature_blocks import FeatureBlocks
+from marmot.util.persist_features import persist_features, persist_features_stream
 from marmot.evaluation.evaluation_utils import write_res_to_file
 from marmot.experiment.preprocessing_utils_old import multiply_data, multiply_data_ngrams, multiply_data_all, multiply_data_base
 
@@ -65,9 +68,11 @@ def main(config):
         representation_generators = build_objects(config['representations'])
     else:
         representation_generators = []
+    # outputs of the generators stored in the previous runs are reused
+    representation_cache = RepresentationCache(config['representation_cache_dir']) if 'representation_cache_dir' in config else None
     for r in representation_generators:
-        train_data = r.generate(train_data)
-        test_data = r.generate(test_data)
+        train_data = generate_representation(r, train_data, cache=representation_cache)
+        test_data = generate_representation(r, test_data, cache=representation_cache)
 
     borders = config['borders'] if 'borders' in config else False
 
@@ -107,9 +112,38 @@ def main(config):
 #    data_type = config['contexts'] if 'contexts' in config else 'plain'
     data_type = config['data_type'] if 'data_type' in config else 'sequential'
 
-    test_contexts = create_contexts(test_data, data_type=data_type)
+    # streaming mode: the features are extracted and persisted for <chunk_size> sentences at a time
+    # the learning stage needs all features in memory, so streaming is only possible when the features are persisted
+    streaming = config['features']['streaming'] if 'streaming' in config['features'] else False
+    if streaming and (config['features']['binarize'] is True or not config['features']['persist']):
+        logger.warning('Streaming mode needs persisted non-binarized features, it is switched off')
+        streaming = False
+    if streaming:
+        chunk_size = config['features']['chunk_size'] if 'chunk_size' in config['features'] else 1000
+        logger.info('Streaming mode, chunk size: {} sentences'.format(chunk_size))
+        feature_extractors = build_objects(config['feature_extractors'])
+        profile_file = config['features']['profile_file'] if 'profile_file' in config['features'] else None
+        # features extracted in the previous runs are reused
+        feature_cache = FeatureCache(config['features']['cache_dir']) if 'cache_dir' in config['features'] else None
+        feature_names = [f for extractor in feature_extractors for f in extractor.get_feature_names()]
+        vocabularies = corpus_vocabularies(feature_extractors)
+        persist_format = config['features']['persist_format'] if 'persist_format' in config['features'] else 'crf++'
+        persist_dir = config['persist_dir'] if 'persist_dir' in config and config['persist_dir'] else os.getcwd()
+        logger.info('persisting your features to: {}'.format(persist_dir))
+        for dataset_name, dataset in [('test', test_data), ('train', train_data)]:
+            feature_chunks = stream_features(dataset, feature_extractors, chunk_size=chunk_size, workers=workers, feature_cache=feature_cache,
+                                             vocabularies=vocabularies)
+            persist_features_stream(dataset_name, feature_chunks, persist_dir, feature_names=feature_names, file_format=persist_format)
+        finish_feature_extraction(feature_cache=feature_cache, profile_file=profile_file)
+        sys.exit()
+
+    # the extractors are created before the contexts: the fields they read as ids are interned in the stores
+    logger.info('creating feature extractors...')
+    feature_extractors = build_objects(config['feature_extractors'])
+    vocabularies = corpus_vocabularies(feature_extractors)
+    test_contexts = create_contexts(test_data, data_type=data_type, vocabularies=vocabularies)
     test_contexts_seq = create_contexts(test_data, data_type='sequential')
-    train_contexts = create_contexts(train_data, data_type=data_type)
+    train_contexts = create_contexts(train_data, data_type=data_type, vocabularies=vocabularies)
 
     logger.info('Vocabulary comparison -- coverage for each dataset: ')
     logger.info(compare_vocabulary([train_data['target'], test_data['target']]))
@@ -121,16 +155,21 @@ def main(config):
     test_tags = call_for_each_element(test_contexts, tags_from_contexts, data_type=data_type)
     test_tags_seq = call_for_each_element(test_contexts_seq, tags_from_contexts, data_type='sequential')
 
-    logger.info('creating feature extractors...')
-    feature_extractors = build_objects(config['feature_extractors'])
+    profile_file = config['features']['profile_file'] if 'profile_file' in config['features'] else None
+    # features extracted in the previous runs are reused
+    feature_cache = FeatureCache(config['features']['cache_dir']) if 'cache_dir' in config['features'] else None
+    # features which will be binarized are extracted as blocks: the numeric features are kept in float32 matrices
+    extract = contexts_to_feature_blocks if config['features']['binarize'] is True else contexts_to_features
     logger.info('mapping the feature extractors over the contexts for test...')
-    test_features = call_for_each_element(test_contexts, contexts_to_features, [feature_extractors, workers], data_type=data_type)
+    test_features = call_for_each_element(test_contexts, extract, [feature_extractors, workers, feature_cache], data_type=data_type)
     logger.info('mapping the feature extractors over the contexts for train...')
-    train_features = call_for_each_element(train_contexts, contexts_to_features, [feature_extractors, workers], data_type=data_type)
+    train_features = call_for_each_element(train_contexts, extract, [feature_extractors, workers, feature_cache], data_type=data_type)
+    # the worker processes are shared by all datasets
+    finish_feature_extraction(feature_cache=feature_cache, profile_file=profile_file)
 
     logger.info('number of training instances: {}'.format(len(train_features)))
     logger.info('number of testing instances: {}'.format(len(test_features)))
-    logger.info('train features sample: {}'.format(train_features[:5]))
+    logger.info('train features sample: {}'.format([train_features[i] for i in range(min(5, len(train_features)))]))
     logger.info('train tags sample: {}'.format(train_tags[:5]))
 
     logger.info('All of your features now exist in their raw representation, but they may not be numbers yet')
@@ -143,22 +182,21 @@ def main(config):
         logger.info('Binarizing your features...')
         all_values = []
         if data_type == 'sequential':
-            all_values = flatten(train_features)
+            all_values = FeatureBlocks.vstack(train_features)
         elif data_type == 'plain':
             all_values = train_features
         elif data_type == 'token':
-            all_values = flatten(train_features.values())
+            all_values = FeatureBlocks.vstack(train_features.values())
 
         feature_names = [f for extractor in feature_extractors for f in extractor.get_feature_names()]
         features_num = len(feature_names)
         true_features_num = len(all_values[0])
 
         logger.info('fitting binarizers...')
-        binarizers = fit_binarizers(all_values)
+        binarizers = build_encoder(config['features'], feature_names, all_values)
         logger.info('binarizing test data...')
         test_features = call_for_each_element(test_features, binarize, [binarizers], data_type=data_type)
         logger.info('binarizing training data...')
-        # TODO: this line hangs with alignment+w2v
         train_features = call_for_each_element(train_features, binarize, [binarizers], data_type=data_type)
 
         logger.info('All of your features are now scalars in numpy arrays')
@@ -190,6 +228,7 @@ def main(config):
     # TODO: create a consistent interface to sequence learners, will need to use *args and **kwargs because APIs are very different
     from sklearn.metrics import f1_score, precision_score, recall_score
     import numpy as np
+    from scipy import sparse
     tag_map = {u'OK': 1, u'BAD': 0, 0: 0, 1: 1}
     if data_type == 'sequential':
         logger.info('training sequential model...')
@@ -197,9 +236,10 @@ def main(config):
         train_tags = [[tag_map[tag] for tag in seq] for seq in train_tags]
         test_tags = [[tag_map[tag] for tag in seq] for seq in test_tags]
 
-        x_train = np.array([np.array(xi) for xi in train_features])
+        # dense arrays: pystruct doesn't accept the sparse matrices of the binarized features
+        x_train = np.array([xi.toarray() if sparse.issparse(xi) else np.array(xi) for xi in train_features])
         y_train = np.array([np.array(xi) for xi in train_tags])
-        x_test = np.array([numpy.array(xi) for xi in test_features])
+        x_test = np.array([xi.toarray() if sparse.issparse(xi) else np.array(xi) for xi in test_features])
         y_test = np.array([numpy.array(xi) for xi in test_tags])
 
         # pystruct
@@ -252,8 +292,13 @@ def main(config):
         print(sequence_correlation_weighted(y_test, structured_hyp, verbose=True)[1])
 
     else:
-        train_tags = [tag_map[tag] for tag in train_tags]
-        test_tags = [tag_map[tag] for tag in test_tags]
+        if data_type == 'token':
+            train_tags = {token: [tag_map[tag] for tag in tags] for token, tags in train_tags.items()}
+            # predictions for the token contexts are returned in the corpus order
+            test_tags = [tag_map[tag] for tag in flatten(test_tags_seq)]
+        else:
+            train_tags = [tag_map[tag] for tag in train_tags]
+            test_tags = [tag_map[tag] for tag in test_tags]
 
        # data_type is 'token' or 'plain'
         logger.info('start training...')
@@ -261,7 +306,7 @@ def main(config):
         # train the classifier(s)
         classifier_map = map_classifiers(train_features, train_tags, classifier_type, data_type=data_type)
         logger.info('classifying the test instances')
-        test_predictions = predict_all(test_features, classifier_map, data_type=data_type)
+        test_predictions = predict_all(test_features, classifier_map, data_type=data_type, token_index=test_contexts if data_type == 'token' else None)
 #        assert(len(test_predictions) == len(flatten(test_tags_seq))), "long predictions: {}, sequential: {}".format(len(test_predictions), len(flatten(test_tags_seq)))
         cnt = 0
         test_predictions_seq = []
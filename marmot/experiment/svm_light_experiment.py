@@ -7,11 +7,16 @@ import sys
 import os
 from subprocess import call
 from sklearn.metrics import f1_score
+from scipy import sparse
 
 from marmot.experiment.import_utils import call_for_each_element, build_object, build_objects, mk_tmp_dir
-from marmot.experiment.preprocessing_utils import create_contexts, tags_from_contexts, contexts_to_features, fit_binarizers, binarize, flatten
+from marmot.experiment.preprocessing_utils import create_contexts, corpus_vocabularies, tags_from_contexts, contexts_to_features, build_encoder, binarize, flatten, stream_features, finish_feature_extraction
 from marmot.evaluation.evaluation_utils import compare_vocabulary
-from marmot.util.persist_features import persist_features
+from marmot.util.feature_cache import FeatureCache
+from marmot.util.representation_cache import RepresentationCache, generate_representation
+from marmot.util.persist_features import persist_features, persist_features_stream
+from marmot.experiment.converter import crfsuite_to_svmlight
+from marmot.util.feature_index import FeatureIndex, write_svm_file
 from marmot.util.generate_crf_template import generate_crf_template
 
 logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
@@ -30,42 +35,33 @@ def feat_to_string(a_feat):
 
 
 # data type - plain
+# binary feature = <feature_name>_<feature_value>_<label>
 def binarize_features(train_features, feature_names, train_tags):
-    binary_features = set()
+    binary_features = FeatureIndex()
     for features, a_tag in zip(train_features, train_tags):
         for a_feat, a_name in zip(features, feature_names):
-            new_feature = "{}_{}_{}".format(a_name, feat_to_string(a_feat), a_tag)
-            binary_features.add(new_feature)
-    return list(binary_features)
+            binary_features.add("{}_{}_{}".format(a_name, feat_to_string(a_feat), a_tag))
+    return binary_features
 
 
 # data type - plain
 # no tag in the feature
 def binarize_features_blind(train_features, feature_names):
-    binary_features = set()
+    binary_features = FeatureIndex()
     for features in train_features:
         for a_feat, a_name in zip(features, feature_names):
-            new_feature = "{}_{}".format(a_name, feat_to_string(a_feat))
-            binary_features.add(new_feature)
-    return list(binary_features)
+            binary_features.add("{}_{}".format(a_name, feat_to_string(a_feat)))
+    return binary_features
 
 
 # features, tags -- dataset to binarize
 # feature_names -- feature names for this dataset
-# binary_features -- list of binary feature names
-# output -- list of binary feature names which light for this object
+# binary_features -- FeatureIndex of the binary features (see binarize_features)
+# output -- sorted numbers of the binary features which light for this object (unknown features are skipped)
 def get_binary_features(test_features, feature_names, test_tags, binary_features):
     new_test_features = []
     for features, a_tag in zip(test_features, test_tags):
-        cur_features = []
-        for a_feat, a_name in zip(features, feature_names):
-            try:
-                cur_features.append(binary_features.index('{}_{}_{}'.format(a_name, feat_to_string(a_feat), a_tag)) + 1)
-            except ValueError:  # no such feature, skipping
-                pass
-        cur_features.sort()
-        # print("Features: ", cur_features)
-        new_test_features.append(cur_features)
+        new_test_features.append(binary_features.ids(['{}_{}_{}'.format(a_name, feat_to_string(a_feat), a_tag) for a_feat, a_name in zip(features, feature_names)]))
     return new_test_features
 
 
@@ -73,15 +69,7 @@ def get_binary_features(test_features, feature_names, test_tags, binary_features
 def get_binary_features_blind(test_features, feature_names, binary_features):
     new_test_features = []
     for features in test_features:
-        cur_features = []
-        for a_feat, a_name in zip(features, feature_names):
-            try:
-                cur_features.append(binary_features.index('{}_{}'.format(a_name, feat_to_string(a_feat))) + 1)
-            except ValueError:  # no such feature, skipping
-                pass
-        cur_features.sort()
-        # print("Features: ", cur_features)
-        new_test_features.append(cur_features)
+        new_test_features.append(binary_features.ids(['{}_{}'.format(a_name, feat_to_string(a_feat)) for a_feat, a_name in zip(features, feature_names)]))
     return new_test_features
 
 
@@ -92,19 +80,9 @@ def get_binary_features_test(test_features, feature_names, test_tags, binary_fea
     new_test_features_inverse = []
     opposite = {'OK': 'BAD', 'BAD': 'OK'}
     for features, a_tag in zip(test_features, test_tags):
-        cur_features_dir = []
-        cur_features_inv = []
-        for a_feat, a_name in zip(features, feature_names):
-            try:
-                cur_features_dir.append(binary_features.index('{}_{}_{}'.format(a_name, feat_to_string(a_feat), a_tag)) + 1)
-                cur_features_inv.append(binary_features.index('{}_{}_{}'.format(a_name, feat_to_string(a_feat), opposite[a_tag])) + 1)
-            except ValueError:  # no such feature, skipping
-                pass
-        cur_features_dir.sort()
-        cur_features_inv.sort()
-        # print("Features: ", cur_features)
-        new_test_features.append(cur_features_dir)
-        new_test_features_inverse.append(cur_features_inv)
+        values = [(a_name, feat_to_string(a_feat)) for a_feat, a_name in zip(features, feature_names)]
+        new_test_features.append(binary_features.ids(['{}_{}_{}'.format(a_name, a_value, a_tag) for a_name, a_value in values]))
+        new_test_features_inverse.append(binary_features.ids(['{}_{}_{}'.format(a_name, a_value, opposite[a_tag]) for a_name, a_value in values]))
     return new_test_features, new_test_features_inverse
 
 
@@ -141,45 +119,18 @@ def get_test_score_blind(test_file):
 def persist_to_svm(train_features, test_features, feature_names, train_tags, test_tags, persist_dir):
     # binarize
     logger.info("Binarize features")
-    binary_features = binarize_features_blind(train_features, feature_names, train_tags)
+    binary_features = binarize_features(train_features, feature_names, train_tags)
+    tags_map = {'OK': '+1', 'BAD': '-1'}
     logger.info("Get binary representation for test")
     new_test_features = get_binary_features(test_features, feature_names, test_tags, binary_features)
-    test_file_name = os.path.join(persist_dir, 'test_binary.svm')
-    test_file = open(test_file_name, 'w')
-    tags_map = {'OK': '+1', 'BAD': '-1'}
-    for feat, a_tag in zip(new_test_features, test_tags):
-        #print("Features: ", feat)
-        #print("Tag: ", a_tag)
-        test_file.write('%s %s\n' % (tags_map[a_tag], ' '.join([str(f) + ':1.0' for f in feat])))
+    test_file_name = write_svm_file(os.path.join(persist_dir, 'test_binary.svm'), [tags_map[t] for t in test_tags], new_test_features)
 
     logger.info("Get binary representation for training")
     new_train_features = get_binary_features(train_features, feature_names, train_tags, binary_features)
 
     # persist
     logger.info("Export training and test")
-    train_file_name = os.path.join(persist_dir, 'train_binary.svm')
-    #test_file_name = os.path.join(persist_dir, 'test_binary.svm')
-    train_file = open(train_file_name, 'w')
-    #test_file = open(test_file_name, 'w')
-    #tags_map = {'OK': '+1', 'BAD': '-1'}
-    for feat, a_tag in zip(new_train_features, train_tags):
-#        print("Features: ", feat)
-#        print("Tag: ", a_tag)
-        train_file.write('%s %s\n' % (tags_map[a_tag], ' '.join([str(f) + ':1.0' for f in feat])))
-    #for feat, a_tag in zip(new_test_features, test_tags):
-    #    test_file.write('%s %s\n' % (tags_map[a_tag], ' '.join([str(f) + ':1.0' for f in feat])))
-    train_file.close()
-    test_file.close()
-    # persist unbinarized
-#    logger.info("Export non-binary versions for control")
-#    train_control = open(os.path.join(persist_dir, 'train_control.svm'), 'w')
-#    test_control = open(os.path.join(persist_dir, 'test_control.svm'), 'w')
-#    for feat, a_tag in zip(train_features, train_tags):
-#        train_control.write("%s %s\n" % (a_tag, ' '.join([str(f_name) + ':' + feat_to_string(f) for f_name, f in zip(feature_names, feat)])))
-#    for feat, a_tag in zip(test_features, test_tags):
-#        test_control.write("%s %s\n" % (a_tag, ' '.join([str(f_name) + ':' + feat_to_string(f) for f_name, f in zip(feature_names, feat)])))
-#    train_control.close()
-#    test_control.close()
+    train_file_name = write_svm_file(os.path.join(persist_dir, 'train_binary.svm'), [tags_map[t] for t in train_tags], new_train_features)
     return train_file_name, test_file_name
 
 
@@ -191,31 +142,17 @@ def persist_to_svm_dbl(train_features, test_features, feature_names, train_tags,
     logger.info("Get binary representation for test")
     new_test_features_dir, new_test_features_inv = get_binary_features_test(test_features, feature_names, test_tags, binary_features)
 
-    test_file_name = os.path.join(persist_dir, 'test_binary_dir.svm')
-    test_file = open(test_file_name, 'w')
     tags_map = {'OK': '+1', 'BAD': '-1'}
-    for feat, a_tag in zip(new_test_features_dir, test_tags):
-        test_file.write('%s %s\n' % (tags_map[a_tag], ' '.join([str(f) + ':1.0' for f in feat])))
-
-    inv_test_file_name = os.path.join(persist_dir, 'test_binary_inv.svm')
-    inv_test_file = open(inv_test_file_name, 'w')
+    test_file_name = write_svm_file(os.path.join(persist_dir, 'test_binary_dir.svm'), [tags_map[t] for t in test_tags], new_test_features_dir)
     tags_map_inv = {'OK': '-1', 'BAD': '+1'}
-    for feat, a_tag in zip(new_test_features_inv, test_tags):
-        inv_test_file.write('%s %s\n' % (tags_map_inv[a_tag], ' '.join([str(f) + ':1.0' for f in feat])))
+    inv_test_file_name = write_svm_file(os.path.join(persist_dir, 'test_binary_inv.svm'), [tags_map_inv[t] for t in test_tags], new_test_features_inv)
 
     logger.info("Get binary representation for training")
     new_train_features = get_binary_features(train_features, feature_names, train_tags, binary_features)
 
     # persist
     logger.info("Export training and test")
-    train_file_name = os.path.join(persist_dir, 'train_binary.svm')
-    #test_file_name = os.path.join(persist_dir, 'test_binary.svm')
-    train_file = open(train_file_name, 'w')
-    for feat, a_tag in zip(new_train_features, train_tags):
-        train_file.write('%s %s\n' % (tags_map[a_tag], ' '.join([str(f) + ':1.0' for f in feat])))
-    train_file.close()
-    test_file.close()
-    inv_test_file.close()
+    train_file_name = write_svm_file(os.path.join(persist_dir, 'train_binary.svm'), [tags_map[t] for t in train_tags], new_train_features)
     return train_file_name, test_file_name, inv_test_file_name
 
 
@@ -227,27 +164,28 @@ def persist_to_svm_blind(train_features, test_features, train_tags, test_tags, f
     logger.info("Get binary representation for test")
     new_test_features = get_binary_features_blind(test_features, feature_names, binary_features)
 
-    test_file_name = os.path.join(persist_dir, 'test_binary.svm')
-    test_file = open(test_file_name, 'w')
     tags_map = {'OK': '+1', 'BAD': '-1'}
-    for feat, a_tag in zip(new_test_features, test_tags):
-        test_file.write('%s %s\n' % (tags_map[a_tag], ' '.join([str(f) + ':1.0' for f in feat])))
+    test_file_name = write_svm_file(os.path.join(persist_dir, 'test_binary.svm'), [tags_map[t] for t in test_tags], new_test_features)
 
     logger.info("Get binary representation for training")
     new_train_features = get_binary_features_blind(train_features, feature_names, binary_features)
 
     # persist
     logger.info("Export training and test")
-    train_file_name = os.path.join(persist_dir, 'train_binary.svm')
-    #test_file_name = os.path.join(persist_dir, 'test_binary.svm')
-    train_file = open(train_file_name, 'w')
-    for feat, a_tag in zip(new_train_features, train_tags):
-        train_file.write('%s %s\n' % (tags_map[a_tag], ' '.join([str(f) + ':1.0' for f in feat])))
-    train_file.close()
-    test_file.close()
+    train_file_name = write_svm_file(os.path.join(persist_dir, 'train_binary.svm'), [tags_map[t] for t in train_tags], new_train_features)
     return train_file_name, test_file_name
 
 
+# binarized features of any datatype as one sparse matrix with a row per object and the list of their tags
+def stack_binarized(features, tags, data_type):
+    if data_type == 'sequential':
+        return sparse.vstack(features, format='csr'), flatten(tags)
+    elif data_type == 'token':
+        tokens = list(features)
+        return sparse.vstack([features[token] for token in tokens], format='csr'), [tag for token in tokens for tag in tags[token]]
+    return features, tags
+
+
 def main(config):
     workers = config['workers']
     tmp_dir = config['tmp_dir']
@@ -281,12 +219,14 @@ def main(config):
         representation_generators = build_objects(config['representations'])
     else:
         representation_generators = []
+    # outputs of the generators stored in the previous runs are reused
+    representation_cache = RepresentationCache(config['representation_cache_dir']) if 'representation_cache_dir' in config else None
     for r in representation_generators:
-        train_data = r.generate(train_data)
+        train_data = generate_representation(r, train_data, cache=representation_cache)
         if test:
-            test_data = r.generate(test_data)
+            test_data = generate_representation(r, test_data, cache=representation_cache)
         if dev:
-            dev_data = r.generate(dev_data)
+            dev_data = generate_representation(r, dev_data, cache=representation_cache)
 
     logger.info("Simple representations: {}".format(len(train_data['target'])))
     logger.info('here are the keys in your representations: {}'.format(train_data.keys()))
@@ -296,86 +236,123 @@ def main(config):
     print("DATA TYPE:", data_type)
 #    sys.exit()
 
-    train_contexts = create_contexts(train_data, data_type=data_type)
-    if test:
-        test_contexts = create_contexts(test_data, data_type=data_type)
-    if dev:
-        dev_contexts = create_contexts(dev_data, data_type=data_type)
-
-    logger.info('Vocabulary comparison -- coverage for each dataset: ')
-    logger.info(compare_vocabulary([train_data['target'], test_data['target']]))
-
-    # END REPRESENTATION GENERATION
-
-    # FEATURE EXTRACTION
-    train_tags = call_for_each_element(train_contexts, tags_from_contexts, data_type=data_type)
-    if test:
-        test_tags = call_for_each_element(test_contexts, tags_from_contexts, data_type=data_type)
-    if dev:
-        dev_tags = call_for_each_element(dev_contexts, tags_from_contexts, data_type=data_type)
-
-    logger.info('creating feature extractors...')
-    feature_extractors = build_objects(config['feature_extractors'])
-    if test:
-        logger.info('mapping the feature extractors over the contexts for test...')
-        test_features = call_for_each_element(test_contexts, contexts_to_features, [feature_extractors, workers], data_type=data_type)
-        print("Test features sample: ", test_features[0])
-    if dev:
-        logger.info('mapping the feature extractors over the contexts for dev...')
-        dev_features = call_for_each_element(dev_contexts, contexts_to_features, [feature_extractors, workers], data_type=data_type)
-    logger.info('mapping the feature extractors over the contexts for train...')
-    train_features = call_for_each_element(train_contexts, contexts_to_features, [feature_extractors, 1], data_type=data_type)
-    print("Train features sample: ", train_features[0])
-
-    logger.info('number of training instances: {}'.format(len(train_features)))
-    logger.info('number of testing instances: {}'.format(len(test_features)))
-
-    logger.info('All of your features now exist in their raw representation, but they may not be numbers yet')
-    # END FEATURE EXTRACTION
-
-    # binarizing features
-    logger.info('binarization flag: {}'.format(config['features']['binarize']))
-    # flatten so that we can properly binarize the features
-    if config['features']['binarize'] is True:
-        logger.info('Binarizing your features...')
-        all_values = []
-        if data_type == 'sequential':
-            all_values = flatten(train_features)
-        elif data_type == 'plain':
-            all_values = train_features
-        elif data_type == 'token':
-            all_values = flatten(train_features.values())
-
+    # streaming mode: the raw features are persisted chunk by chunk in CRFSuite format
+    # and converted to binary svm_light features with a streaming converter
+    streaming = config['features']['streaming'] if 'streaming' in config['features'] else False
+    if streaming and test:
+        chunk_size = config['features']['chunk_size'] if 'chunk_size' in config['features'] else 1000
+        logger.info('Streaming mode, chunk size: {} sentences'.format(chunk_size))
+        feature_extractors = build_objects(config['feature_extractors'])
+        profile_file = config['features']['profile_file'] if 'profile_file' in config['features'] else None
+        # features extracted in the previous runs are reused
+        feature_cache = FeatureCache(config['features']['cache_dir']) if 'cache_dir' in config['features'] else None
         feature_names = [f for extractor in feature_extractors for f in extractor.get_feature_names()]
-        features_num = len(feature_names)
-        true_features_num = len(all_values[0])
-
-        logger.info('fitting binarizers...')
-        binarizers = fit_binarizers(all_values)
-        logger.info('binarizing test data...')
-        test_features = call_for_each_element(test_features, binarize, [binarizers], data_type=data_type)
-        logger.info('binarizing training data...')
-        # TODO: this line hangs with alignment+w2v
-        train_features = call_for_each_element(train_features, binarize, [binarizers], data_type=data_type)
-
-        logger.info('All of your features are now scalars in numpy arrays')
+        vocabularies = corpus_vocabularies(feature_extractors)
+        persist_dir = config['persist_dir'] if 'persist_dir' in config else config['features']['persist_dir']
+        persist_dir = mk_tmp_dir(persist_dir)
+        raw_files = {}
+        for dataset_name, dataset in [('train', train_data), ('test', test_data)]:
+            feature_chunks = stream_features(dataset, feature_extractors, chunk_size=chunk_size, workers=workers, feature_cache=feature_cache,
+                                             vocabularies=vocabularies)
+            raw_files[dataset_name] = persist_features_stream(dataset_name, feature_chunks, persist_dir, feature_names=feature_names, file_format='crf_suite')
+        finish_feature_extraction(feature_cache=feature_cache, profile_file=profile_file)
+        train_file_name, _, binarized_features = crfsuite_to_svmlight(raw_files['train'], persist_dir, 'train', stamp='stream', workers=workers)
+        test_file_name, test_tags, _ = crfsuite_to_svmlight(raw_files['test'], persist_dir, 'test', binarized_features=binarized_features, stamp='stream', workers=workers)
+    # in-memory mode
+    else:
+        # the extractors are created before the contexts: the fields they read as ids are interned in the stores
+        logger.info('creating feature extractors...')
+        feature_extractors = build_objects(config['feature_extractors'])
+        vocabularies = corpus_vocabularies(feature_extractors)
+        train_contexts = create_contexts(train_data, data_type=data_type, vocabularies=vocabularies)
+        if test:
+            test_contexts = create_contexts(test_data, data_type=data_type, vocabularies=vocabularies)
+        if dev:
+            dev_contexts = create_contexts(dev_data, data_type=data_type, vocabularies=vocabularies)
+
+        logger.info('Vocabulary comparison -- coverage for each dataset: ')
+        logger.info(compare_vocabulary([train_data['target'], test_data['target']]))
+
+        # END REPRESENTATION GENERATION
+
+        # FEATURE EXTRACTION
+        train_tags = call_for_each_element(train_contexts, tags_from_contexts, data_type=data_type)
+        if test:
+            test_tags = call_for_each_element(test_contexts, tags_from_contexts, data_type=data_type)
+        if dev:
+            dev_tags = call_for_each_element(dev_contexts, tags_from_contexts, data_type=data_type)
+
+        profile_file = config['features']['profile_file'] if 'profile_file' in config['features'] else None
+        # features extracted in the previous runs are reused
+        feature_cache = FeatureCache(config['features']['cache_dir']) if 'cache_dir' in config['features'] else None
+        if test:
+            logger.info('mapping the feature extractors over the contexts for test...')
+            test_features = call_for_each_element(test_contexts, contexts_to_features, [feature_extractors, workers, feature_cache], data_type=data_type)
+            print("Test features sample: ", test_features[0])
+        if dev:
+            logger.info('mapping the feature extractors over the contexts for dev...')
+            dev_features = call_for_each_element(dev_contexts, contexts_to_features, [feature_extractors, workers, feature_cache], data_type=data_type)
+        logger.info('mapping the feature extractors over the contexts for train...')
+        train_features = call_for_each_element(train_contexts, contexts_to_features, [feature_extractors, workers, feature_cache], data_type=data_type)
+        # the worker processes are shared by all datasets
+        finish_feature_extraction(feature_cache=feature_cache, profile_file=profile_file)
+        print("Train features sample: ", train_features[0])
+
+        logger.info('number of training instances: {}'.format(len(train_features)))
+        logger.info('number of testing instances: {}'.format(len(test_features)))
+
+        logger.info('All of your features now exist in their raw representation, but they may not be numbers yet')
+        # END FEATURE EXTRACTION
+
+        # binarizing features
+        logger.info('binarization flag: {}'.format(config['features']['binarize']))
+        # flatten so that we can properly binarize the features
+        if config['features']['binarize'] is True:
+            logger.info('Binarizing your features...')
+            all_values = []
+            if data_type == 'sequential':
+                all_values = flatten(train_features)
+            elif data_type == 'plain':
+                all_values = train_features
+            elif data_type == 'token':
+                all_values = flatten(train_features.values())
+
+            feature_names = [f for extractor in feature_extractors for f in extractor.get_feature_names()]
+            features_num = len(feature_names)
+            true_features_num = len(all_values[0])
+
+            logger.info('fitting binarizers...')
+            binarizers = build_encoder(config['features'], feature_names, all_values)
+            logger.info('binarizing test data...')
+            test_features = call_for_each_element(test_features, binarize, [binarizers], data_type=data_type)
+            logger.info('binarizing training data...')
+            train_features = call_for_each_element(train_features, binarize, [binarizers], data_type=data_type)
+
+            logger.info('All of your features are now scalars in numpy arrays')
+            logger.info('training and test sets successfully generated')
+
+        # persisting features
         logger.info('training and test sets successfully generated')
 
-    # persisting features
-    logger.info('training and test sets successfully generated')
-
-#    experiment_datasets = [{'name': 'train', 'features': train_features, 'tags': train_tags}]
-#    if test:
-#        experiment_datasets.append({'name': 'test', 'features': test_features, 'tags': test_tags})
-#    if dev:
-#        experiment_datasets.append({'name': 'dev', 'features': dev_features, 'tags': dev_tags})
-#    feature_names = [f for extractor in feature_extractors for f in extractor.get_feature_names()]
-
-    feature_names = [f for extractor in feature_extractors for f in extractor.get_feature_names()]
-    persist_dir = config['persist_dir'] if 'persist_dir' in config else config['features']['persist_dir']
-    persist_dir = mk_tmp_dir(persist_dir)
-#    train_file_name, test_file_name, inv_test_file_name = persist_to_svm_dbl(train_features, test_features, feature_names, train_tags, test_tags, persist_dir)
-    train_file_name, test_file_name = persist_to_svm_blind(train_features, test_features, train_tags, test_tags, feature_names, persist_dir)
+    #    experiment_datasets = [{'name': 'train', 'features': train_features, 'tags': train_tags}]
+    #    if test:
+    #        experiment_datasets.append({'name': 'test', 'features': test_features, 'tags': test_tags})
+    #    if dev:
+    #        experiment_datasets.append({'name': 'dev', 'features': dev_features, 'tags': dev_tags})
+    #    feature_names = [f for extractor in feature_extractors for f in extractor.get_feature_names()]
+
+        feature_names = [f for extractor in feature_extractors for f in extractor.get_feature_names()]
+        persist_dir = config['persist_dir'] if 'persist_dir' in config else config['features']['persist_dir']
+        persist_dir = mk_tmp_dir(persist_dir)
+    #    train_file_name, test_file_name, inv_test_file_name = persist_to_svm_dbl(train_features, test_features, feature_names, train_tags, test_tags, persist_dir)
+        if config['features']['binarize'] is True:
+            # the binarized features are sparse matrices, they are written to the svm_light files as they are
+            train_features, train_tags = stack_binarized(train_features, train_tags, data_type)
+            test_features, test_tags = stack_binarized(test_features, test_tags, data_type)
+            train_file_name = persist_features('train_binary', train_features, persist_dir, tags=train_tags, file_format='svm_light')
+            test_file_name = persist_features('test_binary', test_features, persist_dir, tags=test_tags, file_format='svm_light')
+        else:
+            train_file_name, test_file_name = persist_to_svm_blind(train_features, test_features, train_tags, test_tags, feature_names, persist_dir)
     model_name = os.path.join(persist_dir, 'model')
     logger.info("Start training")
     kernel = 0  # linear kernel (default)
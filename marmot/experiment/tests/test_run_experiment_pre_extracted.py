@@ -0,0 +1,58 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from scipy import sparse
+
+from marmot.experiment.run_experiment_pre_extracted import load_features, add_bigrams
+from marmot.util.feature_file import write_feature_file
+from marmot.util.persist_features import persist_features
+
+
+class PreExtractedTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.names = [u'token', u'lm']
+        self.sentences = [[[u'the', 1.5], [u'boys', 2.5]], [[u'run', 0.5]]]
+        self.tags = [['OK', 'BAD'], ['OK']]
+        self.crf_file = os.path.join(self.tmp_dir, 'train.crf')
+        with open(self.crf_file, 'w') as a_file:
+            a_file.write('the\t1.5\nboys\t2.5\n\nrun\t0.5\n\n')
+        self.binary_file = os.path.join(self.tmp_dir, 'train.mfeat')
+        write_feature_file(self.binary_file, self.sentences, tags=self.tags, feature_names=self.names)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_bigram_features(self):
+        names_file = os.path.join(self.tmp_dir, 'feature_names')
+        with open(names_file, 'w') as a_file:
+            a_file.write('token\nlm\n')
+        for features_file in [self.crf_file, self.binary_file]:
+            features, names = load_features(features_file, names_file)
+            self.assertEqual(len(features), 2)
+            features = add_bigrams(features, self.tags, 'sequential')
+            self.assertEqual(features[0][1][2:], ['boys_BAD', '2.5_BAD'])
+            output = persist_features('train', features, self.tmp_dir, tags=self.tags, feature_names=names + [n + u'_bigram' for n in names], file_format='crf_suite')
+            self.assertEqual(open(output).readline(), 'OK\ttoken=the\tlm=1.5\ttoken_bigram=the_OK\tlm_bigram=1.5_OK\n')
+        # plain data
+        features, names = load_features(self.binary_file, data_type='plain')
+        self.assertEqual(names, self.names)
+        self.assertEqual(len(add_bigrams(features, ['OK', 'BAD', 'OK'], 'plain')[2]), 4)
+
+    def test_binarized(self):
+        sentences = [sparse.csr_matrix(np.array([[0, 1.5, 0], [2, 0, 0]], dtype=np.float32)), sparse.csr_matrix(np.array([[0, 0, 3]], dtype=np.float32))]
+        write_feature_file(self.binary_file, sentences, tags=self.tags)
+        features, names = load_features(self.binary_file)
+        self.assertEqual([s.toarray().tolist() for s in features], [[[0, 1.5, 0], [2, 0, 0]], [[0, 0, 3]]])
+        self.assertEqual(names, [u'f0', u'f1', u'f2'])
+        self.assertRaises(ValueError, add_bigrams, features, self.tags, 'sequential')
+
+
+if __name__ == '__main__':
+    unittest.main()
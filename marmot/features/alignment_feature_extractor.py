@@ -68,5 +68,39 @@ class AlignmentFeatureExtractor(FeatureExtractor):
         aligned_to = context_obj['source'][align_idx]
         return [aligned_to, left, right]
 
+    # the same features for several tokens of a sentence: the fields are checked and the source is padded once
+    def get_features_batch(self, sentence_contexts):
+        if len(sentence_contexts) == 0:
+            return []
+        context_obj = sentence_contexts[0]
+        if 'source' not in context_obj or context_obj['source'] is None:
+            raise NoDataError('source', context_obj, 'AlignmentFeatureExtractor')
+        if 'target' not in context_obj or context_obj['target'] is None:
+            raise NoDataError('target', context_obj, 'AlignmentFeatureExtractor')
+        if 'alignments' not in context_obj:
+            raise NoDataError('alignments', context_obj, 'AlignmentFeatureExtractor')
+
+        alignments = context_obj['alignments']
+        source = context_obj['source']
+        padded = ['<s>' for i in range(self.context_size)] + list(source) + ['</s>' for i in range(self.context_size)]
+        unaligned = ['__unaligned__', '|'.join(['__unaligned__' for i in range(self.context_size)]), '|'.join(['__unaligned__' for i in range(self.context_size)])]
+        features = []
+        for context_obj in sentence_contexts:
+            try:
+                align_idx = alignments[context_obj['index']]
+            except IndexError:
+                print("{} items in the alignment, needed {}-th".format(len(alignments), context_obj['index']))
+                print(alignments, context_obj['target'], source)
+                sys.exit()
+            if align_idx is None:
+                features.append(list(unaligned))
+                continue
+            # position of the aligned word in the padded source
+            pos = align_idx + self.context_size
+            left = '|'.join(padded[pos - self.context_size:pos])
+            right = '|'.join(padded[pos + 1:pos + self.context_size + 1])
+            features.append([source[align_idx], left, right])
+        return features
+
     def get_feature_names(self):
         return ['aligned_token', 'src_left_context', 'src_right_context']
@@ -23,6 +23,24 @@ class FeatureExtractor(object):
         """
         pass
 
+    def get_features_batch(self, sentence_contexts):
+        """
+        returns the features for several tokens of the same sentence at once
+        :param sentence_contexts: a list of context objects which belong to the same sentence
+                                  (the sentence-level fields like 'target', 'source', 'alignments' are the same for all of them)
+        :return: [[<feature1>, <feature2>, ...], ...] -- one list of features per context object
+        - the default implementation calls get_features for every context,
+          extractors which do sentence-level work (windows, LM lookups, ...) should override it to do this work once per sentence
+        """
+        return [self.get_features(context_obj) for context_obj in sentence_contexts]
+
+    def get_id_fields(self):
+        """
+        :return: a list of the fields which have to be interned for the extractor ('target', 'source', ...),
+                 the extractors which return ids of the corpus vocabularies read them as context['<field>_ids']
+        """
+        return []
+
     @abstractmethod
     def get_feature_names(self):
         """
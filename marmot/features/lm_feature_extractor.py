@@ -1,48 +1,20 @@
 from __future__ import print_function
-import codecs
-from subprocess import call
-import os
-from collections import defaultdict
 
 from marmot.features.feature_extractor import FeatureExtractor
 from marmot.util.ngram_window_extractor import extract_window, left_context, right_context
-from marmot.experiment.import_utils import mk_tmp_dir
+from marmot.util.ngram_store import load_ngram_counts
+from marmot.util.lm_scan import SentenceScan
 
 
 # Class that extracts various LM features
 # Calling an external LM is very slow, so a new lm is constructed with nltk
 class LMFeatureExtractor(FeatureExtractor):
 
-    def __init__(self, ngram_file=None, corpus_file=None, srilm=None, tmp_dir=None, order=5):
-        # generate ngram counts
-        if ngram_file is None:
-            if srilm is None:
-                if 'SRILM' in os.environ:
-                    srilm = os.environ['SRILM']
-                else:
-                    print("No SRILM found")
-                    return
-            if corpus_file is None:
-                print ("No corpus for LM generation")
-                return
-
-            srilm_ngram_count = os.path.join(srilm, 'ngram-count')
-
-            tmp_dir = mk_tmp_dir(tmp_dir)
-            lm_file = os.path.join(tmp_dir, 'lm_file')
-            ngram_file = os.path.join(tmp_dir, 'ngram_count_file')
-            call([srilm_ngram_count, '-text', corpus_file, '-lm', lm_file, '-order', str(order), '-write', ngram_file])
-
-        self.lm = defaultdict(int)
-        for line in codecs.open(ngram_file, encoding='utf-8'):
-            chunks = line[:-1].split('\t')
-            if len(chunks) == 2:
-                new_tuple = tuple(chunks[0].split())
-                new_number = int(chunks[1])
-                self.lm[new_tuple] = new_number
-            else:
-                print("Wrong ngram-counts file format at line '", line[:-1], "'")
-
+    def __init__(self, ngram_file=None, corpus_file=None, srilm=None, tmp_dir=None, order=5, cache_dir=None):
+        # the counts are shared with the other LM extractors (see marmot.util.ngram_store)
+        self.lm = load_ngram_counts(ngram_file, corpus_file, srilm, tmp_dir, order, cache_dir)
+        if self.lm is None:
+            return
         self.order = order
 
     def check_lm(self, ngram, side='left'):
@@ -106,5 +78,19 @@ class LMFeatureExtractor(FeatureExtractor):
 
         return [left_ngram_order, right_ngram_order, backoff_left, backoff_middle, backoff_right]
 
+    # the same features for several tokens of a sentence
+    # the sentence is scanned once (see marmot.util.lm_scan), the values are the same as the ones of get_features
+    def get_features_batch(self, sentence_contexts):
+        if len(sentence_contexts) == 0:
+            return []
+        # the trigrams need at least 2 padding symbols
+        scan = SentenceScan(self.lm, sentence_contexts[0]['target'], self.order, max(self.order - 1, 2))
+        features = []
+        for context_obj in sentence_contexts:
+            idx = context_obj['index']
+            # left, middle and right trigrams end at the token, the next token and the token after it
+            features.append([scan.left_order(idx), scan.right_order(idx), scan.backoff(idx), scan.backoff(idx + 1), scan.backoff(idx + 2)])
+        return features
+
     def get_feature_names(self):
         return ['highest_order_ngram_left', 'highest_order_ngram_right', 'backoff_behavior_left', 'backoff_behavior_middle', 'backoff_behavior_right']
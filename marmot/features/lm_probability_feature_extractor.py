@@ -0,0 +1,32 @@
+from __future__ import print_function
+
+from marmot.features.feature_extractor import FeatureExtractor
+from marmot.util.arpa_lm import get_arpa_lm, word_scores
+
+
+# Class that extracts probability features of the target tokens with a backoff LM (ARPA file)
+# the model is converted to a binary file once and shared by all extractors (see marmot.util.arpa_lm)
+class LMProbabilityFeatureExtractor(FeatureExtractor):
+    '''
+    Features extracted:
+      - log10 probability of the token given its left context
+      - perplexity of the window of <window_size> tokens on each side of the token (OOV tokens are not counted)
+      - 1 if the token is not in the vocabulary of the LM, 0 otherwise
+    '''
+
+    def __init__(self, lm_file, window_size=2, cache_dir=None):
+        self.lm = get_arpa_lm(lm_file, cache_dir)
+        self.window_size = window_size
+
+    def get_features(self, context_obj):
+        return self.get_features_batch([context_obj])[0]
+
+    # the sentence is scored once for all its tokens
+    def get_features_batch(self, sentence_contexts):
+        if len(sentence_contexts) == 0:
+            return []
+        scores = self.lm.score_sentence(sentence_contexts[0]['target'])
+        return [word_scores(scores, context_obj['index'], self.window_size) for context_obj in sentence_contexts]
+
+    def get_feature_names(self):
+        return ['lm_logprob', 'lm_window_perplexity', 'lm_oov']
@@ -1,46 +1,18 @@
-import os
-import codecs
-from subprocess import call
-from collections import defaultdict
 from marmot.features.feature_extractor import FeatureExtractor
 from marmot.util.ngram_window_extractor import left_context, right_context
-from marmot.experiment.import_utils import mk_tmp_dir
+from marmot.util.ngram_store import load_ngram_counts
+from marmot.util.lm_scan import SentenceScan
 
 
 class ContextLMFeatureExtractor(FeatureExtractor):
     '''
     '''
 
-    def __init__(self, ngram_file=None, corpus_file=None, srilm=None, tmp_dir=None, order=5):
-        # generate ngram counts
-        if ngram_file is None:
-            if srilm is None:
-                if 'SRILM' in os.environ:
-                    srilm = os.environ['SRILM']
-                else:
-                    print("No SRILM found")
-                    return
-            if corpus_file is None:
-                print ("No corpus for LM generation")
-                return
-
-            srilm_ngram_count = os.path.join(srilm, 'ngram-count')
-
-            tmp_dir = mk_tmp_dir(tmp_dir)
-            lm_file = os.path.join(tmp_dir, 'lm_file')
-            ngram_file = os.path.join(tmp_dir, 'ngram_count_file')
-            call([srilm_ngram_count, '-text', corpus_file, '-lm', lm_file, '-order', str(order), '-write', ngram_file])
-
-        self.lm = defaultdict(int)
-        for line in codecs.open(ngram_file, encoding='utf-8'):
-            chunks = line[:-1].split('\t')
-            if len(chunks) == 2:
-                new_tuple = tuple(chunks[0].split())
-                new_number = int(chunks[1])
-                self.lm[new_tuple] = new_number
-            else:
-                print("Wrong ngram-counts file format at line '", line[:-1], "'")
-
+    def __init__(self, ngram_file=None, corpus_file=None, srilm=None, tmp_dir=None, order=5, cache_dir=None):
+        # the counts are shared with the other LM extractors (see marmot.util.ngram_store)
+        self.lm = load_ngram_counts(ngram_file, corpus_file, srilm, tmp_dir, order, cache_dir)
+        if self.lm is None:
+            return
         self.order = order
 
     def check_lm(self, ngram, side='left'):
@@ -98,5 +70,21 @@ class ContextLMFeatureExtractor(FeatureExtractor):
 
         return [str(left_ngram_order), str(right_ngram_order), str(backoff_left), str(backoff_right)]
 
+    # the same features for several phrases of a sentence, the left contexts come from one scan of the sentence
+    # (see marmot.util.lm_scan). The right windows of get_features skip the word after the phrase,
+    # they are not n-grams of the sentence and are checked as in get_features
+    def get_features_batch(self, sentence_contexts):
+        if len(sentence_contexts) == 0:
+            return []
+        scan = SentenceScan(self.lm, sentence_contexts[0]['target'], self.order, max(self.order - 1, 2), right=False)
+        features = []
+        for context_obj in sentence_contexts:
+            idx_left = context_obj['index'][0]
+            idx_right = context_obj['index'][1]
+            right_ngram = [context_obj['token'][-1]] + right_context(context_obj['target'], context_obj['token'][-1], context_size=self.order-1, idx=idx_right)
+            right_trigram = [context_obj['token'][-1]] + right_context(context_obj['target'], context_obj['token'][-1], context_size=2, idx=idx_right)
+            features.append([str(scan.left_order(idx_left)), str(self.check_lm(right_ngram, side='right')), str(scan.backoff(idx_left)), str(self.get_backoff(right_trigram))])
+        return features
+
     def get_feature_names(self):
         return ['highest_order_ngram_left', 'highest_order_ngram_right', 'backoff_behavior_left', 'backoff_behavior_right']
@@ -1,67 +1,43 @@
 from __future__ import division
 import os
 import sys
-from subprocess import call
-from collections import defaultdict
 from marmot.features.feature_extractor import FeatureExtractor
+from marmot.util.ngram_store import get_ngram_quartiles, resource_cache_dir
+from marmot.util.ngram_counter import corpus_ngram_store
+from marmot.experiment.import_utils import mk_tmp_dir
 
 
 class NgramFrequenciesFeatureExtractor(FeatureExtractor):
 
-    def __init__(self, tmp_dir, ngram_count_file=None, corpus=None, srilm=None):
-        if srilm is None:
-            srilm = os.environ['SRILM'] if 'SRILM' in os.environ else None
+    def __init__(self, tmp_dir, ngram_count_file=None, corpus=None, srilm=None, cache_dir=None):
+        # <srilm> is not used anymore, the counts are computed by marmot.util.ngram_counter
         if ngram_count_file is None:
             if corpus is None or not os.path.exists(corpus):
                 print("No ngram count file and no corpus provided")
                 sys.exit()
-            if not os.path.exists(corpus):
-                print("Corpus doesn't exist")
-                sys.exit()
-            ngram_count_binary = os.path.join(srilm, 'ngram-count')
-            if srilm is None or not os.path.exists(ngram_count_binary):
-                print("No SRILM found, ngram counts can't be extracted")
-                sys.exit()
-            # TODO: run srilm to get the ngram model
-            ngram_count_file = os.path.join(tmp_dir, 'tst_counts')
-            call([ngram_count_binary, '-order', '3', '-text', corpus, '-write', ngram_count_file])
+            counts_dir = mk_tmp_dir(tmp_dir) if tmp_dir is not None else resource_cache_dir(cache_dir)
+            ngram_count_file = corpus_ngram_store(corpus, counts_dir, order=3)
 
-        # get ngram counts
-        ngrams = defaultdict(list)
-        for line in open(ngram_count_file):
-            chunks = line[:-1].decode('utf-8').split('\t')
-            if len(chunks) != 2:
-                print("Wrong format of the ngram file '{}', bad line: {}".format(ngram_count_file, line))
-                sys.exit()
-            words = chunks[0].split()
-            ngrams[len(words)].append((chunks[0], int(chunks[1])))
-        self.ngrams = {}
-        self.ngram_quartiles = {}
-        for order in ngrams:
-            sorted_ngrams = sorted(ngrams[order], key=lambda(k, v): v)
-            self.ngrams[order] = {i: j for (i, j) in sorted_ngrams}
+        # n-gram -> (count, quartile) index: one lookup per n-gram of a phrase (see marmot.util.ngram_store)
+        # the quartiles are computed once and saved in the cache directory with the binary n-gram store
+        self.ngrams, self.quartiles = get_ngram_quartiles(ngram_count_file, cache_dir)[:2]
 
-            ngrams_len = len(sorted_ngrams)
-            q1, q2, q3 = int(ngrams_len/4), int(ngrams_len/2), int(ngrams_len*3/4)
-            # 1 -- low frequency, 4 -- high frequency
-            self.ngram_quartiles[order] = {1: {i: j for (i, j) in sorted_ngrams[:q1]},
-                                           2: {i: j for (i, j) in sorted_ngrams[q1:q2]},
-                                           3: {i: j for (i, j) in sorted_ngrams[q2:q3]},
-                                           4: {i: j for (i, j) in sorted_ngrams[q3:]}}
+    # quartile of an n-gram, 0 if the n-gram is unknown
+    def get_quartile(self, ngram):
+        pos = self.ngrams.find(ngram)
+        return int(self.quartiles[pos]) if pos != -1 else 0
 
-    def get_quartiles_frequency(self, order, source_token):
-        quart_frequencies = []
-        ngram_list = [' '.join(source_token[i:i+order]) for i in range(len(source_token) - order + 1)]
-        if len(ngram_list) == 0:
+    # quartiles of all n-grams of order <order> of a phrase
+    def get_phrase_quartiles(self, order, source_token):
+        return [self.get_quartile(source_token[i:i+order]) for i in range(len(source_token) - order + 1)]
+
+    # share of the n-grams of the phrase in every quartile
+    def get_quartiles_frequency(self, order, source_token, ngram_quartiles=None):
+        if ngram_quartiles is None:
+            ngram_quartiles = self.get_phrase_quartiles(order, source_token)
+        if len(ngram_quartiles) == 0:
             return [0.0, 0.0, 0.0, 0.0]
-        for quart in [1, 2, 3, 4]:
-            quart_count = 0
-            for ngram in ngram_list:
-                if ngram in self.ngram_quartiles[order][quart]:
-#                    print("Yes!")
-                    quart_count += 1
-            quart_frequencies.append(quart_count/len(ngram_list))
-        return quart_frequencies
+        return [ngram_quartiles.count(quart)/len(ngram_quartiles) for quart in [1, 2, 3, 4]]
 
     def get_features(self, context_obj):
         #sys.stderr.write("Start NgramFrequenciesFeatureExtractor\n")
@@ -69,18 +45,16 @@ class NgramFrequenciesFeatureExtractor(FeatureExtractor):
             return ['0' for i in range(15)]
 
         source_token = context_obj['source_token']
-        unigram_quart = self.get_quartiles_frequency(1, source_token)
-        bigram_quart = self.get_quartiles_frequency(2, source_token)
-        trigram_quart = self.get_quartiles_frequency(3, source_token)
-
-        bigram_list = [' '.join(source_token[i:i+2]) for i in range(len(source_token) - 1)]
-        trigram_list = [' '.join(source_token[i:i+3]) for i in range(len(source_token) - 2)]
-        percent_unigram = sum([1 for word in source_token if word in self.ngrams[1]])/len(source_token)
-        percent_bigram = sum([1 for word in bigram_list if word in self.ngrams[2]])/len(source_token)
-        percent_trigram = sum([1 for word in trigram_list if word in self.ngrams[3]])/len(source_token)
+        features = []
+        percents = []
+        for order in [1, 2, 3]:
+            ngram_quartiles = self.get_phrase_quartiles(order, source_token)
+            features.extend(self.get_quartiles_frequency(order, source_token, ngram_quartiles))
+            # share of the n-grams which are in the counts (relative to the number of words)
+            percents.append(sum([1 for quart in ngram_quartiles if quart != 0])/len(source_token))
 
         #sys.stderr.write("Finish NgramFrequenciesFeatureExtractor\n")
-        return [str(n) for n in unigram_quart] + [str(n) for n in bigram_quart] + [str(n) for n in trigram_quart] + [str(percent_unigram), str(percent_bigram), str(percent_trigram)]
+        return [str(n) for n in features] + [str(n) for n in percents]
 
     def get_feature_names(self):
         return ['avg_unigram_quart_1',
@@ -3,27 +3,39 @@
 
 import unittest
 import os
+import shutil
+import tempfile
 from marmot.features.phrase.ngram_frequencies_feature_extractor import NgramFrequenciesFeatureExtractor
 
 
 # test a class which extracts source and target token count features, and the source/target token count ratio
 class NgramFrequenciesFeatureExtractorTests(unittest.TestCase):
 
-    def setUp(self):
-        self.extractor = NgramFrequenciesFeatureExtractor(os.getcwd(), ngram_count_file='test_data/ngram_counts')
+    # the corpus is counted once for all tests
+    @classmethod
+    def setUpClass(cls):
+        module_path = os.path.dirname(os.path.realpath(__file__))
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.extractor = NgramFrequenciesFeatureExtractor(cls.tmp_dir, corpus=os.path.join(module_path, 'test_data/corpus.en'), cache_dir=cls.tmp_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir, ignore_errors=True)
 
     def test_extractor_creation(self):
-        extractor = NgramFrequenciesFeatureExtractor(os.getcwd(), corpus='test_data/corpus.en')
-        self.assertEqual(extractor.ngrams[1]['must'], 783)
-        self.assertEqual(extractor.ngrams[2]['drop of'], 2)
-        self.assertEqual(extractor.ngrams[3]['is something that'], 11)
+        self.assertEqual(self.extractor.ngrams[('must',)], 783)
+        self.assertEqual(self.extractor.ngrams[('drop', 'of')], 2)
+        self.assertEqual(self.extractor.ngrams[('is', 'something', 'that')], 11)
+        # n-grams with a higher count are in the same or a higher quartile
+        self.assertTrue(self.extractor.get_quartile(('must',)) >= self.extractor.get_quartile(('drop',)))
+        self.assertEqual(self.extractor.get_quartile(('unknown_word',)), 0)
 
     def test_get_features(self):
         context = {'token': ['eso', 'es', 'naturally', 'unacceptable', 'ggg'], 'source_token': ['naturally', 'unacceptable', 'thing', 'is']}
         features = self.extractor.get_features(context)
-        self.assertAlmostEqual(features[-3], 1.0)
-        self.assertAlmostEqual(features[-2], 0.5)
-        self.assertAlmostEqual(features[-1], 0.0)
+        self.assertAlmostEqual(float(features[-3]), 1.0)
+        self.assertAlmostEqual(float(features[-2]), 0.5)
+        self.assertAlmostEqual(float(features[-1]), 0.0)
 
 
 if __name__ == '__main__':
@@ -1,46 +1,19 @@
-import codecs
-from subprocess import call
-import os
-from collections import defaultdict
 
 from marmot.features.feature_extractor import FeatureExtractor
 from marmot.util.ngram_window_extractor import left_context, right_context
-from marmot.experiment.import_utils import mk_tmp_dir
+from marmot.util.ngram_store import load_ngram_counts
+from marmot.util.lm_scan import SentenceScan, window_order
 from marmot.exceptions.no_data_error import NoDataError
 
 
 # Class that extracts various LM features for source
 class SourceLMFeatureExtractor(FeatureExtractor):
 
-    def __init__(self, ngram_file=None, corpus_file=None, srilm=None, tmp_dir=None, order=5):
-        # generate ngram counts
-        if ngram_file is None:
-            if srilm is None:
-                if 'SRILM' in os.environ:
-                    srilm = os.environ['SRILM']
-                else:
-                    print("No SRILM found")
-                    return
-            if corpus_file is None:
-                print ("No corpus for LM generation")
-                return
-
-            srilm_ngram_count = os.path.join(srilm, 'ngram-count')
-
-            tmp_dir = mk_tmp_dir(tmp_dir)
-            lm_file = os.path.join(tmp_dir, 'lm_file')
-            ngram_file = os.path.join(tmp_dir, 'ngram_count_file')
-            call([srilm_ngram_count, '-text', corpus_file, '-lm', lm_file, '-order', str(order), '-write', ngram_file])
-
-        self.lm = defaultdict(int)
-        for line in codecs.open(ngram_file, encoding='utf-8'):
-            chunks = line[:-1].split('\t')
-            if len(chunks) == 2:
-                new_tuple = tuple(chunks[0].split())
-                new_number = int(chunks[1])
-                self.lm[new_tuple] = new_number
-            else:
-                print("Wrong ngram-counts file format at line '", line[:-1], "'")
+    def __init__(self, ngram_file=None, corpus_file=None, srilm=None, tmp_dir=None, order=5, cache_dir=None):
+        # the counts are shared with the other LM extractors (see marmot.util.ngram_store)
+        self.lm = load_ngram_counts(ngram_file, corpus_file, srilm, tmp_dir, order, cache_dir)
+        if self.lm is None:
+            return
         self.order = order
 
     def check_lm(self, ngram, side='left'):
@@ -77,5 +50,27 @@ class SourceLMFeatureExtractor(FeatureExtractor):
 
         return [left_ngram_order, right_ngram_order]
 
+    # the same features for several tokens of a sentence, the source sentence is scanned once (see marmot.util.lm_scan)
+    def get_features_batch(self, sentence_contexts):
+        if len(sentence_contexts) == 0:
+            return []
+        if 'source' not in sentence_contexts[0]:
+            raise NoDataError('source', sentence_contexts[0], 'SourceLMFeatureExtractor')
+        if 'alignments' not in sentence_contexts[0]:
+            raise NoDataError('alignments', sentence_contexts[0], 'SourceLMFeatureExtractor')
+        # the windows of get_features have 2 words of context on each side
+        scan = SentenceScan(self.lm, sentence_contexts[0]['source'], 3, 2)
+        alignments = sentence_contexts[0]['alignments']
+        features = []
+        for context_obj in sentence_contexts:
+            align_idx = alignments[context_obj['index']]
+            # unaligned
+            if align_idx is None:
+                features.append([0, 0])
+                continue
+            features.append([window_order(3, scan.left_order(align_idx), self.order, side='left'),
+                             window_order(3, scan.right_order(align_idx), self.order, side='right')])
+        return features
+
     def get_feature_names(self):
         return ['source_highest_order_ngram_left', 'source_highest_order_ngram_right']
@@ -0,0 +1,43 @@
+from __future__ import print_function
+
+from marmot.features.feature_extractor import FeatureExtractor
+from marmot.util.arpa_lm import get_arpa_lm, word_scores
+from marmot.exceptions.no_data_error import NoDataError
+
+
+# Class that extracts probability features of the source token aligned to the target token with a source-side backoff LM
+class SourceLMProbabilityFeatureExtractor(FeatureExtractor):
+    '''
+    The same features as LMProbabilityFeatureExtractor for the aligned source token
+    (log10 probability, window perplexity, OOV flag), all 0 for unaligned tokens.
+    '''
+
+    def __init__(self, lm_file, window_size=2, cache_dir=None):
+        self.lm = get_arpa_lm(lm_file, cache_dir)
+        self.window_size = window_size
+
+    def get_features(self, context_obj):
+        return self.get_features_batch([context_obj])[0]
+
+    # the source sentence is scored once for all tokens of the target sentence
+    def get_features_batch(self, sentence_contexts):
+        if len(sentence_contexts) == 0:
+            return []
+        if 'source' not in sentence_contexts[0]:
+            raise NoDataError('source', sentence_contexts[0], 'SourceLMProbabilityFeatureExtractor')
+        if 'alignments' not in sentence_contexts[0]:
+            raise NoDataError('alignments', sentence_contexts[0], 'SourceLMProbabilityFeatureExtractor')
+        scores = self.lm.score_sentence(sentence_contexts[0]['source'])
+        alignments = sentence_contexts[0]['alignments']
+        features = []
+        for context_obj in sentence_contexts:
+            align_idx = alignments[context_obj['index']]
+            # unaligned
+            if align_idx is None:
+                features.append([0.0, 0.0, 0])
+            else:
+                features.append(word_scores(scores, align_idx, self.window_size))
+        return features
+
+    def get_feature_names(self):
+        return ['source_lm_logprob', 'source_lm_window_perplexity', 'source_lm_oov']
@@ -2,8 +2,8 @@ import numpy as np
 import sys
 
 import logging
-from gensim.models import Word2Vec
 from marmot.features.feature_extractor import FeatureExtractor
+from marmot.util.word_vectors import get_word_vectors
 
 logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
 logger = logging.getLogger('experiment_logger')
@@ -48,11 +48,12 @@ class SourceWord2VecFeatureExtractor(FeatureExtractor):
         - 'avg'
     '''
 
-    def __init__(self, w2v_file, combination='sum', context_size=2):
+    def __init__(self, w2v_file, combination='sum', context_size=2, cache_dir=None):
 
-        self.model = Word2Vec.load(w2v_file)
-        self.default_vector = np.average(np.array([self.model[x] for x in self.model.vocab]), axis=0).reshape((-1,))
-        self.zero_vector = np.zeros(self.default_vector.shape[0])
+        # the same memory-mapped float32 vectors as Word2VecFeatureExtractor (see marmot.util.word_vectors)
+        self.vectors = get_word_vectors(w2v_file, cache_dir)
+        self.default_vector = self.vectors.mean_vector()
+        self.zero_vector = self.vectors.zero_vector()
         self.context_size = context_size
         if combination == 'sum':
             self.combine = np.sum
@@ -62,13 +63,12 @@ class SourceWord2VecFeatureExtractor(FeatureExtractor):
             print("Unknown combination type provided: '{}'".format(combination))
 
     def extract_word2vec_vector(self, token):
-        if token in self.model.vocab:
-            return self.model[token]
-        #elif token == '_START_' or token == '_END_' or token == '_unaligned_':
-        elif token == '<s>' or token == '</s>' or token == '_unaligned_':
-            return self.zero_vector
-        else:
-            return self.default_vector
+        #return self.vectors.vector(token, zero_tokens=('_START_', '_END_', '_unaligned_'))
+        return self.vectors.vector(token, zero_tokens=('<s>', '</s>', '_unaligned_'))
+
+    # matrix of the vectors of the window tokens, gathered with one indexing operation
+    def extract_window_vectors(self, window):
+        return self.vectors.vectors(window, zero_tokens=('<s>', '</s>', '_unaligned_')).reshape((-1,))
 
     def get_features(self, context_obj):
         if context_obj['index'][0] == context_obj['index'][1]:
@@ -79,7 +79,7 @@ class SourceWord2VecFeatureExtractor(FeatureExtractor):
         phrase_vector = []
         # source phrase exists
         if 'source_token' in context_obj and len(context_obj['source_token']) > 0:
-            phrase_vector = [self.extract_word2vec_vector(tok) for tok in context_obj['source_token']]
+            phrase_vector = self.vectors.vectors(context_obj['source_token'], zero_tokens=('<s>', '</s>', '_unaligned_'))
             if type(phrase_vector) is not np.ndarray and type(phrase_vector) is not list:
                 print("Phrase vector type: {}, changed after collecting word2vec vectors".format(type(phrase_vector)))
                 print("Context object: ", context_obj)
@@ -112,7 +112,7 @@ class SourceWord2VecFeatureExtractor(FeatureExtractor):
             elif len(alignments) > 1:
                 left_window = left_context(context_obj['source'], context_obj['source'][alignments[0]], self.context_size, alignments[0])
                 right_window = right_context(context_obj['source'], context_obj['source'][alignments[-1]], self.context_size, alignments[-1])
-                phrase_vector = [self.extract_word2vec_vector(tok) for tok in context_obj['source'][alignments[0]:alignments[-1]+1]]
+                phrase_vector = self.vectors.vectors(context_obj['source'][alignments[0]:alignments[-1]+1], zero_tokens=('<s>', '</s>', '_unaligned_'))
                 phrase_vector = self.combine(phrase_vector, axis=0)
             elif len(alignments) == 1:
                 src_token = context_obj['source'][alignments[0]]
@@ -122,18 +122,12 @@ class SourceWord2VecFeatureExtractor(FeatureExtractor):
             else:
                 print("Golakteko opasnoste!!!!!11")
 
-        vector = []
-        for tok in left_window:
-            vector.extend(self.extract_word2vec_vector(tok))
         # tmp fix if something strange happens and phrase_vector is not a list
         if type(phrase_vector) is not np.ndarray and type(phrase_vector) is not list:
             print("Phrase vector type: {}".format(type(phrase_vector)))
             print("Context object: ", context_obj)
             phrase_vector = self.zero_vector
-        vector.extend(phrase_vector)
-        for tok in right_window:
-            vector.extend(self.extract_word2vec_vector(tok))
-        return np.hstack(vector)
+        return np.hstack([self.extract_window_vectors(left_window), phrase_vector, self.extract_window_vectors(right_window)])
 
     # TODO: there should be a name for every feature
     def get_feature_names(self):
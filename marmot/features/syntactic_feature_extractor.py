@@ -14,6 +14,17 @@ def get_parent(dependencies, word_id, sentence_length, context_obj):
     return None, None
 
 
+# {word_id: (head, dependency type)} for all words of a sentence
+# (the same result as get_parent for every word, but in one pass over the dependencies)
+def get_parents(dependencies):
+    parents = {}
+    for head in dependencies:
+        for dep in dependencies[head]:
+            if dep['id'] not in parents:
+                parents[dep['id']] = (head, dep['type'])
+    return parents
+
+
 def get_siblings(dependencies, word_id, head_id, sentence_length):
     left_sib = 0
     right_sib = sentence_length
@@ -35,10 +46,15 @@ def get_siblings(dependencies, word_id, head_id, sentence_length):
 
 class SyntacticFeatureExtractor(FeatureExtractor):
 
-    def get_features_one_lang(self, dependencies, sentence, sentence_pos, word_idx, context_obj):
+    # <parents> -- output of get_parents for the sentence (if not provided, the parents are searched in <dependencies>)
+    def get_features_one_lang(self, dependencies, sentence, sentence_pos, word_idx, context_obj, parents=None):
         sent_len = len(sentence)
-        head, dep_type = get_parent(dependencies, word_idx, sent_len, context_obj)
-        grandhead, grand_dep_type = get_parent(dependencies, head, sent_len, context_obj)
+        if parents is None:
+            head, dep_type = get_parent(dependencies, word_idx, sent_len, context_obj)
+            grandhead, grand_dep_type = get_parent(dependencies, head, sent_len, context_obj)
+        else:
+            head, dep_type = parents.get(word_idx, (None, None))
+            grandhead, grand_dep_type = parents.get(head, (None, None))
         left_sib, right_sib = get_siblings(dependencies, word_idx, head, sent_len)
 
 #        try:
@@ -83,6 +99,30 @@ class SyntacticFeatureExtractor(FeatureExtractor):
             synt_features_tg = self.get_features_one_lang(context_obj['target_dependencies'], context_obj['target'], context_obj['target_pos'], index, context_obj)
         return synt_features_tg + synt_features_src
 
+    # the same features for several tokens of a sentence: the parents of all words are found once per sentence
+    def get_features_batch(self, sentence_contexts):
+        if len(sentence_contexts) == 0:
+            return []
+        context_obj = sentence_contexts[0]
+        src_ok = len(context_obj['source']) == len(context_obj['source_synt_pos'])
+        tg_ok = len(context_obj['target']) == len(context_obj['target_synt_pos'])
+        src_parents = get_parents(context_obj['source_dependencies']) if src_ok else None
+        tg_parents = get_parents(context_obj['target_dependencies']) if tg_ok else None
+        features = []
+        for context_obj in sentence_contexts:
+            index = context_obj['index']
+            src_index = context_obj['alignments'][index]
+            if not src_ok or src_index is None:
+                synt_features_src = ['None' for i in range(10)]
+            else:
+                synt_features_src = self.get_features_one_lang(context_obj['source_dependencies'], context_obj['source'], context_obj['source_pos'], src_index, context_obj, parents=src_parents)
+            if not tg_ok:
+                synt_features_tg = ['None' for i in range(10)]
+            else:
+                synt_features_tg = self.get_features_one_lang(context_obj['target_dependencies'], context_obj['target'], context_obj['target_pos'], index, context_obj, parents=tg_parents)
+            features.append(synt_features_tg + synt_features_src)
+        return features
+
 
     def get_feature_names(self):
         return ['dep_type',
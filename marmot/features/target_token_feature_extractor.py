@@ -1,5 +1,6 @@
 from marmot.features.feature_extractor import FeatureExtractor
 from marmot.util.ngram_window_extractor import left_context, right_context
+from marmot.util.vocabulary import FeatureId, context_ids, left_ids, right_ids, pack_ids
 
 
 class TargetTokenFeatureExtractor(FeatureExtractor):
@@ -7,16 +8,31 @@ class TargetTokenFeatureExtractor(FeatureExtractor):
     Target features:
       - target token
       - left and right windows of the target token
+    <ids> -- return integer ids of the 'target' vocabulary instead of strings
+             (the windows are packed into one id, see marmot.util.vocabulary)
     '''
 
-    def __init__(self, context_size=1):
+    def __init__(self, context_size=1, ids=False):
         self.context_size = context_size
+        self.ids = ids
 
     def get_features(self, context_obj):
+        if self.ids:
+            return self.get_id_features(context_obj)
         token = context_obj['token']
         left = ' '.join(left_context(context_obj['target'], token, context_size=self.context_size, idx=context_obj['index']))
         right = ' '.join(right_context(context_obj['target'], token, context_size=self.context_size, idx=context_obj['index']))
         return [token, left, right]
 
+    def get_id_features(self, context_obj):
+        target_ids = context_ids(context_obj, 'target')
+        idx = context_obj['index']
+        left = pack_ids(left_ids(target_ids, idx, self.context_size))
+        right = pack_ids(right_ids(target_ids, idx, self.context_size))
+        return [FeatureId(target_ids[idx]), left, right]
+
+    def get_id_fields(self):
+        return ['target'] if self.ids else []
+
     def get_feature_names(self):
         return ['token', 'left_context', 'right_context']
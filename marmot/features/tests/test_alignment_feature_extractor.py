@@ -67,5 +67,12 @@ class AlignmentFeatureExtractorTests(unittest.TestCase):
         self.assertEqual(right, u'_END_')
 
 
+    def test_get_features_batch(self):
+        obj = {'target': [u'a', u'boy', u'hits', u'a', u'dog'], 'source': [u'un', u'garcon', u'frappe', u'un', u'chien'], 'alignments': [0, 1, None, 3, 4]}
+        contexts = [dict(obj, token=tok, index=idx) for idx, tok in enumerate(obj['target'])]
+        for extractor in [self.aligner_no_model, self.aligner_no_model_2]:
+            self.assertEqual(extractor.get_features_batch(contexts), [extractor.get_features(c) for c in contexts])
+
+
 if __name__ == '__main__':
     unittest.main()
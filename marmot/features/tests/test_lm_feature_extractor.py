@@ -4,6 +4,7 @@
 import unittest
 import os
 import shutil
+import tempfile
 from marmot.features.lm_feature_extractor import LMFeatureExtractor
 
 
@@ -13,10 +14,10 @@ class LMFeatureExtractorTests(unittest.TestCase):
     def setUp(self):
         module_path = os.path.dirname(os.path.realpath(__file__))
         self.module_path = module_path
-        self.tmp_dir = os.path.join(module_path, 'tmp_dir')
-        self.lm3Extractor = LMFeatureExtractor(corpus_file=os.path.join(module_path, 'test_data/training.txt'), srilm=os.environ['SRILM'], tmp_dir=self.tmp_dir)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.lm3Extractor = LMFeatureExtractor(corpus_file=os.path.join(module_path, 'test_data/training.txt'), tmp_dir=self.tmp_dir)
 #        self.lm5Extractor = LMFeatureExtractor(corpus_file=os.path.join(module_path, 'test_data/training.txt'), srilm=os.environ['SRILM'], tmp_dir=self.tmp_dir, order=5)
-        self.lm5Extractor = LMFeatureExtractor(ngram_file=os.path.join(module_path, 'test_data/training.ngram'), srilm=os.environ['SRILM'], tmp_dir=self.tmp_dir, order=5)
+        self.lm5Extractor = LMFeatureExtractor(ngram_file=os.path.join(module_path, 'test_data/training.ngram'), tmp_dir=self.tmp_dir, order=5, cache_dir=self.tmp_dir)
 
 
     def test_get_features(self):
@@ -52,8 +53,14 @@ class LMFeatureExtractorTests(unittest.TestCase):
         self.assertAlmostEqual(back_m, 0.3)
         self.assertAlmostEqual(back_r, 0.3)
 
-#    def tearDown(self):
-#        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+    def test_get_features_batch(self):
+        target = [u'It', u'becomes', u'more', u'and', u'more', u'difficult', u'for', u'us', u'to', u'protect', u'her', u'brands', u'in', u'China', '.']
+        contexts = [{'token': tok, 'index': idx, 'target': target, 'tag': 'G'} for idx, tok in enumerate(target)]
+        for extractor in [self.lm3Extractor, self.lm5Extractor]:
+            self.assertEqual(extractor.get_features_batch(contexts), [extractor.get_features(c) for c in contexts])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
 
 
 if __name__ == '__main__':
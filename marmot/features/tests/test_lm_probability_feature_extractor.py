@@ -0,0 +1,47 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from marmot.features.lm_probability_feature_extractor import LMProbabilityFeatureExtractor
+from marmot.features.source_lm_probability_feature_extractor import SourceLMProbabilityFeatureExtractor
+
+
+class LMProbabilityFeatureExtractorTests(unittest.TestCase):
+
+    def setUp(self):
+        module_path = os.path.dirname(os.path.realpath(__file__))
+        self.lm_file = os.path.join(module_path, 'test_data/training.lm')
+        self.tmp_dir = tempfile.mkdtemp()
+        self.target = [u'Finally', u'they', u'brought', u'the', u'unknown_word', u'home', u'.']
+        self.contexts = [{'token': tok, 'index': idx, 'target': self.target, 'source': self.target, 'alignments': [6, None, 1, 2, 4, 5, 0]} for idx, tok in enumerate(self.target)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_get_features(self):
+        extractor = LMProbabilityFeatureExtractor(self.lm_file, window_size=1, cache_dir=self.tmp_dir)
+        features = extractor.get_features_batch(self.contexts)
+        self.assertEqual(features, [extractor.get_features(c) for c in self.contexts])
+        (logprob, perplexity, oov) = features[0]
+        self.assertTrue(-3.0 < logprob < 0.0)
+        self.assertEqual(oov, 0)
+        self.assertEqual(features[4][2], 1)
+        # the window of 'the' is 'brought the unknown_word', the unknown word is not counted
+        expected = 10 ** (-(features[2][0] + features[3][0]) / 2)
+        self.assertAlmostEqual(features[3][1], expected)
+
+    def test_source(self):
+        extractor = SourceLMProbabilityFeatureExtractor(self.lm_file, window_size=1, cache_dir=self.tmp_dir)
+        target_features = LMProbabilityFeatureExtractor(self.lm_file, window_size=1, cache_dir=self.tmp_dir).get_features_batch(self.contexts)
+        features = extractor.get_features_batch(self.contexts)
+        self.assertEqual(features[0], target_features[6])
+        self.assertEqual(features[1], [0.0, 0.0, 0])
+        self.assertEqual(features[4], target_features[4])
+
+
+if __name__ == '__main__':
+    unittest.main()
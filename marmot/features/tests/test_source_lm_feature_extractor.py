@@ -3,6 +3,8 @@
 
 import unittest
 import os
+import shutil
+import tempfile
 from marmot.features.source_lm_feature_extractor import SourceLMFeatureExtractor
 from marmot.exceptions.no_data_error import NoDataError
 
@@ -12,8 +14,12 @@ class LMFeatureExtractorTests(unittest.TestCase):
     def setUp(self):
         module_path = os.path.dirname(os.path.realpath(__file__))
         self.module_path = module_path
-        self.lm3Extractor = SourceLMFeatureExtractor(corpus_file=os.path.join(module_path, 'test_data/training.txt'))
-        self.lm5Extractor = SourceLMFeatureExtractor(corpus_file=os.path.join(module_path, 'test_data/training.txt'), order=5)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.lm3Extractor = SourceLMFeatureExtractor(corpus_file=os.path.join(module_path, 'test_data/training.txt'), cache_dir=self.tmp_dir)
+        self.lm5Extractor = SourceLMFeatureExtractor(corpus_file=os.path.join(module_path, 'test_data/training.txt'), order=5, cache_dir=self.tmp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
 
     def test_get_features(self):
         # { 'token': <token>, index: <idx>, 'source': [<source toks>]', 'target': [<target toks>], 'tag': <tag>}
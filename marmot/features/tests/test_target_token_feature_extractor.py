@@ -3,6 +3,8 @@
 import unittest
 
 from marmot.features.target_token_feature_extractor import TargetTokenFeatureExtractor
+from marmot.util.corpus_store import CorpusStore
+from marmot.util.vocabulary import Vocabularies, unpack_ids
 
 
 class AlignmentFeatureExtractorTests(unittest.TestCase):
@@ -31,6 +33,16 @@ class AlignmentFeatureExtractorTests(unittest.TestCase):
         self.assertEqual(left, u'_START_ _START_')
         self.assertEqual(right, u'boy hits')
 
+    def test_get_id_features(self):
+        extractor = TargetTokenFeatureExtractor(context_size=2, ids=True)
+        vocabularies = Vocabularies(extractor.get_id_fields())
+        obj = CorpusStore({'target': [[u'a',u'boy',u'hits',u'a',u'dog']]}, vocabularies=vocabularies).context(0, 2)
+        [token, left, right] = extractor.get_features(obj)
+        vocabulary = vocabularies.get('target')
+        self.assertEqual(vocabulary.decode([token]), [u'hits'])
+        self.assertEqual(vocabulary.decode(unpack_ids(left, 2)), [u'a', u'boy'])
+        self.assertEqual(vocabulary.decode(unpack_ids(right, 2)), [u'a', u'dog'])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,5 +1,6 @@
 from marmot.features.feature_extractor import FeatureExtractor
 from marmot.util.ngram_window_extractor import left_context, right_context
+from marmot.util.vocabulary import UNALIGNED_ID, context_ids, left_ids, right_ids, pack_ids
 
 
 class PairedFeatureExtractor(FeatureExtractor):
@@ -9,9 +10,15 @@ class PairedFeatureExtractor(FeatureExtractor):
         - target token + right context
         - target token + source token
         - target POS + source POS
+    <ids> -- return packed integer ids of the corpus vocabularies instead of concatenated strings
     '''
 
+    def __init__(self, ids=False):
+        self.ids = ids
+
     def get_features(self, context_obj):
+        if self.ids:
+            return self.get_id_features(context_obj)
         token = context_obj['token']
         left = ' '.join(left_context(context_obj['target'], token, context_size=1, idx=context_obj['index']))
         right = ' '.join(right_context(context_obj['target'], token, context_size=1, idx=context_obj['index']))
@@ -27,5 +34,26 @@ class PairedFeatureExtractor(FeatureExtractor):
 
         return [token + '|' + left, token + '|' + right, token + '|' + src_token, tg_pos + '|' + src_pos]
 
+    def get_id_features(self, context_obj):
+        idx = context_obj['index']
+        target_ids = context_ids(context_obj, 'target')
+        token = target_ids[idx]
+        left = left_ids(target_ids, idx, 1)
+        right = right_ids(target_ids, idx, 1)
+        tg_pos = context_ids(context_obj, 'target_pos')[idx] if len(context_obj['target_pos']) > 0 else 0
+
+        align_idx = context_obj['alignments'][idx]
+        if align_idx is None:
+            src_token = UNALIGNED_ID
+            src_pos = UNALIGNED_ID
+        else:
+            src_token = context_ids(context_obj, 'source')[align_idx]
+            src_pos = context_ids(context_obj, 'source_pos')[align_idx]
+
+        return [pack_ids([token] + left), pack_ids([token] + right), pack_ids([token, src_token]), pack_ids([tg_pos, src_pos])]
+
+    def get_id_fields(self):
+        return ['target', 'target_pos', 'source', 'source_pos'] if self.ids else []
+
     def get_feature_names(self):
         return ['token+left', 'token+right', 'token+source', 'POS+sourcePOS']
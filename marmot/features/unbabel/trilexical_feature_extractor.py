@@ -1,5 +1,6 @@
 from marmot.features.feature_extractor import FeatureExtractor
 from marmot.util.ngram_window_extractor import left_context, right_context
+from marmot.util.vocabulary import UNALIGNED_ID, context_ids, left_ids, right_ids, pack_ids
 
 
 class TrilexicalFeatureExtractor(FeatureExtractor):
@@ -7,9 +8,15 @@ class TrilexicalFeatureExtractor(FeatureExtractor):
     Trilexical features:
         - target token + left context + source token
         - target token + right context + source token
+    <ids> -- return packed integer ids of the corpus vocabularies instead of concatenated strings
     '''
 
+    def __init__(self, ids=False):
+        self.ids = ids
+
     def get_features(self, context_obj):
+        if self.ids:
+            return self.get_id_features(context_obj)
         token = context_obj['token']
         left = ' '.join(left_context(context_obj['target'], token, context_size=1, idx=context_obj['index']))
         right = ' '.join(right_context(context_obj['target'], token, context_size=1, idx=context_obj['index']))
@@ -22,5 +29,23 @@ class TrilexicalFeatureExtractor(FeatureExtractor):
 
         return [token + '|' + left + '|' + aligned_to, token + '|' + right + '|' + aligned_to]
 
+    def get_id_features(self, context_obj):
+        idx = context_obj['index']
+        target_ids = context_ids(context_obj, 'target')
+        token = target_ids[idx]
+        left = left_ids(target_ids, idx, 1)
+        right = right_ids(target_ids, idx, 1)
+
+        align_idx = context_obj['alignments'][idx]
+        if align_idx is None:
+            aligned_to = UNALIGNED_ID
+        else:
+            aligned_to = context_ids(context_obj, 'source')[align_idx]
+
+        return [pack_ids([token] + left + [aligned_to]), pack_ids([token] + right + [aligned_to])]
+
+    def get_id_fields(self):
+        return ['target', 'source'] if self.ids else []
+
     def get_feature_names(self):
         return ['target+left+source', 'target+right+source']
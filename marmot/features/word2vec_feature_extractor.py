@@ -2,8 +2,8 @@ import numpy as np
 import sys
 
 import logging
-from gensim.models import Word2Vec
 from marmot.features.feature_extractor import FeatureExtractor
+from marmot.util.word_vectors import get_word_vectors
 
 logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
 logger = logging.getLogger('experiment_logger')
@@ -48,11 +48,12 @@ class Word2VecFeatureExtractor(FeatureExtractor):
         - 'avg'
     '''
 
-    def __init__(self, w2v_file, combination='sum', context_size=2):
+    def __init__(self, w2v_file, combination='sum', context_size=2, cache_dir=None):
 
-        self.model = Word2Vec.load(w2v_file)
-        self.default_vector = np.average(np.array([self.model[x] for x in self.model.vocab]), axis=0).reshape((-1,))
-        self.zero_vector = np.zeros(self.default_vector.shape[0])
+        # float32 vectors memory-mapped from a binary file (see marmot.util.word_vectors)
+        self.vectors = get_word_vectors(w2v_file, cache_dir)
+        self.default_vector = self.vectors.mean_vector()
+        self.zero_vector = self.vectors.zero_vector()
         self.context_size = context_size
         if combination == 'sum':
             self.combine = np.sum
@@ -62,13 +63,8 @@ class Word2VecFeatureExtractor(FeatureExtractor):
             print("Unknown combination type provided: '{}'".format(combination))
 
     def extract_word2vec_vector(self, token):
-        if token in self.model.vocab:
-            return self.model[token]
-        #elif token == '_START_' or token == '_END_':
-        elif token == '<s>' or token == '</s>':
-            return self.zero_vector
-        else:
-            return self.default_vector
+        #return self.vectors.vector(token, zero_tokens=('_START_', '_END_'))
+        return self.vectors.vector(token, zero_tokens=('<s>', '</s>'))
 
     # extract the word2vec features for a window of tokens around the target token
     def get_features(self, context_obj):
@@ -83,25 +79,31 @@ class Word2VecFeatureExtractor(FeatureExtractor):
             print("Invalid token indices in sentence: ", context_obj['target'])
             print("Indices: {}, {}".format(context_obj['index'][0], context_obj['index'][1]))
 
-        phrase_vector = []
+        return self.get_features_batch([context_obj])[0]
+
+    # the same features for several tokens of a sentence
+    # the rows of all words of the padded sentence are looked up once,
+    # the vectors of all windows are gathered from the matrix with one indexing operation
+    def get_features_batch(self, sentence_contexts):
+        if len(sentence_contexts) == 0:
+            return []
+        cs = self.context_size
+        padded = np.hstack([self.vectors.rows(['<s>' for i in range(cs)], zero_tokens=('<s>',)),
+                            self.vectors.rows(sentence_contexts[0]['target'], zero_tokens=('<s>', '</s>')),
+                            self.vectors.rows(['</s>' for i in range(cs)], zero_tokens=('</s>',))])
         # if 'token' contains more than 1 string, 'index' should be an interval
-        if type(context_obj['token']) is list or type(context_obj['token']) is np.ndarray:
-            left_window = left_context(context_obj['target'], context_obj['token'][0], self.context_size, context_obj['index'][0])
-            right_window = right_context(context_obj['target'], context_obj['token'][-1], self.context_size, context_obj['index'][-1]-1)
-            phrase_vector = [self.extract_word2vec_vector(tok) for tok in context_obj['token']]
-            phrase_vector = self.combine(phrase_vector, axis=0)
-        else:
-            left_window = left_context(context_obj['target'], context_obj['token'], self.context_size, context_obj['index'])
-            right_window = right_context(context_obj['target'], context_obj['token'], self.context_size, context_obj['index'])
-            phrase_vector = self.extract_word2vec_vector(context_obj['token'])
-
-        vector = []
-        for tok in left_window:
-            vector.extend(self.extract_word2vec_vector(tok))
-        vector.extend(phrase_vector)
-        for tok in right_window:
-            vector.extend(self.extract_word2vec_vector(tok))
-        return np.hstack(vector)
+        if type(sentence_contexts[0]['token']) is list or type(sentence_contexts[0]['token']) is np.ndarray:
+            # windows of the phrases: <cs> words on the left of the first token, <cs> words on the right of the last token
+            starts = np.array([context_obj['index'][0] for context_obj in sentence_contexts])
+            ends = np.array([context_obj['index'][1] for context_obj in sentence_contexts]) + cs
+            left = self.vectors.matrix[padded[starts[:, None] + np.arange(cs)]].reshape((len(starts), -1))
+            right = self.vectors.matrix[padded[ends[:, None] + np.arange(cs)]].reshape((len(starts), -1))
+            phrases = [self.combine(self.vectors.vectors(context_obj['token'], zero_tokens=('<s>', '</s>')), axis=0) for context_obj in sentence_contexts]
+            return [np.hstack([left[i], phrases[i], right[i]]) for i in range(len(sentence_contexts))]
+
+        positions = np.array([context_obj['index'] for context_obj in sentence_contexts])
+        windows = padded[positions[:, None] + np.arange(2 * cs + 1)]
+        return list(self.vectors.matrix[windows].reshape((len(sentence_contexts), -1)))
 
     # TODO: there should be a name for every feature
     def get_feature_names(self):
@@ -4,18 +4,19 @@ import time
 import numpy as np
 from collections import defaultdict
 
-from marmot.util.alignments import train_alignments
-from marmot.util.force_align import Aligner
+from marmot.util.alignments import train_alignments, align_sentences
 from marmot.representations.representation_generator import RepresentationGenerator
 from marmot.experiment.import_utils import mk_tmp_dir
 
 
 class AlignmentRepresentationGenerator(RepresentationGenerator):
 
-    def __init__(self, lex_file, align_model=None, src_file=None, tg_file=None, tmp_dir=None):
+    # <aligners> -- number of fast_align pipelines which align the data in parallel
+    def __init__(self, lex_file, align_model=None, src_file=None, tg_file=None, tmp_dir=None, aligners=1):
 
         tmp_dir = mk_tmp_dir(tmp_dir)
         self.tmp = tmp_dir
+        self.aligners = aligners
 
         if align_model is None:
             if src_file is not None and tg_file is not None:
@@ -31,19 +32,7 @@ class AlignmentRepresentationGenerator(RepresentationGenerator):
     # src, tg - lists of lists
     # each inner list is a sentence
     def get_alignments(self, src, tg, out, align_model):
-        out_file = open(out, 'w')
-        alignments = [[[] for j in range(len(tg[i]))] for i in range(len(tg))]
-        aligner = Aligner(align_model+'.fwd_params', align_model+'.fwd_err', align_model+'.rev_params', align_model+'.rev_err')
-        for idx, (src_list, tg_list) in enumerate(zip(src, tg)):
-            align_string = aligner.align(' '.join(src_list) + ' ||| ' + ' '.join(tg_list))
-            out_file.write('%s\n' % align_string)
-            pairs = align_string.split()
-            for p_str in pairs:
-                p = p_str.split('-')
-                alignments[idx][int(p[1])].append(int(p[0]))
-        aligner.close()
-        out_file.close()
-        return alignments
+        return align_sentences(src, tg, align_model, align_file=out, aligners=self.aligners)
 
     # parse lex.f2e file
     # format of self.lex_prob: dictionary of target words
@@ -6,21 +6,22 @@ import re
 import os
 import codecs
 
-from marmot.util.alignments import train_alignments
-from marmot.util.force_align import Aligner
+from marmot.util.alignments import train_alignments, align_sentences
 from marmot.representations.representation_generator import RepresentationGenerator
 from marmot.experiment.import_utils import mk_tmp_dir
 
 
 class SegmentationRepresentationGenerator(RepresentationGenerator):
 
-    def __init__(self, align_model=None, src_file=None, tg_file=None, lex_prefix=None, tmp_dir=None, moses_dir=None, moses_config=None, workers=1):
+    # <aligners> -- number of fast_align pipelines which align the data in parallel
+    def __init__(self, align_model=None, src_file=None, tg_file=None, lex_prefix=None, tmp_dir=None, moses_dir=None, moses_config=None, workers=1, aligners=1):
 
         self.tmp_dir = mk_tmp_dir(tmp_dir)
         self.time_stamp = str(time.time())
         self.moses_dir = moses_dir
         self.moses_config = moses_config
         self.workers = workers
+        self.aligners = aligners
         self.lex_prob = lex_prefix
 
         if align_model is None:
@@ -86,19 +87,7 @@ class SegmentationRepresentationGenerator(RepresentationGenerator):
     # align_file - new file to store the alignments
     # each inner list is a sentence
     def get_alignments(self, src, tg, align_model, align_file):
-        alignments = [[[] for j in range(len(tg[i]))] for i in range(len(tg))]
-        align_stream = open(align_file, 'w')
-        aligner = Aligner(align_model+'.fwd_params', align_model+'.fwd_err', align_model+'.rev_params', align_model+'.rev_err')
-        for idx, (src_list, tg_list) in enumerate(zip(src, tg)):
-            align_string = aligner.align(' '.join(src_list) + ' ||| ' + ' '.join(tg_list))
-            align_stream.write('%s\n' % align_string)
-            pairs = align_string.split()
-            for p_str in pairs:
-                p = p_str.split('-')
-                alignments[idx][int(p[1])].append(int(p[0]))
-        aligner.close()
-        align_stream.close()
-        return alignments
+        return align_sentences(src, tg, align_model, align_file=align_file, aligners=self.aligners)
 
     def get_segments(self, data_obj, segmentation_file):
         seg_regexp = re.compile("\|\d+-\d+\|")
@@ -3,7 +3,7 @@ import sys
 import shutil
 from subprocess import Popen
 
-from marmot.util.force_align import Aligner
+from marmot.util.force_align import AlignerPool
 from marmot.experiment.import_utils import mk_tmp_dir
 
 
@@ -50,33 +50,69 @@ def train_alignments(src_train, tg_train, tmp_dir, align_model='align_model'):
     return align_model_full
 
 
+# number of lines of the files aligned at a time (see align_files)
+READ_BATCH_SIZE = 100000
+
+# aligner pools shared by all calls of align_sentence in the process: {alignment model: AlignerPool}
+_sentence_aligners = {}
+
+
+# pool of <size> aligners for the alignment model <align_model> (prefix of the model files)
+def aligner_pool(align_model, size=1):
+    return AlignerPool(align_model+'.fwd_params', align_model+'.fwd_err', align_model+'.rev_params', align_model+'.rev_err', size=size)
+
+
+# source positions aligned to every target word of the sentences
+def parse_alignments(align_strings, tg):
+    alignments = [[[] for j in range(len(tg_line))] for tg_line in tg]
+    for idx, align_str in enumerate(align_strings):
+        for pair in align_str.split():
+            pair = pair.split('-')
+            alignments[idx][int(pair[1])].append(int(pair[0]))
+    return alignments
+
+
 def align_sentence(src_line, tg_line, align_model):
     # TODO: there is an error here if one or both fields are missing -- we cannot align a sentence without both src_line and tg_line
     # throw an error prompting the user to specify another dataset or context creator
     # if not src_line or not tg_line:
 
-    cur_alignments = [[] for i in range(len(tg_line))]
+    # the aligner processes are started once per model
+    if align_model not in _sentence_aligners:
+        _sentence_aligners[align_model] = aligner_pool(align_model)
+    align_str = _sentence_aligners[align_model].align([' '.join(src_line)+u' ||| '+' '.join(tg_line)])[0]
+    return parse_alignments([align_str], [tg_line])[0]
 
-    aligner = Aligner(align_model+'.fwd_params', align_model+'.fwd_err', align_model+'.rev_params', align_model+'.rev_err')
-    align_str = aligner.align(' '.join(src_line)+u' ||| '+' '.join(tg_line))
-    # parse the return value from the aligner
-    for pair in align_str.split():
-        pair = pair.split('-')
-        cur_alignments[int(pair[1])].append(int(pair[0]))
-    aligner.close()
 
-    return cur_alignments
+# align the sentences <src>, <tg> (lists of lists of words) with <aligners> parallel aligners
+# returns the source positions aligned to every target word,
+# the alignment strings ('<source position>-<target position> ...') are written to <align_file> (if given)
+def align_sentences(src, tg, align_model, align_file=None, aligners=1):
+    pool = aligner_pool(align_model, size=aligners)
+    align_strings = pool.align([' '.join(src_list) + u' ||| ' + ' '.join(tg_list) for src_list, tg_list in zip(src, tg)])
+    pool.close()
+    if align_file is not None:
+        align_out = open(align_file, 'w')
+        align_out.writelines(['%s\n' % align_str for align_str in align_strings])
+        align_out.close()
+    return parse_alignments(align_strings, tg)
 
 
-def align_files(src_file, tg_file, align_model, align_file):
+def align_files(src_file, tg_file, align_model, align_file, aligners=1):
     '''
     align 2 files and put the alignments in a new file
     :align_model: - alignment model prefix
     :align_file: - new file to store the alignments
+    :aligners: - number of parallel aligners
     '''
-    aligner = Aligner(align_model+'.fwd_params', align_model+'.fwd_err', align_model+'.rev_params', align_model+'.rev_err')
+    pool = aligner_pool(align_model, size=aligners)
     align_out = open(align_file, 'w')
+    lines = []
     for src_line, tg_line in zip(open(src_file), open(tg_file)):
-        align_out.write('%s\n' % aligner.align(src_line[:-1].decode('utf-8') + u' ||| ' + tg_line[:-1].decode('utf-8')))
-    aligner.close()
+        lines.append(src_line[:-1].decode('utf-8') + u' ||| ' + tg_line[:-1].decode('utf-8'))
+        if len(lines) == READ_BATCH_SIZE:
+            align_out.writelines(['%s\n' % align_str for align_str in pool.align(lines)])
+            lines = []
+    align_out.writelines(['%s\n' % align_str for align_str in pool.align(lines)])
+    pool.close()
     align_out.close()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+#encoding: utf-8
+
+# local backoff language model read from an ARPA file (SRILM ngram-count -lm, KenLM lmplz, ...)
+# parsing a large ARPA file takes minutes, so it's converted once into a binary file (<arpa_file>.lm_store):
+#   - the n-grams are stored like in an NgramStore (vocabulary, sorted 64-bit keys, word ids)
+#   - the log10 probabilities and backoff weights are quantized to <bits> bits, with one codebook per order
+# the arrays are memory-mapped, so loading the binary file takes seconds and the pages are shared by all processes
+# the models are loaded once per process through a registry (get_arpa_lm)
+
+from __future__ import print_function, division
+
+import os
+import gzip
+import struct
+
+import numpy as np
+
+from marmot.util.ngram_store import NgramStore, encode_ngrams, ngram_keys, store_file_name
+from marmot.util.vocabulary import START, END
+
+
+MAGIC = b'MARMOTLM'
+VERSION = 1
+# magic, version, order, number of words, number of ngrams, size of the vocabulary in bytes, bits of the quantized values
+HEADER = struct.Struct('<8siiqqqi')
+
+# bits of the quantized probabilities and backoff weights
+BITS = 8
+
+UNK = '<unk>'
+# log10 probability of an unknown word if the model has no <unk> (SRILM uses the same value for zero probabilities)
+OOV_LOGPROB = -99.0
+
+
+# (tuple of words, log10 probability, log10 backoff weight) for every n-gram of an ARPA file (can be gzipped)
+def read_arpa(arpa_file):
+    a_file = gzip.open(arpa_file, 'rb') if arpa_file.endswith('.gz') else open(arpa_file, 'rb')
+    order = 0
+    for line in a_file:
+        line = line.decode('utf-8').strip()
+        if line == '':
+            continue
+        if line.startswith('\\'):
+            # '\<n>-grams:' starts the n-grams of order n, '\data\' and '\end\' have no n-grams
+            order = int(line[1:line.index('-')]) if line.endswith('-grams:') else 0
+            continue
+        if order == 0:
+            continue
+        fields = line.split()
+        backoff = float(fields[order + 1]) if len(fields) > order + 1 else 0.0
+        yield tuple(fields[1:order + 1]), float(fields[0]), backoff
+    a_file.close()
+
+
+def quantize(values, orders, order, bits, iterations=10):
+    '''
+    Quantize the values of every n-gram order to <bits> bits.
+    If an order has more than 2^<bits> different values, the bins are quantiles of the different values
+    refined by a few iterations of Lloyd's algorithm (the value of a bin is the mean of its values).
+    Returns the codes and the codebook (one row per order).
+    '''
+    n_bins = 1 << bits
+    codes = np.zeros(len(values), dtype=np.uint8 if bits <= 8 else np.uint16)
+    codebook = np.zeros((order, n_bins), dtype='<f4')
+    for cur_order in range(1, order + 1):
+        mask = orders == cur_order
+        if not mask.any():
+            continue
+        cur_values = values[mask]
+        unique_values = np.unique(cur_values)
+        if len(unique_values) <= n_bins:
+            codes[mask] = np.searchsorted(unique_values, cur_values)
+            codebook[cur_order - 1, :len(unique_values)] = unique_values
+            continue
+        edges = np.percentile(unique_values, np.linspace(0, 100, n_bins + 1)[1:-1])
+        cur_codes = np.searchsorted(edges, cur_values, side='right')
+        for i in range(iterations + 1):
+            counts = np.bincount(cur_codes, minlength=len(edges) + 1)
+            centers = np.bincount(cur_codes, weights=cur_values, minlength=len(edges) + 1) / np.maximum(counts, 1)
+            if i == iterations:
+                break
+            # the bins are the values closest to the centers (empty bins are dropped)
+            centers = centers[counts > 0]
+            edges = (centers[1:] + centers[:-1]) / 2
+            cur_codes = np.searchsorted(edges, cur_values)
+        codebook[cur_order - 1, :len(centers)] = centers
+        codes[mask] = cur_codes
+    return codes, codebook
+
+
+class ArpaLM(NgramStore):
+    '''
+    Backoff language model with memory-mapped n-grams and quantized probabilities.
+    lm.get(ngram) is the log10 probability of an n-gram of the model, score_sentence() scores whole sentences.
+    '''
+
+    def __init__(self, words, keys, ids, order, bits, prob_codes, backoff_codes, prob_codebook, backoff_codebook):
+        NgramStore.__init__(self, words, keys, None, ids, order)
+        self.bits = bits
+        self.prob_codes = prob_codes
+        self.backoff_codes = backoff_codes
+        self.prob_codebook = prob_codebook
+        self.backoff_codebook = backoff_codebook
+        self.has_unk = UNK in self.word2id
+
+    def __reduce__(self):
+        if self.source is not None:
+            return (get_arpa_lm, (self.source, self.cache_dir))
+        return (ArpaLM, (self.words, self.keys, self.ids, self.order, self.bits, self.prob_codes, self.backoff_codes, self.prob_codebook, self.backoff_codebook))
+
+    # log10 probability and backoff weight of the n-gram of <n> words at the position <pos>
+    def prob_at(self, pos, n):
+        return float(self.prob_codebook[n - 1, self.prob_codes[pos]])
+
+    def backoff_at(self, pos, n):
+        return float(self.backoff_codebook[n - 1, self.backoff_codes[pos]])
+
+    def get(self, ngram, default=None):
+        pos = self.find(ngram)
+        return self.prob_at(pos, len(ngram)) if pos != -1 else default
+
+    def __getitem__(self, ngram):
+        pos = self.find(ngram)
+        if pos == -1:
+            raise KeyError(ngram)
+        return self.prob_at(pos, len(ngram))
+
+    def iter_ngrams(self):
+        for pos in range(len(self.keys)):
+            ngram = tuple([self.words[i] for i in self.ids[pos] if i != -1])
+            yield ngram, self.prob_at(pos, len(ngram)), self.backoff_at(pos, len(ngram))
+
+    def score_sentence(self, sentence):
+        '''
+        Score a sentence (list of words) padded with START and END.
+        Returns three lists with one value per word and one for END:
+          - log10 probabilities of the words given their left context
+          - number of words of the longest n-gram of the model which ends at the word (0 for unknown words)
+          - OOV flags (1 for words which are not in the vocabulary of the model)
+        The search for the longest n-gram starts from the result of the previous word
+        (an n-gram is in the model only if its prefix is), see marmot.util.lm_scan
+        '''
+        oovs = [0 if word in self.word2id else 1 for word in sentence] + [0]
+        words = [START] + [UNK if oov and self.has_unk else word for word, oov in zip(sentence, oovs)] + [END]
+        logprobs, lengths = [], []
+        prev = 1 if self.find((START,)) != -1 else 0
+        for i in range(1, len(words)):
+            n = min(prev + 1, self.order, i + 1)
+            pos = -1
+            while n > 0:
+                pos = self.find(words[i - n + 1:i + 1])
+                if pos != -1:
+                    break
+                n -= 1
+            if n == 0:
+                logprob = OOV_LOGPROB
+            else:
+                logprob = self.prob_at(pos, n)
+                # backoff weights of the longer contexts (only contexts up to the length <prev> can be in the model)
+                for k in range(n, min(prev, self.order - 1) + 1):
+                    context_pos = self.find(words[i - k:i])
+                    if context_pos != -1:
+                        logprob += self.backoff_at(context_pos, k)
+            logprobs.append(logprob)
+            lengths.append(n)
+            prev = n
+        return logprobs, lengths, oovs
+
+    def save(self, file_name):
+        vocabulary = u'\n'.join(self.words).encode('utf-8')
+        # temporary file + rename: a concurrent reader never sees a half-written model
+        tmp_name = '{}.{}.tmp'.format(file_name, os.getpid())
+        out = open(tmp_name, 'wb')
+        out.write(HEADER.pack(MAGIC, VERSION, self.order, len(self.words), len(self.keys), len(vocabulary), self.bits))
+        out.write(vocabulary)
+        out.write(b'\0' * (-(HEADER.size + len(vocabulary)) % 8))
+        out.write(np.ascontiguousarray(self.prob_codebook, dtype='<f4').tobytes())
+        out.write(np.ascontiguousarray(self.backoff_codebook, dtype='<f4').tobytes())
+        out.write(np.ascontiguousarray(self.keys, dtype='<i8').tobytes())
+        out.write(np.ascontiguousarray(self.ids, dtype='<i4').tobytes())
+        out.write(np.ascontiguousarray(self.prob_codes).tobytes())
+        out.write(np.ascontiguousarray(self.backoff_codes).tobytes())
+        out.close()
+        os.rename(tmp_name, file_name)
+
+    @staticmethod
+    def load(file_name):
+        in_file = open(file_name, 'rb')
+        magic, version, order, n_words, n_ngrams, vocabulary_size, bits = HEADER.unpack(in_file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{} is not a language model of version {}'.format(file_name, VERSION))
+        words = in_file.read(vocabulary_size).decode('utf-8').split(u'\n')
+        in_file.close()
+        offset = HEADER.size + vocabulary_size
+        offset += -offset % 8
+        n_bins = 1 << bits
+        code_type = '<u1' if bits <= 8 else '<u2'
+
+        # plain ndarray views of the mapped file (lookups on np.memmap objects are slower)
+        def mapped(dtype, shape):
+            return np.memmap(file_name, dtype=dtype, mode='r', offset=offset, shape=shape).view(np.ndarray)
+
+        prob_codebook = mapped('<f4', (order, n_bins))
+        offset += 4 * order * n_bins
+        backoff_codebook = mapped('<f4', (order, n_bins))
+        offset += 4 * order * n_bins
+        keys = mapped('<i8', (n_ngrams,))
+        offset += 8 * n_ngrams
+        ids = mapped('<i4', (n_ngrams, order))
+        offset += 4 * n_ngrams * order
+        prob_codes = mapped(code_type, (n_ngrams,))
+        offset += prob_codes.nbytes
+        backoff_codes = mapped(code_type, (n_ngrams,))
+        return ArpaLM(words, keys, ids, order, bits, prob_codes, backoff_codes, prob_codebook, backoff_codebook)
+
+    @staticmethod
+    def from_arpa(arpa_file, bits=BITS):
+        values = []
+        words, id_matrix = encode_ngrams(((ngram, (prob, backoff)) for ngram, prob, backoff in read_arpa(arpa_file)), values)
+        order = id_matrix.shape[1]
+        values = np.array(values, dtype=np.float64).reshape((len(values), 2))
+        ngram_orders = (id_matrix != -1).sum(axis=1)
+        prob_codes, prob_codebook = quantize(values[:, 0], ngram_orders, order, bits)
+        backoff_codes, backoff_codebook = quantize(values[:, 1], ngram_orders, order, bits)
+        keys = ngram_keys(id_matrix.astype(np.int64))
+        sort_order = np.argsort(keys, kind='mergesort')
+        return ArpaLM(words, keys[sort_order], id_matrix[sort_order], order, bits, prob_codes[sort_order], backoff_codes[sort_order], prob_codebook, backoff_codebook)
+
+
+def is_lm_store(file_name):
+    with open(file_name, 'rb') as a_file:
+        return a_file.read(len(MAGIC)) == MAGIC
+
+
+_models = {}
+
+
+# the model for <lm_file> (an ARPA file or its binary version), loaded once per process
+# the binary version of an ARPA file is created in the cache directory (see ngram_store.resource_cache_dir) on first use
+# and rebuilt if the ARPA file is newer
+def get_arpa_lm(lm_file, cache_dir=None):
+    path = os.path.abspath(lm_file)
+    binary_file = path if is_lm_store(path) else store_file_name(path, '.lm_store', cache_dir)
+    if binary_file not in _models:
+        if binary_file != path and (not os.path.exists(binary_file) or os.path.getmtime(binary_file) < os.path.getmtime(path)):
+            print("Converting the language model {} to the binary file {}".format(path, binary_file))
+            ArpaLM.from_arpa(path).save(binary_file)
+        _models[binary_file] = ArpaLM.load(binary_file)
+        _models[binary_file].source = path
+        _models[binary_file].cache_dir = cache_dir
+    return _models[binary_file]
+
+
+# probability features of the word <idx> of a scored sentence (the result of ArpaLM.score_sentence):
+# log10 probability, perplexity of the words <idx> - <window_size> .. <idx> + <window_size>, OOV flag
+# OOV words are not counted in the perplexity (as in SRILM), the perplexity of a window of OOV words is 0
+def word_scores(scores, idx, window_size):
+    logprobs, lengths, oovs = scores
+    # the last score is END
+    window = range(max(idx - window_size, 0), min(idx + window_size + 1, len(logprobs) - 1))
+    known = [logprobs[i] for i in window if not oovs[i]]
+    perplexity = 10 ** (-sum(known) / len(known)) if len(known) > 0 else 0.0
+    return [logprobs[idx], perplexity, oovs[idx]]
@@ -0,0 +1,371 @@
+#!/usr/bin/env python
+#encoding: utf-8
+
+# columnar storage for a dataset and lightweight context views over it
+# a data_obj ({representation_name: [per-sentence representation]}) is stored once, column by column,
+# and every token context is a small view object holding only (sentence_id, index)
+# all other context fields are resolved lazily from the store when a feature extractor asks for them
+
+from __future__ import print_function
+
+import bisect
+from array import array
+
+try:
+    from collections.abc import Mapping
+except ImportError:  # Python 2
+    from collections import Mapping
+
+try:
+    string_types = basestring
+except NameError:  # Python 3
+    string_types = str
+
+
+# fields which are computed for every token and not stored in the columns
+TOKEN_FIELDS = ('token', 'index', 'sentence_id', 'tag', 'sequence_tags')
+
+
+# a representation is stored as a column if it has one value per sentence
+# strings (e.g. 'target_file') and dicts are corpus-level values shared by all contexts
+def is_sequence_column(value):
+    return hasattr(value, '__len__') and hasattr(value, '__getitem__') and not isinstance(value, (string_types, dict))
+
+
+class CorpusStore(object):
+    '''
+    Columnar storage for a data_obj:
+      - one column per representation ('target', 'source', 'alignments', 'target_pos', ...),
+        every column holds the values for each sentence (the lists of the data_obj are reused, not copied)
+      - corpus-level values (file names etc.) are stored once
+      - sentence offsets: offsets[s] is the position of the first token of sentence s in the flat token numbering
+      - interned string fields: the ids of the tokens in the vocabularies of the store (see marmot.util.vocabulary),
+        stored in flat integer arrays with their own sentence offsets next to the string columns
+    <first_sentence> -- number of the first sentence of the store in the whole corpus
+                        (the value of 'sentence_id' in contexts of a store which holds a part of the corpus)
+    <vocabularies> -- marmot.util.vocabulary.Vocabularies: the fields to intern when the store is created, None -- nothing is interned.
+                      The stores of all datasets of an experiment share one Vocabularies object.
+                      The store is created in the main process, so the ids are the same in all worker processes which receive the contexts
+    '''
+
+    def __init__(self, data_obj, first_sentence=0, vocabularies=None):
+        if 'target' not in data_obj:
+            raise ValueError("No 'target' label in data representations")
+        self.first_sentence = first_sentence
+        self.columns = {}
+        self.constants = {}
+        self.vocabularies = vocabularies
+        # interned fields: {field: (flat array of ids, array of sentence offsets)}
+        self.id_columns = {}
+        for key, value in data_obj.items():
+            if is_sequence_column(value):
+                self.columns[key] = value
+            else:
+                self.constants[key] = value
+        # the same behaviour as zip(*data_obj.values()) -- the shortest representation defines the corpus size
+        self.n_sentences = min([len(col) for col in self.columns.values()])
+
+        self.offsets = array('l', [0])
+        target = self.columns['target']
+        for s_idx in range(self.n_sentences):
+            self.offsets.append(self.offsets[-1] + len(target[s_idx]))
+        if vocabularies is not None:
+            self.intern(vocabularies)
+
+    def __len__(self):
+        return self.n_sentences
+
+    def n_tokens(self):
+        return self.offsets[-1]
+
+    def sentence_length(self, sentence_id):
+        return self.offsets[sentence_id + 1] - self.offsets[sentence_id]
+
+    def has_field(self, key):
+        if key == 'tag':
+            return 'tags' in self.columns
+        elif key == 'sequence_tags':
+            return self.has_sequence_tags()
+        elif key in TOKEN_FIELDS:
+            return True
+        elif key == 'tags':
+            return False
+        elif key.endswith('_ids') and key[:-4] in self.id_columns:
+            return True
+        return key in self.columns or key in self.constants
+
+    def has_sequence_tags(self):
+        return 'tags' in self.columns and self.n_sentences > 0 and is_sequence_column(self.columns['tags'][0])
+
+    # names of all fields available in a context object
+    def field_names(self):
+        names = ['token', 'index', 'sentence_id']
+        if 'tags' in self.columns:
+            names.append('tag')
+            if self.has_sequence_tags():
+                names.append('sequence_tags')
+        names.extend([k for k in self.columns if k != 'tags'])
+        names.extend(self.constants.keys())
+        names.extend([k + '_ids' for k in self.id_columns])
+        return names
+
+    # value of a sentence-level field
+    def field(self, key, sentence_id):
+        if key in self.columns:
+            return self.columns[key][sentence_id]
+        return self.constants[key]
+
+    # value of a field for the token <index> of the sentence <sentence_id>
+    def token_field(self, key, sentence_id, index):
+        if key == 'token':
+            return self.columns['target'][sentence_id][index]
+        elif key == 'index':
+            return index
+        elif key == 'sentence_id':
+            return self.first_sentence + sentence_id
+        elif key == 'tag':
+            return self.columns['tags'][sentence_id][index]
+        elif key == 'sequence_tags':
+            if not self.has_sequence_tags():
+                raise KeyError(key)
+            return self.columns['tags'][sentence_id]
+        elif key == 'tags':
+            raise KeyError(key)
+        elif key.endswith('_ids') and key[:-4] in self.id_columns:
+            return self.ids(key[:-4], sentence_id)
+        try:
+            return self.field(key, sentence_id)
+        except KeyError:
+            raise KeyError(key)
+
+    # integer ids of the strings of the fields of <vocabularies>, the string columns are kept
+    # (string features and context filters still read them)
+    # the ids of a sentence are available in the context objects as '<field>_ids'
+    def intern(self, vocabularies):
+        for field in vocabularies.names():
+            if field not in self.columns or field in self.id_columns:
+                continue
+            vocabulary = vocabularies.get(field)
+            ids = array('i')
+            offsets = array('l', [0])
+            column = self.columns[field]
+            for s_idx in range(self.n_sentences):
+                ids.extend([vocabulary.add(tok) for tok in column[s_idx]])
+                offsets.append(len(ids))
+            self.id_columns[field] = (ids, offsets)
+
+    # ids of the interned field <field> for the sentence <sentence_id>
+    def ids(self, field, sentence_id):
+        ids, offsets = self.id_columns[field]
+        return ids[offsets[sentence_id]:offsets[sentence_id + 1]]
+
+    # convert a flat token number into (sentence_id, index)
+    def locate(self, position):
+        sentence_id = bisect.bisect_right(self.offsets, position) - 1
+        return sentence_id, position - self.offsets[sentence_id]
+
+    def context(self, sentence_id, index):
+        return ContextView(self, sentence_id, index)
+
+    def sentence_contexts(self, sentence_id):
+        return [ContextView(self, sentence_id, idx) for idx in range(self.sentence_length(sentence_id))]
+
+    def iter_contexts(self):
+        for s_idx in range(self.n_sentences):
+            for idx in range(self.sentence_length(s_idx)):
+                yield ContextView(self, s_idx, idx)
+
+
+class ContextView(object):
+    '''
+    A context object: behaves like the dict produced by the old create_context
+    ({'token': ..., 'index': ..., 'tag': ..., 'target': [...], 'source': [...], ...}),
+    but keeps only a reference to the store and the token position.
+    Values written to a view (a new tag, a representation computed by an extractor) are kept in the view's own
+    overlay dict, like in the old per-token dicts: the columns of the store (the data of the caller) are never changed.
+    '''
+
+    __slots__ = ('store', 'sentence_id', 'index', 'overlay')
+
+    def __init__(self, store, sentence_id, index):
+        self.store = store
+        self.sentence_id = sentence_id
+        self.index = index
+        # created on the first write
+        self.overlay = None
+
+    def __getitem__(self, key):
+        if self.overlay is not None and key in self.overlay:
+            return self.overlay[key]
+        return self.store.token_field(key, self.sentence_id, self.index)
+
+    def __setitem__(self, key, value):
+        if self.overlay is None:
+            self.overlay = {}
+        self.overlay[key] = value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except (KeyError, IndexError):
+            return default
+
+    def __contains__(self, key):
+        return self.overlay is not None and key in self.overlay or self.store.has_field(key)
+
+    def has_key(self, key):
+        return key in self
+
+    def keys(self):
+        names = self.store.field_names()
+        if self.overlay is not None:
+            names.extend([k for k in self.overlay if k not in names])
+        return names
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, ContextView):
+            return self.store is other.store and self.sentence_id == other.sentence_id and self.index == other.index and \
+                (self.overlay or {}) == (other.overlay or {})
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        res = self.__eq__(other)
+        return res if res is NotImplemented else not res
+
+    __hash__ = None
+
+    # pickling (e.g. to send a context to a worker process) produces a plain dict,
+    # otherwise the whole store would be serialized with every context
+    def __reduce__(self):
+        return (dict, (self.items(),))
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+Mapping.register(ContextView)
+
+
+class TokenIndex(object):
+    '''
+    Token index over a CorpusStore: {token: posting list of flat token positions}.
+    Built in a single pass over the 'target' column, positions are kept in compact arrays.
+    Behaves like the old {token: [<context>, ...]} dict -- index[token] returns the context views of the token.
+    The views are created on first access and kept, so the values written to them are seen in the next accesses
+    (e.g. the tags changed by the context filters).
+    '''
+
+    def __init__(self, store, postings=None, views=None):
+        self.store = store
+        # {flat token position: ContextView}
+        self.views = views if views is not None else {}
+        if postings is None:
+            postings = {}
+            position = 0
+            target = store.columns['target']
+            for s_idx in range(len(store)):
+                for token in target[s_idx]:
+                    if token not in postings:
+                        postings[token] = array('l')
+                    postings[token].append(position)
+                    position += 1
+        self.postings = postings
+
+    def positions(self, token):
+        return self.postings[token]
+
+    def count(self, token):
+        return len(self.postings[token])
+
+    def view(self, position):
+        context = self.views.get(position)
+        if context is None:
+            context = ContextView(self.store, *self.store.locate(position))
+            self.views[position] = context
+        return context
+
+    def contexts(self, token):
+        return [self.view(pos) for pos in self.postings[token]]
+
+    def tags(self, token):
+        store = self.store
+        tags = store.columns['tags']
+        res = []
+        for pos in self.postings[token]:
+            context = self.views.get(pos)
+            if context is not None:
+                res.append(context['tag'])
+            else:
+                s_idx, idx = store.locate(pos)
+                res.append(tags[s_idx][idx])
+        return res
+
+    def tag_counts(self, token):
+        counts = {}
+        for tag in self.tags(token):
+            counts[tag] = counts.get(tag, 0) + 1
+        return counts
+
+    # new index with a part of the tokens (the store, the posting lists and the views are shared)
+    def subset(self, tokens):
+        return TokenIndex(self.store, {token: self.postings[token] for token in tokens}, self.views)
+
+    # put per-token values (e.g. predictions of per-token classifiers) back in the corpus order
+    # <values_by_token> -- {token: [value for every occurrence of the token]}
+    # tokens which are not in <values_by_token> get the value <default>
+    def scatter(self, values_by_token, default=None):
+        res = [default for i in range(self.store.n_tokens())]
+        for token, values in values_by_token.items():
+            for pos, val in zip(self.postings[token], values):
+                res[pos] = val
+        return res
+
+    def __getitem__(self, token):
+        return self.contexts(token)
+
+    def __contains__(self, token):
+        return token in self.postings
+
+    def __len__(self):
+        return len(self.postings)
+
+    def __iter__(self):
+        return iter(self.postings)
+
+    def keys(self):
+        return list(self.postings.keys())
+
+    def values(self):
+        return [self.contexts(token) for token in self.postings]
+
+    def iteritems(self):
+        for token in self.postings:
+            yield token, self.contexts(token)
+
+    def items(self):
+        return list(self.iteritems())
+
+    def get(self, token, default=None):
+        if token in self.postings:
+            return self.contexts(token)
+        return default
+
+
+Mapping.register(TokenIndex)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+#encoding: utf-8
+
+# fitted feature encoders saved to a compact binary file, so a model trained once can score new data
+# without fitting the encoders on the training data again
+# the file holds (no pickled objects):
+#   - a JSON header: the type and the parameters of the encoder, the feature names, the kinds of the categorical
+#     features and the list of the tables which follow the header
+#   - the vocabularies of the categorical features in the slot order (see encode_strings)
+#   - the scaling factors of the numeric features (float32)
+#   - the corpus vocabularies of the experiment (marmot.util.vocabulary.Vocabularies): FeatureId values are ids of these vocabularies,
+#     the vocabularies are restored when the encoder is loaded, so new data gets the same ids
+
+from __future__ import print_function
+
+import ast
+import json
+import os
+import struct
+
+import numpy as np
+
+from marmot.util.feature_encoder import CategoricalEncoder, HashingEncoder
+from marmot.util.vocabulary import FeatureId
+
+
+MAGIC = b'MARMOTEN'
+VERSION = 2
+# magic, version, size of the JSON header in bytes
+HEADER = struct.Struct('<8siq')
+
+
+# a value of a categorical feature as a string: the first character is its type
+def encode_value(value):
+    if isinstance(value, FeatureId):
+        return u'i' + unicode(int(value))
+    elif isinstance(value, unicode):
+        return u'u' + value
+    elif isinstance(value, str):
+        return u'b' + value.decode('utf-8')
+    return u'r' + unicode(repr(value))
+
+
+def decode_value(text):
+    kind, value = text[0], text[1:]
+    if kind == u'i':
+        return FeatureId(int(value))
+    elif kind == u'u':
+        return value
+    elif kind == u'b':
+        return value.encode('utf-8')
+    return ast.literal_eval(value)
+
+
+# a table of values: the lengths of the encoded values in bytes (uint32), then the utf-8 encoded values,
+# so the values may contain any character (no separator to escape)
+def encode_strings(values):
+    encoded = [encode_value(v).encode('utf-8') for v in values]
+    return np.array([len(data) for data in encoded], dtype='<u4').tobytes() + b''.join(encoded)
+
+
+def decode_strings(data, count):
+    if count == 0:
+        return []
+    start = 4 * count
+    ends = (np.cumsum(np.frombuffer(data[:start], dtype='<u4'), dtype=np.int64) + start).tolist()
+    return [decode_value(data[begin:end].decode('utf-8')) for begin, end in zip([start] + ends[:-1], ends)]
+
+
+# <vocabularies> -- Vocabularies of the corpus the encoder was fitted on, None if no fields were interned
+def save_encoder(encoder, file_name, vocabularies=None):
+    meta = {'feature_names': [unicode(name) for name in encoder.feature_names], 'tables': []}
+    tables = []
+    if isinstance(encoder, HashingEncoder):
+        meta['encoder'] = 'hashing'
+        meta['hash_bits'] = encoder.n_bits
+        meta['signed_hash'] = encoder.signed
+    else:
+        meta['encoder'] = 'one_hot'
+        meta['n_columns'] = encoder.n_columns
+        meta['kinds'] = [[col, encoder.kinds[col]] for col in sorted(encoder.kinds)]
+        for col in sorted(encoder.vocabularies):
+            vocabulary = encoder.vocabularies[col]
+            tables.append((u'values.{}'.format(col), 'strings', len(vocabulary), encode_strings(sorted(vocabulary, key=vocabulary.get))))
+    if encoder.scales is not None:
+        tables.append((u'scales', 'float32', len(encoder.scales), np.asarray(encoder.scales, dtype='<f4').tobytes()))
+    for name in vocabularies.names() if vocabularies is not None else []:
+        id2token = vocabularies.get(name).id2token
+        tables.append((u'vocabulary.' + name, 'strings', len(id2token), encode_strings(id2token)))
+    meta['tables'] = [[name, kind, count, len(data)] for name, kind, count, data in tables]
+
+    header = json.dumps(meta).encode('utf-8')
+    # temporary file + rename: a concurrent reader never sees a half-written file
+    tmp_name = '{}.{}.tmp'.format(file_name, os.getpid())
+    out = open(tmp_name, 'wb')
+    out.write(HEADER.pack(MAGIC, VERSION, len(header)))
+    out.write(header)
+    for name, kind, count, data in tables:
+        out.write(data)
+    out.close()
+    os.rename(tmp_name, file_name)
+
+
+def is_encoder_file(file_name):
+    with open(file_name, 'rb') as a_file:
+        return a_file.read(len(MAGIC)) == MAGIC
+
+
+# <vocabularies> -- Vocabularies to restore the saved corpus vocabularies into
+#                   (has to be done before the new corpus is interned), None -- the corpus vocabularies are not restored
+def load_encoder(file_name, vocabularies=None):
+    data = open(file_name, 'rb').read()
+    magic, version, header_size = HEADER.unpack(data[:HEADER.size])
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('{} is not an encoder file of version {}'.format(file_name, VERSION))
+    meta = json.loads(data[HEADER.size:HEADER.size + header_size].decode('utf-8'))
+    position = HEADER.size + header_size
+    tables = {}
+    for name, kind, count, size in meta['tables']:
+        chunk = data[position:position + size]
+        position += size
+        if kind == 'float32':
+            tables[name] = np.frombuffer(chunk, dtype='<f4').astype(np.float32)
+        else:
+            tables[name] = decode_strings(chunk, count)
+
+    if meta['encoder'] == 'hashing':
+        encoder = HashingEncoder(feature_names=meta['feature_names'], n_bits=meta['hash_bits'], signed=meta['signed_hash'])
+    else:
+        encoder = CategoricalEncoder(feature_names=meta['feature_names'])
+        encoder.n_columns = meta['n_columns']
+        encoder.kinds = {col: kind for col, kind in meta['kinds']}
+        encoder.vocabularies = {col: {value: slot + 1 for slot, value in enumerate(tables[u'values.{}'.format(col)])} for col in encoder.kinds}
+        widths = np.ones(encoder.n_columns, dtype=np.int64)
+        for col, vocabulary in encoder.vocabularies.items():
+            widths[col] = len(vocabulary) + 1
+        encoder.offsets = np.concatenate([[0], np.cumsum(widths)])
+    if u'scales' in tables:
+        encoder.scale = True
+        encoder.scales = tables[u'scales']
+    if vocabularies is not None:
+        for name in tables:
+            if name.startswith(u'vocabulary.'):
+                vocabularies.restore(name[len(u'vocabulary.'):], tables[name])
+    return encoder
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+#encoding: utf-8
+
+# per-extractor profiling of the feature extraction
+# every call of a feature extractor (one call per sentence batch) is measured:
+#   - wall time, number of calls, number of tokens
+#   - number of exceptions raised by the extractor
+#   - growth of the peak memory (maximum resident set size) of the process during the call
+# the overhead is a few microseconds per sentence, so the profiler is always on
+
+from __future__ import print_function, division
+
+import time
+import json
+import logging
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+logger = logging.getLogger('experiment_logger')
+
+STAT_NAMES = ('seconds', 'calls', 'tokens', 'exceptions', 'peak_memory_kb')
+
+
+def peak_memory():
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class ExtractorProfiler(object):
+    '''
+    Statistics of the feature extractors: {extractor name: {stat name: value}}.
+    Worker processes have their own profilers, their statistics are merged into the profiler of the main process.
+    '''
+
+    def __init__(self):
+        self.stats = {}
+
+    def reset(self):
+        self.stats = {}
+
+    def record(self, name, seconds, tokens, memory, failed=False):
+        if name not in self.stats:
+            self.stats[name] = {stat: 0 for stat in STAT_NAMES}
+        cur_stats = self.stats[name]
+        cur_stats['seconds'] += seconds
+        cur_stats['calls'] += 1
+        cur_stats['tokens'] += tokens
+        cur_stats['peak_memory_kb'] += memory
+        if failed:
+            cur_stats['exceptions'] += 1
+
+    # measure one call of an extractor for <tokens> tokens
+    @contextmanager
+    def measure(self, extractor, tokens):
+        name = type(extractor).__name__
+        memory = peak_memory()
+        start = time.time()
+        try:
+            yield
+        except Exception:
+            self.record(name, time.time() - start, tokens, peak_memory() - memory, failed=True)
+            raise
+        self.record(name, time.time() - start, tokens, peak_memory() - memory)
+
+    # add the statistics collected in another process
+    def merge(self, stats):
+        for name, other_stats in stats.items():
+            if name not in self.stats:
+                self.stats[name] = {stat: 0 for stat in STAT_NAMES}
+            for stat in STAT_NAMES:
+                self.stats[name][stat] += other_stats[stat]
+
+    # rows of the report, the slowest extractor first
+    def report(self):
+        rows = []
+        for name, cur_stats in self.stats.items():
+            row = {'extractor': name}
+            row.update(cur_stats)
+            row['tokens_per_second'] = cur_stats['tokens'] / cur_stats['seconds'] if cur_stats['seconds'] > 0 else 0.0
+            rows.append(row)
+        total = sum([row['seconds'] for row in rows])
+        for row in rows:
+            row['time_share'] = row['seconds'] / total if total > 0 else 0.0
+        return sorted(rows, key=lambda row: row['seconds'], reverse=True)
+
+    def log_summary(self):
+        rows = self.report()
+        if len(rows) == 0:
+            return
+        logger.info('Feature extraction profile (slowest first):')
+        for row in rows:
+            logger.info('{extractor}: {seconds:.2f}s ({time_share:.1%}), {calls} calls, {tokens_per_second:.0f} tokens/s, {exceptions} exceptions, peak memory +{peak_memory_kb} KB'.format(**row))
+
+    # save the report in JSON or TSV format (depending on the extension of <file_name>)
+    def write(self, file_name):
+        rows = self.report()
+        columns = ['extractor', 'seconds', 'time_share', 'calls', 'tokens', 'tokens_per_second', 'exceptions', 'peak_memory_kb']
+        out = open(file_name, 'w')
+        if file_name.endswith('.json'):
+            json.dump(rows, out, indent=2, sort_keys=True)
+        else:
+            out.write('\t'.join(columns) + '\n')
+            for row in rows:
+                out.write('\t'.join([str(row[col]) for col in columns]) + '\n')
+        out.close()
+        logger.info('Feature extraction profile saved to {}'.format(file_name))
+
+
+# the profiler of the current process
+profiler = ExtractorProfiler()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+#encoding: utf-8
+
+# feature rows split into dense numeric blocks and categorical columns
+# the extractors return one flat list of values per context, where a w2v vector or a list of LM scores
+# gives one column per number. Only the categorical columns need binarization, so the numeric columns
+# are stored as float32 matrices (one per run of consecutive numeric columns) and never touched column by column
+
+from __future__ import print_function
+
+import numbers
+
+import numpy as np
+
+from marmot.util.vocabulary import FeatureId
+
+
+# numbers are dense features, strings, lists and interned ids (FeatureId) are categorical
+def is_numeric(value):
+    return isinstance(value, numbers.Number) and not isinstance(value, FeatureId)
+
+
+def is_integer(value):
+    return isinstance(value, numbers.Integral) and not isinstance(value, (bool, FeatureId))
+
+
+# runs of consecutive columns of the same kind: (first column, last column + 1, is numeric)
+def column_runs(flags):
+    runs = []
+    for col, flag in enumerate(flags):
+        if len(runs) > 0 and runs[-1][2] == flag:
+            runs[-1][1] = col + 1
+        else:
+            runs.append([col, col + 1, flag])
+    return [tuple(run) for run in runs]
+
+
+class FeatureBlocks(object):
+    '''
+    Features of a list of contexts stored by column kind:
+      - dense -- a float32 matrix with all numeric columns (n_rows x n_dense)
+      - columns -- {column number: list of values} for the categorical columns
+      - layout -- the original column order: a list of ('dense', first, last + 1, offset in <dense>)
+                  and ('column', column, column + 1, None) entries
+      - int_columns -- numbers of the dense columns with integer values, the rows get ints in these columns
+                       (so e.g. an LM order is written as '2' and not as '2.0')
+    '''
+
+    def __init__(self, n_rows, dense, columns, layout, int_columns=()):
+        self.n_rows = n_rows
+        self.dense = dense
+        self.columns = columns
+        self.layout = layout
+        self.int_columns = frozenset(int_columns)
+
+    def __repr__(self):
+        return 'FeatureBlocks({} rows, {} columns, {} dense)'.format(self.n_rows, self.n_columns(), self.dense.shape[1])
+
+    def __len__(self):
+        return self.n_rows
+
+    # the original row of features (used for logging samples of the features),
+    # a slice gives the blocks of a range of rows (the dense block is a view, e.g. the rows of one sentence)
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            start, end, step = idx.indices(self.n_rows)
+            assert(step == 1), 'only contiguous ranges of rows can be selected'
+            end = max(start, end)
+            columns = {col: values[start:end] for col, values in self.columns.items()}
+            return FeatureBlocks(end - start, self.dense[start:end], columns, self.layout, self.int_columns)
+        return self.row(idx)
+
+    def __iter__(self):
+        return iter(self.rows())
+
+    def n_columns(self):
+        return self.layout[-1][2] if len(self.layout) > 0 else 0
+
+    def dense_columns(self):
+        return [col for kind, first, last, offset in self.layout if kind == 'dense' for col in range(first, last)]
+
+    def categorical_columns(self):
+        return sorted(self.columns.keys())
+
+    # all values of a column (numeric columns are returned as float32 arrays)
+    def column(self, col):
+        if col in self.columns:
+            return self.columns[col]
+        for kind, first, last, offset in self.layout:
+            if kind == 'dense' and first <= col < last:
+                return self.dense[:, offset + col - first]
+        raise IndexError('column {} is out of range'.format(col))
+
+    # the original row of features
+    def row(self, idx):
+        res = []
+        for kind, first, last, offset in self.layout:
+            if kind == 'dense':
+                values = self.dense[idx, offset:offset + last - first]
+                res.extend([int(v) if col in self.int_columns else v for col, v in zip(range(first, last), values)])
+            else:
+                res.append(self.columns[first][idx])
+        return res
+
+    # all rows (faster than row() for every row: the dense block is split into columns once)
+    # the numbers are scalars of the type of the dense block as in row(), so a float32 value is written as '0.8'
+    # and not as the double '0.800000011921'
+    def rows(self):
+        values = []
+        for kind, first, last, offset in self.layout:
+            if kind == 'dense':
+                dense_values = self.dense[:, offset:offset + last - first].T
+                values.extend([[int(v) for v in column.tolist()] if col in self.int_columns else list(column) for col, column in zip(range(first, last), dense_values)])
+            else:
+                values.append(self.columns[first])
+        if len(values) == 0:
+            return [[] for i in range(self.n_rows)]
+        return [list(row) for row in zip(*values)]
+
+    # one matrix from the dense block and the converted categorical columns in the original column order
+    # <converted> -- {column number: matrix with one row per context}
+    # the columns without a converted version are used as they are
+    def assemble(self, converted):
+        parts = []
+        for kind, first, last, offset in self.layout:
+            if kind == 'dense':
+                parts.append(self.dense[:, offset:offset + last - first])
+            elif first in converted:
+                parts.append(converted[first])
+            else:
+                parts.append(np.array(self.columns[first]).reshape(self.n_rows, 1))
+        return np.hstack(parts)
+
+    # blocks with the same rows and different columns (e.g. the features of different extractors)
+    @staticmethod
+    def hstack(blocks):
+        n_rows = blocks[0].n_rows if len(blocks) > 0 else 0
+        dense_parts, columns, layout, int_columns = [], {}, [], []
+        n_columns, n_dense = 0, 0
+        for block in blocks:
+            assert(block.n_rows == n_rows), 'all blocks must have the same number of rows'
+            int_columns.extend([col + n_columns for col in block.int_columns])
+            for kind, first, last, offset in block.layout:
+                if kind == 'dense':
+                    layout.append(('dense', first + n_columns, last + n_columns, offset + n_dense))
+                else:
+                    columns[first + n_columns] = block.columns[first]
+                    layout.append(('column', first + n_columns, last + n_columns, None))
+            dense_parts.append(block.dense)
+            n_columns += block.n_columns()
+            n_dense += block.dense.shape[1]
+        dense = np.hstack(dense_parts) if len(dense_parts) > 0 else np.zeros((n_rows, 0), dtype=np.float32)
+        return FeatureBlocks(n_rows, dense, columns, layout, int_columns)
+
+    # blocks with the same columns and different rows (e.g. the features of all sentences of a dataset)
+    # blocks of different layouts (the kind of a column depends on its first value) are rebuilt from the rows
+    # a column has ints if it has ints in all blocks
+    @staticmethod
+    def vstack(blocks):
+        blocks = [block for block in blocks if block.n_rows > 0]
+        if len(blocks) == 0:
+            return FeatureBlocks.from_rows([])
+        if any([block.layout != blocks[0].layout for block in blocks]):
+            categorical = set([col for block in blocks for col in block.columns])
+            return FeatureBlocks.from_rows([block.row(i) for block in blocks for i in range(block.n_rows)], categorical=categorical)
+        columns = {col: [x for block in blocks for x in block.columns[col]] for col in blocks[0].columns}
+        int_columns = frozenset.intersection(*[block.int_columns for block in blocks])
+        return FeatureBlocks(sum([block.n_rows for block in blocks]), np.vstack([block.dense for block in blocks]), columns, blocks[0].layout, int_columns)
+
+    # blocks from the outputs of the extractors (one list with the outputs for all contexts per extractor)
+    # numeric arrays (e.g. w2v vectors) are stacked into a dense block directly, other outputs are split into columns
+    @staticmethod
+    def from_extractor_outputs(outputs, n_rows):
+        blocks = []
+        for values in outputs:
+            if len(values) > 0 and all([isinstance(v, np.ndarray) and v.dtype.kind in 'biuf' and v.shape == values[0].shape for v in values]):
+                dense = np.vstack(values).astype(np.float32).reshape((len(values), -1))
+                int_columns = range(dense.shape[1]) if values[0].dtype.kind in 'iu' else ()
+                blocks.append(FeatureBlocks(n_rows, dense, {}, [('dense', 0, dense.shape[1], 0)], int_columns))
+            else:
+                blocks.append(FeatureBlocks.from_rows([list(v) for v in values]))
+        return FeatureBlocks.hstack(blocks)
+
+    # <categorical> -- numbers of the columns which are categorical whatever their values are
+    # the kind of a column is decided by its value in the first row,
+    # a run of numeric columns which can't be converted to float32 (e.g. missing values) is kept as separate columns
+    # a numeric column has ints if all its values are ints
+    @staticmethod
+    def from_rows(rows, categorical=()):
+        if len(rows) == 0:
+            return FeatureBlocks(0, np.zeros((0, 0), dtype=np.float32), {}, [])
+        categorical = set(categorical)
+        flags = [is_numeric(value) and col not in categorical for col, value in enumerate(rows[0])]
+        dense_parts, columns, layout, int_columns = [], {}, [], []
+        offset = 0
+        for first, last, numeric in column_runs(flags):
+            if numeric:
+                try:
+                    block = np.array([row[first:last] for row in rows], dtype=np.float32)
+                except (ValueError, TypeError):
+                    block = None
+                if block is not None and block.shape == (len(rows), last - first):
+                    int_columns.extend([col for col in range(first, last) if is_integer(rows[0][col]) and all([is_integer(row[col]) for row in rows])])
+                    dense_parts.append(block)
+                    layout.append(('dense', first, last, offset))
+                    offset += last - first
+                    continue
+            for col in range(first, last):
+                columns[col] = [row[col] for row in rows]
+                layout.append(('column', col, col + 1, None))
+        dense = np.hstack(dense_parts) if len(dense_parts) > 0 else np.zeros((len(rows), 0), dtype=np.float32)
+        return FeatureBlocks(len(rows), dense, columns, layout, int_columns)
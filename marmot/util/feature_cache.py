@@ -0,0 +1,476 @@
+#!/usr/bin/env python
+#encoding: utf-8
+
+# content-addressed on-disk cache of extracted features
+# the features are stored per extractor and per sentence:
+#   - the extractor key is a hash of the extractor class, its constructor arguments and its code version:
+#     the source code of its module and of the marmot modules this module uses, or the 'version' attribute of the class
+#   - the sentence key is a hash of the sentence-level fields which the extractor has read (see RecordingContext):
+#     the fields are recorded when the features are extracted, so e.g. the tags or the file names are a part of the key
+#     only for the extractors which use them
+#   - a token of the sentence is identified by a hash of its 'index' and of the token-level fields the extractor has read
+# so rerunning an experiment with one changed extractor recomputes the features of this extractor only
+#
+# layout of the cache directory:
+#   <cache_dir>/<extractor_key>/spec -- human-readable description of the extractor
+#   <cache_dir>/<extractor_key>/block.<n>.<pid>.mfc -- a block of features, new features are appended as new blocks
+#
+# format of a block (no pickled objects, the arrays are memory-mapped and the features are decoded only for the sentences which are looked up):
+#   - a JSON header: the recorded sets of fields, the layout of the features and the list of the tables which follow the header
+#   - the index: the number of the set of fields (int32), the key (20 bytes) and the first row (int64) of every sentence
+#     and the keys of the tokens (20 bytes)
+#   - the features: 'array' -- the numpy vectors returned by the extractor as one matrix with their dtype,
+#     'columns' -- one table per feature: float64 or int64 values, or int32 codes of the other values (strings, FeatureId, lists, ...)
+#     and their distinct values (see encoder_store.encode_value), 'rows' -- rows of different lengths, one value per row
+
+from __future__ import print_function
+
+import os
+import sys
+import glob
+import json
+import errno
+import struct
+import hashlib
+import inspect
+import logging
+
+import numpy as np
+
+from marmot.util.corpus_store import TOKEN_FIELDS
+from marmot.util.encoder_store import encode_value, decode_value, encode_strings, decode_strings
+from marmot.util.feature_file import encode_column
+
+logger = logging.getLogger('experiment_logger')
+
+MAGIC = b'MARMOTFC'
+VERSION = 2
+# magic, version, size of the JSON header in bytes
+HEADER = struct.Struct('<8siq')
+# the arrays start at multiples of 8 bytes
+ALIGNMENT = 8
+DIGEST_SIZE = 20
+INT64_RANGE = (-(1 << 63), (1 << 63) - 1)
+
+
+# convert a value to a structure with a stable repr (no dict ordering, no numpy summarization)
+def _canonical(value):
+    if isinstance(value, dict):
+        return sorted([(repr(k), _canonical(v)) for k, v in value.items()])
+    if hasattr(value, 'tolist'):
+        value = value.tolist()
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    return value
+
+
+def _hash(value):
+    return hashlib.sha1(repr(_canonical(value)).encode('utf-8')).hexdigest()
+
+
+# hash of a field of a context object, None if the context has no such field
+def field_hash(context_obj, field):
+    return _hash(context_obj[field]) if field in context_obj else None
+
+
+class FieldRecorder(object):
+    '''
+    The fields of the context objects of one sentence which an extractor has read: {field: hash}.
+    The sentence-level fields are hashed when they are read for the first time, so the values which the extractor writes
+    to the contexts itself are not a part of the key. The token-level fields (TOKEN_FIELDS) are hashed for every token (see row_key).
+    '''
+
+    def __init__(self):
+        self.fields = {}
+        self.written = set()
+
+    def read(self, context_obj, key):
+        if key in self.fields or key in self.written:
+            return
+        self.fields[key] = None if key in TOKEN_FIELDS else field_hash(context_obj, key)
+
+    def write(self, key):
+        if key not in self.fields:
+            self.written.add(key)
+
+
+class RecordingContext(object):
+    '''
+    A context object which passes all reads and writes to <context_obj> and records the fields which are read in <recorder>
+    '''
+
+    def __init__(self, context_obj, recorder):
+        self.context_obj = context_obj
+        self.recorder = recorder
+
+    def __getitem__(self, key):
+        self.recorder.read(self.context_obj, key)
+        return self.context_obj[key]
+
+    def __setitem__(self, key, value):
+        self.recorder.write(key)
+        self.context_obj[key] = value
+
+    def __contains__(self, key):
+        self.recorder.read(self.context_obj, key)
+        return key in self.context_obj
+
+    def has_key(self, key):
+        return key in self
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def keys(self):
+        keys = list(self.context_obj.keys())
+        for key in keys:
+            self.recorder.read(self.context_obj, key)
+        return keys
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.context_obj)
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    iterkeys = __iter__
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def to_dict(self):
+        return dict(self.items())
+
+
+# key of a sentence: a hash of the sentence-level fields of <fields>
+# <hashes> -- {field: hash} for the sentence-level fields of <fields>
+def sentence_key(fields, hashes):
+    return hashlib.sha1(repr([(field, hashes[field]) for field in fields if field not in TOKEN_FIELDS]).encode('utf-8')).digest()
+
+
+# the recorded fields as a sorted tuple of names ('index' is a part of the token keys)
+def recorded_fields(fields):
+    return tuple(sorted([str(field) for field in fields if field != 'index']))
+
+
+# key of a token: its index and the token-level fields of <fields>
+def row_key(context_obj, fields):
+    parts = [_canonical(context_obj['index'])]
+    parts.extend([(field, _canonical(context_obj[field]) if field in context_obj else None) for field in fields if field in TOKEN_FIELDS])
+    return hashlib.sha1(repr(parts).encode('utf-8')).digest()
+
+
+_code_versions = {}
+
+
+# names of the modules of <package> which the module <name> uses: the modules it imports and the modules
+# of the classes and functions it imports, recursively
+def module_dependencies(name, package):
+    seen, todo = set(), [name]
+    while len(todo) > 0:
+        cur = todo.pop()
+        if cur in seen or sys.modules.get(cur) is None:
+            continue
+        seen.add(cur)
+        for value in vars(sys.modules[cur]).values():
+            dependency = value.__name__ if inspect.ismodule(value) else getattr(value, '__module__', None)
+            if isinstance(dependency, str) and (dependency == package or dependency.startswith(package + '.')):
+                todo.append(dependency)
+    return seen
+
+
+# code version of the class of <obj>: its 'version' attribute if it has one, otherwise a hash of the source files
+# of the modules of the class and of its base classes and of the modules of the same package which they use
+def code_version(obj):
+    klass = type(obj)
+    if klass not in _code_versions:
+        if hasattr(klass, 'version'):
+            _code_versions[klass] = repr(klass.version)
+        else:
+            package = klass.__module__.split('.')[0]
+            modules = set()
+            for base in inspect.getmro(klass):
+                if base.__module__ == klass.__module__ or base.__module__.startswith(package + '.'):
+                    modules.update(module_dependencies(base.__module__, package))
+            digest = hashlib.sha1()
+            for name in sorted(modules):
+                try:
+                    source = open(inspect.getsourcefile(sys.modules[name]), 'rb').read()
+                except (TypeError, IOError):
+                    continue
+                digest.update(name.encode('utf-8'))
+                digest.update(source)
+            _code_versions[klass] = digest.hexdigest()
+    return _code_versions[klass]
+
+
+# description of an extractor: class, constructor arguments and code version
+# the arguments are saved by build_object ('build_spec' attribute), for other objects the simple attributes are used
+# files in the arguments are identified by their size and modification time, so changed resources invalidate the cache
+def extractor_spec(extractor):
+    klass = type(extractor)
+    class_name = klass.__module__ + '.' + klass.__name__
+    if hasattr(extractor, 'build_spec'):
+        args = extractor.build_spec[1]
+    else:
+        args = sorted([(k, v) for k, v in vars(extractor).items() if v is None or isinstance(v, (bool, int, float, str, type(u'')))])
+    resources = []
+    for arg in args if isinstance(args, list) else []:
+        if isinstance(arg, (str, type(u''))) and os.path.isfile(arg):
+            stat = os.stat(arg)
+            resources.append((arg, stat.st_size, int(stat.st_mtime)))
+    return repr([class_name, _canonical(args), resources, code_version(extractor)])
+
+
+def is_array_rows(rows):
+    return len(rows) > 0 and all([isinstance(r, np.ndarray) and r.dtype.kind in 'biuf' and r.dtype == rows[0].dtype and r.shape == rows[0].shape for r in rows])
+
+
+# a column of feature values: (kind, tables)
+def encode_feature_column(name, values):
+    if all([type(v) is float for v in values]):
+        return 'float64', [(name, np.array(values, dtype='<f8'))]
+    if all([type(v) in (int, long) and INT64_RANGE[0] <= v <= INT64_RANGE[1] for v in values]):
+        return 'int64', [(name, np.array(values, dtype='<i8'))]
+    texts, codes = encode_column([encode_value(v) for v in values])
+    return 'values', [(name + '.codes', codes), (name + '.values', texts)]
+
+
+# layout of the feature rows and their tables
+def encode_rows(rows):
+    if is_array_rows(rows):
+        matrix = np.array(rows)
+        return {'kind': 'array'}, [('array', matrix.astype(matrix.dtype.newbyteorder('<')))]
+    if len(rows) > 0 and all([isinstance(r, (list, tuple)) and len(r) == len(rows[0]) for r in rows]):
+        layout = {'kind': 'columns', 'columns': [], 'tuples': all([isinstance(r, tuple) for r in rows])}
+        tables = []
+        for col in range(len(rows[0])):
+            kind, col_tables = encode_feature_column('column.{}'.format(col), [r[col] for r in rows])
+            layout['columns'].append(kind)
+            tables.extend(col_tables)
+        return layout, tables
+    kind, tables = encode_feature_column('rows', [list(r) if isinstance(r, np.ndarray) else r for r in rows])
+    return {'kind': 'rows', 'rows': kind}, tables
+
+
+# keys of the sentences or tokens as a matrix with one row of 20 bytes per key
+def digest_table(keys):
+    return np.array(bytearray(b''.join(keys)), dtype=np.uint8).reshape((len(keys), DIGEST_SIZE))
+
+
+# <field_sets> -- the recorded sets of fields of the sentences
+# <sentences> -- [(number of the set of fields, sentence key, keys of the tokens, features of the tokens)]
+def write_block(file_name, field_sets, sentences):
+    rows = [features for s in sentences for features in s[3]]
+    tables = [('sentence.field_sets', np.array([s[0] for s in sentences], dtype='<i4')),
+              ('sentence.keys', digest_table([s[1] for s in sentences])),
+              ('sentence.offsets', np.concatenate([[0], np.cumsum([len(s[2]) for s in sentences])]).astype('<i8')),
+              ('row.keys', digest_table([k for s in sentences for k in s[2]]))]
+    layout, feature_tables = encode_rows(rows)
+    tables.extend(feature_tables)
+    meta = {'field_sets': [list(fields) for fields in field_sets], 'layout': layout}
+
+    # the data of the tables, their offsets are counted from the end of the header
+    chunks, meta['tables'], position = [], [], 0
+    for name, table in tables:
+        if isinstance(table, np.ndarray):
+            data = table.tobytes()
+            meta['tables'].append([name, table.dtype.str, list(table.shape), position, len(data)])
+        else:
+            data = encode_strings(table)
+            meta['tables'].append([name, 'strings', [len(table)], position, len(data)])
+        padding = b'\0' * (-len(data) % ALIGNMENT)
+        chunks.extend([data, padding])
+        position += len(data) + len(padding)
+    header = json.dumps(meta).encode('utf-8')
+    header += b' ' * (-(HEADER.size + len(header)) % ALIGNMENT)
+
+    # temporary file + rename: a concurrent reader never sees a half-written file
+    tmp_name = '{}.{}.tmp'.format(file_name, os.getpid())
+    out = open(tmp_name, 'wb')
+    out.write(HEADER.pack(MAGIC, VERSION, len(header)))
+    out.write(header)
+    out.writelines(chunks)
+    out.close()
+    os.rename(tmp_name, file_name)
+
+
+class CacheBlock(object):
+    '''
+    A block of cached features, the arrays are memory-mapped.
+    The distinct values of the feature columns are read when a row which uses them is decoded for the first time.
+    '''
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        in_file = open(file_name, 'rb')
+        magic, version, header_size = HEADER.unpack(in_file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{} is not a feature cache block of version {}'.format(file_name, VERSION))
+        meta = json.loads(in_file.read(header_size).decode('utf-8'))
+        in_file.close()
+        data_start = HEADER.size + header_size
+        self.tables = {}
+        # {name: (offset, size, count)} of the string tables which are not read yet
+        self.string_tables = {}
+        for name, dtype, shape, offset, size in meta['tables']:
+            if dtype == 'strings':
+                self.string_tables[name] = (data_start + offset, size, shape[0])
+            elif size == 0:
+                self.tables[name] = np.zeros(shape, dtype=dtype)
+            else:
+                # a plain ndarray view of the mapped file (indexing np.memmap objects is slower)
+                self.tables[name] = np.memmap(file_name, dtype=dtype, mode='r', offset=data_start + offset, shape=tuple(shape)).view(np.ndarray)
+        self.field_sets = [recorded_fields(fields) for fields in meta['field_sets']]
+        self.layout = meta['layout']
+
+    def table(self, name):
+        if name not in self.tables:
+            offset, size, count = self.string_tables.pop(name)
+            in_file = open(self.file_name, 'rb')
+            in_file.seek(offset)
+            self.tables[name] = decode_strings(in_file.read(size), count)
+            in_file.close()
+        return self.tables[name]
+
+    # (set of fields, sentence key, first row, end row) of every sentence
+    def sentences(self):
+        field_sets, keys, offsets = self.tables['sentence.field_sets'], self.tables['sentence.keys'], self.tables['sentence.offsets']
+        for idx in range(len(field_sets)):
+            yield self.field_sets[field_sets[idx]], keys[idx].tobytes(), int(offsets[idx]), int(offsets[idx + 1])
+
+    def column(self, name, kind, start, end):
+        if kind in ('float64', 'int64'):
+            return self.tables[name][start:end].tolist()
+        values = self.table(name + '.values')
+        return [decode_value(values[code]) for code in self.tables[name + '.codes'][start:end]]
+
+    # {token key: features} for the rows start..end-1
+    def rows(self, start, end):
+        keys = [key.tobytes() for key in self.tables['row.keys'][start:end]]
+        if self.layout['kind'] == 'array':
+            rows = list(np.array(self.tables['array'][start:end]))
+        elif self.layout['kind'] == 'columns':
+            columns = [self.column('column.{}'.format(col), kind, start, end) for col, kind in enumerate(self.layout['columns'])]
+            container = tuple if self.layout['tuples'] else list
+            rows = [container(row) for row in zip(*columns)] if len(columns) > 0 else [container() for key in keys]
+        else:
+            rows = self.column('rows', self.layout['rows'], start, end)
+        return dict(zip(keys, rows))
+
+
+class FeatureCache(object):
+    '''
+    Features of (extractor, sentence) pairs stored in <cache_dir>.
+    The index of the blocks of an extractor is loaded when the extractor is used for the first time,
+    the features of a sentence are decoded when it is looked up.
+    New features are kept in memory until <block_size> new sentences are collected or flush() is called.
+    '''
+
+    def __init__(self, cache_dir, block_size=10000):
+        self.cache_dir = cache_dir
+        self.block_size = block_size
+        self.n_new = 0
+        try:
+            os.makedirs(cache_dir)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST or not os.path.isdir(cache_dir):
+                raise
+        self.keys = {}
+        # {extractor_key: [recorded set of fields]}, the sets which were recorded for the sentences of the extractor
+        self.field_sets = {}
+        # {extractor_key: {(set of fields, sentence key): (CacheBlock, start row, end row) or {token key: features}}}
+        self.entries = {}
+        # {extractor_key: [(set of fields, sentence key, token keys, features)]}, the entries which are not written yet
+        self.new_entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def extractor_key(self, extractor):
+        # the extractor is kept with its key, so its id can't be reused by another object
+        if id(extractor) not in self.keys:
+            spec = extractor_spec(extractor)
+            # blocks of another version of the format are in another directory
+            key = hashlib.sha1('{}:{}'.format(VERSION, spec).encode('utf-8')).hexdigest()
+            self.keys[id(extractor)] = (extractor, key)
+            if key not in self.entries:
+                self._load(key, spec)
+        return self.keys[id(extractor)][1]
+
+    def _load(self, key, spec):
+        self.entries[key] = {}
+        self.new_entries[key] = []
+        self.field_sets[key] = []
+        extractor_dir = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(extractor_dir):
+            os.makedirs(extractor_dir)
+            spec_file = open(os.path.join(extractor_dir, 'spec'), 'w')
+            spec_file.write(spec + '\n')
+            spec_file.close()
+            return
+        for block_file in sorted(glob.glob(os.path.join(extractor_dir, 'block.*.mfc'))):
+            self._index_block(key, CacheBlock(block_file))
+        logger.info('Feature cache: {} sentences indexed for {}'.format(len(self.entries[key]), spec))
+
+    def _index_block(self, key, block):
+        for fields, s_key, start, end in block.sentences():
+            self._add_field_set(key, fields)
+            self.entries[key][(fields, s_key)] = (block, start, end)
+
+    def _add_field_set(self, key, fields):
+        if fields not in self.field_sets[key]:
+            self.field_sets[key].append(fields)
+
+    # features for the contexts of <batch> (contexts of one sentence), None if any of them is missing
+    # <memo> -- {field: hash} of the sentence, shared by the lookups of all extractors
+    def lookup(self, key, batch, memo):
+        for fields in self.field_sets[key]:
+            for field in fields:
+                if field not in memo and field not in TOKEN_FIELDS:
+                    memo[field] = field_hash(batch[0], field)
+            entry = self.entries[key].get((fields, sentence_key(fields, memo)))
+            if entry is None:
+                continue
+            rows = entry[0].rows(entry[1], entry[2]) if isinstance(entry, tuple) else entry
+            row_keys = [row_key(context, fields) for context in batch]
+            if all([k in rows for k in row_keys]):
+                self.hits += 1
+                return [rows[k] for k in row_keys]
+        self.misses += 1
+        return None
+
+    # <recorded> -- the fields which the extractor has read (see FieldRecorder)
+    def add(self, key, batch, features, recorded):
+        fields = recorded_fields(recorded)
+        self._add_field_set(key, fields)
+        s_key = sentence_key(fields, recorded)
+        row_keys = [row_key(context, fields) for context in batch]
+        self.entries[key][(fields, s_key)] = dict(zip(row_keys, features))
+        self.new_entries[key].append((fields, s_key, row_keys, features))
+        self.n_new += 1
+        if self.n_new >= self.block_size:
+            self.flush()
+
+    # write the new features as one block per extractor
+    def flush(self):
+        for key, entries in self.new_entries.items():
+            if len(entries) == 0:
+                continue
+            extractor_dir = os.path.join(self.cache_dir, key)
+            block_name = os.path.join(extractor_dir, 'block.{}.{}.mfc'.format(len(glob.glob(os.path.join(extractor_dir, 'block.*.mfc'))), os.getpid()))
+            field_sets = sorted(set([entry[0] for entry in entries]))
+            write_block(block_name, field_sets, [(field_sets.index(fields), s_key, row_keys, features) for fields, s_key, row_keys, features in entries])
+            self.new_entries[key] = []
+            # the written features are read from the block when they are needed again
+            self._index_block(key, CacheBlock(block_name))
+        self.n_new = 0
+        logger.info('Feature cache: {} sentence hits, {} misses'.format(self.hits, self.misses))
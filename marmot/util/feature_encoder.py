@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+#encoding: utf-8
+
+# encoding of categorical features into a sparse matrix
+# CategoricalEncoder -- one-hot encoding: every categorical column is mapped to its own vocabulary of values,
+# the first slot of a column is reserved for unknown values (__unk__). The encoded matrix is assembled in one pass
+# from the codes of all columns and the dense numeric blocks, in the original column order
+# HashingEncoder -- feature hashing: (feature name, value) pairs are hashed into a fixed number of columns,
+# nothing has to be fitted, so it also works when the features are extracted chunk by chunk
+
+from __future__ import print_function
+
+import numpy as np
+from scipy import sparse
+from sklearn.utils import murmurhash3_32
+
+from marmot.util.feature_blocks import FeatureBlocks
+from marmot.util.vocabulary import FeatureId
+
+UNK = u'__unk__'
+
+
+# single-label columns hold one value per context (strings, FeatureId), multi-label columns hold lists of values
+def column_kind(value):
+    if isinstance(value, list):
+        return 'multilabel'
+    if isinstance(value, (str, unicode, FeatureId)):
+        return 'label'
+    return None
+
+
+# factors which scale every numeric feature into [-1, 1]: 1 / the maximum absolute value in the training data
+# the values are not centered, so the sparse matrices stay sparse. The factors of categorical features are 1
+def max_abs_scales(features):
+    scales = np.ones(features.n_columns(), dtype=np.float32)
+    for kind, first, last, offset in features.layout:
+        if kind == 'dense' and len(features) > 0:
+            maximum = np.abs(features.dense[:, offset:offset + last - first]).max(axis=0)
+            maximum[maximum == 0] = 1.0
+            scales[first:last] = 1.0 / maximum
+    return scales
+
+
+class CategoricalEncoder(object):
+    '''
+    One-hot encoder fitted on the categorical columns of the training features.
+    Output columns: every numeric feature is one column, every categorical column c gets 1 + len(vocabularies[c])
+    columns (unknown values + the sorted values seen in training).
+    <feature_names> -- names of the input features (saved with the encoder, see marmot.util.encoder_store)
+    <scale> -- scale the numeric features into [-1, 1] (see max_abs_scales)
+    '''
+
+    def __init__(self, feature_names=None, scale=False):
+        self.feature_names = feature_names if feature_names is not None else []
+        self.scale = scale
+        # scaling factors of all features (None -- no scaling)
+        self.scales = None
+        self.n_columns = 0
+        # {column number: 'label' or 'multilabel'}
+        self.kinds = {}
+        # {column number: {value: slot}} -- slot 0 is the unknown value
+        self.vocabularies = {}
+        # offsets[c] -- the first output column of the feature c
+        self.offsets = np.zeros(1, dtype=np.int64)
+
+    def n_features(self):
+        return int(self.offsets[-1])
+
+    # names of the output columns: <feature name> for numeric features, <feature name>=<value> for categorical ones
+    def output_feature_names(self):
+        res = []
+        for col in range(self.n_columns):
+            name = self.feature_names[col] if col < len(self.feature_names) else unicode(col)
+            if col in self.vocabularies:
+                values = sorted(self.vocabularies[col], key=self.vocabularies[col].get)
+                res.extend([u'{}={}'.format(name, value) for value in [UNK] + values])
+            else:
+                res.append(name)
+        return res
+
+    # <features> -- a list of feature rows or FeatureBlocks
+    def fit(self, features):
+        if not isinstance(features, FeatureBlocks):
+            features = FeatureBlocks.from_rows(features)
+        self.n_columns = features.n_columns()
+        self.kinds, self.vocabularies = {}, {}
+        for col in features.categorical_columns():
+            values = features.column(col)
+            kind = column_kind(values[0])
+            if kind is None:
+                continue
+            if kind == 'multilabel':
+                classes = set([x for a_list in values for x in a_list])
+            else:
+                classes = set(values)
+            self.kinds[col] = kind
+            self.vocabularies[col] = {value: slot + 1 for slot, value in enumerate(sorted(classes))}
+        widths = np.ones(self.n_columns, dtype=np.int64)
+        for col, vocabulary in self.vocabularies.items():
+            widths[col] = len(vocabulary) + 1
+        self.offsets = np.concatenate([[0], np.cumsum(widths)])
+        self.scales = max_abs_scales(features) if self.scale else None
+        return self
+
+    # slots of the values of a column (0 for unknown values)
+    def codes(self, col, values):
+        vocabulary = self.vocabularies[col]
+        return np.fromiter((vocabulary.get(value, 0) for value in values), dtype=np.int64, count=len(values))
+
+    # sparse CSR matrix with one row per context
+    def transform(self, features):
+        if not isinstance(features, FeatureBlocks):
+            features = FeatureBlocks.from_rows(features, categorical=self.vocabularies.keys())
+        if features.n_columns() != self.n_columns:
+            raise ValueError('The encoder is fitted for {} features, got {}'.format(self.n_columns, features.n_columns()))
+        n_rows = len(features)
+        all_rows, all_cols, all_data = [], [], []
+        for kind, first, last, offset in features.layout:
+            if kind == 'dense':
+                block = features.dense[:, offset:offset + last - first]
+                if any([col in self.vocabularies for col in range(first, last)]):
+                    # numeric values of a column which is categorical in the training data
+                    for col in range(first, last):
+                        self.add_column(col, list(features.column(col)), n_rows, all_rows, all_cols, all_data)
+                    continue
+                rows, cols = np.nonzero(block)
+                all_rows.append(rows)
+                all_cols.append(self.offsets[first:last][cols])
+                all_data.append(block[rows, cols] if self.scales is None else block[rows, cols] * self.scales[first:last][cols])
+            else:
+                self.add_column(first, features.columns[first], n_rows, all_rows, all_cols, all_data)
+        if len(all_rows) == 0:
+            return sparse.csr_matrix((n_rows, self.n_features()), dtype=np.float32)
+        return sparse.csr_matrix((np.concatenate(all_data).astype(np.float32), (np.concatenate(all_rows), np.concatenate(all_cols))),
+                                 shape=(n_rows, self.n_features()), dtype=np.float32)
+
+    # entries of the output matrix for one column of the input
+    def add_column(self, col, values, n_rows, all_rows, all_cols, all_data):
+        if col not in self.vocabularies:
+            # not categorical in the training data -- used as a number
+            try:
+                numbers = np.asarray(values, dtype=np.float32)
+            except (ValueError, TypeError):
+                raise ValueError('Feature {} is numeric in the training data, got the value {}'.format(col, values[0]))
+            rows = np.nonzero(numbers)[0]
+            all_rows.append(rows)
+            all_cols.append(np.repeat(self.offsets[col], len(rows)))
+            all_data.append(numbers[rows] if self.scales is None else numbers[rows] * self.scales[col])
+            return
+        if self.kinds[col] == 'multilabel':
+            lengths = np.fromiter((len(a_list) for a_list in values), dtype=np.int64, count=n_rows)
+            codes = self.codes(col, [x for a_list in values for x in a_list])
+            # a value which occurs several times in a list is encoded once
+            keys = np.unique(np.repeat(np.arange(n_rows), lengths) * (len(self.vocabularies[col]) + 1) + codes)
+            rows, codes = np.divmod(keys, len(self.vocabularies[col]) + 1)
+        else:
+            rows, codes = np.arange(n_rows), self.codes(col, values)
+        all_rows.append(rows)
+        all_cols.append(self.offsets[col] + codes)
+        all_data.append(np.ones(len(rows), dtype=np.float32))
+
+
+class HashingEncoder(object):
+    '''
+    Hashing encoder: a categorical value v of the feature f sets the column hash(u'f=v') mod 2^n_bits,
+    a numeric feature f is written to the column hash(u'f'). With <signed> the sign of the value is
+    taken from the hash, so collisions cancel out on average (as in sklearn's FeatureHasher).
+    The values which are hashed to the same column are summed.
+    <scale> -- scale the numeric features into [-1, 1], the factors are computed by fit (see max_abs_scales),
+               transform raises a ValueError if they are not fitted
+    '''
+
+    def __init__(self, feature_names=None, n_bits=18, signed=True, scale=False):
+        self.feature_names = feature_names if feature_names is not None else []
+        self.n_bits = n_bits
+        self.signed = signed
+        self.scale = scale
+        # scaling factors of all features (None -- no scaling)
+        self.scales = None
+        # {feature number: (column, sign)} of the numeric features (one entry per feature).
+        # The slots of categorical values are not kept between the calls of transform, the vocabulary of the values is unbounded
+        self.numeric_slots = {}
+
+    def n_features(self):
+        return 1 << self.n_bits
+
+    # only the scaling factors are fitted, the encoder can be used in place of a CategoricalEncoder
+    def fit(self, features):
+        if self.scale:
+            if not isinstance(features, FeatureBlocks):
+                features = FeatureBlocks.from_rows(features)
+            self.scales = max_abs_scales(features)
+        return self
+
+    def feature_name(self, col):
+        return self.feature_names[col] if col < len(self.feature_names) else unicode(col)
+
+    # column and sign of a hashed string
+    def hash_slot(self, key):
+        h = murmurhash3_32(key, positive=False)
+        return abs(h) % self.n_features(), -1 if self.signed and h < 0 else 1
+
+    # column and sign of the numeric feature <col>
+    def numeric_slot(self, col):
+        res = self.numeric_slots.get(col)
+        if res is None:
+            res = self.hash_slot(self.feature_name(col))
+            self.numeric_slots[col] = res
+        return res
+
+    # column and sign of the value <value> of the categorical feature <col>
+    def slot(self, col, value):
+        key_value = value.decode('utf-8') if isinstance(value, str) else value
+        return self.hash_slot(u'{}={}'.format(self.feature_name(col), key_value))
+
+    # columns and signs of the values of a categorical feature, every distinct value is hashed once per call
+    def value_slots(self, col, values):
+        distinct = {value: self.slot(col, value) for value in set(values)}
+        slots = [distinct[value] for value in values]
+        return np.array([c for c, sign in slots], dtype=np.int64), np.array([sign for c, sign in slots], dtype=np.float32)
+
+    # sparse CSR matrix with one row per context and 2^n_bits columns
+    def transform(self, features):
+        if self.scale and self.scales is None:
+            raise ValueError('The scaling factors of the hashing encoder are not fitted, call fit with the training features before transform')
+        if not isinstance(features, FeatureBlocks):
+            features = FeatureBlocks.from_rows(features)
+        n_rows = len(features)
+        all_rows, all_cols, all_data = [], [], []
+        for kind, first, last, offset in features.layout:
+            if kind == 'dense':
+                block = features.dense[:, offset:offset + last - first]
+                slots = [self.numeric_slot(col) for col in range(first, last)]
+                columns = np.array([c for c, sign in slots], dtype=np.int64)
+                signs = np.array([sign for c, sign in slots], dtype=np.float32)
+                rows, cols = np.nonzero(block)
+                all_rows.append(rows)
+                all_cols.append(columns[cols])
+                if self.scales is not None:
+                    signs = signs * self.scales[first:last]
+                all_data.append(block[rows, cols] * signs[cols])
+                continue
+            values = features.columns[first]
+            if len(values) > 0 and isinstance(values[0], list):
+                lengths = np.fromiter((len(a_list) for a_list in values), dtype=np.int64, count=n_rows)
+                columns, signs = self.value_slots(first, [x for a_list in values for x in a_list])
+                all_rows.append(np.repeat(np.arange(n_rows), lengths))
+            else:
+                columns, signs = self.value_slots(first, values)
+                all_rows.append(np.arange(n_rows))
+            all_cols.append(columns)
+            all_data.append(signs)
+        if len(all_rows) == 0:
+            return sparse.csr_matrix((n_rows, self.n_features()), dtype=np.float32)
+        return sparse.csr_matrix((np.concatenate(all_data).astype(np.float32), (np.concatenate(all_rows), np.concatenate(all_cols))),
+                                 shape=(n_rows, self.n_features()), dtype=np.float32)
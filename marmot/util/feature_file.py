@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+#encoding: utf-8
+
+# binary file with the features of a dataset (<dataset>.mfeat)
+# the features are written in bulk and the arrays are memory-mapped when the file is loaded:
+#   - a JSON header: the feature names, the layout of the columns (see FeatureBlocks), the kinds of the categorical
+#     columns and the list of the tables which follow the header
+#   - the offsets of the sentences (int64, the rows of the sentence i are offsets[i]..offsets[i + 1])
+#   - the numeric features as one float32 matrix (n_rows x n_dense), the columns with integer values are listed in the header
+#   - every categorical column as int32 codes of its values + the values (a list column also has int64 row offsets)
+#   - the tags as int32 codes + the tag values
+#   - or, for binarized features, the arrays of a sparse CSR matrix
+# the text formats (CRF++, CRFSuite, svm_light) are exported from the file (see persist_features.export_features)
+
+from __future__ import print_function
+
+import json
+import os
+import struct
+
+import numpy as np
+from scipy import sparse
+
+from marmot.experiment.import_utils import list_of_lists
+from marmot.util.encoder_store import encode_strings, decode_strings
+from marmot.util.feature_blocks import FeatureBlocks
+
+
+MAGIC = b'MARMOTFF'
+VERSION = 2
+# magic, version, size of the JSON header in bytes
+HEADER = struct.Struct('<8siq')
+# the arrays start at multiples of 8 bytes
+ALIGNMENT = 8
+
+
+# integer codes of the values of a column, the values are numbered in the order of their first occurrence
+def encode_column(values):
+    value2code, codes = {}, np.empty(len(values), dtype='<i4')
+    for idx, value in enumerate(values):
+        code = value2code.get(value)
+        if code is None:
+            code = len(value2code)
+            value2code[value] = code
+        codes[idx] = code
+    return sorted(value2code, key=value2code.get), codes
+
+
+# features of a dataset as one FeatureBlocks (or a sparse matrix) and the numbers of rows of the sentences
+def flatten_features(features, sequential):
+    if sparse.issparse(features):
+        return sparse.csr_matrix(features), [features.shape[0]]
+    if isinstance(features, FeatureBlocks):
+        return features, [len(features)]
+    if isinstance(features, np.ndarray):
+        return dense_blocks(features), [features.shape[0]]
+    # binarized sentences: the sparse matrices are stacked
+    if sequential and len(features) > 0 and all([sparse.issparse(s) for s in features]):
+        return sparse.vstack(features, format='csr'), [s.shape[0] for s in features]
+    if sequential:
+        sentences = [s if isinstance(s, FeatureBlocks) else dense_blocks(s) if isinstance(s, np.ndarray) else FeatureBlocks.from_rows(s) for s in features]
+        return FeatureBlocks.vstack(sentences), [len(s) for s in sentences]
+    return FeatureBlocks.from_rows(features), [len(features)]
+
+
+def dense_blocks(matrix):
+    int_columns = range(int(np.prod(matrix.shape[1:]))) if matrix.dtype.kind in 'iu' else ()
+    matrix = np.asarray(matrix, dtype=np.float32).reshape((matrix.shape[0], -1))
+    return FeatureBlocks(matrix.shape[0], matrix, {}, [('dense', 0, matrix.shape[1], 0)] if matrix.shape[1] > 0 else [], int_columns)
+
+
+# <features> -- the features of the 'plain' datatype (a list of rows, FeatureBlocks, a numpy array or a sparse matrix)
+#               or of the 'sequential' datatype (a list with the features of every sentence)
+# <tags> -- tags of the objects (a list of lists for sequences)
+# <sequential> -- True for the 'sequential' datatype, False for 'plain', None -- decided by the first element of <features>:
+#                 the data is sequential if it's a list whose first element is the features of a sentence
+#                 (FeatureBlocks, a numpy array, a sparse matrix or a list of rows), and plain otherwise
+#                 (FeatureBlocks, an array or a matrix with all objects, or a list of rows of values).
+#                 Plain rows whose values are all lists (e.g. only multi-label columns) look like a sentence
+#                 and plain rows given as numpy arrays look like sentences of one column -- pass <sequential> for such data
+def write_feature_file(file_name, features, tags=None, feature_names=None, sequential=None):
+    if sequential is None:
+        sequential = isinstance(features, list) and len(features) > 0 and \
+            (isinstance(features[0], (FeatureBlocks, np.ndarray)) or sparse.issparse(features[0]) or list_of_lists(features[0]))
+    features, lengths = flatten_features(features, sequential)
+    n_rows = features.shape[0] if sparse.issparse(features) else len(features)
+    meta = {'feature_names': [unicode(name) for name in feature_names] if feature_names is not None else [], 'n_rows': n_rows}
+    tables = [('sentence_offsets', np.concatenate([[0], np.cumsum(lengths)]).astype('<i8'))]
+    if sparse.issparse(features):
+        meta['sparse_shape'] = list(features.shape)
+        tables.append(('sparse.data', features.data.astype('<f4')))
+        tables.append(('sparse.indices', features.indices.astype('<i4')))
+        tables.append(('sparse.indptr', features.indptr.astype('<i8')))
+    else:
+        meta['layout'] = [list(entry) for entry in features.layout]
+        meta['int_columns'] = sorted(features.int_columns)
+        meta['columns'] = []
+        tables.append(('dense', np.ascontiguousarray(features.dense, dtype='<f4')))
+        for col in features.categorical_columns():
+            values = features.columns[col]
+            if len(values) > 0 and isinstance(values[0], list):
+                meta['columns'].append([col, 'multilabel'])
+                tables.append(('offsets.{}'.format(col), np.concatenate([[0], np.cumsum([len(v) for v in values])]).astype('<i8')))
+                values = [x for a_list in values for x in a_list]
+            else:
+                meta['columns'].append([col, 'label'])
+            column_values, codes = encode_column(values)
+            tables.append(('codes.{}'.format(col), codes))
+            tables.append(('values.{}'.format(col), column_values))
+    if tags is not None:
+        flat_tags = [t for seq in tags for t in seq] if sequential else list(tags)
+        assert(len(flat_tags) == n_rows), "Different numbers of tags and feature rows: {} and {}".format(len(flat_tags), n_rows)
+        tag_values, tag_codes = encode_column(flat_tags)
+        tables.append(('tags', tag_codes))
+        tables.append(('tag_values', tag_values))
+
+    # the data of the tables, their offsets are counted from the end of the header
+    chunks, meta['tables'], position = [], [], 0
+    for name, table in tables:
+        if isinstance(table, np.ndarray):
+            data = table.tobytes()
+            meta['tables'].append([name, table.dtype.str, list(table.shape), position, len(data)])
+        else:
+            data = encode_strings(table)
+            meta['tables'].append([name, 'strings', [len(table)], position, len(data)])
+        padding = b'\0' * (-len(data) % ALIGNMENT)
+        chunks.extend([data, padding])
+        position += len(data) + len(padding)
+    header = json.dumps(meta).encode('utf-8')
+    header += b' ' * (-(HEADER.size + len(header)) % ALIGNMENT)
+
+    # temporary file + rename: a concurrent reader never sees a half-written file
+    tmp_name = '{}.{}.tmp'.format(file_name, os.getpid())
+    out = open(tmp_name, 'wb')
+    out.write(HEADER.pack(MAGIC, VERSION, len(header)))
+    out.write(header)
+    out.writelines(chunks)
+    out.close()
+    os.rename(tmp_name, file_name)
+    return file_name
+
+
+def is_feature_file(file_name):
+    with open(file_name, 'rb') as a_file:
+        return a_file.read(len(MAGIC)) == MAGIC
+
+
+class FeatureFile(object):
+    '''
+    Features loaded from a binary feature file, the arrays are memory-mapped.
+    The categorical values are decoded only for the requested rows (see blocks).
+    '''
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        in_file = open(file_name, 'rb')
+        magic, version, header_size = HEADER.unpack(in_file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{} is not a feature file of version {}'.format(file_name, VERSION))
+        meta = json.loads(in_file.read(header_size).decode('utf-8'))
+        data_start = HEADER.size + header_size
+        self.tables = {}
+        for name, dtype, shape, offset, size in meta['tables']:
+            if dtype == 'strings':
+                in_file.seek(data_start + offset)
+                self.tables[name] = decode_strings(in_file.read(size), shape[0])
+            elif size == 0:
+                self.tables[name] = np.zeros(shape, dtype=dtype)
+            else:
+                # a plain ndarray view of the mapped file (indexing np.memmap objects is slower)
+                self.tables[name] = np.memmap(file_name, dtype=dtype, mode='r', offset=data_start + offset, shape=tuple(shape)).view(np.ndarray)
+        in_file.close()
+        self.feature_names = meta['feature_names']
+        self.n_rows = meta['n_rows']
+        self.sentence_offsets = self.tables['sentence_offsets']
+        self.sparse_shape = tuple(meta['sparse_shape']) if 'sparse_shape' in meta else None
+        self.layout = [tuple(entry) for entry in meta['layout']] if 'layout' in meta else []
+        self.kinds = {col: kind for col, kind in meta['columns']} if 'columns' in meta else {}
+        self.int_columns = meta['int_columns'] if 'int_columns' in meta else []
+
+    # number of sentences
+    def __len__(self):
+        return len(self.sentence_offsets) - 1
+
+    def is_sparse(self):
+        return self.sparse_shape is not None
+
+    def sentence_rows(self, idx):
+        return int(self.sentence_offsets[idx]), int(self.sentence_offsets[idx + 1])
+
+    # binarized features as a CSR matrix
+    def matrix(self):
+        return sparse.csr_matrix((self.tables['sparse.data'], self.tables['sparse.indices'], self.tables['sparse.indptr']), shape=self.sparse_shape)
+
+    # values of the categorical column <col> for the rows start..end-1
+    def column(self, col, start, end):
+        values, codes = self.tables['values.{}'.format(col)], self.tables['codes.{}'.format(col)]
+        if self.kinds[col] == 'multilabel':
+            offsets = self.tables['offsets.{}'.format(col)]
+            return [[values[c] for c in codes[offsets[row]:offsets[row + 1]]] for row in range(start, end)]
+        return [values[c] for c in codes[start:end]]
+
+    # FeatureBlocks with the rows start..end-1 (all rows by default)
+    def blocks(self, start=0, end=None):
+        end = self.n_rows if end is None else end
+        columns = {col: self.column(col, start, end) for col in self.kinds}
+        return FeatureBlocks(end - start, self.tables['dense'][start:end], columns, self.layout, self.int_columns)
+
+    def sentence_blocks(self):
+        return [self.blocks(*self.sentence_rows(idx)) for idx in range(len(self))]
+
+    # tags of the rows start..end-1, None if the file has no tags
+    def tags(self, start=0, end=None):
+        if 'tags' not in self.tables:
+            return None
+        end = self.n_rows if end is None else end
+        values = self.tables['tag_values']
+        return [values[c] for c in self.tables['tags'][start:end]]
+
+    def sentence_tags(self):
+        tags = self.tags()
+        if tags is None:
+            return None
+        return [tags[start:end] for start, end in [self.sentence_rows(idx) for idx in range(len(self))]]
+
+    # features of every sentence as lists of rows (the representation used by the text formats)
+    def sentences(self):
+        res = []
+        matrix = self.matrix() if self.is_sparse() else None
+        for idx in range(len(self)):
+            start, end = self.sentence_rows(idx)
+            if matrix is not None:
+                res.append(matrix[start:end].toarray())
+            else:
+                blocks = self.blocks(start, end)
+                res.append([blocks.row(row) for row in range(end - start)])
+        return res
+
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+#encoding: utf-8
+
+# numbering of binary features for the svm_light format
+# a binary feature is a string (e.g. '<feature name>_<value>_<tag>'), its number is the column of the svm_light file
+# the numbers are kept in a dict (one lookup per feature) and follow the order in which the features were added,
+# so the same training data always gets the same numbering
+# HashedFeatureIndex numbers the features by their hashes instead: nothing is stored, so one index can be shared
+# by all processes and datasets without a pass over the training data
+
+from __future__ import print_function
+
+from sklearn.utils import murmurhash3_32
+
+SVM_BUFFER_SIZE = 1 << 20
+
+
+class FeatureIndex(object):
+    '''
+    Bidirectional mapping between binary features and their numbers. The numbers start from 1 (svm_light
+    doesn't allow the feature 0), features[i - 1] is the feature number i.
+    '''
+
+    def __init__(self, features=()):
+        self.feature2id = {}
+        self.features = []
+        for feature in features:
+            self.add(feature)
+
+    def add(self, feature):
+        feature_id = self.feature2id.get(feature)
+        if feature_id is None:
+            self.features.append(feature)
+            feature_id = len(self.features)
+            self.feature2id[feature] = feature_id
+        return feature_id
+
+    # number of a feature, <default> for unknown features
+    def get(self, feature, default=None):
+        return self.feature2id.get(feature, default)
+
+    # sorted numbers of <features>, unknown features are skipped (or added if <grow>)
+    def ids(self, features, grow=False):
+        if grow:
+            return sorted(set([self.add(f) for f in features]))
+        feature2id = self.feature2id
+        return sorted(set([feature2id[f] for f in features if f in feature2id]))
+
+    def __contains__(self, feature):
+        return feature in self.feature2id
+
+    def __len__(self):
+        return len(self.features)
+
+    def __iter__(self):
+        return iter(self.features)
+
+
+class HashedFeatureIndex(object):
+    '''
+    Numbers of binary features computed as murmurhash3(feature) mod 2^n_bits + 1.
+    Has the interface of FeatureIndex (get, ids), every feature is known, different features can share a number.
+    '''
+
+    def __init__(self, n_bits=20):
+        self.n_bits = n_bits
+
+    def get(self, feature, default=None):
+        return murmurhash3_32(feature, positive=True) % len(self) + 1
+
+    # sorted numbers of <features> (<grow> is ignored: the index doesn't change)
+    def ids(self, features, grow=False):
+        n_features = len(self)
+        return sorted(set([murmurhash3_32(f, positive=True) % n_features + 1 for f in features]))
+
+    def __contains__(self, feature):
+        return True
+
+    def __len__(self):
+        return 1 << self.n_bits
+
+
+# line of an svm_light file with binary features
+# <qid> -- number of the sequence for the sequential representation
+def svm_light_line(label, feature_ids, qid=None, separator=' '):
+    values = ' '.join([str(f) + ':1.0' for f in feature_ids])
+    if qid is not None:
+        return '%s qid:%d %s\n' % (label, qid, values)
+    return '%s%s%s\n' % (label, separator, values)
+
+
+def open_svm_file(file_name):
+    return open(file_name, 'w', SVM_BUFFER_SIZE)
+
+
+# svm_light file with one line per object: <labels> -- labels in the svm_light notation, <features> -- sorted feature numbers
+def write_svm_file(file_name, labels, features):
+    out_file = open_svm_file(file_name)
+    out_file.writelines(svm_light_line(label, feature_ids) for label, feature_ids in zip(labels, features))
+    out_file.close()
+    return file_name
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+#encoding: utf-8
+
+# fast loading of pre-extracted features in the text formats (one object per line, tab-separated,
+# an empty line after every sentence):
+#   - 'crf++' -- the cells are the feature values
+#   - 'crf_suite' -- the first cell is the tag, the others are <feature name>=<value>
+# the file is split into byte ranges which end at sentence boundaries, every range is read as one block
+# (in parallel with <workers> processes) and split into columns in bulk. The type of a column (numeric or
+# categorical) is inferred once from the first rows of the file: numeric columns are converted to one
+# array per range, categorical columns to integer codes (np.unique), the codes of the ranges are then
+# merged into one vocabulary per column
+
+from __future__ import print_function
+
+import os
+import multiprocessing as multi
+
+import numpy as np
+
+from marmot.util.feature_blocks import FeatureBlocks, column_runs
+
+# size of the byte ranges read at a time
+BLOCK_SIZE = 1 << 26
+# number of rows used to infer the types of the columns
+SAMPLE_ROWS = 1000
+
+
+# positions in the file after the empty lines which follow the sentences
+# the file is split into ranges of about <block_size> bytes (at least <n_parts> ranges)
+def sentence_ranges(file_name, n_parts=1, block_size=BLOCK_SIZE):
+    size = os.path.getsize(file_name)
+    n_parts = max(n_parts, size // block_size + 1)
+    bounds = [0]
+    a_file = open(file_name, 'rb')
+    for part in range(1, n_parts):
+        position = max(size * part // n_parts, bounds[-1])
+        # '\n\n' which starts before <position> and ends after it is a boundary too
+        a_file.seek(max(position - 1, 0))
+        tail, start = b'', max(position - 1, 0)
+        while True:
+            chunk = a_file.read(1 << 16)
+            if len(chunk) == 0:
+                boundary = size
+                break
+            found = (tail + chunk).find(b'\n\n')
+            if found != -1:
+                boundary = start - len(tail) + found + 2
+                break
+            tail = chunk[-1:]
+            start += len(chunk)
+        if boundary < size and boundary > bounds[-1]:
+            bounds.append(boundary)
+    a_file.close()
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+# tags and columns of values of rows split into cells (<tags> is None for the crf++ format)
+# used for the sample of the file which decides the types of the columns
+def block_columns(rows, file_format):
+    n_cells = len(rows[0]) if len(rows) > 0 else 0
+    if any([len(row) != n_cells for row in rows]):
+        raise ValueError('Rows with different numbers of cells')
+    columns = list(zip(*rows))
+    tags = None
+    if file_format == 'crf_suite' and len(columns) > 0:
+        tags, columns = columns[0], [[cell[cell.find(b'=') + 1:] for cell in column] for column in columns[1:]]
+    return tags, columns
+
+
+class BlockCells(object):
+    '''
+    Cells of a block of the file found without splitting it into strings:
+    <data> -- the bytes of the non-empty lines (uint8 array), <starts>, <ends> -- positions of the cells (row-major),
+    <lengths> -- numbers of lines of the sentences. In the crf_suite format the cells start after '<name>='.
+    '''
+
+    def __init__(self, data, file_format):
+        data = np.frombuffer(data + (b'' if data.endswith(b'\n') else b'\n'), dtype=np.uint8)
+        newlines = np.flatnonzero(data == ord('\n'))
+        line_starts = np.concatenate([[0], newlines[:-1] + 1])
+        blank = newlines == line_starts
+        # every empty line ends a sentence
+        sentence_ids = np.cumsum(blank)[~blank]
+        self.lengths = [int(n) for n in np.bincount(sentence_ids) if n > 0] if len(sentence_ids) > 0 else []
+        keep = np.ones(len(data), dtype=bool)
+        keep[newlines[blank]] = False
+        self.data = data[keep]
+        self.ends = np.flatnonzero((self.data == ord('\t')) | (self.data == ord('\n')))
+        self.n_rows = int(sum(self.lengths))
+        self.n_cells = len(self.ends) // self.n_rows if self.n_rows > 0 else 0
+        if self.n_cells * self.n_rows != len(self.ends) or self.n_rows > 0 and np.any(self.data[self.ends[self.n_cells - 1::self.n_cells]] != ord('\n')):
+            raise ValueError('Rows with different numbers of cells')
+        self.starts = np.concatenate([[0], self.ends[:-1] + 1]).astype(np.int64)
+        self.value_starts = self.starts
+        if file_format == 'crf_suite' and self.n_rows > 0:
+            # the first '=' of every cell, except for the tags
+            equals = np.flatnonzero(self.data == ord('='))
+            cells = np.searchsorted(self.ends, equals)
+            first = np.concatenate([[True], cells[1:] != cells[:-1]]) if len(cells) > 0 else np.zeros(0, dtype=bool)
+            first &= cells % self.n_cells != 0
+            self.value_starts = self.starts.copy()
+            self.value_starts[cells[first]] = equals[first] + 1
+
+    # cells of the column <col> as a fixed-width bytes array
+    def cells(self, col):
+        starts, ends = self.value_starts[col::self.n_cells], self.ends[col::self.n_cells]
+        width = max(int((ends - starts).max()), 1) if len(starts) > 0 else 1
+        positions = starts[:, None] + np.arange(width)
+        matrix = self.data[np.minimum(positions, len(self.data) - 1)]
+        matrix[positions >= ends[:, None]] = 0
+        return matrix.view('S{}'.format(width)).reshape(len(starts))
+
+    # the values of the columns <cols> parsed as numbers in one pass, a matrix with one row per line
+    # (the other cells and the delimiters are replaced by spaces), None if some values aren't numbers
+    def numbers(self, cols, dtype):
+        if len(cols) == 0 or self.n_rows == 0:
+            return np.zeros((self.n_rows, len(cols)), dtype=dtype)
+        is_numeric = np.zeros(self.n_cells, dtype=bool)
+        is_numeric[cols] = True
+        cell_columns = np.tile(np.arange(self.n_cells), self.n_rows)
+        # ranges of bytes to blank: the other cells and the names of the crf_suite format
+        first = self.starts
+        last = np.where(is_numeric[cell_columns], self.value_starts, self.ends)
+        non_empty = last > first
+        changes = np.zeros(len(self.data) + 1, dtype=np.int8)
+        changes[first[non_empty]] = 1
+        changes[last[non_empty]] = -1
+        text = self.data.copy()
+        text[np.cumsum(changes[:-1], dtype=np.int8) > 0] = ord(' ')
+        text[self.ends] = ord(' ')
+        values = np.fromstring(text.tobytes(), dtype=dtype, sep=' ')
+        if len(values) != self.n_rows * len(cols):
+            return None
+        return values.reshape((self.n_rows, len(cols)))
+
+
+def is_number(value):
+    try:
+        float(value)
+    except ValueError:
+        return False
+    return True
+
+
+# categorical columns: the columns with values which aren't numbers in the first <sample_rows> rows
+# also returns the feature names of the crf_suite format
+def infer_columns(file_name, file_format, sample_rows=SAMPLE_ROWS):
+    lines = []
+    for line in open(file_name, 'rb'):
+        line = line.rstrip(b'\n')
+        if line != b'':
+            lines.append(line.split(b'\t'))
+            if len(lines) >= sample_rows:
+                break
+    tags, columns = block_columns(lines, file_format)
+    categorical = set([col for col, column in enumerate(columns) if not all([is_number(v) for v in column])])
+    names = None
+    if file_format == 'crf_suite' and len(lines) > 0:
+        names = [cell[:cell.find(b'=')].decode('utf-8') for cell in lines[0][1:]]
+    return categorical, names
+
+
+# unique values (decoded) and codes of a column of cells
+def encode_values(cells):
+    values, codes = np.unique(cells, return_inverse=True)
+    return [v.decode('utf-8') for v in values], codes.astype(np.int32)
+
+
+# parse one byte range of the file
+# returns a dict: 'lengths', 'numeric' ({column: array}), 'categorical' ({column: (values, codes)}), 'tags' ((values, codes) or None)
+# and 'failed' -- numeric columns with values which aren't numbers (the file is parsed again with these columns as categorical)
+def parse_range(args):
+    file_name, start, end, file_format, categorical, dtype = args
+    a_file = open(file_name, 'rb')
+    a_file.seek(start)
+    data = a_file.read(end - start)
+    a_file.close()
+    block = BlockCells(data, file_format)
+    # the tag is the first cell of the crf_suite format
+    first = 1 if file_format == 'crf_suite' else 0
+    n_columns = max(block.n_cells - first, 0)
+    res = {'lengths': block.lengths, 'n_columns': n_columns, 'numeric': {}, 'categorical': {}, 'failed': set(),
+           'tags': encode_values(block.cells(0)) if first == 1 and block.n_rows > 0 else None}
+    numeric = [col for col in range(n_columns) if col not in categorical]
+    positions = {col: idx for idx, col in enumerate(numeric)}
+    values = block.numbers([col + first for col in numeric], dtype)
+    for col in range(n_columns):
+        if col in categorical:
+            res['categorical'][col] = encode_values(block.cells(col + first))
+        elif values is not None:
+            res['numeric'][col] = values[:, positions[col]]
+        else:
+            # some values aren't numbers: find the columns
+            try:
+                res['numeric'][col] = block.cells(col + first).astype(dtype)
+            except ValueError:
+                res['failed'].add(col)
+    return res
+
+
+# codes of all parts mapped to one vocabulary, returns the decoded values of all rows
+def merge_codes(parts):
+    vocabulary = sorted(set([v for values, codes in parts for v in values]))
+    index = {v: i for i, v in enumerate(vocabulary)}
+    codes = [np.array([index[v] for v in values], dtype=np.int32)[part_codes] for values, part_codes in parts if len(part_codes) > 0]
+    if len(codes) == 0:
+        return []
+    return np.array(vocabulary, dtype=object)[np.concatenate(codes)].tolist()
+
+
+# <file_format> -- 'crf++' or 'crf_suite'
+# <dtype> -- type of the numeric features (float64 keeps the values of the file exactly)
+# returns the features (FeatureBlocks with one row per line), the numbers of rows of the sentences,
+# the feature names and the tags (for the crf_suite format, None otherwise)
+def load_text_features(file_name, file_format='crf++', workers=1, dtype=np.float32, block_size=BLOCK_SIZE, sample_rows=SAMPLE_ROWS):
+    categorical, names = infer_columns(file_name, file_format, sample_rows=sample_rows)
+    ranges = sentence_ranges(file_name, n_parts=workers, block_size=block_size)
+    pool = multi.Pool(workers) if workers > 1 and len(ranges) > 1 else None
+    while True:
+        args = [(file_name, start, end, file_format, categorical, dtype) for start, end in ranges]
+        parts = pool.map(parse_range, args) if pool is not None else [parse_range(a) for a in args]
+        failed = set([col for part in parts for col in part['failed']])
+        if len(failed) == 0:
+            break
+        categorical = categorical | failed
+    if pool is not None:
+        pool.close()
+        pool.join()
+    parts = [part for part in parts if len(part['lengths']) > 0]
+    lengths = [n for part in parts for n in part['lengths']]
+    n_rows = sum(lengths)
+    n_columns = parts[0]['n_columns'] if len(parts) > 0 else 0
+    if any([part['n_columns'] != n_columns for part in parts]):
+        raise ValueError('{}: rows with different numbers of cells'.format(file_name))
+
+    dense_parts, columns, layout, offset = [], {}, [], 0
+    for first, last, numeric in column_runs([col not in categorical for col in range(n_columns)]):
+        if numeric:
+            dense_parts.append(np.vstack([np.column_stack([part['numeric'][col] for col in range(first, last)]) for part in parts]))
+            layout.append(('dense', first, last, offset))
+            offset += last - first
+            continue
+        for col in range(first, last):
+            columns[col] = merge_codes([part['categorical'][col] for part in parts])
+            layout.append(('column', col, col + 1, None))
+    dense = np.hstack(dense_parts) if len(dense_parts) > 0 else np.zeros((n_rows, 0), dtype=dtype)
+    tags = merge_codes([part['tags'] for part in parts]) if file_format == 'crf_suite' else None
+    return FeatureBlocks(n_rows, dense, columns, layout), lengths, names, tags
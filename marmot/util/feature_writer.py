@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+#encoding: utf-8
+
+# writers of the text feature formats (crf++, crf_suite, svm_light)
+# the sentences are split into chunks which are formatted into byte strings in worker processes,
+# the main process only concatenates the formatted chunks and writes them with a large buffer,
+# optionally compressed (gzip, or zstd if the zstandard package is installed)
+# the chunks of several datasets are formatted by the same pool, so all datasets are written concurrently
+
+from __future__ import print_function
+
+import io
+import gzip
+import multiprocessing as multi
+
+from scipy import sparse
+
+from marmot.util.feature_blocks import FeatureBlocks
+
+WRITE_BUFFER_SIZE = 1 << 22
+# number of sentences (objects for svm_light) formatted by a worker at a time
+CHUNK_SIZE = 1000
+COMPRESSION_SUFFIXES = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+SVM_LIGHT_TAGS = {'OK': '+1', 'BAD': '-1'}
+
+
+# a feature value as a byte string (str() for everything except for strings)
+def value_bytes(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    elif isinstance(value, str):
+        return value
+    return str(value)
+
+
+def is_zero(value):
+    try:
+        return float(value) == 0.0
+    except (ValueError, TypeError):
+        return False
+
+
+# lines of one chunk of the crf++ or crf_suite format
+# <sentences> -- lists of feature rows (or FeatureBlocks, or sparse matrices), <tags> -- lists of tags (or None), <names> -- feature names (for crf_suite)
+# every sentence is followed by an empty line
+def format_crf(sentences, tags, names, file_format):
+    prefixes = [value_bytes(name) + '=' for name in names] if names is not None else None
+    lines = []
+    for s_idx, seq in enumerate(sentences):
+        tag_seq = tags[s_idx] if tags is not None else None
+        # the crf formats have a value for every column: a binarized sentence is densified here, one sentence at a time
+        if sparse.issparse(seq):
+            seq = seq.toarray()
+        elif isinstance(seq, FeatureBlocks):
+            seq = seq.rows()
+        for w_idx, row in enumerate(seq):
+            if file_format == 'crf++':
+                features = '\t'.join([value_bytes(f) for f in row])
+                lines.append(features + '\t' + str(tag_seq[w_idx]) if tag_seq is not None else features)
+            else:
+                features = '\t'.join([prefix + value_bytes(f) for prefix, f in zip(prefixes, row)])
+                lines.append(str(tag_seq[w_idx]) + '\t' + features if tag_seq is not None else features)
+        lines.append('')
+    lines.append('')
+    return '\n'.join(lines)
+
+
+# lines of one chunk of the svm_light format: one object per line, the columns are numbered from 1,
+# zero values are skipped
+# <rows> -- a list of rows or FeatureBlocks
+def format_svm_light(rows, tags):
+    if isinstance(rows, FeatureBlocks):
+        rows = rows.rows()
+    lines = []
+    for a_tag, row in zip(tags, rows):
+        features = ' '.join(['%d:%s' % (col + 1, value_bytes(f)) for col, f in enumerate(row) if not is_zero(f)])
+        lines.append(SVM_LIGHT_TAGS[a_tag] + ' ' + features)
+    lines.append('')
+    return '\n'.join(lines)
+
+
+# <args> -- (dataset number, sentences or rows, tags, feature names, file format)
+def format_chunk(args):
+    dataset_idx, features, tags, names, file_format = args
+    if file_format == 'svm_light':
+        return dataset_idx, format_svm_light(features, tags)
+    return dataset_idx, format_crf(features, tags, names, file_format)
+
+
+# fails fast on an unknown compression or a missing package (before the features are extracted, not when they are written)
+def check_compression(compression):
+    if compression not in COMPRESSION_SUFFIXES:
+        raise ValueError("Unknown compression: '{}', the options are 'gzip' and 'zstd'".format(compression))
+    if compression == 'zstd':
+        try:
+            # imported here: zstandard is needed only for the zstd compression
+            import zstandard
+        except ImportError:
+            raise ImportError("The zstd compression needs the zstandard package (pip install zstandard), use 'gzip' or no compression without it")
+
+
+def output_file_name(file_name, compression=None):
+    check_compression(compression)
+    return file_name + COMPRESSION_SUFFIXES[compression]
+
+
+# buffered binary output, <compression> -- None, 'gzip' or 'zstd'
+# the compressed formats can be appended to (the new data is written as another gzip member / zstd frame)
+def open_output(file_name, mode='w', compression=None):
+    mode = mode[0] + 'b'
+    if compression == 'gzip':
+        return io.BufferedWriter(gzip.open(file_name, mode, compresslevel=6), WRITE_BUFFER_SIZE)
+    elif compression == 'zstd':
+        # imported here: zstandard is needed only for the zstd compression
+        import zstandard
+        return zstandard.ZstdCompressor(threads=-1).stream_writer(open(file_name, mode, WRITE_BUFFER_SIZE))
+    return open(file_name, mode, WRITE_BUFFER_SIZE)
+
+
+def chunk_args(dataset_idx, features, tags, names, file_format, chunk_size):
+    for start in range(0, len(features), chunk_size):
+        yield (dataset_idx, features[start:start + chunk_size], tags[start:start + chunk_size] if tags is not None else None, names, file_format)
+
+
+# write several datasets at a time
+# <outputs> -- list of (file name, features, tags): features and tags of the 'sequential' datatype
+#              (lists of rows and tags for every sentence) for crf++ and crf_suite, one row and tag per object for svm_light
+#              the rows may be FeatureBlocks (one per sentence, or one for all objects for svm_light): they are converted
+#              to lists of values chunk by chunk in the worker processes
+# <workers> -- number of processes which format the chunks
+def write_features(outputs, feature_names, file_format, workers=1, compression=None, mode='w', chunk_size=CHUNK_SIZE):
+    if file_format not in ('crf++', 'crf_suite', 'svm_light'):
+        raise ValueError("Unknown data format: '{}'".format(file_format))
+    names = [f for f in feature_names] if feature_names is not None else None
+    args = [a for idx, (file_name, features, tags) in enumerate(outputs) for a in chunk_args(idx, features, tags, names, file_format, chunk_size)]
+    files = [open_output(file_name, mode=mode, compression=compression) for file_name, features, tags in outputs]
+    pool = multi.Pool(workers) if workers > 1 and len(args) > 1 else None
+    # the chunks are formatted in order, so the lines of every file keep the order of the data
+    formatted = pool.imap(format_chunk, args) if pool is not None else (format_chunk(a) for a in args)
+    for dataset_idx, data in formatted:
+        files[dataset_idx].write(data)
+    if pool is not None:
+        pool.close()
+        pool.join()
+    for a_file in files:
+        a_file.close()
+    return [file_name for file_name, features, tags in outputs]
+
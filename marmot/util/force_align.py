@@ -7,6 +7,12 @@ import os
 import subprocess
 import sys
 import threading
+from collections import deque
+
+# number of lines written to a process at a time
+BATCH_SIZE = 1000
+# number of the last lines of stderr of a process which are kept for the error messages
+STDERR_LINES = 10
 
 # Simplified, non-threadsafe version for force_align.py
 # Use the version in realtime for development
@@ -35,15 +41,110 @@ class Aligner:
 
     def align(self, line):
         self.fwd_align.stdin.write('{}\n'.format(line.encode('utf-8')))
+        self.fwd_align.stdin.flush()
         self.rev_align.stdin.write('{}\n'.format(line.encode('utf-8')))
+        self.rev_align.stdin.flush()
         # f words ||| e words ||| links ||| score
         fwd_line = self.fwd_align.stdout.readline().split('|||')[2].strip()
         rev_line = self.rev_align.stdout.readline().split('|||')[2].strip()
         self.tools.stdin.write('{}\n'.format(fwd_line))
         self.tools.stdin.write('{}\n'.format(rev_line))
+        self.tools.stdin.flush()
         al_line = self.tools.stdout.readline().strip()
         return al_line
- 
+
+    # align many lines without waiting for every line: the lines are written to both fast_align processes
+    # by two threads in batches, a third thread passes their links to atools, the alignments are read from atools
+    # returns the alignments in the order of the lines
+    # if a process dies or prints a malformed line, all processes are killed (so no thread waits on a pipe forever)
+    # and RuntimeError is raised, the aligner can't be used after that
+    def align_lines(self, lines, batch_size=BATCH_SIZE):
+        for name, process in self.processes():
+            if process.poll() is not None:
+                raise RuntimeError('{} has exited with code {}, the aligner can\'t be used'.format(name, process.returncode))
+        data = ['{}\n'.format(line.encode('utf-8')) for line in lines]
+        # the errors of the threads, the first one stops the processes
+        errors = []
+
+        def run(function, *args):
+            try:
+                function(*args)
+            except Exception as exc:
+                errors.append(exc)
+                self.kill()
+
+        def feed(stream):
+            for start in range(0, len(data), batch_size):
+                stream.write(''.join(data[start:start + batch_size]))
+                stream.flush()
+
+        # f words ||| e words ||| links ||| score
+        def read_links(name, process):
+            line = process.stdout.readline()
+            if line == '':
+                raise RuntimeError('{} has stopped before all lines were aligned'.format(name))
+            fields = line.split('|||')
+            if len(fields) < 3:
+                raise RuntimeError('Malformed output of {}: {}'.format(name, line.strip()))
+            return fields[2].strip() + '\n'
+
+        def join_links():
+            links = []
+            for idx in range(len(data)):
+                links.append(read_links('fast_align', self.fwd_align))
+                links.append(read_links('fast_align -r', self.rev_align))
+                if len(links) >= 2 * batch_size or idx == len(data) - 1:
+                    self.tools.stdin.write(''.join(links))
+                    self.tools.stdin.flush()
+                    links = []
+
+        threads = [threading.Thread(target=run, args=(feed, self.fwd_align.stdin)), threading.Thread(target=run, args=(feed, self.rev_align.stdin)),
+                   threading.Thread(target=run, args=(join_links,))]
+        for thread in threads:
+            thread.start()
+        alignments = []
+        for line in data:
+            alignment = self.tools.stdout.readline()
+            # EOF: atools has exited or the processes were killed after an error
+            if alignment == '':
+                break
+            alignments.append(alignment.strip())
+        if len(alignments) < len(data):
+            self.kill()
+        for thread in threads:
+            thread.join()
+        if len(errors) > 0 or len(alignments) < len(data):
+            self.abort()
+            message = str(errors[0]) if len(errors) > 0 else 'atools has stopped before all lines were aligned'
+            stderr = ['{}: {}'.format(name, ''.join(process.stderr_tail).strip()) for name, process in self.processes() if len(process.stderr_tail) > 0]
+            raise RuntimeError('Alignment failed: {}'.format('\n'.join([message] + stderr)))
+        return alignments
+
+    def processes(self):
+        return [('fast_align', self.fwd_align), ('fast_align -r', self.rev_align), ('atools', self.tools)]
+
+    # stop all processes after an error: the threads which read or write their pipes get EOF or a broken pipe
+    def kill(self):
+        for name, process in self.processes():
+            if process.poll() is None:
+                try:
+                    process.kill()
+                except OSError:
+                    pass
+
+    # close the pipes of the killed processes (their buffers can't be flushed) and wait for the processes
+    def abort(self):
+        self.kill()
+        for name, process in self.processes():
+            for stream in (process.stdin, process.stdout):
+                try:
+                    stream.close()
+                except IOError:
+                    pass
+            process.wait()
+            process.stderr_consumer.join()
+
+
     def close(self):
         self.fwd_align.stdin.close()
         self.fwd_align.wait()
@@ -63,12 +164,56 @@ class Aligner:
                 T = line.split()[-1]
         return (T, m)
 
+
+class AlignerPool(object):
+    '''
+    <size> aligners (fast_align + atools pipelines) which align parts of the data at the same time.
+    The lines are split into <size> contiguous parts, the alignments are returned in the order of the lines.
+    '''
+
+    def __init__(self, fwd_params, fwd_err, rev_params, rev_err, heuristic='grow-diag-final-and', size=1, batch_size=BATCH_SIZE):
+        self.aligners = [Aligner(fwd_params, fwd_err, rev_params, rev_err, heuristic=heuristic) for i in range(max(size, 1))]
+        self.batch_size = batch_size
+
+    # <lines> -- '<source words> ||| <target words>'
+    def align(self, lines):
+        part_size = (len(lines) + len(self.aligners) - 1) // len(self.aligners)
+        parts = [lines[start:start + part_size] for start in range(0, len(lines), part_size)] if part_size > 0 else []
+        results = [None] * len(parts)
+        errors = []
+
+        def align_part(idx):
+            try:
+                results[idx] = self.aligners[idx].align_lines(parts[idx], batch_size=self.batch_size)
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=align_part, args=(idx,)) for idx in range(len(parts))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if len(errors) > 0:
+            raise errors[0]
+        return [alignment for result in results for alignment in result]
+
+    def close(self):
+        for aligner in self.aligners:
+            aligner.close()
+
+
 def popen_io(cmd):
-    p = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    # buffered pipes: the writes are flushed explicitly
+    p = subprocess.Popen(cmd, bufsize=-1, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    # the last lines of stderr are kept for the error messages
+    p.stderr_tail = deque(maxlen=STDERR_LINES)
     def consume(s):
-        for _ in s:
-            pass
-    threading.Thread(target=consume, args=(p.stderr,)).start()
+        for line in iter(s.readline, ''):
+            p.stderr_tail.append(line)
+    # a daemon thread: an aligner which is never closed doesn't keep the interpreter alive
+    p.stderr_consumer = threading.Thread(target=consume, args=(p.stderr,))
+    p.stderr_consumer.daemon = True
+    p.stderr_consumer.start()
     return p
 
 def main():
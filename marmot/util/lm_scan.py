@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+#encoding: utf-8
+
+# sentence-level scan of an n-gram table (an NgramStore or any object which supports 'ngram in lm')
+# the LM extractors need, for every token, the longest n-gram of the table which ends (left context)
+# or starts (right context) at the token, and the backoff class of the trigrams around the token.
+# Probing every window from the highest order down repeats almost the same lookups for neighbouring tokens,
+# so the whole sentence is scanned once:
+#   - an n-gram is in the table only if its prefixes and suffixes are (true for n-gram counts),
+#     so left[i] <= left[i - 1] + 1 and right[i] <= right[i + 1] + 1 -- the search at every position starts
+#     from the result of the previous position (about 2 lookups per position instead of <order>)
+#   - the backoff classes are computed from the left orders without any lookups
+
+from marmot.util.vocabulary import START, END
+
+
+# left[i] -- number of words of the longest n-gram (up to <max_order> words) of <lm> which ends at words[i]
+def longest_left(lm, words, max_order):
+    res = []
+    prev = 0
+    for i in range(len(words)):
+        n = min(prev + 1, max_order, i + 1)
+        while n > 0 and tuple(words[i - n + 1:i + 1]) not in lm:
+            n -= 1
+        res.append(n)
+        prev = n
+    return res
+
+
+# right[i] -- number of words of the longest n-gram (up to <max_order> words) of <lm> which starts at words[i]
+def longest_right(lm, words, max_order):
+    res = [0 for i in range(len(words))]
+    prev = 0
+    for i in range(len(words) - 1, -1, -1):
+        n = min(prev + 1, max_order, len(words) - i)
+        while n > 0 and tuple(words[i:i + n]) not in lm:
+            n -= 1
+        res[i] = n
+        prev = n
+    return res
+
+
+# backoff behaviour of the trigram which ends at words[i] (the same classes as get_backoff of the LM extractors)
+# <left> -- the result of longest_left with max_order >= 3
+def backoff_class(left, i):
+    cur, prev = left[i], left[i - 1] if i > 0 else 0
+    # trigram (1, 2, 3)
+    if cur >= 3:
+        return 1.0
+    # two bigrams (1, 2) and (2, 3)
+    elif cur == 2 and prev >= 2:
+        return 0.8
+    # bigram (2, 3)
+    elif cur == 2:
+        return 0.6
+    # bigram (1, 2) and unigram (3)
+    elif cur == 1 and prev >= 2:
+        return 0.4
+    # unigrams (2) and (3)
+    elif cur == 1 and prev == 1:
+        return 0.3
+    # unigram (3)
+    elif cur == 1:
+        return 0.2
+    # all words unknown
+    else:
+        return 0.1
+
+
+# the value of check_lm(<window>, side) of the LM extractors for a window of <length> words
+# whose longest n-gram in the table (the suffix for side='left', the prefix for side='right') has <longest> words
+# check_lm probes the orders <order>..1 with slices of the window, so a window shorter than <order>
+# gets the order of the first slice which is in the table (not the length of the n-gram)
+def window_order(length, longest, order, side='left'):
+    if length == order:
+        return longest
+    for i in range(order, 0, -1):
+        if side == 'left':
+            n = len(range(length)[length - i:])
+        else:
+            n = len(range(length)[:i])
+        if n <= longest:
+            return i
+    return 0
+
+
+class SentenceScan(object):
+    '''
+    Longest n-grams and backoff classes for all positions of a sentence padded with <pad> START and END symbols.
+    The positions of the methods are the indices of the tokens in the unpadded sentence.
+    <right> -- scan the right contexts too (extractors which use only the left context don't need them)
+    '''
+
+    def __init__(self, lm, sentence, order, pad, right=True):
+        self.order = order
+        self.pad = pad
+        self.words = [START for i in range(pad)] + list(sentence) + [END for i in range(pad)]
+        # the backoff classes need the trigrams
+        max_order = max(order, 3)
+        self.left = longest_left(lm, self.words, max_order)
+        self.right = longest_right(lm, self.words, max_order) if right else None
+
+    # longest n-gram (up to <order> words) which ends at the token <idx>
+    def left_order(self, idx):
+        return min(self.left[idx + self.pad], self.order)
+
+    # longest n-gram (up to <order> words) which starts at the token <idx>
+    def right_order(self, idx):
+        return min(self.right[idx + self.pad], self.order)
+
+    # backoff class of the trigram which ends at the token <idx> (negative or too large indices are the padding)
+    def backoff(self, idx):
+        return backoff_class(self.left, idx + self.pad)
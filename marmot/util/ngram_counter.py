@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+#encoding: utf-8
+
+# built-in n-gram counting (replaces the SRILM 'ngram-count -write' call of the LM extractors)
+# the counts are the same as the ones of ngram-count: every line of the corpus is a sentence
+# padded with <s> and </s>, all n-grams of orders 1..<order> are counted
+#   - the corpus is split into shards (byte ranges aligned to lines) which are counted in parallel
+#   - a shard spills its counts to a sorted file as soon as it holds <max_ngrams> distinct n-grams
+#   - the sorted files are merged and streamed into an n-gram store in chunks (see marmot.util.ngram_store.save_ngrams)
+# the store is named after a hash of the corpus and the order, so later runs on the same corpus reuse it
+
+from __future__ import print_function
+
+import os
+import codecs
+import heapq
+import hashlib
+import tempfile
+import multiprocessing as multi
+from itertools import groupby
+
+from marmot.util.ngram_store import save_ngrams
+from marmot.util.vocabulary import START, END
+
+# distinct n-grams kept in memory by one shard before they are spilled to disk
+MAX_NGRAMS = 2000000
+# shards smaller than this are not worth a separate process
+MIN_SHARD_SIZE = 1 << 20
+
+
+# hash of the content of <corpus_file> and the counting parameters
+def corpus_hash(corpus_file, order):
+    sha = hashlib.sha1()
+    a_file = open(corpus_file, 'rb')
+    for block in iter(lambda: a_file.read(1 << 20), b''):
+        sha.update(block)
+    a_file.close()
+    sha.update('order={}'.format(order).encode('utf-8'))
+    return sha.hexdigest()
+
+
+# byte ranges of <n_shards> parts of a file, every range starts at the beginning of a line
+def shard_offsets(corpus_file, n_shards):
+    size = os.path.getsize(corpus_file)
+    offsets = [0]
+    a_file = open(corpus_file, 'rb')
+    for i in range(1, n_shards):
+        a_file.seek(max(size * i // n_shards, offsets[-1]))
+        if a_file.tell() > 0:
+            a_file.readline()
+        offsets.append(min(a_file.tell(), size))
+    a_file.close()
+    offsets.append(size)
+    return [(start, end) for start, end in zip(offsets[:-1], offsets[1:]) if end > start]
+
+
+def sentence_ngrams(words, order):
+    words = [START] + words + [END]
+    for i in range(len(words)):
+        for n in range(1, min(order, len(words) - i) + 1):
+            yield tuple(words[i:i + n])
+
+
+# write the counts sorted by n-gram, one 'w1 w2 ... wn<TAB>count' line per n-gram
+def spill(counts, tmp_dir):
+    fd, file_name = tempfile.mkstemp(suffix='.counts', dir=tmp_dir)
+    out = codecs.getwriter('utf-8')(os.fdopen(fd, 'wb'))
+    for ngram in sorted(counts):
+        out.write(u'{}\t{}\n'.format(u' '.join(ngram), counts[ngram]))
+    out.close()
+    return file_name
+
+
+# count the n-grams of the lines in the byte range [start, end) of the corpus
+# returns the names of the spill files
+def count_shard((corpus_file, start, end, order, max_ngrams, tmp_dir)):
+    counts = {}
+    spills = []
+    a_file = open(corpus_file, 'rb')
+    a_file.seek(start)
+    while a_file.tell() < end:
+        line = a_file.readline()
+        if not line:
+            break
+        for ngram in sentence_ngrams(line.decode('utf-8').split(), order):
+            counts[ngram] = counts.get(ngram, 0) + 1
+            if len(counts) >= max_ngrams:
+                spills.append(spill(counts, tmp_dir))
+                counts = {}
+    a_file.close()
+    if len(counts) > 0:
+        spills.append(spill(counts, tmp_dir))
+    return spills
+
+
+def read_spill(file_name):
+    for line in codecs.open(file_name, encoding='utf-8'):
+        ngram, count = line[:-1].split(u'\t')
+        yield tuple(ngram.split(u' ')), int(count)
+
+
+# merge the sorted spill files, the counts of the same n-gram are summed
+def merge_spills(spills):
+    merged = heapq.merge(*[read_spill(file_name) for file_name in spills])
+    for ngram, group in groupby(merged, key=lambda pair: pair[0]):
+        yield ngram, sum([count for _, count in group])
+
+
+def count_ngrams(corpus_file, store_file, order=5, workers=None, max_ngrams=MAX_NGRAMS, tmp_dir=None):
+    '''
+    Count the n-grams of <corpus_file> and save them as an n-gram store <store_file>.
+    <workers> -- number of processes (all cores by default)
+    <max_ngrams> -- distinct n-grams kept in memory by one process before they are spilled to <tmp_dir>
+    '''
+    if workers is None:
+        workers = multi.cpu_count()
+    n_shards = max(1, min(workers, os.path.getsize(corpus_file) // MIN_SHARD_SIZE))
+    spill_dir = tempfile.mkdtemp(prefix='ngram_counts.', dir=tmp_dir)
+    shards = [(corpus_file, start, end, order, max_ngrams, spill_dir) for start, end in shard_offsets(corpus_file, n_shards)]
+    if len(shards) > 1:
+        pool = multi.Pool(len(shards))
+        spills = pool.map(count_shard, shards)
+        pool.close()
+        pool.join()
+    else:
+        spills = [count_shard(shard) for shard in shards]
+    spills = [file_name for shard_spills in spills for file_name in shard_spills]
+    try:
+        save_ngrams(merge_spills(spills), store_file, order)
+    finally:
+        for file_name in spills:
+            os.remove(file_name)
+        os.rmdir(spill_dir)
+    return store_file
+
+
+# n-gram store of <corpus_file> in <store_dir>, counted only if there is no store for the same corpus yet
+def corpus_ngram_store(corpus_file, store_dir, order=5, workers=None):
+    store_file = os.path.join(store_dir, 'ngram_counts.{}.ngram_store'.format(corpus_hash(corpus_file, order)))
+    if not os.path.exists(store_file):
+        print("Counting the ngrams of {}".format(corpus_file))
+        count_ngrams(corpus_file, store_file, order=order, workers=workers, tmp_dir=store_dir)
+    return store_file
@@ -0,0 +1,420 @@
+#!/usr/bin/env python
+#encoding: utf-8
+
+# compact read-only storage of n-gram counts shared by all LM-based feature extractors
+# an SRILM counts file ('w1 w2 ... wn<TAB>count' per line) is converted once into a binary file:
+#   - the vocabulary of the counts file (words are encoded with integer ids)
+#   - a sorted array of 64-bit n-gram keys (a hash of the word ids)
+#   - the counts and the word ids of every n-gram (the ids are used to resolve hash collisions)
+# the arrays are memory-mapped, so the pages are shared by all processes which use the same file
+# the stores are loaded once per process through a registry (get_ngram_store)
+
+from __future__ import print_function
+
+import os
+import codecs
+import struct
+import hashlib
+import tempfile
+from itertools import islice
+
+import numpy as np
+
+from marmot.experiment.import_utils import mk_tmp_dir
+
+
+MAGIC = b'MARMOTNG'
+VERSION = 1
+# magic, version, order, number of words, number of ngrams, size of the vocabulary in bytes
+HEADER = struct.Struct('<8siiqqq')
+
+QUARTILES_MAGIC = b'MARMOTQT'
+# version 2: n-grams with the same count are ordered by their words
+QUARTILES_VERSION = 2
+# magic, version, order, number of ngrams
+QUARTILES_HEADER = struct.Struct('<8siiq')
+
+# n-grams encoded at a time when a store is written from a stream (see save_ngrams)
+CHUNK_SIZE = 1 << 16
+
+_MASK = (1 << 64) - 1
+_MULTIPLIER = 0x9E3779B97F4A7C15
+
+
+# 64-bit key of a sequence of word ids (padded with -1 to the order of the store)
+# the same function is applied to single n-grams (python ints) and to arrays of n-grams (numpy uint64)
+def _mix(h):
+    h = h ^ (h >> 33)
+    h = (h * 0xFF51AFD7ED558CCD) & _MASK
+    h = h ^ (h >> 33)
+    return h
+
+
+def ngram_key(ids, order):
+    h = 0
+    for word_id in ids[:order]:
+        h = (h * _MULTIPLIER + word_id + 2) & _MASK
+    for i in range(order - len(ids)):
+        h = (h * _MULTIPLIER + 1) & _MASK
+    h = _mix(h)
+    # signed 64-bit representation
+    return h - (1 << 64) if h >= (1 << 63) else h
+
+
+def ngram_keys(id_matrix):
+    h = np.zeros(id_matrix.shape[0], dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for i in range(id_matrix.shape[1]):
+            h = h * np.uint64(_MULTIPLIER) + (id_matrix[:, i] + 2).astype(np.uint64)
+        h = h ^ (h >> np.uint64(33))
+        h = h * np.uint64(0xFF51AFD7ED558CCD)
+        h = h ^ (h >> np.uint64(33))
+    return h.view(np.int64)
+
+
+# encode (tuple of words, value) pairs with integer word ids, the values are appended to <values>
+# returns the vocabulary and the matrix of word ids (one row per n-gram, padded with -1)
+def encode_ngrams(ngrams, values):
+    words, word2id = [], {}
+    ngram_ids = []
+    for ngram, value in ngrams:
+        ids = []
+        for word in ngram:
+            if word not in word2id:
+                word2id[word] = len(words)
+                words.append(word)
+            ids.append(word2id[word])
+        ngram_ids.append(ids)
+        values.append(value)
+    order = max([len(ids) for ids in ngram_ids]) if len(ngram_ids) > 0 else 1
+    id_matrix = np.full((len(ngram_ids), order), -1, dtype='<i4')
+    for row, ids in enumerate(ngram_ids):
+        id_matrix[row, :len(ids)] = ids
+    return words, id_matrix
+
+
+class NgramStore(object):
+    '''
+    Read-only n-gram counts with integer-encoded keys.
+    Supports the subset of the dict interface used by the LM extractors:
+    <ngram> in store, store[ngram] (0 for unknown n-grams), store.get(ngram, default).
+    An n-gram is a tuple or a list of words.
+    '''
+
+    def __init__(self, words, keys, counts, ids, order):
+        self.words = words
+        self.word2id = {w: i for i, w in enumerate(words)}
+        self.keys = keys
+        self.counts = counts
+        self.ids = ids
+        self.order = order
+        # the counts file of a store loaded through get_ngram_store
+        self.source = None
+        # the binary file and the cache directory of a store loaded through get_ngram_store
+        self.file_name = None
+        self.cache_dir = None
+
+    # a pickled store (e.g. an extractor sent to a worker process) is reopened from the file, the arrays are not copied
+    def __reduce__(self):
+        if self.source is not None:
+            return (get_ngram_store, (self.source, self.cache_dir))
+        return (NgramStore, (self.words, self.keys, self.counts, self.ids, self.order))
+
+    def __len__(self):
+        return len(self.keys)
+
+    # position of the n-gram in the arrays, -1 if it's not in the store
+    def find(self, ngram):
+        if len(ngram) == 0 or len(ngram) > self.order:
+            return -1
+        word2id = self.word2id
+        ids = [word2id.get(word, -2) for word in ngram]
+        if -2 in ids:
+            return -1
+        ids.extend([-1] * (self.order - len(ids)))
+        key = ngram_key(ids, self.order)
+        keys = self.keys
+        pos = int(keys.searchsorted(key))
+        while pos < len(keys) and keys[pos] == key:
+            if self.ids[pos].tolist() == ids:
+                return pos
+            pos += 1
+        return -1
+
+    def __contains__(self, ngram):
+        return self.find(ngram) != -1
+
+    def get(self, ngram, default=None):
+        pos = self.find(ngram)
+        return int(self.counts[pos]) if pos != -1 else default
+
+    def __getitem__(self, ngram):
+        return self.get(ngram, 0)
+
+    # number of words of every n-gram
+    def ngram_orders(self):
+        return (self.ids != -1).sum(axis=1)
+
+    # all n-grams of the store as (tuple of words, count)
+    def iter_ngrams(self):
+        for pos in range(len(self.keys)):
+            yield tuple([self.words[i] for i in self.ids[pos] if i != -1]), int(self.counts[pos])
+
+    def save(self, file_name):
+        vocabulary = u'\n'.join(self.words).encode('utf-8')
+        # temporary file + rename: a concurrent reader never sees a half-written store
+        tmp_name = '{}.{}.tmp'.format(file_name, os.getpid())
+        out = open(tmp_name, 'wb')
+        out.write(HEADER.pack(MAGIC, VERSION, self.order, len(self.words), len(self.keys), len(vocabulary)))
+        out.write(vocabulary)
+        out.write(b'\0' * (-(HEADER.size + len(vocabulary)) % 8))
+        out.write(np.ascontiguousarray(self.keys, dtype='<i8').tobytes())
+        out.write(np.ascontiguousarray(self.counts, dtype='<i8').tobytes())
+        out.write(np.ascontiguousarray(self.ids, dtype='<i4').tobytes())
+        out.close()
+        os.rename(tmp_name, file_name)
+
+    @staticmethod
+    def load(file_name):
+        in_file = open(file_name, 'rb')
+        magic, version, order, n_words, n_ngrams, vocabulary_size = HEADER.unpack(in_file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{} is not an n-gram store of version {}'.format(file_name, VERSION))
+        vocabulary = in_file.read(vocabulary_size).decode('utf-8')
+        in_file.close()
+        words = vocabulary.split(u'\n') if n_words > 0 else []
+        offset = HEADER.size + vocabulary_size
+        offset += -offset % 8
+        if n_ngrams == 0:
+            return NgramStore(words, np.zeros(0, dtype='<i8'), np.zeros(0, dtype='<i8'), np.zeros((0, order), dtype='<i4'), order)
+        # plain ndarray views of the mapped file (lookups on np.memmap objects are slower)
+        keys = np.memmap(file_name, dtype='<i8', mode='r', offset=offset, shape=(n_ngrams,)).view(np.ndarray)
+        offset += 8 * n_ngrams
+        counts = np.memmap(file_name, dtype='<i8', mode='r', offset=offset, shape=(n_ngrams,)).view(np.ndarray)
+        offset += 8 * n_ngrams
+        ids = np.memmap(file_name, dtype='<i4', mode='r', offset=offset, shape=(n_ngrams, order)).view(np.ndarray)
+        return NgramStore(words, keys, counts, ids, order)
+
+    # build a store from (tuple of words, count) pairs
+    @staticmethod
+    def from_ngrams(ngrams):
+        counts = []
+        words, id_matrix = encode_ngrams(ngrams, counts)
+        keys = ngram_keys(id_matrix.astype(np.int64))
+        sort_order = np.argsort(keys, kind='mergesort')
+        return NgramStore(words, keys[sort_order], np.array(counts, dtype='<i8')[sort_order], id_matrix[sort_order], id_matrix.shape[1])
+
+    # build a store from an SRILM counts file
+    @staticmethod
+    def from_counts_file(ngram_file):
+        return NgramStore.from_ngrams(read_counts_file(ngram_file))
+
+
+# write a store of order <order> from a stream of (tuple of words, count) pairs without holding the n-grams in memory:
+#   - the n-grams are encoded in chunks of <chunk_size> and appended to unsorted key, count and id files
+#   - the keys are sorted, then the counts and the ids are copied to the store in the order of the keys, chunk by chunk
+# only the vocabulary, the keys and their sort order are kept in memory (16 bytes per n-gram)
+def save_ngrams(ngrams, file_name, order, chunk_size=None):
+    if chunk_size is None:
+        chunk_size = CHUNK_SIZE
+    ngrams = iter(ngrams)
+    tmp_name = '{}.{}.tmp'.format(file_name, os.getpid())
+    unsorted_names = [tmp_name + '.keys', tmp_name + '.counts', tmp_name + '.ids']
+    try:
+        words, word2id = [], {}
+        n_ngrams = 0
+        unsorted_files = [open(name, 'wb') for name in unsorted_names]
+        for chunk in iter(lambda: list(islice(ngrams, chunk_size)), []):
+            id_matrix = np.full((len(chunk), order), -1, dtype='<i4')
+            for row, (ngram, count) in enumerate(chunk):
+                for col, word in enumerate(ngram):
+                    if word not in word2id:
+                        word2id[word] = len(words)
+                        words.append(word)
+                    id_matrix[row, col] = word2id[word]
+            unsorted_files[0].write(ngram_keys(id_matrix.astype(np.int64)).astype('<i8').tobytes())
+            unsorted_files[1].write(np.array([count for ngram, count in chunk], dtype='<i8').tobytes())
+            unsorted_files[2].write(id_matrix.tobytes())
+            n_ngrams += len(chunk)
+        for a_file in unsorted_files:
+            a_file.close()
+
+        vocabulary = u'\n'.join(words).encode('utf-8')
+        out = open(tmp_name, 'wb')
+        out.write(HEADER.pack(MAGIC, VERSION, order, len(words), n_ngrams, len(vocabulary)))
+        out.write(vocabulary)
+        out.write(b'\0' * (-(HEADER.size + len(vocabulary)) % 8))
+        if n_ngrams > 0:
+            keys = np.fromfile(unsorted_names[0], dtype='<i8')
+            sort_order = np.argsort(keys, kind='mergesort')
+            for start in range(0, n_ngrams, chunk_size):
+                out.write(keys[sort_order[start:start + chunk_size]].tobytes())
+            del keys
+            counts = np.memmap(unsorted_names[1], dtype='<i8', mode='r', shape=(n_ngrams,))
+            for start in range(0, n_ngrams, chunk_size):
+                out.write(counts[sort_order[start:start + chunk_size]].tobytes())
+            ids = np.memmap(unsorted_names[2], dtype='<i4', mode='r', shape=(n_ngrams, order))
+            for start in range(0, n_ngrams, chunk_size):
+                out.write(ids[sort_order[start:start + chunk_size]].tobytes())
+            del counts, ids
+        out.close()
+        # temporary file + rename: a concurrent reader never sees a half-written store
+        os.rename(tmp_name, file_name)
+    finally:
+        for name in unsorted_names + [tmp_name]:
+            if os.path.exists(name):
+                os.remove(name)
+
+
+def read_counts_file(ngram_file):
+    for line in codecs.open(ngram_file, encoding='utf-8'):
+        chunks = line[:-1].split('\t')
+        if len(chunks) == 2:
+            yield tuple(chunks[0].split()), int(chunks[1])
+        else:
+            print("Wrong ngram-counts file format at line '", line[:-1], "'")
+
+
+def is_ngram_store(file_name):
+    with open(file_name, 'rb') as a_file:
+        return a_file.read(len(MAGIC)) == MAGIC
+
+
+# directory of the binary versions of text resources and of the corpus counts:
+# <cache_dir> if it's given (from the config), otherwise the user cache directory ($XDG_CACHE_HOME/marmot or ~/.cache/marmot)
+# or, if it can't be created, a directory in the temp directory
+# nothing is written next to the data files, their directories can be read-only
+def resource_cache_dir(cache_dir=None):
+    if cache_dir is not None:
+        return mk_tmp_dir(cache_dir)
+    user_cache = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    for cache_dir in [os.path.join(user_cache, 'marmot'), os.path.join(tempfile.gettempdir(), 'marmot-{}'.format(os.getuid()))]:
+        try:
+            mk_tmp_dir(cache_dir)
+        except OSError:
+            continue
+        if os.access(cache_dir, os.W_OK):
+            return cache_dir
+    raise OSError('No writable cache directory for the binary resources, set cache_dir in the config')
+
+
+# binary version of a text file in the cache directory
+# the name has a hash of the path of the file, so files with the same name in different directories don't clash
+def store_file_name(source_file, extension='.ngram_store', cache_dir=None):
+    source_file = os.path.abspath(source_file)
+    name_hash = hashlib.sha1(source_file.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(resource_cache_dir(cache_dir), os.path.basename(source_file) + '.' + name_hash + extension)
+
+
+_stores = {}
+
+
+# the store for <ngram_file> (an SRILM counts file or a binary store), loaded once per process
+# the binary store of a counts file is created in the cache directory (see resource_cache_dir) on first use
+# and rebuilt if the counts file is newer
+def get_ngram_store(ngram_file, cache_dir=None):
+    path = os.path.abspath(ngram_file)
+    binary_file = path if is_ngram_store(path) else store_file_name(path, cache_dir=cache_dir)
+    if binary_file not in _stores:
+        if binary_file != path and (not os.path.exists(binary_file) or os.path.getmtime(binary_file) < os.path.getmtime(path)):
+            print("Converting the ngram counts {} to the binary store {}".format(path, binary_file))
+            NgramStore.from_counts_file(path).save(binary_file)
+        _stores[binary_file] = NgramStore.load(binary_file)
+        _stores[binary_file].source = path
+        _stores[binary_file].file_name = binary_file
+        _stores[binary_file].cache_dir = cache_dir
+    return _stores[binary_file]
+
+
+# n-gram counts for an LM extractor: read from <ngram_file> or counted from <corpus_file>
+# the counts of a corpus are saved in <tmp_dir> (the cache directory if it's not given)
+# and reused while the corpus doesn't change (see marmot.util.ngram_counter)
+# <srilm> is not used anymore (the counts are the same as the ones of SRILM ngram-count), it's kept for old configs
+# returns None if the counts can't be produced
+def load_ngram_counts(ngram_file=None, corpus_file=None, srilm=None, tmp_dir=None, order=5, cache_dir=None):
+    if ngram_file is None:
+        if corpus_file is None:
+            print("No corpus for LM generation")
+            return None
+        # imported here: ngram_counter builds on this module
+        from marmot.util.ngram_counter import corpus_ngram_store
+        counts_dir = mk_tmp_dir(tmp_dir) if tmp_dir is not None else resource_cache_dir(cache_dir)
+        ngram_file = corpus_ngram_store(corpus_file, counts_dir, order=order)
+    return get_ngram_store(ngram_file, cache_dir=cache_dir)
+
+
+def compute_quartiles(store):
+    '''
+    Frequency quartile of every n-gram of <store> among the n-grams of the same order
+    (1 -- the least frequent quarter, 4 -- the most frequent quarter).
+    The n-grams are ranked by count, n-grams with the same count are ordered by their words,
+    so the quartiles don't depend on the order of the store (the hashes of the n-grams).
+    Returns the quartiles (aligned with the arrays of the store) and the boundary table:
+    boundaries[n - 1] -- the counts of the first n-grams of order n in the quartiles 2, 3 and 4.
+    '''
+    orders = store.ngram_orders()
+    quartiles = np.zeros(len(store), dtype=np.uint8)
+    boundaries = np.zeros((store.order, 3), dtype='<i8')
+    # rank of every word id in the sorted vocabulary, the last element is for the padding id (-1)
+    word_ranks = np.full(len(store.words) + 1, -1, dtype=np.int64)
+    word_ranks[np.array(sorted(range(len(store.words)), key=store.words.__getitem__), dtype=np.int64)] = np.arange(len(store.words))
+    for order in range(1, store.order + 1):
+        positions = np.nonzero(orders == order)[0]
+        ranks = word_ranks[store.ids[positions]]
+        # np.lexsort sorts by the last key first: the count, then the first word, the second word, ...
+        ranked = positions[np.lexsort([ranks[:, col] for col in reversed(range(store.order))] + [store.counts[positions]])]
+        n_ngrams = len(ranked)
+        starts = [0, n_ngrams // 4, n_ngrams // 2, n_ngrams * 3 // 4, n_ngrams]
+        for quartile in range(4):
+            quartiles[ranked[starts[quartile]:starts[quartile + 1]]] = quartile + 1
+        for i in range(3):
+            if starts[i + 1] < n_ngrams:
+                boundaries[order - 1, i] = store.counts[ranked[starts[i + 1]]]
+    return quartiles, boundaries
+
+
+def save_quartiles(quartiles, boundaries, file_name):
+    tmp_name = '{}.{}.tmp'.format(file_name, os.getpid())
+    out = open(tmp_name, 'wb')
+    out.write(QUARTILES_HEADER.pack(QUARTILES_MAGIC, QUARTILES_VERSION, boundaries.shape[0], len(quartiles)))
+    out.write(np.ascontiguousarray(boundaries, dtype='<i8').tobytes())
+    out.write(np.ascontiguousarray(quartiles, dtype=np.uint8).tobytes())
+    out.close()
+    os.rename(tmp_name, file_name)
+
+
+# a quartile file of the current version (the files of older versions are recomputed)
+def is_current_quartiles(file_name):
+    with open(file_name, 'rb') as a_file:
+        header = a_file.read(QUARTILES_HEADER.size)
+    return len(header) == QUARTILES_HEADER.size and QUARTILES_HEADER.unpack(header)[:2] == (QUARTILES_MAGIC, QUARTILES_VERSION)
+
+
+def load_quartiles(file_name):
+    in_file = open(file_name, 'rb')
+    magic, version, order, n_ngrams = QUARTILES_HEADER.unpack(in_file.read(QUARTILES_HEADER.size))
+    boundaries = np.frombuffer(in_file.read(8 * order * 3), dtype='<i8').reshape((order, 3))
+    in_file.close()
+    if magic != QUARTILES_MAGIC or version != QUARTILES_VERSION:
+        raise ValueError('{} is not a quartile file of version {}'.format(file_name, QUARTILES_VERSION))
+    if n_ngrams == 0:
+        return np.zeros(0, dtype=np.uint8), boundaries
+    quartiles = np.memmap(file_name, dtype=np.uint8, mode='r', offset=QUARTILES_HEADER.size + 8 * order * 3, shape=(n_ngrams,)).view(np.ndarray)
+    return quartiles, boundaries
+
+
+_quartiles = {}
+
+
+# the store of <ngram_file> with the frequency quartiles of its n-grams (see compute_quartiles)
+# the quartiles are saved in the cache directory (<store file>.<hash>.quartiles) and loaded once per process
+def get_ngram_quartiles(ngram_file, cache_dir=None):
+    store = get_ngram_store(ngram_file, cache_dir=cache_dir)
+    if store.file_name not in _quartiles:
+        quartiles_file = store_file_name(store.file_name, '.quartiles', cache_dir)
+        if not os.path.exists(quartiles_file) or os.path.getmtime(quartiles_file) < os.path.getmtime(store.file_name) or \
+                not is_current_quartiles(quartiles_file):
+            save_quartiles(*compute_quartiles(store), file_name=quartiles_file)
+        _quartiles[store.file_name] = load_quartiles(quartiles_file)
+    quartiles, boundaries = _quartiles[store.file_name]
+    return store, quartiles, boundaries
@@ -4,22 +4,27 @@
 # if it's an list of lists, write to crf++ format, with a separate file containing the feature names
 # if it's a dict, write to .json or pickle the object(?), write the feature names to a separate file
 import os
-import sys
 import errno
 import pandas as pd
 import numpy as np
+from scipy import sparse
 import logging
+from argparse import ArgumentParser
 
 from marmot.experiment.import_utils import list_of_lists
+from marmot.util.feature_blocks import FeatureBlocks
 from marmot.util.generate_crf_template import generate_crf_template
+from marmot.util.feature_file import FeatureFile, write_feature_file
+from marmot.util.feature_writer import write_features, output_file_name, open_output
 
 logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
 logger = logging.getLogger('experiment_logger')
 
 
 # write list of lists to file in CRF++ format (one item per line, empty line between sequences)
-def write_lofl(lofl, filename):
-    a_file = open(filename, 'w')
+# <mode> -- 'a' appends the sequences to the file (streaming mode)
+def write_lofl(lofl, filename, mode='w'):
+    a_file = open(filename, mode)
     for seq in lofl:
         for it in seq:
             a_file.write('%s\n' % str(it))
@@ -37,13 +42,44 @@ def val_to_str(f_val):
         return str(f_val)
 
 
+# write a sparse matrix (binarized features of the 'plain' datatype) in the svm_light format
+# only the non-zero values are written, the feature numbers start from 1
+def write_svm_light_sparse(features, tags, output):
+    features = sparse.csr_matrix(features)
+    tags_map = {'OK': '+1', 'BAD': '-1'}
+    for row, a_tag in enumerate(tags):
+        start, end = features.indptr[row], features.indptr[row + 1]
+        feat_list = ['%d:%s' % (col + 1, val) for col, val in zip(features.indices[start:end], features.data[start:end])]
+        output.write("%s %s\n" % (tags_map[a_tag], ' '.join(feat_list)))
+
+
+# binarized features of the 'sequential' datatype: a sparse matrix per sequence
+def is_sparse_sequences(features):
+    return isinstance(features, list) and len(features) > 0 and all([sparse.issparse(seq) for seq in features])
+
+
+# features as FeatureBlocks: one for all objects ('plain') or one per sequence ('sequential'), see run_experiment_pre_extracted
+def is_blocks(features):
+    return isinstance(features, FeatureBlocks) or \
+        (isinstance(features, list) and len(features) > 0 and all([isinstance(seq, FeatureBlocks) for seq in features]))
+
+
+# number of features in a row of a sequence (a list of rows, FeatureBlocks, a numpy array or a sparse matrix)
+def row_length(sequence):
+    if sparse.issparse(sequence) or isinstance(sequence, np.ndarray):
+        return sequence.shape[1]
+    if isinstance(sequence, FeatureBlocks):
+        return sequence.n_columns()
+    return len(sequence[0])
+
+
 # <word_tags> -- list of sequences of word-level tags
 #    if specified - should be saved to a separate file in CRF++ format
 # <phrase_lengths> -- list of phrase lengths
 #    needed to be able to restore word-level tags from phrase-level
 #    if specified - should be saved to a separate file in CRF++ format
 #    TODO: check if matches the number of phrases
-def persist_features(dataset_name, features, persist_dir, tags=None, feature_names=None, phrase_lengths=None, file_format='crf_suite'):
+def persist_features(dataset_name, features, persist_dir, tags=None, feature_names=None, phrase_lengths=None, file_format='crf_suite', append=False, encoder=None, workers=1, compression=None):
     '''
     persist the features to persist_dir -- use dataset_name as the prefix for the persisted files
     :param dataset_name: prefix of the output file
@@ -51,9 +87,16 @@ def persist_features(dataset_name, features, persist_dir, tags=None, feature_nam
     :param persist_dir: directory of output file(s)
     :param tags: tags for the dataset
     :param feature_names: names of features in the dataset
-    :param file_format: format of the output file for sequences. Values -- 'crf++', 'crf_suite', 'svm_light'
+    :param file_format: format of the output file for sequences. Values -- 'crf++', 'crf_suite', 'svm_light', 'binary'
+                        ('binary' -- a binary feature file, the other formats can be exported from it, see export_features)
+    :param append: add the features to the end of an existing output file (the feature names and the template are not rewritten)
+    :param encoder: encoder of the categorical features (e.g. a HashingEncoder) -- the features of the 'plain' datatype
+                    are encoded before they are written in the svm_light format
+    :param workers: number of processes which format the text formats (see marmot.util.feature_writer)
+    :param compression: compression of the text formats -- None, 'gzip' or 'zstd'
     :return:
     '''
+    mode = 'a' if append else 'w'
     try:
         os.makedirs(persist_dir)
     except OSError as exc:  # Python >2.5
@@ -62,111 +105,177 @@ def persist_features(dataset_name, features, persist_dir, tags=None, feature_nam
         else:
             raise
 
+    if file_format == 'binary':
+        if append:
+            raise ValueError("Features can't be appended to a binary feature file, persist the whole dataset at once")
+        output_path = os.path.join(persist_dir, dataset_name + '.mfeat')
+        write_feature_file(output_path, features, tags=tags, feature_names=feature_names)
+        logger.info('saved features in: {} to file: {}'.format(dataset_name, output_path))
+        return output_path
     if file_format == 'crf_suite' and feature_names is None:
         print("Feature names are required to save features in CRFSuite and SVMLight formats")
         return
+    if encoder is not None and file_format == 'svm_light' and not sparse.issparse(features):
+        features = encoder.transform(features)
+    # svm_light has one object per line: the sparse matrices of the sequences are stacked, the tags are flattened
+    if is_sparse_sequences(features) and file_format == 'svm_light':
+        features = sparse.vstack(features, format='csr')
+        tags = [t for seq in tags for t in seq] if tags is not None else None
+    # binarized features of the 'plain' datatype as a sparse matrix
+    if sparse.issparse(features):
+        if file_format != 'svm_light':
+            # densified: the csv output has a value for every column
+            features = features.toarray()
+        else:
+            output_path = output_file_name(os.path.join(persist_dir, dataset_name + '.svm'), compression)
+            output = open_output(output_path, mode=mode, compression=compression)
+            write_svm_light_sparse(features, tags, output)
+            output.close()
+            return output_path
     # for the 'plain' datatype
     if type(features) == np.ndarray and features.shape[1] == len(feature_names):
         output_df = pd.DataFrame(data=features, columns=feature_names)
         output_path = os.path.join(persist_dir, dataset_name + '.csv')
-        output_df.to_csv(output_path, index=False)
+        output_df.to_csv(output_path, index=False, mode=mode, header=not append)
         logger.info('saved features in: {} to file: {}'.format(dataset_name, output_path))
 
-    # for the 'sequential' datatype
-    elif list_of_lists(features):
-        if file_format == 'svm_light':
-            feature_names = range(1, len(features[0]) + 1)
-            output_path = os.path.join(persist_dir, dataset_name + '.svm')
-            output = open(output_path, 'w')
-            tags_map = {'OK': '+1', 'BAD': '-1'}
-            for a_tag, feat_seq in zip(tags, features):
-                feat_list = []
-                for f_name, f_val in zip(feature_names, feat_seq):
-                    try:
-                        if float(f_val) != 0.0:
-                            feat_list.append(str(f_name) + ':' + val_to_str(f_val))
-                    except ValueError:
-                        feat_list.append(str(f_name) + ':' + val_to_str(f_val))
-                output.write("%s %s\n" % (tags_map[a_tag], ' '.join(feat_list)))
-            return
-        output_path = os.path.join(persist_dir, dataset_name + '.crf')
-        output = open(output_path, 'w')
-        if tags is not None:
-            assert(len(features) == len(tags)), "Different numbers of tag and feature sequences"
-            for s_idx, (seq, tag_seq) in enumerate(zip(features, tags)):
-                assert(len(seq) == len(tag_seq)), "Lengths of tag and feature sequences don't match in sequence {}: {} and {} ({} and {})".format(s_idx, len(seq), len(tag_seq), seq, tag_seq)
-                for w_idx, (feature_list, tag) in enumerate(zip(seq, tag_seq)):
-                    if len(feature_list) != len(feature_names):
-                        print(feature_list)
-                        print(feature_names)
-                        sys.exit()
-                    tag = str(tag)
-                    feature_str = []
-                    for f in feature_list:
-                        if type(f) == unicode:
-                            feature_str.append(f.encode('utf-8'))
-#                        else:
-#                            feature_str.append(str(f))
-                        else:
-                            feature_str.append(f)
-                    if file_format == 'crf++':
-                        feature_str = '\t'.join([str(f) for f in feature_str])
-                        output.write('%s\t%s\n' % (feature_str, tag))
-                    elif file_format == 'crf_suite':
-                        feature_str_all = []
-                        for i in range(len(feature_str)):
-#                            if isinstance(feature_str[i], (int, float, np.float32, np.float64, np.int32, np.int64)):
-#                                feature_str_all.append(feature_names[i] + '=1:' + str(feature_str[i]))
-#                            else:
-                            feature_str_all.append(feature_names[i] + '=' + str(feature_str[i]))
-#                        feature_str = [feature_names[i] + '=' + feature_str[i] for i in range(len(feature_str))]
-                        feature_str = '\t'.join(feature_str_all)
-                        output.write("%s\t%s\n" % (tag, feature_str))
-                    else:
-                        print("Unknown data format:", file_format)
-                        return False
-                output.write("\n")
+    # for the 'sequential' datatype (and the 'plain' one in the svm_light format)
+    elif list_of_lists(features) or is_sparse_sequences(features) or is_blocks(features):
+        output_path = persist_datasets([{'name': dataset_name, 'features': features, 'tags': tags, 'phrase_lengths': phrase_lengths}], persist_dir,
+                                       feature_names=feature_names, file_format=file_format, append=append, workers=workers, compression=compression)[0]
+    return output_path
+
+
+# features which are written by the text writers (lists of rows or of sequences of rows, FeatureBlocks, sparse sequences for crf++ and crf_suite)
+# a numpy array with a column per feature name is written to csv, sparse matrices -- by write_svm_light_sparse
+def is_text_data(features, feature_names, file_format):
+    if sparse.issparse(features):
+        return False
+    if is_sparse_sequences(features):
+        return file_format != 'svm_light'
+    if type(features) == np.ndarray and feature_names is not None and features.shape[1] == len(feature_names):
+        return False
+    return list_of_lists(features) or is_blocks(features)
+
+
+# persist several datasets at a time: the text formats of all datasets are formatted by the same pool
+# of <workers> processes and written concurrently (see marmot.util.feature_writer)
+# <datasets> -- list of dicts with the keys 'name', 'features', 'tags' (and optionally 'phrase_lengths')
+# the other representations of the features are persisted one by one with persist_features
+# returns the names of the output files
+def persist_datasets(datasets, persist_dir, feature_names=None, file_format='crf_suite', append=False, workers=1, compression=None):
+    text_format = file_format in ('crf++', 'crf_suite', 'svm_light')
+    if not text_format or not all([is_text_data(d['features'], feature_names, file_format) for d in datasets]):
+        if not text_format and file_format != 'binary':
+            print("Unknown data format:", file_format)
+            return [False for d in datasets]
+        return [persist_features(d['name'], d['features'], persist_dir, tags=d['tags'], feature_names=feature_names,
+                                 phrase_lengths=d['phrase_lengths'] if 'phrase_lengths' in d else None, file_format=file_format, append=append)
+                for d in datasets]
+    if file_format == 'crf_suite' and feature_names is None:
+        print("Feature names are required to save features in CRFSuite and SVMLight formats")
+        return [None for d in datasets]
+    try:
+        os.makedirs(persist_dir)
+    except OSError as exc:  # Python >2.5
+        if exc.errno == errno.EEXIST and os.path.isdir(persist_dir):
+            pass
         else:
-            for s_idx, seq in enumerate(features):
-                for w_idx, feature_list in enumerate(seq):
-                    #assert(len(seq) == len(feature_names)), "Wrong number of features in sequence %d, word %d" % (s_idx, w_idx)
-                    feature_str = []
-                    for f in feature_list:
-                        if type(f) == unicode:
-                            feature_str.append(f.encode('utf-8'))
-#                        else:
-#                            feature_str.append(str(f))
-                        else:
-                            feature_str.append(f)
-                    if file_format == 'crf++':
-                        feature_str = '\t'.join([str(f) for f in feature_str])
-                    elif file_format == 'crf_suite':
-#                        feature_str = [feature_names[i] + '=' + feature_str[i] for i in range(len(feature_str))]
-                        feature_str_all = []
-                        for i in range(len(feature_str)):
-#                            if isinstance(feature_str[i], (int, float, np.float32, np.float64, np.int32, np.int64)):
-#                                feature_str_all.append(feature_names[i] + '=1:' + str(feature_str[i]))
-#                            else:
-                            feature_str_all.append(feature_names[i] + '=' + str(feature_str[i]))
-                        feature_str = '\t'.join(feature_str_all)
-                    else:
-                        print("Unknown data format:", file_format)
-                        return False
-                    output.write("%s\n" % feature_str)
-                output.write("\n")
-        if feature_names is not None:
-            output_features = open(os.path.join(persist_dir, dataset_name + '.features'), 'w')
-            for f_name in feature_names:
-                output_features.write("%s\n" % f_name.encode('utf-8'))
-            output_features.close()
-        output.close()
-
-        # write phrase lengths
-        if phrase_lengths is not None:
-            write_lofl(phrase_lengths, os.path.join(persist_dir, dataset_name + '.phrase-lengths'))
+            raise
+
+    outputs = []
+    for d in datasets:
+        features, tags = d['features'], d['tags']
+        if file_format != 'svm_light':
+            if tags is not None:
+                assert(len(features) == len(tags)), "Different numbers of tag and feature sequences"
+                for s_idx, (seq, tag_seq) in enumerate(zip(features, tags)):
+                    seq_length = seq.shape[0] if sparse.issparse(seq) else len(seq)
+                    assert(seq_length == len(tag_seq)), "Lengths of tag and feature sequences don't match in sequence {}: {} and {} ({} and {})".format(s_idx, seq_length, len(tag_seq), seq, tag_seq)
+            # the binarized (sparse) sequences have a column per one-hot value, not per feature name
+            if feature_names is not None and not is_sparse_sequences(features):
+                for seq in features:
+                    # all rows of FeatureBlocks have the same columns, they aren't converted to lists here
+                    if isinstance(seq, FeatureBlocks):
+                        if seq.n_columns() != len(feature_names):
+                            raise ValueError('Wrong number of features: {} for the feature names {}'.format(seq.n_columns(), feature_names))
+                        continue
+                    for feature_list in seq:
+                        if len(feature_list) != len(feature_names):
+                            raise ValueError('Wrong number of features: {} for the feature names {}'.format(feature_list, feature_names))
+        extension = '.svm' if file_format == 'svm_light' else '.crf'
+        outputs.append((output_file_name(os.path.join(persist_dir, d['name'] + extension), compression), features, tags))
+    write_features(outputs, feature_names if file_format == 'crf_suite' else None, file_format, workers=workers, compression=compression, mode='a' if append else 'w')
 
+    if file_format != 'svm_light' and not append:
+        for d in datasets:
+            if feature_names is not None:
+                output_features = open(os.path.join(persist_dir, d['name'] + '.features'), 'w')
+                for f_name in feature_names:
+                    output_features.write("%s\n" % f_name.encode('utf-8'))
+                output_features.close()
         # generate CRF++ template
         if file_format == 'crf++':
-            feature_num = len(features[0][0])
+            feature_num = row_length(datasets[0]['features'][0])
             generate_crf_template(feature_num, tmp_dir=persist_dir)
+    # phrase lengths, appended in streaming mode like the features
+    for d in datasets:
+        if file_format != 'svm_light' and 'phrase_lengths' in d and d['phrase_lengths'] is not None:
+            write_lofl(d['phrase_lengths'], os.path.join(persist_dir, d['name'] + '.phrase-lengths'), mode='a' if append else 'w')
+    for output_path, features, tags in outputs:
+        logger.info('saved features to file: {}'.format(output_path))
+    return [output_path for output_path, features, tags in outputs]
+
+
+# persist a dataset which is produced chunk by chunk (see preprocessing_utils.stream_features)
+# <feature_chunks> -- iterable of pairs (feature sequences, tag sequences) or of triples
+#                     (feature sequences, tag sequences, phrase lengths) for the phrase-level data
+# the first chunk creates the output files, the others are appended to them (the phrase lengths too)
+# <encoder> -- encoder of the categorical features for the svm_light format (see persist_features)
+# <workers>, <compression> -- see persist_features
+def persist_features_stream(dataset_name, feature_chunks, persist_dir, feature_names=None, file_format='crf_suite', encoder=None, workers=1, compression=None):
+    output_path = None
+    n_sentences = 0
+    for chunk in feature_chunks:
+        features, tags = chunk[0], chunk[1]
+        phrase_lengths = chunk[2] if len(chunk) > 2 else None
+        if len(features) == 0:
+            continue
+        # svm_light is a format for plain data -- one object per line
+        if file_format == 'svm_light':
+            if phrase_lengths is not None:
+                raise ValueError("The phrase lengths can't be saved in the svm_light format, the phrase tags couldn't be mapped back to the words")
+            features = [f for seq in features for f in seq]
+            tags = [t for seq in tags for t in seq]
+        output_path = persist_features(dataset_name, features, persist_dir, tags=tags, feature_names=feature_names, phrase_lengths=phrase_lengths, file_format=file_format,
+                                       append=output_path is not None, encoder=encoder, workers=workers, compression=compression)
+        n_sentences += len(features)
+        logger.info('{}: {} objects persisted'.format(dataset_name, n_sentences))
     return output_path
+
+
+# export a binary feature file (see marmot.util.feature_file) to a text format: 'crf++', 'crf_suite' or 'svm_light'
+# svm_light files get one object per line, the other formats -- one sentence per block
+# <dataset_name> -- prefix of the output files, the name of the binary file by default
+def export_features(feature_file, persist_dir, dataset_name=None, file_format='crf_suite'):
+    features = FeatureFile(feature_file)
+    if dataset_name is None:
+        dataset_name = os.path.splitext(os.path.basename(feature_file))[0]
+    feature_names = features.feature_names if len(features.feature_names) > 0 else None
+    if file_format == 'svm_light':
+        if features.is_sparse():
+            rows = features.matrix()
+        else:
+            rows = [row for sentence in features.sentences() for row in sentence]
+        return persist_features(dataset_name, rows, persist_dir, tags=features.tags(), feature_names=feature_names, file_format=file_format)
+    return persist_features(dataset_name, features.sentences(), persist_dir, tags=features.sentence_tags(), feature_names=feature_names, file_format=file_format)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("feature_file", action="store", help="binary feature file (<dataset>.mfeat)")
+    parser.add_argument("file_format", action="store", help="crf++ | crf_suite | svm_light")
+    parser.add_argument("persist_dir", action="store", help="directory of the exported files")
+    parser.add_argument("--name", action="store", default=None, help="prefix of the exported files")
+    args = parser.parse_args()
+    print(export_features(args.feature_file, args.persist_dir, dataset_name=args.name, file_format=args.file_format))
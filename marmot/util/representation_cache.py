@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+#encoding: utf-8
+
+# on-disk cache of the outputs of representation generators (POS tags, alignments, segmentation, parses)
+# the generators call external tools (TreeTagger, fast_align, Moses, Stanford/ParZu) which give the same output for the same input,
+# so the fields added by a generator are stored and reused in the next runs:
+#   - the key of an entry is a hash of the generator spec (class, constructor arguments, code version, see feature_cache.extractor_spec)
+#     and of the content of all fields of the data object (the files of the '*_file' fields are hashed by their content)
+#   - an entry is one binary file <cache_dir>/<key>.mrep with the fields which were added or replaced by the generator
+#     and the names of the fields which were deleted
+#
+# format of an entry (no pickled objects):
+#   - a JSON header: the generator spec, the fields with their kinds, the deleted fields and the list of the tables which follow the header
+#   - a field which is a list of sentences has the offsets of the sentences (int64) and one column with the values of all tokens:
+#       'strings' -- int32 codes + the distinct strings,
+#       'ints' -- int64 values + a uint8 mask of the None values (e.g. alignments),
+#       'int_lists' -- lists or tuples of ints (e.g. segments): int64 offsets + int64 values,
+#       'values' -- any other literals (e.g. dependencies) as their repr
+
+from __future__ import print_function
+
+import os
+import json
+import errno
+import struct
+import hashlib
+import logging
+
+import numpy as np
+
+from marmot.util.encoder_store import encode_strings, decode_strings
+from marmot.util.feature_cache import extractor_spec
+from marmot.util.feature_file import encode_column
+
+logger = logging.getLogger('experiment_logger')
+
+MAGIC = b'MARMOTRC'
+VERSION = 2
+# magic, version, size of the JSON header in bytes
+HEADER = struct.Struct('<8siq')
+HASH_BUFFER_SIZE = 1 << 20
+INT_TYPES = (int, long, np.integer)
+TABLE_TYPES = {'int32': '<i4', 'int64': '<i8', 'uint8': np.uint8}
+
+
+def is_int(value):
+    return isinstance(value, INT_TYPES) and not isinstance(value, bool)
+
+
+# values which are restored exactly from their repr (see encoder_store.decode_value)
+def is_literal(value):
+    if value is None or isinstance(value, (bool, int, long, float, str, unicode)):
+        return True
+    if isinstance(value, (list, tuple)):
+        return all([is_literal(v) for v in value])
+    if isinstance(value, dict):
+        return all([is_literal(k) and is_literal(v) for k, v in value.items()])
+    return False
+
+
+# kind of a column of token values, None if the values can't be stored
+def column_kind(values):
+    if all([isinstance(v, (str, unicode)) for v in values]):
+        return 'strings'
+    if all([v is None or is_int(v) for v in values]):
+        return 'ints'
+    if all([isinstance(v, list) and all([is_int(x) for x in v]) for v in values]) or \
+            all([isinstance(v, tuple) and all([is_int(x) for x in v]) for v in values]):
+        return 'int_lists'
+    if all([is_literal(v) for v in values]):
+        return 'values'
+    return None
+
+
+# tables of a column: (table name, table kind, number of values, data)
+def encode_values(name, kind, values):
+    if kind == 'strings':
+        strings, codes = encode_column(values)
+        return [(name + u'.codes', 'int32', len(codes), codes.astype('<i4').tobytes()),
+                (name + u'.values', 'strings', len(strings), encode_strings(strings))]
+    if kind == 'ints':
+        nulls = np.array([v is None for v in values], dtype=np.uint8)
+        ints = np.array([0 if v is None else v for v in values], dtype='<i8')
+        return [(name + u'.values', 'int64', len(ints), ints.tobytes()), (name + u'.nulls', 'uint8', len(nulls), nulls.tobytes())]
+    if kind == 'int_lists':
+        offsets = np.concatenate([[0], np.cumsum([len(v) for v in values])]).astype('<i8')
+        ints = np.array([x for v in values for x in v], dtype='<i8')
+        return [(name + u'.value_offsets', 'int64', len(offsets), offsets.tobytes()), (name + u'.values', 'int64', len(ints), ints.tobytes())]
+    return [(name + u'.values', 'strings', len(values), encode_strings(values))]
+
+
+def decode_values(name, kind, tables, is_tuple):
+    if kind == 'strings':
+        return np.array(tables[name + u'.values'], dtype=object)[tables[name + u'.codes']].tolist()
+    if kind == 'ints':
+        values = tables[name + u'.values'].tolist()
+        for idx in np.flatnonzero(tables[name + u'.nulls']):
+            values[idx] = None
+        return values
+    if kind == 'int_lists':
+        ints, offsets = tables[name + u'.values'].tolist(), tables[name + u'.value_offsets'].tolist()
+        container = tuple if is_tuple else list
+        return [container(ints[start:end]) for start, end in zip(offsets[:-1], offsets[1:])]
+    return tables[name + u'.values']
+
+
+# [name, layout, kind, is_tuple] and the tables of a field, None if the field can't be stored
+# layout: 'sentences' -- a list of lists of token values, 'list' -- a list of values, 'value' -- any other literal
+def encode_field(name, value):
+    layout = 'value'
+    if isinstance(value, list) and all([isinstance(s, list) for s in value]):
+        layout = 'sentences'
+        values = [v for sentence in value for v in sentence]
+    elif isinstance(value, list):
+        layout = 'list'
+        values = value
+    else:
+        values = [value]
+    kind = column_kind(values)
+    if kind is None:
+        return None
+    tables = encode_values(name, kind, values)
+    if layout == 'sentences':
+        offsets = np.concatenate([[0], np.cumsum([len(s) for s in value])]).astype('<i8')
+        tables.append((name + u'.offsets', 'int64', len(offsets), offsets.tobytes()))
+    is_tuple = kind == 'int_lists' and len(values) > 0 and isinstance(values[0], tuple)
+    return [name, layout, kind, is_tuple], tables
+
+
+def decode_field(entry, tables):
+    name, layout, kind, is_tuple = entry
+    values = decode_values(name, kind, tables, is_tuple)
+    if layout == 'sentences':
+        offsets = tables[name + u'.offsets'].tolist()
+        return [values[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+    elif layout == 'list':
+        return values
+    return values[0]
+
+
+def write_entry(file_name, spec, fields, deleted):
+    meta = {'spec': spec, 'fields': [], 'deleted': deleted}
+    tables = []
+    for name in sorted(fields):
+        encoded = encode_field(name, fields[name])
+        if encoded is None:
+            logger.info('Representation cache: field {} has values which can\'t be stored, the output of {} is not cached'.format(name, spec))
+            return False
+        meta['fields'].append(encoded[0])
+        tables.extend(encoded[1])
+    meta['tables'] = [[name, kind, count, len(data)] for name, kind, count, data in tables]
+
+    header = json.dumps(meta).encode('utf-8')
+    # temporary file + rename: a concurrent reader never sees a half-written file
+    tmp_name = '{}.{}.tmp'.format(file_name, os.getpid())
+    out = open(tmp_name, 'wb')
+    out.write(HEADER.pack(MAGIC, VERSION, len(header)))
+    out.write(header)
+    for name, kind, count, data in tables:
+        out.write(data)
+    out.close()
+    os.rename(tmp_name, file_name)
+    return True
+
+
+# returns the stored fields and the names of the deleted fields
+def read_entry(file_name):
+    data = open(file_name, 'rb').read()
+    magic, version, header_size = HEADER.unpack(data[:HEADER.size])
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('{} is not a representation cache file of version {}'.format(file_name, VERSION))
+    meta = json.loads(data[HEADER.size:HEADER.size + header_size].decode('utf-8'))
+    position = HEADER.size + header_size
+    tables = {}
+    for name, kind, count, size in meta['tables']:
+        chunk = data[position:position + size]
+        position += size
+        if kind == 'strings':
+            tables[name] = decode_strings(chunk, count)
+        elif size == 0:
+            tables[name] = np.zeros(0, dtype=TABLE_TYPES[kind])
+        else:
+            tables[name] = np.frombuffer(chunk, dtype=TABLE_TYPES[kind])
+    fields = {entry[0]: decode_field(entry, tables) for entry in meta['fields']}
+    return fields, meta['deleted']
+
+
+# hash of the content of a field: files are hashed by their content, lists -- sentence by sentence
+def field_hash(value):
+    digest = hashlib.sha1()
+    if isinstance(value, (str, unicode)) and os.path.isfile(value):
+        a_file = open(value, 'rb')
+        chunk = a_file.read(HASH_BUFFER_SIZE)
+        while len(chunk) > 0:
+            digest.update(chunk)
+            chunk = a_file.read(HASH_BUFFER_SIZE)
+        a_file.close()
+    elif isinstance(value, list):
+        for element in value:
+            digest.update(repr(element))
+            digest.update(b'\n')
+    else:
+        digest.update(repr(value))
+    return digest.hexdigest()
+
+
+class RepresentationCache(object):
+    '''
+    Outputs of representation generators stored in <cache_dir>, see generate.
+    The hashes of the fields are computed once per field object, so a data object passed through several generators
+    is hashed once (the generators add new fields and don't change the existing ones in place).
+    '''
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        try:
+            os.makedirs(cache_dir)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST or not os.path.isdir(cache_dir):
+                raise
+        # {id(value): (value, hash)}, the value is kept with its hash, so its id can't be reused by another object
+        self.hashes = {}
+        self.hits = 0
+        self.misses = 0
+
+    def data_hash(self, data_obj):
+        hashes = []
+        for key in sorted(data_obj):
+            value = data_obj[key]
+            if id(value) not in self.hashes:
+                self.hashes[id(value)] = (value, field_hash(value))
+            hashes.append((key, self.hashes[id(value)][1]))
+        return hashes
+
+    def key(self, generator, data_obj):
+        # entries of another version of the format get other keys
+        return hashlib.sha1(repr([VERSION, extractor_spec(generator), self.data_hash(data_obj)]).encode('utf-8')).hexdigest()
+
+    def file_name(self, key):
+        return os.path.join(self.cache_dir, key + '.mrep')
+
+    # generator.generate(data_obj) or the stored output of a previous call with the same generator and the same data
+    def generate(self, generator, data_obj):
+        spec = extractor_spec(generator)
+        file_name = self.file_name(self.key(generator, data_obj))
+        if os.path.isfile(file_name):
+            fields, deleted = read_entry(file_name)
+            data_obj.update(fields)
+            for name in deleted:
+                data_obj.pop(name, None)
+            self.hits += 1
+            logger.info('Representation cache: fields {} of {} loaded from {}'.format(', '.join(sorted(fields)), spec, file_name))
+            return data_obj
+
+        self.misses += 1
+        before = dict(data_obj)
+        data_obj = generator.generate(data_obj)
+        fields = {name: value for name, value in data_obj.items() if name not in before or value is not before[name]}
+        deleted = sorted([name for name in before if name not in data_obj])
+        if write_entry(file_name, spec, fields, deleted):
+            logger.info('Representation cache: fields {} of {} saved to {}'.format(', '.join(sorted(fields)), spec, file_name))
+        return data_obj
+
+
+# <cache> -- RepresentationCache or None (the generator is always called)
+def generate_representation(generator, data_obj, cache=None):
+    if cache is None:
+        return generator.generate(data_obj)
+    return cache.generate(generator, data_obj)
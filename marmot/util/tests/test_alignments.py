@@ -0,0 +1,131 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os
+import sys
+import stat
+import shutil
+import tempfile
+import threading
+import unittest
+
+from marmot.util.alignments import align_sentence, align_sentences, align_files
+from marmot.util.force_align import AlignerPool
+
+# stand-ins for the cdec tools, they answer line by line like the real ones
+# fast_align: the target word j is aligned to the source word min(j, <source length> - 1)
+FAST_ALIGN = '''
+import sys
+for line in iter(sys.stdin.readline, ''):
+    src, tg = line.rstrip('\\n').split(' ||| ')
+    n_src = len(src.split())
+    links = ' '.join(['%d-%d' % (min(j, n_src - 1), j) for j in range(len(tg.split()))])
+    sys.stdout.write('%s ||| %s ||| %s ||| -1.0\\n' % (src, tg, links))
+    sys.stdout.flush()
+'''
+# fast_align which crashes on the 11th line
+CRASHING_FAST_ALIGN = '''
+import sys
+for idx, line in enumerate(iter(sys.stdin.readline, '')):
+    if idx == 10:
+        sys.stderr.write('fast_align: crashed\\n')
+        sys.exit(1)
+    sys.stdout.write('a ||| b ||| 0-0 ||| -1.0\\n')
+    sys.stdout.flush()
+'''
+# fast_align which prints a malformed 11th line
+MALFORMED_FAST_ALIGN = '''
+import sys
+for idx, line in enumerate(iter(sys.stdin.readline, '')):
+    sys.stdout.write('garbage\\n' if idx == 10 else 'a ||| b ||| 0-0 ||| -1.0\\n')
+    sys.stdout.flush()
+'''
+# atools: the links of the forward direction
+ATOOLS = '''
+import sys
+for fwd in iter(sys.stdin.readline, ''):
+    sys.stdin.readline()
+    sys.stdout.write(fwd)
+    sys.stdout.flush()
+'''
+
+
+class AlignmentsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.write_tools(FAST_ALIGN)
+        self.cdec_home = os.environ.get('CDEC_HOME')
+        os.environ['CDEC_HOME'] = os.path.join(self.tmp_dir, 'cdec')
+        self.model = os.path.join(self.tmp_dir, 'align_model')
+        for suffix in ['.fwd_err', '.rev_err']:
+            with open(self.model + suffix, 'w') as a_file:
+                a_file.write('expected target length = source length * 1.0\nfinal tension: 4.0\n')
+        self.src = [[u'le', u'garçon'], [u'il'], [u'a', u'b', u'c']] * 20
+        self.tg = [[u'the', u'boy', u'runs'], [u'he', u'is'], [u'a']] * 20
+
+    def write_tools(self, fast_align):
+        for name, code in [('word-aligner/fast_align', fast_align), ('utils/atools', ATOOLS)]:
+            file_name = os.path.join(self.tmp_dir, 'cdec', name)
+            if not os.path.isdir(os.path.dirname(file_name)):
+                os.makedirs(os.path.dirname(file_name))
+            with open(file_name, 'w') as a_file:
+                a_file.write('#!{}\n{}'.format(sys.executable, code))
+            os.chmod(file_name, os.stat(file_name).st_mode | stat.S_IEXEC)
+
+    def tearDown(self):
+        if self.cdec_home is None:
+            del os.environ['CDEC_HOME']
+        else:
+            os.environ['CDEC_HOME'] = self.cdec_home
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_pool(self):
+        pool = AlignerPool(self.model + '.fwd_params', self.model + '.fwd_err', self.model + '.rev_params', self.model + '.rev_err', size=3, batch_size=7)
+        lines = [u' '.join(s) + u' ||| ' + u' '.join(t) for s, t in zip(self.src, self.tg)]
+        # the parts aligned by different aligners are returned in the order of the lines
+        self.assertEqual(pool.align(lines)[:3], ['0-0 1-1 1-2', '0-0 0-1', '0-0'])
+        self.assertEqual(pool.align(lines), pool.aligners[0].align_lines(lines))
+        self.assertEqual(pool.align([]), [])
+        pool.close()
+
+    def test_failing_aligner(self):
+        lines = [u' '.join(s) + u' ||| ' + u' '.join(t) for s, t in zip(self.src, self.tg)]
+        for fast_align, message in [(CRASHING_FAST_ALIGN, 'fast_align: crashed'), (MALFORMED_FAST_ALIGN, 'Malformed output of fast_align')]:
+            self.write_tools(fast_align)
+            pool = AlignerPool(self.model + '.fwd_params', self.model + '.fwd_err', self.model + '.rev_params', self.model + '.rev_err', size=2, batch_size=7)
+            errors = []
+
+            def align():
+                try:
+                    pool.align(lines)
+                except RuntimeError as exc:
+                    errors.append(exc)
+            # the error is raised instead of waiting for atools forever
+            thread = threading.Thread(target=align)
+            thread.daemon = True
+            thread.start()
+            thread.join(60)
+            self.assertFalse(thread.is_alive())
+            self.assertEqual(len(errors), 1)
+            self.assertTrue(message in str(errors[0]), str(errors[0]))
+            # the failed aligner is not used again
+            self.assertRaises(RuntimeError, pool.aligners[0].align_lines, lines[:1])
+            pool.close()
+
+    def test_align(self):
+        align_file = os.path.join(self.tmp_dir, 'data.align')
+        alignments = align_sentences(self.src, self.tg, self.model, align_file=align_file, aligners=2)
+        self.assertEqual(alignments[:3], [[[0], [1], [1]], [[0], [0]], [[0]]])
+        self.assertEqual(len(alignments), 60)
+        self.assertEqual(open(align_file).readline(), '0-0 1-1 1-2\n')
+        self.assertEqual(align_sentence(self.src[0], self.tg[0], self.model), [[0], [1], [1]])
+        src_file, tg_file = os.path.join(self.tmp_dir, 'src'), os.path.join(self.tmp_dir, 'tg')
+        for file_name, sentences in [(src_file, self.src), (tg_file, self.tg)]:
+            with open(file_name, 'w') as a_file:
+                a_file.writelines([u' '.join(s).encode('utf-8') + '\n' for s in sentences])
+        align_files(src_file, tg_file, self.model, os.path.join(self.tmp_dir, 'files.align'), aligners=2)
+        self.assertEqual(open(os.path.join(self.tmp_dir, 'files.align')).read(), open(align_file).read())
+
+
+if __name__ == '__main__':
+    unittest.main()
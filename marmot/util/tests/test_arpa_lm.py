@@ -0,0 +1,78 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from marmot.util.arpa_lm import ArpaLM, get_arpa_lm, read_arpa, OOV_LOGPROB
+
+
+# log10 probabilities of the words of a sentence computed directly from the ARPA entries
+def backoff_scores(entries, sentence, order):
+    words = ['<s>'] + sentence + ['</s>']
+    res = []
+    for i in range(1, len(words)):
+        history = words[max(0, i - order + 1):i]
+        logprob = 0.0
+        while tuple(history + [words[i]]) not in entries:
+            if len(history) == 0:
+                return res + [OOV_LOGPROB]
+            logprob += entries.get(tuple(history), (0.0, 0.0))[1]
+            history = history[1:]
+        res.append(logprob + entries[tuple(history + [words[i]])][0])
+    return res
+
+
+class ArpaLMTests(unittest.TestCase):
+
+    def setUp(self):
+        module_path = os.path.dirname(os.path.realpath(__file__))
+        # the binary file is created in the cache directory, not next to the ARPA file
+        self.tmp_dir = tempfile.mkdtemp()
+        self.lm_file = os.path.join(module_path, '../../features/tests/test_data/training.lm')
+        self.entries = {ngram: (prob, backoff) for ngram, prob, backoff in read_arpa(self.lm_file)}
+        self.sentences = [u'Finally they brought the boys home .'.split(), u'the European Commission is here'.split()]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_scores(self):
+        # 16 bits -- the quantization error is negligible
+        lm = ArpaLM.from_arpa(self.lm_file, bits=16)
+        for sentence in self.sentences:
+            logprobs, lengths, oovs = lm.score_sentence(sentence)
+            for logprob, expected in zip(logprobs, backoff_scores(self.entries, sentence, 5)):
+                self.assertAlmostEqual(logprob, expected, places=4)
+            self.assertEqual(len(lengths), len(sentence) + 1)
+            self.assertEqual(oovs, [0 for i in range(len(sentence) + 1)])
+
+    def test_quantized_scores(self):
+        lm = get_arpa_lm(self.lm_file, self.tmp_dir)
+        for sentence in self.sentences:
+            for logprob, expected in zip(lm.score_sentence(sentence)[0], backoff_scores(self.entries, sentence, 5)):
+                self.assertTrue(abs(logprob - expected) < 0.2)
+
+    def test_oov(self):
+        lm = get_arpa_lm(self.lm_file, self.tmp_dir)
+        logprobs, lengths, oovs = lm.score_sentence([u'the', u'unknown_word', u'is'])
+        self.assertEqual(oovs, [0, 1, 0, 0])
+        self.assertEqual(logprobs[1], OOV_LOGPROB)
+        # the history is lost after an unknown word
+        self.assertEqual(lengths[1:3], [0, 1])
+
+    def test_registry_and_binary_file(self):
+        lm = get_arpa_lm(self.lm_file, self.tmp_dir)
+        self.assertTrue(get_arpa_lm(self.lm_file, self.tmp_dir) is lm)
+        binary_files = os.listdir(self.tmp_dir)
+        self.assertEqual(len(binary_files), 1)
+        self.assertFalse(os.path.exists(self.lm_file + '.lm_store'))
+        self.assertTrue(pickle.loads(pickle.dumps(lm)) is lm)
+        # the binary file can be used directly
+        binary_lm = get_arpa_lm(os.path.join(self.tmp_dir, binary_files[0]))
+        self.assertEqual(binary_lm.score_sentence(self.sentences[0]), lm.score_sentence(self.sentences[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+import pickle
+
+from marmot.util.corpus_store import CorpusStore, ContextView, TokenIndex
+
+
+class CorpusStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        self.data_obj = {'target': [[u'a', u'good', u'day'], [u'bad', u'day']],
+                         'source': [[u'un', u'bon', u'jour'], [u'mauvais', u'jour']],
+                         'alignments': [[0, 1, 2], [0, None]],
+                         'tags': [[u'OK', u'OK', u'BAD'], [u'BAD', u'OK']],
+                         'target_file': '/tmp/target.txt'}
+        self.store = CorpusStore(self.data_obj)
+
+    def test_offsets(self):
+        self.assertEqual(len(self.store), 2)
+        self.assertEqual(self.store.n_tokens(), 5)
+        self.assertEqual(self.store.sentence_length(1), 2)
+        self.assertEqual(self.store.locate(3), (1, 0))
+        self.assertEqual(self.store.locate(2), (0, 2))
+
+    def test_context_fields(self):
+        context = self.store.context(1, 1)
+        self.assertEqual(context['token'], u'day')
+        self.assertEqual(context['index'], 1)
+        self.assertEqual(context['sentence_id'], 1)
+        self.assertEqual(context['tag'], u'OK')
+        self.assertEqual(context['sequence_tags'], [u'BAD', u'OK'])
+        self.assertIsNone(context['alignments'][context['index']])
+        self.assertEqual(context['target_file'], '/tmp/target.txt')
+        self.assertTrue('source' in context)
+        self.assertFalse('tags' in context)
+        self.assertFalse('target_pos' in context)
+        self.assertRaises(KeyError, lambda: context['target_pos'])
+        # the sentence-level representations are shared, not copied
+        self.assertTrue(context['target'] is self.data_obj['target'][1])
+
+    def test_mapping_interface(self):
+        context = self.store.context(0, 0)
+        as_dict = context.to_dict()
+        self.assertEqual(set(as_dict.keys()), set(['token', 'index', 'sentence_id', 'tag', 'sequence_tags', 'target', 'source', 'alignments', 'target_file']))
+        self.assertEqual(context, as_dict)
+        self.assertEqual(context.get('missing', 'default'), 'default')
+        # pickled contexts become plain dicts
+        self.assertEqual(pickle.loads(pickle.dumps(context)), as_dict)
+
+    def test_write(self):
+        context, sibling = self.store.context(0, 2), self.store.context(0, 0)
+        context['target_pos'] = [u'DT', u'JJ', u'NN']
+        context['tag'] = u'OK'
+        self.assertEqual(context['target_pos'], [u'DT', u'JJ', u'NN'])
+        self.assertEqual(context['tag'], u'OK')
+        self.assertTrue('target_pos' in context)
+        self.assertEqual(pickle.loads(pickle.dumps(context))['tag'], u'OK')
+        # the written values belong to the view only: the sibling views and the data of the caller are unchanged
+        self.assertFalse('target_pos' in sibling)
+        self.assertFalse('target_pos' in self.store.context(0, 2))
+        self.assertEqual(self.data_obj['tags'][0], [u'OK', u'OK', u'BAD'])
+        self.assertFalse('target_pos' in self.data_obj)
+
+    def test_no_instance_dict(self):
+        context = self.store.context(0, 0)
+        self.assertFalse(hasattr(context, '__dict__'))
+        self.assertTrue(isinstance(context, ContextView))
+
+    def test_first_sentence(self):
+        store = CorpusStore({'target': [[u'x']], 'tags': [[u'OK']]}, first_sentence=10)
+        self.assertEqual(store.context(0, 0)['sentence_id'], 10)
+
+
+class TokenIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.store = CorpusStore({'target': [[u'a', u'good', u'day'], [u'bad', u'day'], [u'a', u'day']],
+                                  'tags': [[u'OK', u'OK', u'BAD'], [u'BAD', u'OK'], [u'OK', u'OK']]})
+        self.index = TokenIndex(self.store)
+
+    def test_postings(self):
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual(list(self.index.positions(u'day')), [2, 4, 6])
+        self.assertEqual(self.index.count(u'a'), 2)
+        self.assertEqual(self.index.tags(u'day'), [u'BAD', u'OK', u'OK'])
+        self.assertEqual(self.index.tag_counts(u'day'), {u'BAD': 1, u'OK': 2})
+
+    def test_contexts(self):
+        contexts = self.index[u'day']
+        self.assertEqual([(c['sentence_id'], c['index']) for c in contexts], [(0, 2), (1, 1), (2, 1)])
+        self.assertTrue(all([c['token'] == u'day' for c in contexts]))
+        # the index keeps its views: a tag written to a context is seen in the next accesses, the data is unchanged
+        contexts[0]['tag'] = u'OK'
+        self.assertEqual(self.index[u'day'][0]['tag'], u'OK')
+        self.assertEqual(self.index.subset([u'day']).tags(u'day'), [u'OK', u'OK', u'OK'])
+        self.assertEqual(self.store.columns['tags'][0][2], u'BAD')
+
+    def test_subset_and_scatter(self):
+        subset = self.index.subset([u'a', u'day'])
+        self.assertEqual(set(subset.keys()), set([u'a', u'day']))
+        self.assertTrue(subset.store is self.store)
+        predictions = subset.scatter({u'a': [1, 2], u'day': [3, 4, 5]}, default=0)
+        self.assertEqual(predictions, [1, 0, 3, 0, 4, 2, 5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from marmot.util.encoder_store import save_encoder, load_encoder, is_encoder_file, encode_strings, decode_strings
+from marmot.util.feature_encoder import CategoricalEncoder, HashingEncoder
+from marmot.util.vocabulary import FeatureId, Vocabularies
+
+
+class EncoderStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.tmp_dir, 'encoder')
+        self.vocabularies = Vocabularies(['target'])
+        vocabulary = self.vocabularies.get('target')
+        the, boys = FeatureId(vocabulary.add(u'the')), FeatureId(vocabulary.add(u'garçons'))
+        self.names = ['token', 'w0', 'w1', 'id', 'list', 'pos']
+        self.rows = [[u'the', 0.5, 1.5, the, [u'a', u'b'], 'DT'],
+                     [u'garçons', 0.25, -3.0, boys, [u'b'], 'NN'],
+                     [u'the', 1.0, 1.0, the, [], 'DT']]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_one_hot(self):
+        encoder = CategoricalEncoder(feature_names=self.names, scale=True).fit(self.rows)
+        save_encoder(encoder, self.file_name)
+        self.assertTrue(is_encoder_file(self.file_name))
+        loaded = load_encoder(self.file_name)
+        self.assertEqual(loaded.vocabularies, encoder.vocabularies)
+        self.assertEqual(loaded.kinds, encoder.kinds)
+        self.assertEqual(loaded.output_feature_names(), encoder.output_feature_names())
+        self.assertTrue(np.allclose(loaded.scales, encoder.scales))
+        self.assertTrue(np.allclose(loaded.transform(self.rows).toarray(), encoder.transform(self.rows).toarray()))
+
+    def test_hashing(self):
+        encoder = HashingEncoder(feature_names=self.names, n_bits=10, signed=False)
+        save_encoder(encoder, self.file_name)
+        loaded = load_encoder(self.file_name)
+        self.assertEqual((loaded.n_bits, loaded.signed, loaded.scales), (10, False, None))
+        self.assertTrue(np.allclose(loaded.transform(self.rows).toarray(), encoder.transform(self.rows).toarray()))
+
+    def test_restore_vocabularies(self):
+        save_encoder(CategoricalEncoder(feature_names=self.names).fit(self.rows), self.file_name, vocabularies=self.vocabularies)
+        vocabularies = Vocabularies(['target'])
+        load_encoder(self.file_name, vocabularies=vocabularies)
+        self.assertEqual(vocabularies.get('target').get(u'garçons'), self.rows[1][3])
+        # the new corpus was interned before the encoder was loaded
+        vocabularies = Vocabularies(['target'])
+        vocabularies.get('target').add(u'garçons')
+        self.assertRaises(ValueError, load_encoder, self.file_name, vocabularies)
+
+    def test_saved_vocabularies(self):
+        # only the vocabularies of the passed Vocabularies are stored (see preprocessing_utils.corpus_vocabularies)
+        save_encoder(CategoricalEncoder(feature_names=self.names).fit(self.rows), self.file_name, vocabularies=self.vocabularies)
+        vocabularies = Vocabularies()
+        load_encoder(self.file_name, vocabularies=vocabularies)
+        self.assertEqual(vocabularies.names(), ['target'])
+        self.assertEqual(vocabularies.get('target').id2token, self.vocabularies.get('target').id2token)
+
+    def test_strings(self):
+        values = [u'a\0b', u'\0', u'', 'garçons', FeatureId(3), (1, u'\0'), None]
+        self.assertEqual(decode_strings(encode_strings(values), len(values)), values)
+        self.assertEqual(decode_strings(encode_strings([]), 0), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from marmot.util.extractor_profiler import ExtractorProfiler
+
+
+class DummyExtractor(object):
+    pass
+
+
+class ExtractorProfilerTests(unittest.TestCase):
+
+    def test_measure(self):
+        profiler = ExtractorProfiler()
+        with profiler.measure(DummyExtractor(), 5):
+            pass
+        with profiler.measure(DummyExtractor(), 3):
+            pass
+        try:
+            with profiler.measure(DummyExtractor(), 2):
+                raise ValueError('broken extractor')
+        except ValueError:
+            pass
+        stats = profiler.stats['DummyExtractor']
+        self.assertEqual(stats['calls'], 3)
+        self.assertEqual(stats['tokens'], 10)
+        self.assertEqual(stats['exceptions'], 1)
+
+    def test_merge_and_report(self):
+        profiler = ExtractorProfiler()
+        profiler.record('Fast', 1.0, 100, 0)
+        worker_profiler = ExtractorProfiler()
+        worker_profiler.record('Slow', 3.0, 30, 10)
+        profiler.merge(worker_profiler.stats)
+        rows = profiler.report()
+        self.assertEqual([row['extractor'] for row in rows], ['Slow', 'Fast'])
+        self.assertAlmostEqual(rows[0]['tokens_per_second'], 10.0)
+        self.assertAlmostEqual(rows[0]['time_share'], 0.75)
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            profiler.write(os.path.join(tmp_dir, 'profile.json'))
+            self.assertEqual(len(json.load(open(os.path.join(tmp_dir, 'profile.json')))), 2)
+            profiler.write(os.path.join(tmp_dir, 'profile.tsv'))
+            self.assertEqual(len(open(os.path.join(tmp_dir, 'profile.tsv')).readlines()), 3)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import unittest
+
+import numpy as np
+from scipy import sparse
+
+from marmot.util.feature_blocks import FeatureBlocks
+from marmot.util.vocabulary import FeatureId
+from marmot.features.feature_extractor import FeatureExtractor
+from marmot.experiment.preprocessing_utils import fit_binarizers, binarize, create_contexts, contexts_to_features, contexts_to_feature_blocks
+
+
+class TokenExtractor(FeatureExtractor):
+
+    def get_features(self, context_obj):
+        return [context_obj['token'], len(context_obj['token'])]
+
+    def get_feature_names(self):
+        return ['token', 'length']
+
+
+class VectorExtractor(FeatureExtractor):
+
+    def get_features(self, context_obj):
+        return np.array([context_obj['index'], 0.5, -1.0], dtype=np.float32)
+
+    def get_feature_names(self):
+        return ['v0', 'v1', 'v2']
+
+
+class FeatureBlocksTests(unittest.TestCase):
+
+    def setUp(self):
+        # token, 3 w2v dimensions, an interned id, a list of values, 2 LM features
+        self.rows = [[u'the', 0.5, 1.5, 2.5, FeatureId(3), [u'a', u'b'], 1, 2],
+                     [u'boys', 0.25, -1.0, 0.0, FeatureId(4), [u'b'], 2, 0],
+                     [u'the', 1.0, 1.0, 1.0, FeatureId(3), [], 0, 1]]
+
+    def test_from_rows(self):
+        blocks = FeatureBlocks.from_rows(self.rows)
+        self.assertEqual(len(blocks), 3)
+        self.assertEqual(blocks.n_columns(), 8)
+        self.assertEqual(blocks.categorical_columns(), [0, 4, 5])
+        self.assertEqual(blocks.dense_columns(), [1, 2, 3, 6, 7])
+        self.assertEqual(blocks.dense.dtype, np.float32)
+        self.assertEqual(blocks.dense.shape, (3, 5))
+        self.assertEqual(blocks.column(5), [[u'a', u'b'], [u'b'], []])
+        self.assertEqual(list(blocks.column(6)), [1, 2, 0])
+        for idx, row in enumerate(self.rows):
+            self.assertEqual(blocks.row(idx), row)
+
+    def test_not_convertible_numeric_columns(self):
+        rows = [[1.0, 2.0], [u'n/a', 3.0]]
+        blocks = FeatureBlocks.from_rows(rows)
+        self.assertEqual(blocks.dense_columns(), [])
+        self.assertEqual(blocks.column(0), [1.0, u'n/a'])
+
+    def test_slice(self):
+        blocks = FeatureBlocks.from_rows(self.rows)
+        sentence = blocks[1:3]
+        self.assertEqual(len(sentence), 2)
+        self.assertEqual(list(sentence), self.rows[1:])
+        # the dense block is a view
+        self.assertTrue(sentence.dense.base is blocks.dense)
+        self.assertEqual(len(blocks[3:3]), 0)
+
+    def test_int_columns(self):
+        blocks = FeatureBlocks.from_rows(self.rows)
+        self.assertEqual(sorted(blocks.int_columns), [6, 7])
+        # ints are restored in the rows, so the text formats get '2' and not '2.0'
+        self.assertEqual([type(v) for v in blocks.row(0)[6:]], [int, int])
+        self.assertEqual([type(v) for v in blocks.rows()[1][6:]], [int, int])
+        self.assertEqual(type(blocks.rows()[1][1]), np.float32)
+        # a column is int if all its values are ints
+        self.assertEqual(FeatureBlocks.from_rows([[1, 1], [2, 2.5]]).int_columns, frozenset([0]))
+        self.assertEqual(FeatureBlocks.vstack([blocks, FeatureBlocks.from_rows([row[:6] + [0.5, 1] for row in self.rows])]).int_columns, frozenset([7]))
+        stacked = FeatureBlocks.hstack([FeatureBlocks.from_rows([[u'x', 1], [u'y', 2], [u'z', 3]]), blocks])
+        self.assertEqual(sorted(stacked.int_columns), [1, 8, 9])
+        outputs = [[np.array([1, 2]), np.array([3, 4])], [np.array([0.5]), np.array([1.5])]]
+        self.assertEqual(FeatureBlocks.from_extractor_outputs(outputs, 2).rows(), [[1, 2, 0.5], [3, 4, 1.5]])
+
+    def test_binarize(self):
+        binarizers = fit_binarizers(self.rows)
+        # a CSR matrix by default, a numpy array for the consumers which need dense input
+        features = binarize(self.rows, binarizers)
+        self.assertTrue(sparse.isspmatrix_csr(features))
+        dense = binarize(self.rows, binarizers, sparse=False)
+        self.assertTrue(isinstance(dense, np.ndarray))
+        self.assertTrue(np.array_equal(features.toarray(), dense))
+        # the same result for FeatureBlocks
+        self.assertTrue(np.array_equal(binarize(FeatureBlocks.from_rows(self.rows), binarizers).toarray(), dense))
+
+    def test_stack(self):
+        blocks = FeatureBlocks.from_rows(self.rows)
+        stacked = FeatureBlocks.hstack([blocks, FeatureBlocks.from_rows([[0.0, u'x'], [1.0, u'y'], [2.0, u'z']])])
+        self.assertEqual(stacked.categorical_columns(), [0, 4, 5, 9])
+        self.assertEqual(stacked.row(1), self.rows[1] + [1.0, u'y'])
+        stacked = FeatureBlocks.vstack([blocks, FeatureBlocks.from_rows(self.rows[:1])])
+        self.assertEqual(len(stacked), 4)
+        self.assertEqual(stacked.row(3), self.rows[0])
+        # different layouts are merged through the rows
+        stacked = FeatureBlocks.vstack([FeatureBlocks.from_rows([[1.0]]), FeatureBlocks.from_rows([[u'a']])])
+        self.assertEqual(stacked.column(0), [1.0, u'a'])
+
+    def test_contexts_to_feature_blocks(self):
+        data = {'target': [[u'the', u'boys'], [u'are', u'at', u'home']], 'tags': [[1, 0], [1, 1, 1]]}
+        contexts = create_contexts(data)
+        extractors = [TokenExtractor(), VectorExtractor()]
+        blocks = contexts_to_feature_blocks(contexts, extractors)
+        self.assertEqual(blocks.categorical_columns(), [0])
+        self.assertEqual(blocks.dense.shape, (5, 4))
+        for idx, row in enumerate(contexts_to_features(contexts, extractors)):
+            self.assertEqual(blocks.row(idx), row)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os
+import glob
+import unittest
+import shutil
+import tempfile
+
+import numpy as np
+
+from marmot.util.feature_cache import FeatureCache, FieldRecorder, RecordingContext, code_version
+from marmot.util.corpus_store import CorpusStore
+from marmot.util.vocabulary import FeatureId
+
+
+class DummyExtractor(object):
+
+    def __init__(self, context_size=1):
+        self.context_size = context_size
+
+
+class VersionedExtractor(object):
+    version = 2
+
+
+# reads the target and the tag of every token
+def extract(batch, fields=('target',)):
+    recorder = FieldRecorder()
+    features = []
+    for context in [RecordingContext(c, recorder) for c in batch]:
+        features.append([context[f][context['index']] if f != 'tag' else context['tag'] for f in fields])
+    return features, recorder.fields
+
+
+class FeatureCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.store = CorpusStore({'target': [[u'a', u'boy'], [u'a', u'boy'], [u'a', u'dog']], 'tags': [[1, 1], [1, 0], [1, 0]],
+                                  'target_file': '/data/train.txt'})
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_recorded_fields(self):
+        batch = self.store.sentence_contexts(0)
+        features, fields = extract(batch)
+        self.assertEqual(sorted(fields), ['index', 'target'])
+        # the values written by the extractor are not recorded
+        recorder = FieldRecorder()
+        context = RecordingContext(batch[0], recorder)
+        context['target_pos'] = [u'DT', u'NN']
+        self.assertEqual(context['target_pos'], [u'DT', u'NN'])
+        self.assertFalse('target_pos' in recorder.fields)
+
+    def test_keys_of_read_fields(self):
+        cache = FeatureCache(self.cache_dir)
+        key = cache.extractor_key(DummyExtractor())
+        features, fields = extract(self.store.sentence_contexts(0))
+        cache.add(key, self.store.sentence_contexts(0), features, fields)
+        # the second sentence has other tags, the extractor doesn't read them
+        self.assertEqual(cache.lookup(key, self.store.sentence_contexts(1), {}), [[u'a'], [u'boy']])
+        self.assertEqual(cache.lookup(key, self.store.sentence_contexts(2), {}), None)
+        # an extractor which reads the tags
+        tag_key = cache.extractor_key(DummyExtractor(context_size=2))
+        features, fields = extract(self.store.sentence_contexts(0), fields=('target', 'tag'))
+        cache.add(tag_key, self.store.sentence_contexts(0), features, fields)
+        self.assertEqual(cache.lookup(tag_key, self.store.sentence_contexts(0), {}), [[u'a', 1], [u'boy', 1]])
+        self.assertEqual(cache.lookup(tag_key, self.store.sentence_contexts(1), {}), None)
+
+    def test_extractor_key(self):
+        cache = FeatureCache(self.cache_dir)
+        self.assertEqual(cache.extractor_key(DummyExtractor()), cache.extractor_key(DummyExtractor()))
+        self.assertNotEqual(cache.extractor_key(DummyExtractor()), cache.extractor_key(DummyExtractor(context_size=2)))
+        self.assertEqual(code_version(VersionedExtractor()), '2')
+        self.assertEqual(len(code_version(DummyExtractor())), 40)
+
+    def test_persisted_features(self):
+        extractor = DummyExtractor()
+        cache = FeatureCache(self.cache_dir)
+        key = cache.extractor_key(extractor)
+        batch = self.store.sentence_contexts(0)
+        self.assertEqual(cache.lookup(key, batch, {}), None)
+        rows = [[u'a', 1, 0.1, FeatureId(1 << 40), [u'x', u'y']], [u'boy', 2, 0.25, FeatureId(5), []]]
+        cache.add(key, batch, rows, extract(batch)[1])
+        cache.flush()
+        self.assertEqual(len(glob.glob(os.path.join(self.cache_dir, key, 'block.*.mfc'))), 1)
+
+        new_cache = FeatureCache(self.cache_dir)
+        key = new_cache.extractor_key(extractor)
+        restored = new_cache.lookup(key, batch, {})
+        self.assertEqual(restored, rows)
+        self.assertTrue(isinstance(restored[0][3], FeatureId))
+        self.assertEqual(new_cache.lookup(key, batch[1:], {}), [rows[1]])
+        self.assertEqual(new_cache.lookup(key, self.store.sentence_contexts(2), {}), None)
+
+    def test_persisted_vectors(self):
+        cache = FeatureCache(self.cache_dir)
+        key = cache.extractor_key(DummyExtractor())
+        batch = self.store.sentence_contexts(0)
+        vectors = [np.array([0.5, 1.5], dtype=np.float32), np.array([-1.0, 2.0], dtype=np.float32)]
+        cache.add(key, batch, vectors, extract(batch)[1])
+        cache.flush()
+        new_cache = FeatureCache(self.cache_dir)
+        restored = new_cache.lookup(new_cache.extractor_key(DummyExtractor()), batch, {})
+        self.assertEqual(restored[0].dtype, np.float32)
+        self.assertTrue(np.allclose(np.vstack(restored), np.vstack(vectors)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import unittest
+
+import numpy as np
+from scipy import sparse
+
+from marmot.util.feature_blocks import FeatureBlocks
+from marmot.util.feature_encoder import CategoricalEncoder, HashingEncoder
+from marmot.experiment.preprocessing_utils import build_encoder
+from marmot.util.vocabulary import FeatureId
+
+
+class CategoricalEncoderTests(unittest.TestCase):
+
+    def setUp(self):
+        # token, 3 w2v dimensions, an interned id, a list of values, 2 LM features
+        self.rows = [[u'the', 0.5, 1.5, 2.5, FeatureId(3), [u'a', u'b'], 1, 2],
+                     [u'boys', 0.25, -1.0, 0.0, FeatureId(4), [u'b'], 2, 0],
+                     [u'the', 1.0, 1.0, 1.0, FeatureId(3), [], 0, 1]]
+        self.encoder = CategoricalEncoder().fit(self.rows)
+
+    def test_fit(self):
+        self.assertEqual(sorted(self.encoder.vocabularies.keys()), [0, 4, 5])
+        self.assertEqual(self.encoder.vocabularies[0], {u'boys': 1, u'the': 2})
+        self.assertEqual(self.encoder.kinds[5], 'multilabel')
+        # 3 columns for every categorical feature (unknown + 2 values), 5 numeric features
+        self.assertEqual(self.encoder.n_features(), 14)
+        encoder = CategoricalEncoder(feature_names=['token', 'w0', 'w1', 'w2', 'id', 'list', 'lm0', 'lm1']).fit(self.rows)
+        names = encoder.output_feature_names()
+        self.assertEqual(len(names), 14)
+        self.assertEqual(names[:4], [u'token=__unk__', u'token=boys', u'token=the', 'w0'])
+
+    def test_transform(self):
+        features = self.encoder.transform(self.rows)
+        self.assertTrue(sparse.isspmatrix_csr(features))
+        self.assertEqual(features.dtype, np.float32)
+        self.assertEqual(list(features.toarray()[0]), [0, 0, 1, 0.5, 1.5, 2.5, 0, 1, 0, 0, 1, 1, 1, 2])
+        self.assertEqual(list(features.toarray()[2]), [0, 0, 1, 1, 1, 1, 0, 1, 0, 0, 0, 0, 0, 1])
+        self.assertEqual(features.nnz, 9 + 6 + 6)
+        blocks = FeatureBlocks.from_rows(self.rows)
+        self.assertEqual((self.encoder.transform(blocks) != features).nnz, 0)
+
+    def test_unknown_values(self):
+        rows = [[u'house', 0.0, 0.0, 0.0, FeatureId(7), [u'c', u'b', u'b'], 0, 0]]
+        features = self.encoder.transform(rows).toarray()
+        self.assertEqual(list(features[0]), [1, 0, 0, 0, 0, 0, 1, 0, 0, 1, 0, 1, 0, 0])
+
+    def test_scale(self):
+        encoder = CategoricalEncoder(scale=True).fit(self.rows)
+        features = encoder.transform(self.rows).toarray()
+        self.assertEqual(list(features[0]), [0, 0, 1, 0.5, 1, 1, 0, 1, 0, 0, 1, 1, 0.5, 1])
+        self.assertTrue(np.allclose(features[1][3:6], [0.25, -1.0 / 1.5, 0]))
+
+    def test_wrong_number_of_features(self):
+        self.assertRaises(ValueError, self.encoder.transform, [[u'the', 0.5]])
+
+
+class HashingEncoderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.names = ['token', 'w0', 'w1', 'list', 'lm']
+        self.rows = [[u'the', 0.5, 1.5, [u'a', u'b'], 1],
+                     [u'boys', 0.0, -1.0, [u'b'], 2],
+                     [u'the', 1.0, 1.0, [], 0]]
+
+    def test_transform(self):
+        encoder = HashingEncoder(feature_names=self.names, n_bits=10, signed=False)
+        features = encoder.transform(self.rows)
+        self.assertTrue(sparse.isspmatrix_csr(features))
+        self.assertEqual(features.shape, (3, 1024))
+        col, sign = encoder.hash_slot(u'token=the')
+        self.assertEqual(features[0, col], 1.0)
+        self.assertEqual(features[0].sum(), 1 + 0.5 + 1.5 + 2 + 1)
+        # the same columns in another process / without any fitting
+        other = HashingEncoder(feature_names=self.names, n_bits=10, signed=False).transform(self.rows[2:] + self.rows[:1])
+        self.assertEqual((other[1] != features[0]).nnz, 0)
+
+    def test_signed(self):
+        encoder = HashingEncoder(feature_names=self.names, n_bits=20)
+        features = encoder.transform(self.rows).toarray()
+        for col, value in [(0, u'the'), (3, u'a'), (3, u'b')]:
+            column, sign = encoder.slot(col, value)
+            self.assertTrue(sign in (-1, 1))
+            self.assertEqual(features[0, column], sign)
+        column, sign = encoder.numeric_slot(2)
+        self.assertEqual(features[0, column], 1.5 * sign)
+
+    def test_no_value_cache(self):
+        encoder = HashingEncoder(feature_names=self.names, n_bits=10)
+        encoder.transform(self.rows)
+        encoder.transform([[u'value_{}'.format(i), 0.0, 0.0, [], 0] for i in range(100)])
+        # only the numeric features are remembered
+        self.assertEqual(sorted(encoder.numeric_slots), [1, 2, 4])
+
+    def test_scale(self):
+        encoder = HashingEncoder(feature_names=self.names, n_bits=10, signed=False, scale=True)
+        # the scaling factors are not fitted
+        self.assertRaises(ValueError, encoder.transform, self.rows)
+        features = encoder.fit(self.rows).transform(self.rows)
+        column, sign = encoder.numeric_slot(4)
+        self.assertEqual(features[1, column], 1.0)
+
+    def test_build_encoder(self):
+        self.assertTrue(isinstance(build_encoder({'encoder': 'hashing', 'hash_bits': 12}, self.names), HashingEncoder))
+        self.assertEqual(build_encoder({'encoder': 'hashing', 'hash_bits': 12}, self.names).n_features(), 4096)
+        self.assertTrue(isinstance(build_encoder({}, self.names, self.rows), CategoricalEncoder))
+        self.assertRaises(ValueError, build_encoder, {'encoder': 'unknown'}, self.names)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from scipy import sparse
+
+from marmot.util.feature_blocks import FeatureBlocks
+from marmot.util.feature_file import FeatureFile, write_feature_file, is_feature_file
+from marmot.util.vocabulary import FeatureId
+
+
+class FeatureFileTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.tmp_dir, 'train.mfeat')
+        self.names = ['token', 'w0', 'w1', 'id', 'list', 'lm']
+        # two sentences: token, 2 w2v dimensions, an interned id, a list of values, an LM feature
+        self.sentences = [[[u'the', 0.5, 1.5, FeatureId(3), [u'a', u'b'], 1],
+                           [u'garçons', 0.25, -1.0, FeatureId(4), [], 2]],
+                          [[u'the', 1.0, 1.0, FeatureId(3), [u'b'], 0]]]
+        self.tags = [['OK', 'BAD'], ['OK']]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_sequential(self):
+        write_feature_file(self.file_name, self.sentences, tags=self.tags, feature_names=self.names)
+        self.assertTrue(is_feature_file(self.file_name))
+        features = FeatureFile(self.file_name)
+        self.assertEqual(len(features), 2)
+        self.assertEqual(features.feature_names, self.names)
+        self.assertEqual(features.sentence_tags(), self.tags)
+        self.assertEqual(features.sentences(), self.sentences)
+        self.assertTrue(isinstance(features.sentences()[0][0][3], FeatureId))
+        # the LM feature is written to the text formats as an int
+        self.assertEqual([str(row[5]) for row in features.sentences()[0]], ['1', '2'])
+        self.assertEqual(str(features.sentences()[0][0][1]), '0.5')
+        blocks = features.blocks()
+        self.assertEqual(blocks.dense.shape, (3, 3))
+        self.assertTrue(isinstance(blocks.dense, np.ndarray))
+        self.assertEqual(blocks.column(4), [[u'a', u'b'], [], [u'b']])
+        self.assertEqual(features.blocks(1, 3).column(0), [u'garçons', u'the'])
+
+    def test_plain(self):
+        rows = [row for sentence in self.sentences for row in sentence]
+        write_feature_file(self.file_name, FeatureBlocks.from_rows(rows), tags=['OK', 'BAD', 'OK'], feature_names=self.names)
+        features = FeatureFile(self.file_name)
+        self.assertEqual(len(features), 1)
+        self.assertEqual(features.sentences()[0], rows)
+        self.assertEqual(features.tags(), ['OK', 'BAD', 'OK'])
+
+    def test_detect_sequential(self):
+        rows = [row for sentence in self.sentences for row in sentence]
+        # a list of sentences given as lists of rows, FeatureBlocks, arrays or sparse matrices
+        for sentences in [self.sentences, [FeatureBlocks.from_rows(s) for s in self.sentences],
+                          [np.ones((2, 3)), np.ones((1, 3))], [sparse.csr_matrix(np.ones((2, 3))), sparse.csr_matrix(np.ones((1, 3)))]]:
+            write_feature_file(self.file_name, sentences, tags=self.tags)
+            self.assertEqual(FeatureFile(self.file_name).sentence_tags(), self.tags)
+        # a list of rows is plain data
+        write_feature_file(self.file_name, rows, tags=['OK', 'BAD', 'OK'])
+        self.assertEqual(FeatureFile(self.file_name).sentences(), [rows])
+        # plain rows of lists only look like a sentence
+        rows = [[[u'a'], [u'b']], [[u'c'], []]]
+        write_feature_file(self.file_name, rows, tags=['OK', 'BAD'], sequential=False)
+        self.assertEqual(FeatureFile(self.file_name).sentences(), [rows])
+
+    def test_sparse(self):
+        matrix = sparse.csr_matrix(np.array([[0, 1.5, 0], [2, 0, 0]], dtype=np.float32))
+        write_feature_file(self.file_name, matrix, tags=['OK', 'BAD'])
+        features = FeatureFile(self.file_name)
+        self.assertTrue(features.is_sparse())
+        self.assertEqual(features.matrix().toarray().tolist(), matrix.toarray().tolist())
+        self.assertEqual(features.tags(), ['OK', 'BAD'])
+
+    def test_sparse_sentences(self):
+        sentences = [sparse.csr_matrix(np.array([[0, 1.5, 0], [2, 0, 0]], dtype=np.float32)), sparse.csr_matrix(np.array([[0, 0, 3]], dtype=np.float32))]
+        write_feature_file(self.file_name, sentences, tags=self.tags)
+        features = FeatureFile(self.file_name)
+        self.assertTrue(features.is_sparse())
+        self.assertEqual(len(features), 2)
+        self.assertEqual(features.matrix().toarray().tolist(), [[0, 1.5, 0], [2, 0, 0], [0, 0, 3]])
+        self.assertEqual(features.sentence_tags(), self.tags)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from marmot.util.feature_index import FeatureIndex, HashedFeatureIndex, svm_light_line, write_svm_file
+from marmot.experiment.converter import crfsuite_to_svmlight, crfsuite_to_crfpp
+
+
+class FeatureIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_ids(self):
+        index = FeatureIndex(['token_the', 'pos_DT', 'token_the', 'pos_NN'])
+        # numbers start from 1 and follow the order of the first occurrence
+        self.assertEqual(list(index), ['token_the', 'pos_DT', 'pos_NN'])
+        self.assertEqual(index.get('pos_NN'), 3)
+        self.assertEqual(index.ids(['pos_NN', 'token_boys', 'token_the', 'pos_NN']), [1, 3])
+        self.assertEqual(index.ids(['token_boys'], grow=True), [4])
+        self.assertEqual(len(index), 4)
+
+    def test_svm_light(self):
+        self.assertEqual(svm_light_line('+1', [1, 3]), '+1 1:1.0 3:1.0\n')
+        self.assertEqual(svm_light_line('-1', [2], qid=5), '-1 qid:5 2:1.0\n')
+        file_name = write_svm_file(os.path.join(self.tmp_dir, 'train.svm'), ['+1', '-1'], [[1, 2], []])
+        self.assertEqual(open(file_name).read(), '+1 1:1.0 2:1.0\n-1 \n')
+
+    def test_converter(self):
+        train_file = os.path.join(self.tmp_dir, 'train.crfsuite')
+        with open(train_file, 'w') as a_file:
+            a_file.write('OK\ttoken=the\tpos=DT\nBAD\ttoken=boys\tpos=NN\n\nOK\ttoken=the\tpos=NN\n')
+        test_file = os.path.join(self.tmp_dir, 'test.crfsuite')
+        with open(test_file, 'w') as a_file:
+            a_file.write('BAD\ttoken=girls\tpos=NN\n')
+        out_file, tags, index = crfsuite_to_svmlight(train_file, self.tmp_dir, 'train', stamp='test')
+        self.assertEqual(tags, ['OK', 'BAD', 'OK'])
+        self.assertEqual(open(out_file).read().split('\n'), ['+1\t1:1.0 2:1.0', '-1\t3:1.0 4:1.0', '+1\t1:1.0 4:1.0', ''])
+        out_file, tags, index = crfsuite_to_svmlight(test_file, self.tmp_dir, 'test', binarized_features=index, stamp='test')
+        self.assertEqual(open(out_file).read(), '-1\t4:1.0\n')
+        self.assertEqual(len(index), 4)
+
+    def test_sharded_converter(self):
+        in_file = os.path.join(self.tmp_dir, 'train.crfsuite')
+        with open(in_file, 'w') as a_file:
+            for idx in range(50):
+                a_file.write('OK\ttoken=w{}\tpos=DT\nBAD\ttoken=w{}\tpos=NN\n\n'.format(idx, idx + 1))
+        one_file, tags, index = crfsuite_to_svmlight(in_file, self.tmp_dir, 'one', sequence=True, stamp='test')
+        # the shards are merged in order: the same output and numbering as with one process
+        many_file, many_tags, many_index = crfsuite_to_svmlight(in_file, self.tmp_dir, 'many', sequence=True, stamp='test', workers=3)
+        self.assertEqual(open(one_file).read(), open(many_file).read())
+        self.assertEqual((tags, list(index)), (many_tags, list(many_index)))
+        self.assertEqual(open(many_file).readlines()[-1], '-1 qid:50 4:1.0 53:1.0\n')
+        out_file, crf_tags = crfsuite_to_crfpp(in_file, self.tmp_dir, 'train', stamp='test', workers=3)
+        self.assertEqual(crf_tags, tags)
+        self.assertEqual(open(out_file).read().split('\n')[:3], ['token=w0\tpos=DT\tOK', 'token=w1\tpos=NN\tBAD', ''])
+        # hashed numbers: nothing is built, the same index is used for all datasets
+        hashed = HashedFeatureIndex(4)
+        out_file, tags, index = crfsuite_to_svmlight(in_file, self.tmp_dir, 'hashed', binarized_features=hashed, stamp='test', workers=2)
+        self.assertTrue(index is hashed)
+        self.assertTrue(all([1 <= int(cell.split(':')[0]) <= 16 for line in open(out_file) for cell in line.split()[1:]]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from marmot.util.feature_loader import load_text_features, sentence_ranges
+
+
+class FeatureLoaderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.tmp_dir, 'train.crf')
+        self.sentences = [[[u'the', 0.5, 1.0], [u'garçons', -1.5, 2.0]],
+                          [[u'the', 2.0, 0.0]],
+                          [[u'boys', 1.0, 3.0], [u'.', 0.0, u'n/a'], [u'the', 1.0, 1.0]]]
+        with open(self.file_name, 'w') as a_file:
+            for sentence in self.sentences:
+                for row in sentence:
+                    a_file.write(u'\t'.join([unicode(v) for v in row]).encode('utf-8') + '\n')
+                a_file.write('\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_sentence_ranges(self):
+        ranges = sentence_ranges(self.file_name, n_parts=3)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], os.path.getsize(self.file_name))
+        data = open(self.file_name, 'rb').read()
+        for start, end in ranges:
+            self.assertEqual(data[end - 2:end], '\n\n')
+
+    def test_load(self):
+        # the third column is numeric in the sample and has a string later
+        for workers in (1, 2):
+            features, lengths, names, tags = load_text_features(self.file_name, workers=workers, block_size=16, sample_rows=2)
+            self.assertEqual(lengths, [2, 1, 3])
+            self.assertEqual((names, tags), (None, None))
+            self.assertEqual(features.dense.dtype, np.float32)
+            self.assertEqual(features.dense_columns(), [1])
+            self.assertEqual(features.column(0), [u'the', u'garçons', u'the', u'boys', u'.', u'the'])
+            self.assertEqual(features.column(2), [u'1.0', u'2.0', u'0.0', u'3.0', u'n/a', u'1.0'])
+            self.assertEqual(features.rows()[1], [u'garçons', -1.5, u'2.0'])
+
+    def test_crf_suite(self):
+        file_name = os.path.join(self.tmp_dir, 'train.crfsuite')
+        with open(file_name, 'w') as a_file:
+            a_file.write('OK\ttoken=the\tw2v=0.5\nBAD\ttoken=boys\tw2v=1.5\n\nOK\ttoken=.\tw2v=0\n\n')
+        features, lengths, names, tags = load_text_features(file_name, file_format='crf_suite', dtype=np.float64)
+        self.assertEqual(names, [u'token', u'w2v'])
+        self.assertEqual(tags, [u'OK', u'BAD', u'OK'])
+        self.assertEqual(lengths, [2, 1])
+        self.assertEqual(features.rows(), [[u'the', 0.5], [u'boys', 1.5], [u'.', 0.0]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import __builtin__
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from scipy import sparse
+
+from marmot.util.feature_blocks import FeatureBlocks
+from marmot.util.feature_writer import format_crf, format_svm_light, write_features, output_file_name, check_compression
+from marmot.util.vocabulary import FeatureId
+
+
+class FeatureWriterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.names = ['token', 'lm', 'id']
+        self.sentences = [[[u'the', 0.5, FeatureId(3)], [u'garçons', 0, FeatureId(4)]], [[u'the', 1, FeatureId(3)]]]
+        self.tags = [['OK', 'BAD'], ['OK']]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_format(self):
+        self.assertEqual(format_crf(self.sentences[1:], self.tags[1:], self.names, 'crf_suite'), 'OK\ttoken=the\tlm=1\tid=3\n\n')
+        self.assertEqual(format_crf(self.sentences[1:], None, None, 'crf++'), 'the\t1\t3\n\n')
+        # zero values are skipped
+        self.assertEqual(format_svm_light(self.sentences[0], self.tags[0]), '+1 1:the 2:0.5 3:3\n-1 1:garçons 3:4\n')
+        # binarized sentences are sparse matrices
+        binarized = [sparse.csr_matrix(np.array([[1.0, 0.0, 0.5], [0.0, 1.0, 0.0]]))]
+        self.assertEqual(format_crf(binarized, self.tags[:1], None, 'crf++'), '1.0\t0.0\t0.5\tOK\n0.0\t1.0\t0.0\tBAD\n\n')
+
+    def test_write(self):
+        outputs = [(os.path.join(self.tmp_dir, 'train.crf'), self.sentences, self.tags),
+                   (os.path.join(self.tmp_dir, 'test.crf'), self.sentences[1:], self.tags[1:])]
+        write_features(outputs, self.names, 'crf++', workers=2, chunk_size=1)
+        self.assertEqual(open(outputs[0][0]).read(), 'the\t0.5\t3\tOK\ngarçons\t0\t4\tBAD\n\nthe\t1\t3\tOK\n\n')
+        self.assertEqual(open(outputs[1][0]).read(), 'the\t1\t3\tOK\n\n')
+
+    def test_format_blocks(self):
+        # float32 values which have no exact binary representation are written as the same rows written as lists
+        rows = [[0.8, u'w', 3]]
+        blocks = FeatureBlocks.from_rows(rows)
+        self.assertEqual(format_crf([blocks], None, None, 'crf++'), '0.8\tw\t3\n\n')
+        self.assertEqual(format_crf([blocks], None, None, 'crf++'), format_crf([rows], None, None, 'crf++'))
+        self.assertEqual(format_svm_light(blocks, ['OK']), '+1 1:0.8 2:w 3:3\n')
+
+    def test_write_blocks(self):
+        # FeatureBlocks are written as their rows: one per sentence for crf++, one with all objects for svm_light
+        outputs = [(os.path.join(self.tmp_dir, 'train.crf'), [FeatureBlocks.from_rows(s) for s in self.sentences], self.tags)]
+        write_features(outputs, self.names, 'crf++', workers=2, chunk_size=1)
+        self.assertEqual(open(outputs[0][0]).read(), 'the\t0.5\t3\tOK\ngarçons\t0.0\t4\tBAD\n\nthe\t1\t3\tOK\n\n')
+        rows = [row for sentence in self.sentences for row in sentence]
+        outputs = [(os.path.join(self.tmp_dir, 'train.svm'), FeatureBlocks.from_rows(rows), ['OK', 'BAD', 'OK'])]
+        write_features(outputs, None, 'svm_light', chunk_size=2)
+        self.assertEqual(open(outputs[0][0]).read(), '+1 1:the 2:0.5 3:3\n-1 1:garçons 3:4\n+1 1:the 2:1.0 3:3\n')
+
+    def test_gzip(self):
+        file_name = output_file_name(os.path.join(self.tmp_dir, 'train.crf'), 'gzip')
+        self.assertTrue(file_name.endswith('.crf.gz'))
+        write_features([(file_name, self.sentences, self.tags)], self.names, 'crf_suite', compression='gzip')
+        # appended data is another gzip member of the same file
+        write_features([(file_name, self.sentences[1:], self.tags[1:])], self.names, 'crf_suite', compression='gzip', mode='a')
+        lines = gzip.open(file_name).read().split('\n')
+        self.assertEqual(lines, ['OK\ttoken=the\tlm=0.5\tid=3', 'BAD\ttoken=garçons\tlm=0\tid=4', '', 'OK\ttoken=the\tlm=1\tid=3', '',
+                                 'OK\ttoken=the\tlm=1\tid=3', '', ''])
+        self.assertRaises(ValueError, output_file_name, file_name, 'bzip2')
+
+    def test_missing_zstandard(self):
+        # a missing package is reported when the file name is made, before anything is written
+        original_import = __builtin__.__import__
+
+        def no_zstandard(name, *args, **kwargs):
+            if name == 'zstandard':
+                raise ImportError('No module named zstandard')
+            return original_import(name, *args, **kwargs)
+        __builtin__.__import__ = no_zstandard
+        try:
+            self.assertRaises(ImportError, check_compression, 'zstd')
+            self.assertRaises(ImportError, output_file_name, os.path.join(self.tmp_dir, 'train.crf'), 'zstd')
+        finally:
+            __builtin__.__import__ = original_import
+        check_compression('gzip')
+        check_compression(None)
+
+
+if __name__ == '__main__':
+    unittest.main()
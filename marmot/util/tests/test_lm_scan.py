@@ -0,0 +1,65 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import unittest
+
+from marmot.util.lm_scan import SentenceScan, longest_left, longest_right, window_order
+from marmot.features.lm_feature_extractor import LMFeatureExtractor
+
+
+# an n-gram table which counts its lookups
+class CountingLM(set):
+
+    def __init__(self, sentences, order):
+        super(CountingLM, self).__init__()
+        self.lookups = 0
+        for sentence in sentences:
+            words = ['<s>'] + sentence + ['</s>']
+            for i in range(len(words)):
+                for n in range(1, order + 1):
+                    if i + n <= len(words):
+                        self.add(tuple(words[i:i + n]))
+
+    def __contains__(self, ngram):
+        self.lookups += 1
+        return super(CountingLM, self).__contains__(ngram)
+
+
+class LMScanTests(unittest.TestCase):
+
+    def setUp(self):
+        self.lm = CountingLM([u'the cat sat on the mat'.split(), u'a dog sat on a mat'.split()], 5)
+        self.sentence = u'the dog sat on the mat today'.split()
+
+    def test_longest_ngrams(self):
+        words = ['<s>'] + self.sentence + ['</s>']
+        self.assertEqual(longest_left(self.lm, words, 5), [1, 2, 1, 2, 3, 3, 4, 0, 1])
+        self.assertEqual(longest_right(self.lm, words, 5), [2, 1, 3, 4, 3, 2, 1, 0, 1])
+
+    def test_same_features_as_check_lm(self):
+        # check_lm and get_backoff of the LM extractors on the same table
+        extractor = LMFeatureExtractor.__new__(LMFeatureExtractor)
+        extractor.lm = self.lm
+        extractor.order = 5
+        contexts = [{'token': tok, 'index': idx, 'target': self.sentence} for idx, tok in enumerate(self.sentence)]
+        self.lm.lookups = 0
+        features = [extractor.get_features(c) for c in contexts]
+        single_lookups = self.lm.lookups
+        self.lm.lookups = 0
+        self.assertEqual(extractor.get_features_batch(contexts), features)
+        self.assertTrue(self.lm.lookups * 2 < single_lookups)
+
+    def test_short_windows(self):
+        scan = SentenceScan(self.lm, self.sentence, 3, 2)
+        # check_lm of a 3-word window with order 5 returns the order of the first slice which is in the table
+        for idx in range(len(self.sentence)):
+            window = (['<s>', '<s>'] + self.sentence)[idx:idx + 3]
+            expected = 0
+            for i in range(5, 0, -1):
+                if tuple(window[len(window) - i:]) in self.lm:
+                    expected = i
+                    break
+            self.assertEqual(window_order(3, scan.left_order(idx), 5), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from marmot.util import ngram_counter
+from marmot.util.ngram_counter import count_ngrams, corpus_ngram_store
+from marmot.util import ngram_store
+from marmot.util.ngram_store import NgramStore, read_counts_file
+
+
+class NgramCounterTests(unittest.TestCase):
+
+    def setUp(self):
+        module_path = os.path.dirname(os.path.realpath(__file__))
+        test_data = os.path.join(module_path, '../../features/tests/test_data')
+        self.corpus_file = os.path.join(test_data, 'training.txt')
+        # counts of the same corpus produced by SRILM ngram-count
+        self.srilm_counts = dict(read_counts_file(os.path.join(test_data, 'training.ngram')))
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_same_counts_as_srilm(self):
+        store_file = count_ngrams(self.corpus_file, os.path.join(self.tmp_dir, 'counts'), order=5, workers=1)
+        self.assertEqual(dict(NgramStore.load(store_file).iter_ngrams()), self.srilm_counts)
+
+    def test_shards_and_spills(self):
+        min_shard_size = ngram_counter.MIN_SHARD_SIZE
+        ngram_counter.MIN_SHARD_SIZE = 1
+        try:
+            store_file = count_ngrams(self.corpus_file, os.path.join(self.tmp_dir, 'counts'), order=5, workers=3, max_ngrams=1000, tmp_dir=self.tmp_dir)
+        finally:
+            ngram_counter.MIN_SHARD_SIZE = min_shard_size
+        self.assertEqual(dict(NgramStore.load(store_file).iter_ngrams()), self.srilm_counts)
+        # the spill files are removed
+        self.assertEqual(os.listdir(self.tmp_dir), ['counts'])
+
+    def test_spill_limit(self):
+        # one process: the spills and the chunks of the merge are recorded in this process
+        spill_sizes, chunk_sizes = [], []
+        original_spill, original_chunk_size, original_keys = ngram_counter.spill, ngram_store.CHUNK_SIZE, ngram_store.ngram_keys
+
+        def recording_spill(counts, tmp_dir):
+            spill_sizes.append(len(counts))
+            return original_spill(counts, tmp_dir)
+
+        def recording_keys(id_matrix):
+            chunk_sizes.append(len(id_matrix))
+            return original_keys(id_matrix)
+        ngram_counter.spill, ngram_store.ngram_keys = recording_spill, recording_keys
+        ngram_store.CHUNK_SIZE = 500
+        try:
+            store_file = ngram_counter.count_ngrams(self.corpus_file, os.path.join(self.tmp_dir, 'counts'), order=5, workers=1, max_ngrams=1000,
+                                                    tmp_dir=self.tmp_dir)
+        finally:
+            ngram_counter.spill, ngram_store.CHUNK_SIZE, ngram_store.ngram_keys = original_spill, original_chunk_size, original_keys
+        self.assertTrue(len(spill_sizes) > 1)
+        self.assertTrue(max(spill_sizes) <= 1000)
+        # the merged n-grams are written in chunks
+        self.assertTrue(len(chunk_sizes) > 1)
+        self.assertTrue(max(chunk_sizes) <= 500)
+        self.assertEqual(sum(chunk_sizes), len(self.srilm_counts))
+        self.assertEqual(dict(NgramStore.load(store_file).iter_ngrams()), self.srilm_counts)
+        self.assertEqual(os.listdir(self.tmp_dir), ['counts'])
+
+    def test_store_reused(self):
+        store_file = corpus_ngram_store(self.corpus_file, self.tmp_dir, order=3, workers=1)
+        mtime = os.path.getmtime(store_file)
+        self.assertEqual(corpus_ngram_store(self.corpus_file, self.tmp_dir, order=3, workers=1), store_file)
+        self.assertEqual(os.path.getmtime(store_file), mtime)
+        # another order -- another store
+        self.assertNotEqual(corpus_ngram_store(self.corpus_file, self.tmp_dir, order=2, workers=1), store_file)
+
+
+if __name__ == '__main__':
+    unittest.main()
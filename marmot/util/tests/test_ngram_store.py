@@ -0,0 +1,101 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from marmot.util import ngram_store
+from marmot.util.ngram_store import NgramStore, get_ngram_store, get_ngram_quartiles, read_counts_file, store_file_name, compute_quartiles
+
+
+class NgramStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        module_path = os.path.dirname(os.path.realpath(__file__))
+        # the binary store is created in the cache directory, not next to the counts file
+        self.tmp_dir = tempfile.mkdtemp()
+        self.ngram_file = os.path.join(module_path, '../../features/tests/test_data/training.ngram')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_same_counts_as_the_counts_file(self):
+        store = get_ngram_store(self.ngram_file, self.tmp_dir)
+        counts = dict(read_counts_file(self.ngram_file))
+        self.assertEqual(len(store), len(counts))
+        for ngram, count in list(counts.items())[:2000]:
+            self.assertTrue(ngram in store)
+            self.assertEqual(store[ngram], count)
+        self.assertEqual(store[(u'Finally', u'they')], 1)
+        self.assertFalse((u'they', u'Finally') in store)
+        self.assertFalse((u'unknown_word',) in store)
+        self.assertEqual(store[(u'unknown_word',)], 0)
+
+    def test_registry_and_binary_file(self):
+        store = get_ngram_store(self.ngram_file, self.tmp_dir)
+        self.assertTrue(get_ngram_store(self.ngram_file, self.tmp_dir) is store)
+        binary_file = store.file_name
+        self.assertEqual(os.path.dirname(binary_file), self.tmp_dir)
+        self.assertTrue(os.path.exists(binary_file))
+        self.assertFalse(os.path.exists(self.ngram_file + '.ngram_store'))
+        # the binary store can be used directly
+        self.assertEqual(get_ngram_store(binary_file)[(u'Finally',)], 3)
+        # a pickled store is reopened through the registry
+        self.assertTrue(pickle.loads(pickle.dumps(store)) is store)
+
+    def test_default_cache_dir(self):
+        original_cache = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = self.tmp_dir
+        try:
+            binary_file = store_file_name(self.ngram_file)
+        finally:
+            if original_cache is None:
+                del os.environ['XDG_CACHE_HOME']
+            else:
+                os.environ['XDG_CACHE_HOME'] = original_cache
+        self.assertEqual(os.path.dirname(binary_file), os.path.join(self.tmp_dir, 'marmot'))
+        self.assertTrue(os.path.isdir(os.path.join(self.tmp_dir, 'marmot')))
+        # files with the same name in different directories get different binary files
+        self.assertNotEqual(store_file_name(self.ngram_file, cache_dir=self.tmp_dir), store_file_name('training.ngram', cache_dir=self.tmp_dir))
+
+    def test_quartiles(self):
+        store, quartiles, boundaries = get_ngram_quartiles(self.ngram_file, self.tmp_dir)
+        self.assertEqual([name.split('.')[-1] for name in sorted(os.listdir(self.tmp_dir))], ['ngram_store', 'quartiles'])
+        orders = store.ngram_orders()
+        for order in range(1, store.order + 1):
+            cur_quartiles = quartiles[orders == order]
+            # four quarters of the same size
+            sizes = [(cur_quartiles == quartile).sum() for quartile in [1, 2, 3, 4]]
+            self.assertTrue(max(sizes) - min(sizes) <= 1)
+            # the counts grow with the quartiles
+            cur_counts = store.counts[orders == order]
+            for quartile in [1, 2, 3]:
+                self.assertTrue(cur_counts[cur_quartiles == quartile].max() <= cur_counts[cur_quartiles == quartile + 1].min())
+                self.assertEqual(boundaries[order - 1, quartile - 1], cur_counts[cur_quartiles == quartile + 1].min())
+
+    def test_quartile_ties(self):
+        # n-grams with the same count are ranked by their words, not by the order of the store
+        store = NgramStore.from_ngrams([((u'd',), 1), ((u'b',), 1), ((u'a',), 1), ((u'c',), 1), ((u'b', u'a'), 2), ((u'a', u'b'), 2)])
+        quartiles, boundaries = compute_quartiles(store)
+        self.assertEqual([int(quartiles[store.find((w,))]) for w in [u'a', u'b', u'c', u'd']], [1, 2, 3, 4])
+        self.assertEqual([int(quartiles[store.find(ngram)]) for ngram in [(u'a', u'b'), (u'b', u'a')]], [2, 4])
+
+    def test_collisions(self):
+        store = NgramStore.from_ngrams([((u'a', u'b'), 2), ((u'b', u'a'), 3), ((u'a',), 5)])
+        # all n-grams get the same key -- they are told apart by their word ids
+        store.keys[:] = 0
+        original_key = ngram_store.ngram_key
+        ngram_store.ngram_key = lambda ids, order: 0
+        try:
+            self.assertEqual(store[(u'a', u'b')], 2)
+            self.assertEqual(store[(u'b', u'a')], 3)
+            self.assertEqual(store[(u'a',)], 5)
+            self.assertFalse((u'b',) in store)
+        finally:
+            ngram_store.ngram_key = original_key
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from marmot.util.persist_features import persist_features_stream
+
+
+class PersistFeaturesTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.names = ['token', 'length']
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_stream_phrase_lengths(self):
+        # two chunks of phrase-level data: the phrase lengths are appended like the features
+        chunks = [([[[u'the boys', 2]]], [['OK']], [[2]]), ([[[u'run', 1], [u'home', 1]]], [['BAD', 'OK']], [[1, 1]])]
+        output = persist_features_stream('test', chunks, self.tmp_dir, feature_names=self.names, file_format='crf++')
+        self.assertEqual(open(output).read(), 'the boys\t2\tOK\n\nrun\t1\tBAD\nhome\t1\tOK\n\n')
+        self.assertEqual(open(os.path.join(self.tmp_dir, 'test.phrase-lengths')).read(), '2\n\n1\n1\n\n')
+        # svm_light has no sequences to map the phrase tags back to
+        self.assertRaises(ValueError, persist_features_stream, 'test', chunks, self.tmp_dir, feature_names=self.names, file_format='svm_light')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from marmot.experiment.import_utils import build_object
+from marmot.representations.representation_generator import RepresentationGenerator
+from marmot.util.representation_cache import RepresentationCache, generate_representation
+
+
+class FakeToolGenerator(RepresentationGenerator):
+    '''
+    Stands in for a generator which calls an external tool: counts its calls
+    '''
+
+    def __init__(self, suffix):
+        self.suffix = suffix
+        self.calls = 0
+
+    def generate(self, data_obj):
+        self.calls += 1
+        data_obj['target_pos'] = [[w + self.suffix for w in sentence] for sentence in data_obj['target']]
+        data_obj['alignments'] = [[i if i % 2 == 0 else None for i in range(len(sentence))] for sentence in data_obj['target']]
+        data_obj['segmentation'] = [[(0, len(sentence))] for sentence in data_obj['target']]
+        data_obj['target_dependencies'] = [[{'type': u'nsubj', 'head': 1}] for sentence in data_obj['target']]
+        del data_obj['target_file']
+        return data_obj
+
+
+class RepresentationCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.target_file = os.path.join(self.tmp_dir, 'target.txt')
+        with open(self.target_file, 'w') as a_file:
+            a_file.write('the boys\ngarçons\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    # built as in the experiments: the arguments from the config are a part of the key
+    def generator(self, suffix):
+        return build_object({'module': 'marmot.util.tests.test_representation_cache.FakeToolGenerator', 'args': [suffix]})
+
+    def data(self):
+        return {'target': [[u'the', u'boys'], [u'garçons']], 'target_file': self.target_file}
+
+    def test_cache(self):
+        cache = RepresentationCache(os.path.join(self.tmp_dir, 'cache'))
+        generator = self.generator(u'_pos')
+        generated = generate_representation(generator, self.data(), cache=cache)
+        # a new cache object reads the stored fields instead of calling the generator
+        cached = generate_representation(generator, self.data(), cache=RepresentationCache(os.path.join(self.tmp_dir, 'cache')))
+        self.assertEqual(generator.calls, 1)
+        self.assertEqual(cached, generated)
+        self.assertEqual(cached['alignments'], [[0, None], [0]])
+        self.assertEqual(cached['segmentation'], [[(0, 2)], [(0, 1)]])
+        self.assertFalse('target_file' in cached)
+
+    def test_keys(self):
+        cache = RepresentationCache(os.path.join(self.tmp_dir, 'cache'))
+        generate_representation(self.generator(u'_pos'), self.data(), cache=cache)
+        # other arguments of the generator
+        generator = self.generator(u'_tag')
+        self.assertEqual(generate_representation(generator, self.data(), cache=cache)['target_pos'][1], [u'garçons_tag'])
+        self.assertEqual(generator.calls, 1)
+        # the same data in memory, another content of the input file
+        with open(self.target_file, 'w') as a_file:
+            a_file.write('the girls\ngarçons\n')
+        generate_representation(generator, self.data(), cache=RepresentationCache(os.path.join(self.tmp_dir, 'cache')))
+        self.assertEqual(generator.calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
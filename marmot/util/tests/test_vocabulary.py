@@ -0,0 +1,67 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import unittest
+
+from marmot.util.vocabulary import FeatureId, Vocabulary, Vocabularies, pack_ids, unpack_ids, context_ids, START, END, left_ids, right_ids
+from marmot.util.corpus_store import CorpusStore
+
+
+class VocabularyTests(unittest.TestCase):
+
+    def test_add_and_decode(self):
+        vocabulary = Vocabulary('target')
+        ids = vocabulary.encode([u'a', u'boy', u'a'])
+        self.assertEqual(ids[0], ids[2])
+        self.assertNotEqual(ids[0], ids[1])
+        self.assertEqual(vocabulary.decode(ids), [u'a', u'boy', u'a'])
+        # unknown tokens get the id 0 if the vocabulary isn't extended
+        self.assertEqual(list(vocabulary.encode([u'dog'], grow=False)), [0])
+
+    def test_pack_ids(self):
+        packed = pack_ids([3, 0, 7])
+        self.assertTrue(isinstance(packed, FeatureId))
+        self.assertEqual(unpack_ids(packed, 3), [3, 0, 7])
+        self.assertNotEqual(pack_ids([1, 2]), pack_ids([2, 1]))
+
+    def test_windows(self):
+        vocabulary = Vocabulary('target')
+        ids = vocabulary.encode([u'a', u'boy', u'hits'])
+        self.assertEqual(left_ids(ids, 0, 2), [vocabulary.get(START)] * 2)
+        self.assertEqual(right_ids(ids, 1, 2), [ids[2], vocabulary.get(END)])
+
+    def test_interned_store(self):
+        data_obj = {'target': [[u'a', u'boy'], [u'a', u'dog']], 'source': [[u'un', u'garcon'], [u'un', u'chien']]}
+        vocabularies = Vocabularies(['target', 'source'])
+        store = CorpusStore(data_obj, vocabularies=vocabularies)
+        context = store.context(1, 0)
+        self.assertTrue('target_ids' in context)
+        self.assertEqual(list(context['target_ids']), list(store.context(0, 0)['target_ids'][:1]) + [vocabularies.get('target').get(u'dog')])
+        self.assertEqual(list(context_ids(context, 'source')), list(vocabularies.get('source').encode([u'un', u'chien'], grow=False)))
+        # the strings are kept
+        self.assertEqual(context['target'], [u'a', u'dog'])
+        # contexts sent to other processes keep the ids
+        self.assertEqual(list(context.to_dict()['target_ids']), list(context['target_ids']))
+        # a store of another dataset with the same vocabularies gets the same ids
+        other = CorpusStore({'target': [[u'dog', u'cat']]}, vocabularies=vocabularies)
+        self.assertEqual(other.context(0, 0)['target_ids'][0], context['target_ids'][1])
+
+    def test_not_interned(self):
+        # nothing is interned without vocabularies
+        context = CorpusStore({'target': [[u'a', u'boy']]}).context(0, 0)
+        self.assertFalse('target_ids' in context)
+        self.assertRaises(ValueError, context_ids, context, 'target')
+        # the vocabularies belong to the stores, a new experiment starts with new ones
+        self.assertEqual(len(Vocabularies(['target']).get('target')), 4)
+
+    def test_restore(self):
+        vocabularies = Vocabularies(['target'])
+        CorpusStore({'target': [[u'a', u'boy']]}, vocabularies=vocabularies)
+        restored = Vocabularies()
+        restored.restore('target', vocabularies.get('target').id2token)
+        self.assertEqual(restored.get('target').get(u'boy'), vocabularies.get('target').get(u'boy'))
+        other = Vocabularies(['target'])
+        other.get('target').add(u'boy')
+        self.assertRaises(ValueError, other.restore, 'target', vocabularies.get('target').id2token)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from marmot.util.word_vectors import WordVectors, get_word_vectors
+from marmot.features.word2vec_feature_extractor import Word2VecFeatureExtractor
+from marmot.features.source_word2vec_feature_extractor import SourceWord2VecFeatureExtractor
+
+
+class WordVectorsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.words = [u'the', u'boys', u'brought', u'home', u'.', u'les', u'garçons']
+        self.vectors = np.arange(len(self.words) * 3, dtype=np.float64).reshape((len(self.words), 3))
+        self.vectors_file = os.path.join(self.tmp_dir, 'model.vectors')
+        WordVectors.from_vectors(self.words, self.vectors).save(self.vectors_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_save_load(self):
+        model = WordVectors.load(self.vectors_file)
+        self.assertEqual(model.words, self.words)
+        self.assertEqual(model.matrix.dtype, np.float32)
+        self.assertTrue(np.allclose(model.vector(u'garçons'), self.vectors[6]))
+        self.assertTrue(np.allclose(model.vector(u'unknown_word'), np.average(self.vectors, axis=0)))
+        self.assertTrue(np.allclose(model.vector(u'<s>', zero_tokens=('<s>',)), np.zeros(3)))
+        self.assertTrue(np.allclose(model.vectors([u'the', u'<s>'], zero_tokens=('<s>',)), [self.vectors[0], np.zeros(3)]))
+
+    def test_registry(self):
+        model = get_word_vectors(self.vectors_file)
+        self.assertTrue(get_word_vectors(self.vectors_file) is model)
+        # the matrix is not copied to the pickle
+        self.assertTrue(pickle.loads(pickle.dumps(model)) is model)
+
+    def test_extractor(self):
+        extractor = Word2VecFeatureExtractor(self.vectors_file, context_size=2)
+        target = [u'the', u'boys', u'brought', u'unknown_word', u'home', u'.']
+        contexts = [{'token': tok, 'index': idx, 'target': target} for idx, tok in enumerate(target)]
+        features = extractor.get_features_batch(contexts)
+        self.assertEqual(len(features), len(target))
+        self.assertEqual(len(features[0]), len(extractor.get_feature_names()))
+        for idx, feature in enumerate(features):
+            left = [u'<s>', u'<s>'] + target
+            right = target + [u'</s>', u'</s>']
+            window = left[idx:idx + 2] + [target[idx]] + right[idx + 1:idx + 3]
+            expected = np.hstack([extractor.extract_word2vec_vector(tok) for tok in window])
+            self.assertTrue(np.allclose(feature, expected))
+
+    def test_phrase_extractor(self):
+        extractor = Word2VecFeatureExtractor(self.vectors_file, context_size=1)
+        target = [u'the', u'boys', u'brought', u'home', u'.']
+        contexts = [{'token': [u'the', u'boys'], 'index': (0, 2), 'target': target},
+                    {'token': [u'home', u'.'], 'index': (3, 5), 'target': target}]
+        features = extractor.get_features_batch(contexts)
+        self.assertTrue(np.allclose(features[0], np.hstack([np.zeros(3), self.vectors[0] + self.vectors[1], self.vectors[2]])))
+        self.assertTrue(np.allclose(features[1], np.hstack([self.vectors[2], self.vectors[3] + self.vectors[4], np.zeros(3)])))
+
+    def test_source_extractor(self):
+        extractor = SourceWord2VecFeatureExtractor(self.vectors_file, context_size=1)
+        context = {'token': [u'boys'], 'index': (1, 2), 'target': [u'the', u'boys'], 'source': [u'les', u'garçons'], 'alignments': [0, 1]}
+        self.assertTrue(np.allclose(extractor.get_features(context), np.hstack([self.vectors[5], self.vectors[6], np.zeros(3)])))
+        context['alignments'] = [0, None]
+        self.assertTrue(np.allclose(extractor.get_features(context), np.zeros(9)))
+
+
+if __name__ == '__main__':
+    unittest.main()
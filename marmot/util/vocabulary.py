@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+#encoding: utf-8
+
+# interning of strings (tokens, POS tags, ...) for the feature extractors which return integer ids
+# every field ('target', 'source', 'target_pos', ...) has its own vocabulary which maps strings to integer ids
+# the vocabularies of an experiment are held by one Vocabularies object, which is shared by the CorpusStores
+# of all its datasets (train, test, dev), so the same strings get the same ids in all of them
+#
+# IMPORTANT: the vocabularies grow when new strings are interned. To get the same ids in all worker processes,
+# the corpus has to be interned before the workers are started (CorpusStore does it when it's created)
+
+from array import array
+
+
+# special symbols used by the window extractors
+START = '<s>'
+END = '</s>'
+UNALIGNED = '__unaligned__'
+UNKNOWN = '__unk__'
+
+# the special symbols have the same ids in all vocabularies
+UNKNOWN_ID, START_ID, END_ID, UNALIGNED_ID = range(4)
+
+# number of bits reserved for one id in a packed combination of ids
+ID_BITS = 32
+
+
+try:
+    integer_type = long
+except NameError:  # Python 3
+    integer_type = int
+
+
+# long in Python 2: packed ids don't fit into a C long
+class FeatureId(integer_type):
+    '''
+    Integer id of a categorical feature value.
+    Feature values of this type are binarized like strings (they are NOT numeric features).
+    '''
+    __slots__ = ()
+
+
+class Vocabulary(object):
+    '''
+    Bidirectional mapping between strings and integer ids. The id 0 is reserved for unknown values,
+    the special symbols have fixed ids in all vocabularies (so they are the same in all processes).
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.token2id = {}
+        self.id2token = []
+        for symbol in (UNKNOWN, START, END, UNALIGNED):
+            self.add(symbol)
+
+    def add(self, token):
+        token_id = self.token2id.get(token)
+        if token_id is None:
+            token_id = len(self.id2token)
+            self.token2id[token] = token_id
+            self.id2token.append(token)
+        return token_id
+
+    # id of a token which is not added to the vocabulary if it's unknown
+    def get(self, token, default=0):
+        return self.token2id.get(token, default)
+
+    def encode(self, tokens, grow=True):
+        if grow:
+            return array('i', [self.add(t) for t in tokens])
+        return array('i', [self.token2id.get(t, 0) for t in tokens])
+
+    def decode(self, ids):
+        return [self.id2token[i] for i in ids]
+
+    def __contains__(self, token):
+        return token in self.token2id
+
+    def __len__(self):
+        return len(self.id2token)
+
+
+class Vocabularies(object):
+    '''
+    The vocabularies of the interned fields: {field: Vocabulary}.
+    <fields> -- the fields to intern (a CorpusStore interns the fields of its vocabularies)
+    '''
+
+    def __init__(self, fields=()):
+        self.vocabularies = {field: Vocabulary(field) for field in fields}
+
+    def get(self, field):
+        return self.vocabularies[field]
+
+    def names(self):
+        return sorted(self.vocabularies.keys())
+
+    def __contains__(self, field):
+        return field in self.vocabularies
+
+    # restore a vocabulary saved in another process, so the tokens get the same ids as there
+    # the vocabulary must be empty or agree with <id2token> -- restore the vocabularies before the corpus is interned
+    def restore(self, field, id2token):
+        if field not in self.vocabularies:
+            self.vocabularies[field] = Vocabulary(field)
+        vocabulary = self.vocabularies[field]
+        for token_id, token in enumerate(id2token):
+            if vocabulary.add(token) != token_id:
+                raise ValueError("The vocabulary '{}' already has other ids, it has to be restored before the corpus is interned".format(field))
+        return vocabulary
+
+
+# combine several ids into one integer (e.g. token + left context)
+# the result doesn't depend on the process, so no shared vocabulary of combinations is needed
+def pack_ids(ids):
+    res = 0
+    for i in ids:
+        res = (res << ID_BITS) | i
+    return FeatureId(res)
+
+
+def unpack_ids(packed, length):
+    mask = (1 << ID_BITS) - 1
+    res = []
+    for i in range(length):
+        res.append(packed & mask)
+        packed >>= ID_BITS
+    return res[::-1]
+
+
+# ids of a sentence-level field of a context object
+# views over a CorpusStore which interns <field> provide the '<field>_ids' key
+def context_ids(context_obj, field):
+    key = field + '_ids'
+    if key not in context_obj:
+        raise ValueError("The field '{}' is not interned: the extractors which return ids need the contexts of a CorpusStore "
+                         "with the vocabulary of this field (see preprocessing_utils.corpus_vocabularies)".format(field))
+    return context_obj[key]
+
+
+# window of ids around <idx>, padded with the ids of START and END
+def left_ids(ids, idx, context_size):
+    return [ids[i] if i >= 0 else START_ID for i in range(idx - context_size, idx)]
+
+
+def right_ids(ids, idx, context_size):
+    return [ids[i] if i < len(ids) else END_ID for i in range(idx + 1, idx + context_size + 1)]
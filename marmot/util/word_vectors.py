@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+#encoding: utf-8
+
+# read-only word vectors shared by the word2vec feature extractors
+# a gensim model is converted once into a binary file (<w2v_file>.vectors):
+#   - the vocabulary of the model
+#   - a float32 matrix with one row per word and two extra rows: the mean of all vectors (used for unknown words)
+#     and a zero vector (used for the padding symbols)
+# the matrix is memory-mapped, so the pages are shared by all worker processes, and the features of
+# a whole sentence are gathered from the matrix with one fancy-indexing operation (see WordVectors.rows)
+
+from __future__ import print_function
+
+import os
+import struct
+
+import numpy as np
+
+from marmot.util.ngram_store import store_file_name
+
+
+MAGIC = b'MARMOTWV'
+VERSION = 1
+# magic, version, number of words, vector size, size of the vocabulary in bytes
+HEADER = struct.Struct('<8siqqq')
+
+
+class WordVectors(object):
+    '''
+    Word vectors in a float32 matrix: rows 0..n-1 -- the words of <words>, row n -- the mean vector, row n+1 -- zeros.
+    '''
+
+    def __init__(self, words, matrix):
+        self.words = words
+        self.word2row = {w: i for i, w in enumerate(words)}
+        self.matrix = matrix
+        self.default_row = len(words)
+        self.zero_row = len(words) + 1
+        # the model file and the cache directory of vectors loaded through get_word_vectors
+        self.source = None
+        self.cache_dir = None
+
+    # a pickled model is reopened from the file, the matrix is not copied
+    def __reduce__(self):
+        if self.source is not None:
+            return (get_word_vectors, (self.source, self.cache_dir))
+        return (WordVectors, (self.words, self.matrix))
+
+    def __contains__(self, word):
+        return word in self.word2row
+
+    def __len__(self):
+        return len(self.words)
+
+    def vector_size(self):
+        return self.matrix.shape[1]
+
+    def mean_vector(self):
+        return self.matrix[self.default_row]
+
+    def zero_vector(self):
+        return self.matrix[self.zero_row]
+
+    # row of a word: its own vector, zeros for the symbols <zero_tokens> (e.g. padding), the mean vector otherwise
+    def row(self, word, zero_tokens=()):
+        res = self.word2row.get(word)
+        if res is not None:
+            return res
+        return self.zero_row if word in zero_tokens else self.default_row
+
+    def rows(self, words, zero_tokens=()):
+        return np.array([self.row(w, zero_tokens) for w in words], dtype=np.int64)
+
+    def vector(self, word, zero_tokens=()):
+        return self.matrix[self.row(word, zero_tokens)]
+
+    # matrix of the vectors of <words> (one row per word)
+    def vectors(self, words, zero_tokens=()):
+        return self.matrix[self.rows(words, zero_tokens)]
+
+    def save(self, file_name):
+        vocabulary = u'\n'.join(self.words).encode('utf-8')
+        # temporary file + rename: a concurrent reader never sees a half-written file
+        tmp_name = '{}.{}.tmp'.format(file_name, os.getpid())
+        out = open(tmp_name, 'wb')
+        out.write(HEADER.pack(MAGIC, VERSION, len(self.words), self.vector_size(), len(vocabulary)))
+        out.write(vocabulary)
+        out.write(b'\0' * (-(HEADER.size + len(vocabulary)) % 8))
+        out.write(np.ascontiguousarray(self.matrix, dtype='<f4').tobytes())
+        out.close()
+        os.rename(tmp_name, file_name)
+
+    @staticmethod
+    def load(file_name):
+        in_file = open(file_name, 'rb')
+        magic, version, n_words, vector_size, vocabulary_size = HEADER.unpack(in_file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{} is not a word vectors file of version {}'.format(file_name, VERSION))
+        vocabulary = in_file.read(vocabulary_size).decode('utf-8')
+        in_file.close()
+        words = vocabulary.split(u'\n') if n_words > 0 else []
+        offset = HEADER.size + vocabulary_size
+        offset += -offset % 8
+        # a plain ndarray view of the mapped file (indexing np.memmap objects is slower)
+        matrix = np.memmap(file_name, dtype='<f4', mode='r', offset=offset, shape=(n_words + 2, vector_size)).view(np.ndarray)
+        return WordVectors(words, matrix)
+
+    # the mean and the zero rows are added to the vectors of the words
+    @staticmethod
+    def from_vectors(words, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        mean = np.average(vectors, axis=0) if len(words) > 0 else np.zeros(vectors.shape[1], dtype=np.float32)
+        return WordVectors(words, np.vstack([vectors, mean, np.zeros_like(mean)]).astype(np.float32))
+
+    @staticmethod
+    def from_gensim(w2v_file):
+        # imported here: gensim is needed only to convert a model
+        from gensim.models import Word2Vec
+        model = Word2Vec.load(w2v_file)
+        vectors = model.wv if hasattr(model, 'wv') else model
+        words = list(vectors.index2word) if hasattr(vectors, 'index2word') else list(vectors.vocab)
+        return WordVectors.from_vectors(words, [vectors[w] for w in words])
+
+
+def is_word_vectors(file_name):
+    with open(file_name, 'rb') as a_file:
+        return a_file.read(len(MAGIC)) == MAGIC
+
+
+_models = {}
+
+
+# the vectors of <w2v_file> (a gensim Word2Vec model or its binary version), loaded once per process
+# the binary version of a model is created in the cache directory (see ngram_store.resource_cache_dir) on first use
+# and rebuilt if the model is newer
+def get_word_vectors(w2v_file, cache_dir=None):
+    path = os.path.abspath(w2v_file)
+    binary_file = path if is_word_vectors(path) else store_file_name(path, '.vectors', cache_dir)
+    if binary_file not in _models:
+        if binary_file != path and (not os.path.exists(binary_file) or os.path.getmtime(binary_file) < os.path.getmtime(path)):
+            print("Converting the word2vec model {} to the binary file {}".format(path, binary_file))
+            WordVectors.from_gensim(path).save(binary_file)
+        _models[binary_file] = WordVectors.load(binary_file)
+        _models[binary_file].source = path
+        _models[binary_file].cache_dir = cache_dir
+    return _models[binary_file]